@@ -95,6 +95,9 @@ PY_VER_TUPLE: tuple[str, str, str] = platform.python_version_tuple()
 ## Dynamically set Python version
 DEFAULT_PYTHON: str = f"{PY_VER_TUPLE[0]}.{PY_VER_TUPLE[1]}"
 
+## Where the bench session saves results, each run is compared with the last one saved
+BENCHMARK_STORAGE: Path = Path("./.benchmarks")
+
 ## Set directory for requirements.txt file output
 REQUIREMENTS_OUTPUT_DIR: Path = Path("./requirements")
 
@@ -228,6 +231,45 @@ def run_tests(session: nox.Session, pdm_ver: str):
         "--tb=auto",
         "-v",
         "-rsXxfP",
+        ## Benchmarks don't time anything under xdist, run them with the bench session
+        "--benchmark-skip",
+    )
+
+
+@nox.session(python=[DEFAULT_PYTHON], name="bench")
+@nox.parametrize("pdm_ver", [PDM_VER])
+def run_benchmarks(session: nox.Session, pdm_ver: str):
+    """Run the benchmark suite against the OWM stand-in & save the results.
+
+    Extra args are passed to pytest, i.e. `nox -s bench -- --benchmark-compare-fail=mean:10%`
+    to fail when a benchmark's mean is more than 10% slower than the last saved run.
+    """
+    session.install(f"pdm>={pdm_ver}")
+    session.run("pdm", "install")
+
+    bench_args: list[str] = [
+        f"--benchmark-storage={BENCHMARK_STORAGE}",
+        "--benchmark-autosave",
+        "--benchmark-columns=min,mean,stddev,rounds",
+        "--benchmark-sort=name",
+    ]
+    if list(BENCHMARK_STORAGE.glob("*/*.json")):
+        ## Compare with the latest saved run
+        bench_args.append("--benchmark-compare")
+    else:
+        log.info(
+            f"No saved benchmarks in '{BENCHMARK_STORAGE}', nothing to compare with"
+        )
+
+    log.info("Running benchmarks")
+    session.run(
+        "pdm",
+        "run",
+        "pytest",
+        "tests/benchmarks",
+        "--benchmark-only",
+        *bench_args,
+        *session.posargs,
     )
 
 
@@ -0,0 +1,4 @@
+from __future__ import annotations
+
+from ._parser import build_parser
+from ._cache import http_cache_stats, prune_http_cache
@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import logging
+from pathlib import Path
+import typing as t
+
+log = logging.getLogger("owm_bot.cli.cache")
+
+from owm_bot.core.constants import HTTP_CACHE_BACKENDS, HTTP_CACHE_ENDPOINTS
+from owm_bot.core.paths import OWM_HTTP_CACHE_DIR
+
+if t.TYPE_CHECKING:
+    from owm_bot.core.http import HttpCacheStats
+
+
+def _endpoint_ttl(endpoint: str) -> int:
+    from owm_bot.core.config import settings
+
+    return (
+        settings.http_cache_geo_ttl
+        if endpoint == "geo"
+        else settings.http_cache_weather_ttl
+    )
+
+
+def http_cache_stats(
+    endpoints: list[str] | None = None,
+    backend: str | None = None,
+    cache_dir: t.Union[str, Path] = OWM_HTTP_CACHE_DIR,
+) -> list[HttpCacheStats]:
+    """Count the entries & bytes in each endpoint's HTTP cache.
+
+    The 'memory' backend only lives as long as the process, so its stats are for the
+    current process's cache.
+    """
+    ## hishel & the settings are only loaded when a cache command runs
+    from owm_bot.core.config import settings
+    from owm_bot.core.depends import (
+        owm_hishel_storage_dependency,
+        owm_http_cache_location,
+    )
+    from owm_bot.core.http import (
+        HttpCacheStats,
+        file_cache_stats,
+        open_sqlite_cache_connection,
+        sqlite_cache_stats,
+    )
+
+    backend = backend or settings.http_cache_backend
+    stats: list[HttpCacheStats] = []
+
+    for endpoint in endpoints or HTTP_CACHE_ENDPOINTS:
+        location: Path | None = owm_http_cache_location(
+            endpoint=endpoint, backend=backend, cache_dir=cache_dir
+        )
+
+        match backend:
+            case "sqlite":
+                if not location.exists():
+                    stats.append(
+                        HttpCacheStats(
+                            backend=backend, endpoint=endpoint, location=f"{location}"
+                        )
+                    )
+                    continue
+
+                conn = open_sqlite_cache_connection(db_file=location)
+                try:
+                    stats.append(
+                        sqlite_cache_stats(
+                            conn=conn, endpoint=endpoint, location=f"{location}"
+                        )
+                    )
+                finally:
+                    conn.close()
+            case "file":
+                stats.append(file_cache_stats(cache_dir=location, endpoint=endpoint))
+            case "memory":
+                cache_storage = owm_hishel_storage_dependency(
+                    endpoint=endpoint, backend=backend, cache_dir=cache_dir
+                )
+                stats.append(
+                    HttpCacheStats(
+                        backend=backend,
+                        endpoint=endpoint,
+                        entries=len(cache_storage._cache),
+                    )
+                )
+
+    return stats
+
+
+def prune_http_cache(
+    endpoints: list[str] | None = None,
+    backend: str | None = None,
+    max_entries: int | None = None,
+    max_mb: int | None = None,
+    cache_dir: t.Union[str, Path] = OWM_HTTP_CACHE_DIR,
+) -> dict[str, int]:
+    """Evict expired entries, then the oldest entries past the size limits.
+
+    Params:
+        max_entries (int | None): Max entries to keep per endpoint. Defaults to `settings.http_cache_max_entries`.
+        max_mb (int | None): Max size per endpoint, in MB. Defaults to `settings.http_cache_max_mb`.
+
+    Returns:
+        (dict[str, int]): Number of entries removed, per endpoint.
+
+    """
+    from owm_bot.core.config import settings
+    from owm_bot.core.depends import owm_http_cache_location
+    from owm_bot.core.http import (
+        open_sqlite_cache_connection,
+        prune_file_cache,
+        prune_sqlite_cache,
+    )
+
+    backend = backend or settings.http_cache_backend
+    max_entries = (
+        settings.http_cache_max_entries if max_entries is None else max_entries
+    )
+    max_mb = settings.http_cache_max_mb if max_mb is None else max_mb
+    max_bytes: int = max_mb * 1024 * 1024
+
+    removed: dict[str, int] = {}
+
+    for endpoint in endpoints or HTTP_CACHE_ENDPOINTS:
+        location: Path | None = owm_http_cache_location(
+            endpoint=endpoint, backend=backend, cache_dir=cache_dir
+        )
+
+        match backend:
+            case "sqlite":
+                if not location.exists():
+                    removed[endpoint] = 0
+                    continue
+
+                conn = open_sqlite_cache_connection(db_file=location)
+                try:
+                    removed[endpoint] = prune_sqlite_cache(
+                        conn=conn,
+                        max_entries=max_entries,
+                        max_bytes=max_bytes,
+                        ttl=_endpoint_ttl(endpoint),
+                    )
+                    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                finally:
+                    conn.close()
+            case "file":
+                removed[endpoint] = prune_file_cache(
+                    cache_dir=location,
+                    max_entries=max_entries,
+                    max_bytes=max_bytes,
+                    ttl=_endpoint_ttl(endpoint),
+                )
+            case "memory":
+                log.info(
+                    "The 'memory' HTTP cache is evicted as it fills and cleared on exit, nothing to prune"
+                )
+                removed[endpoint] = 0
+
+    return removed
+
+
+def _format_ts(ts: float | None) -> str:
+    if ts is None:
+        return "-"
+
+    return dt.datetime.fromtimestamp(ts).isoformat(sep=" ", timespec="seconds")
+
+
+def cache_stats_cmd(args: argparse.Namespace) -> int:
+    for stats in http_cache_stats(endpoints=args.endpoint, backend=args.backend):
+        print(
+            f"[{stats.backend}:{stats.endpoint}] entries={stats.entries} size={stats.size_bytes / 1024 / 1024:.2f}MB oldest={_format_ts(stats.oldest)} newest={_format_ts(stats.newest)} location={stats.location or '-'}"
+        )
+
+    return 0
+
+
+def cache_prune_cmd(args: argparse.Namespace) -> int:
+    removed: dict[str, int] = prune_http_cache(
+        endpoints=args.endpoint,
+        backend=args.backend,
+        max_entries=args.max_entries,
+        max_mb=args.max_mb,
+    )
+    for endpoint, count in removed.items():
+        print(f"[{endpoint}] removed {count} entr(y/ies)")
+
+    return 0
+
+
+def add_cache_parser(subparsers: argparse._SubParsersAction) -> None:
+    cache_parser: argparse.ArgumentParser = subparsers.add_parser(
+        "cache", help="Inspect & prune the HTTP response cache."
+    )
+    cache_subparsers = cache_parser.add_subparsers(
+        dest="cache_command", metavar="<cache_command>", required=True
+    )
+
+    common: argparse.ArgumentParser = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "--backend",
+        choices=HTTP_CACHE_BACKENDS,
+        default=None,
+        help="Cache backend. Defaults to the 'http_cache_backend' setting.",
+    )
+    common.add_argument(
+        "--endpoint",
+        choices=HTTP_CACHE_ENDPOINTS,
+        action="append",
+        default=None,
+        help="Only this endpoint's cache. Can be passed more than once. Defaults to all endpoints.",
+    )
+
+    stats_parser = cache_subparsers.add_parser(
+        "stats", parents=[common], help="Show entries & size per endpoint."
+    )
+    stats_parser.set_defaults(func=cache_stats_cmd)
+
+    prune_parser = cache_subparsers.add_parser(
+        "prune",
+        parents=[common],
+        help="Evict expired entries, then the oldest entries past the size limits.",
+    )
+    prune_parser.add_argument(
+        "--max-entries",
+        type=int,
+        default=None,
+        help="Max entries to keep per endpoint. Defaults to the 'http_cache_max_entries' setting.",
+    )
+    prune_parser.add_argument(
+        "--max-mb",
+        type=int,
+        default=None,
+        help="Max size per endpoint, in MB. Defaults to the 'http_cache_max_mb' setting.",
+    )
+    prune_parser.set_defaults(func=cache_prune_cmd)
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import argparse
+import logging
+
+log = logging.getLogger("owm_bot.cli.compact")
+
+
+def compact_cmd(args: argparse.Namespace) -> int:
+    ## Imported here so other commands don't pay for pandas/pyarrow
+    import datetime as dt
+
+    from owm_bot.location.controllers import (
+        CurrentWeatherPQFileController,
+        ForecastWeatherPQFileController,
+    )
+
+    before: str | None = (
+        None if args.all else dt.datetime.now(dt.timezone.utc).date().isoformat()
+    )
+
+    for controller in (
+        CurrentWeatherPQFileController(append_only=True),
+        ForecastWeatherPQFileController(append_only=True),
+    ):
+        compacted: int = controller.compact(min_files=args.min_files, before=before)
+        print(f"{controller.table_name}: compacted {compacted} partition(s)")
+
+    return 0
+
+
+def add_compact_parser(subparsers: argparse._SubParsersAction) -> None:
+    compact_parser: argparse.ArgumentParser = subparsers.add_parser(
+        "compact",
+        help="Merge the small files in each partition of the weather history datasets.",
+    )
+    compact_parser.add_argument(
+        "--min-files",
+        type=int,
+        default=2,
+        help="Only compact partitions holding at least this many files.",
+    )
+    compact_parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Also compact today's partitions, which may still be written to.",
+    )
+    compact_parser.set_defaults(func=compact_cmd)
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import argparse
+import logging
+
+log = logging.getLogger("owm_bot.cli.import_locations")
+
+from owm_bot.core.paths import LOCATIONS_PQ_FILE
+
+
+def import_locations_cmd(args: argparse.Namespace) -> int:
+    ## Imported here so other commands don't pay for pandas/pyarrow
+    from owm_bot.location.importer import LocationImportStats, import_locations
+
+    stats: LocationImportStats = import_locations(
+        path=args.path,
+        file_format=args.format,
+        pq_file=args.pq_file,
+        geocode=not args.no_geocode,
+        batch_size=args.batch_size,
+    )
+
+    print(
+        f"Read {stats.rows} location(s) in {stats.seconds:.1f}s: {stats.added} added, {stats.duplicates} duplicate(s), {stats.invalid} invalid"
+    )
+    print(
+        f"Geocoded {stats.geocoded} location(s), {stats.not_geocoded} still missing coordinates"
+    )
+
+    return 0
+
+
+def add_import_locations_parser(subparsers: argparse._SubParsersAction) -> None:
+    import_parser: argparse.ArgumentParser = subparsers.add_parser(
+        "import-locations",
+        help="Add a CSV, JSONL or Parquet list of places to the locations table & geocode them.",
+    )
+    import_parser.add_argument("path", help="File of places to import.")
+    import_parser.add_argument(
+        "--format",
+        choices=["csv", "jsonl", "parquet"],
+        default=None,
+        help="Format of the file. Defaults to the format matching its suffix.",
+    )
+    import_parser.add_argument(
+        "--pq-file",
+        default=f"{LOCATIONS_PQ_FILE}",
+        help="Locations table to add the places to.",
+    )
+    import_parser.add_argument(
+        "--no-geocode",
+        action="store_true",
+        help="Store the places without requesting missing coordinates.",
+    )
+    import_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="Locations geocoded & saved at a time.",
+    )
+    import_parser.set_defaults(func=import_locations_cmd)
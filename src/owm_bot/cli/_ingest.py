@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import argparse
+import logging
+
+log = logging.getLogger("owm_bot.cli.ingest")
+
+from owm_bot.core.paths import OWM_HTTP_CACHE_DIR, SERIALIZE_DIR
+
+## Raw responses kept by the HTTP cache, and our own response dumps
+DEFAULT_ARCHIVE_PATHS: list[str] = [f"{OWM_HTTP_CACHE_DIR}", f"{SERIALIZE_DIR}"]
+
+
+def ingest_cmd(args: argparse.Namespace) -> int:
+    ## Imported here so other commands don't pay for pandas/pyarrow
+    from owm_bot.weather.ingest import IngestStats, ingest_archives
+
+    stats: IngestStats = ingest_archives(
+        paths=args.paths or DEFAULT_ARCHIVE_PATHS,
+        tables=args.table,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        rebuild=args.rebuild,
+        append_only=args.append_only,
+        batch_rows=args.batch_rows,
+    )
+
+    print(
+        f"Ingested {stats.responses} response(s) from {stats.archives} archive(s) in {stats.seconds:.1f}s ({stats.errors} error(s))"
+    )
+    for table_name, rows in stats.rows.items():
+        print(f"[{table_name}] {rows} row(s) written")
+
+    return 1 if stats.errors and not stats.responses else 0
+
+
+def add_ingest_parser(subparsers: argparse._SubParsersAction) -> None:
+    ingest_parser: argparse.ArgumentParser = subparsers.add_parser(
+        "ingest",
+        help="Load raw One Call responses (HTTP cache, JSON/JSONL dumps) into the weather history tables.",
+    )
+    ingest_parser.add_argument(
+        "paths",
+        nargs="*",
+        help=f"Archive files or directories to read. Defaults to {DEFAULT_ARCHIVE_PATHS}.",
+    )
+    ingest_parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Replace the history tables with what is in the archives, instead of adding to them.",
+    )
+    ingest_parser.add_argument(
+        "--table",
+        choices=["current", "forecast"],
+        action="append",
+        default=None,
+        help="Only this table. Can be passed more than once. Defaults to all tables.",
+    )
+    ingest_parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes parsing archives. Defaults to the number of CPUs.",
+    )
+    ingest_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=256,
+        help="Approximate number of responses each worker task parses.",
+    )
+    ingest_parser.add_argument(
+        "--append-only",
+        action="store_true",
+        help="Write to the partitioned history datasets instead of the Parquet files.",
+    )
+    ingest_parser.add_argument(
+        "--batch-rows",
+        type=int,
+        default=1_000_000,
+        help="With --append-only, append once this many rows are buffered.",
+    )
+    ingest_parser.set_defaults(func=ingest_cmd)
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import argparse
+import logging
+
+log = logging.getLogger("owm_bot.cli")
+
+from ._cache import add_cache_parser
+from ._compact import add_compact_parser
+from ._import_locations import add_import_locations_parser
+from ._ingest import add_ingest_parser
+from ._serve import add_serve_parser
+from ._standin import add_standin_parser
+from ._summary import add_summary_parser
+from ._verify import add_verify_parser
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Build the `owm-bot` argument parser.
+
+    Running without a subcommand initializes the configured location.
+    """
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        prog="owm-bot",
+        description="Controllers & methods for interacting with the OpenWeathermap API.",
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="<command>")
+
+    add_cache_parser(subparsers)
+    add_compact_parser(subparsers)
+    add_import_locations_parser(subparsers)
+    add_ingest_parser(subparsers)
+    add_serve_parser(subparsers)
+    add_standin_parser(subparsers)
+    add_summary_parser(subparsers)
+    add_verify_parser(subparsers)
+
+    return parser
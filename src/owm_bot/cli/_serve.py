@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import argparse
+import logging
+
+log = logging.getLogger("owm_bot.cli.serve")
+
+
+def serve_cmd(args: argparse.Namespace) -> int:
+    ## Imported here so other commands don't pay for the daemon's imports
+    import asyncio
+
+    from owm_bot.core.config import owm_settings
+    from owm_bot.core.paths import DAILY_SUMMARY_PQ_FILE
+    from owm_bot.location import init_locations
+    from owm_bot.serve import WeatherPollDaemon
+
+    location_loader = init_locations(
+        location_file=args.location_file or owm_settings.location_file
+    )
+
+    daemon: WeatherPollDaemon = WeatherPollDaemon(
+        locations=location_loader.locations,
+        interval=args.interval,
+        jitter=args.jitter,
+        flush_interval=args.flush_interval,
+        flush_rows=args.flush_rows,
+        store_forecast=not args.no_forecast,
+        daily_summary_file=None if args.no_summary else DAILY_SUMMARY_PQ_FILE,
+        compact_interval=None if args.no_compact else args.compact_interval,
+    )
+    asyncio.run(daemon.run())
+
+    return 0
+
+
+def add_serve_parser(subparsers: argparse._SubParsersAction) -> None:
+    serve_parser: argparse.ArgumentParser = subparsers.add_parser(
+        "serve",
+        help="Poll weather for every location in the location file until stopped.",
+    )
+    serve_parser.add_argument(
+        "--location-file",
+        default=None,
+        help="JSON file with the location(s) to poll. Defaults to the 'owm_location_file' setting.",
+    )
+    serve_parser.add_argument(
+        "--interval",
+        type=float,
+        default=None,
+        help="Seconds between polls of each location. Defaults to the 'owm_poll_interval' setting.",
+    )
+    serve_parser.add_argument(
+        "--jitter",
+        type=float,
+        default=None,
+        help="Max seconds each poll is moved earlier/later. Defaults to the 'owm_poll_jitter' setting.",
+    )
+    serve_parser.add_argument(
+        "--flush-interval",
+        type=float,
+        default=60.0,
+        help="Max seconds observations are buffered before being written.",
+    )
+    serve_parser.add_argument(
+        "--flush-rows",
+        type=int,
+        default=500,
+        help="Write buffered observations once this many rows are waiting.",
+    )
+    serve_parser.add_argument(
+        "--no-forecast",
+        action="store_true",
+        help="Only store current weather, not the hourly/daily forecasts.",
+    )
+    serve_parser.add_argument(
+        "--no-summary",
+        action="store_true",
+        help="Don't update the daily summary table after each write.",
+    )
+    serve_parser.add_argument(
+        "--compact-interval",
+        type=float,
+        default=86400.0,
+        help="Seconds between compactions of past days' partitions.",
+    )
+    serve_parser.add_argument(
+        "--no-compact",
+        action="store_true",
+        help="Never compact the datasets, i.e. when another process does.",
+    )
+    serve_parser.set_defaults(func=serve_cmd)
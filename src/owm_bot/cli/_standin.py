@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import argparse
+import logging
+
+log = logging.getLogger("owm_bot.cli.standin")
+
+
+def standin_cmd(args: argparse.Namespace) -> int:
+    import threading
+
+    from owm_bot.standin import OWMStandin, StandinServer
+
+    standin: OWMStandin = OWMStandin(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        calls_per_minute=args.calls_per_minute,
+        seed=args.seed,
+    )
+
+    with StandinServer(standin=standin, host=args.host, port=args.port) as server:
+        print(f"Serving the OWM stand-in at {server.url}, stop with Ctrl+C")
+        print(f"Point owm-bot at it with: OWM_BASE_URL={server.url}")
+
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+    print(
+        f"Answered {standin.requests} request(s): "
+        + ", ".join(
+            f"{endpoint} [{status}]: {n}"
+            for (endpoint, status), n in sorted(standin.stats.items())
+        )
+    )
+
+    return 0
+
+
+def add_standin_parser(subparsers: argparse._SubParsersAction) -> None:
+    standin_parser: argparse.ArgumentParser = subparsers.add_parser(
+        "standin",
+        help="Serve a local stand-in for the OWM geocoding & One Call APIs, for offline testing.",
+    )
+    standin_parser.add_argument("--host", default="127.0.0.1", help="Address to bind.")
+    standin_parser.add_argument(
+        "--port", type=int, default=8080, help="Port to bind. 0 picks a free port."
+    )
+    standin_parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds each response is delayed by.",
+    )
+    standin_parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.0,
+        help="Max seconds added to or removed from --latency, at random.",
+    )
+    standin_parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Share of requests (0-1) answered with a 500.",
+    )
+    standin_parser.add_argument(
+        "--throttle-rate",
+        type=float,
+        default=0.0,
+        help="Share of requests (0-1) answered with a 429 & a Retry-After header.",
+    )
+    standin_parser.add_argument(
+        "--calls-per-minute",
+        type=int,
+        default=None,
+        help="Requests allowed per API key & minute before answering with 429s.",
+    )
+    standin_parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Seed for jitter & injected faults, for repeatable runs.",
+    )
+    standin_parser.set_defaults(func=standin_cmd)
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import argparse
+import logging
+
+log = logging.getLogger("owm_bot.cli.summary")
+
+
+def summary_cmd(args: argparse.Namespace) -> int:
+    ## Imported here so other commands don't pay for pandas/pyarrow
+    import pandas as pd
+
+    from owm_bot.weather.summary import (
+        SummaryUpdate,
+        read_daily_summary,
+        update_daily_summary,
+    )
+
+    if not args.no_update:
+        update: SummaryUpdate = update_daily_summary(
+            full=args.full, append_only=args.append_only
+        )
+        print(
+            f"Summarized {update.days} location-day(s) from {update.observations} new observation(s)"
+        )
+
+    start: pd.Timestamp = pd.Timestamp.now(tz="UTC").floor("D") - pd.Timedelta(
+        days=args.days - 1
+    )
+    summary: pd.DataFrame = read_daily_summary(
+        columns=[
+            "location_key",
+            "dt",
+            "temp_min",
+            "temp",
+            "temp_max",
+            "humidity",
+            "rain",
+            "observations",
+        ],
+        filters={"location_key": args.location} if args.location else None,
+        time_range=(start, None),
+    )
+    if summary.empty:
+        print("No daily summaries yet")
+
+        return 0
+
+    summary["dt"] = summary["dt"].dt.date
+    print(summary.to_string(index=False, float_format=lambda v: f"{v:.1f}"))
+
+    return 0
+
+
+def add_summary_parser(subparsers: argparse._SubParsersAction) -> None:
+    summary_parser: argparse.ArgumentParser = subparsers.add_parser(
+        "summary",
+        help="Update the daily summary table from new observations & show recent days.",
+    )
+    summary_parser.add_argument(
+        "--days",
+        type=int,
+        default=7,
+        help="Number of days to show, including today.",
+    )
+    summary_parser.add_argument(
+        "--location",
+        action="append",
+        default=None,
+        help="Only this location key. Can be passed more than once.",
+    )
+    summary_parser.add_argument(
+        "--no-update",
+        action="store_true",
+        help="Show stored summaries without reading new observations.",
+    )
+    summary_parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Discard stored summaries & aggregate every stored observation again.",
+    )
+    summary_parser.add_argument(
+        "--append-only",
+        action="store_true",
+        help="Read the partitioned history dataset instead of the Parquet file.",
+    )
+    summary_parser.set_defaults(func=summary_cmd)
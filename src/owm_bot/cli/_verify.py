@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import argparse
+import logging
+
+log = logging.getLogger("owm_bot.cli.verify")
+
+
+def verify_cmd(args: argparse.Namespace) -> int:
+    ## Imported here so other commands don't pay for pandas/pyarrow
+    from owm_bot.weather.verification import VerificationResult, verify_forecasts
+
+    result: VerificationResult = verify_forecasts(
+        tolerance=args.tolerance, full=args.full, append_only=args.append_only
+    )
+    print(
+        f"Verified {result.matched}/{result.forecasts} new forecast row(s) against observations"
+    )
+
+    summary = result.summary(
+        by=["location_key", "forecast_type", "lead_hours"]
+        if args.by_location
+        else None,
+        variables=[args.variable],
+    )
+    if summary.empty:
+        print("No verified forecasts yet")
+
+        return 0
+
+    print(summary.to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+
+    return 0
+
+
+def add_verify_parser(subparsers: argparse._SubParsersAction) -> None:
+    verify_parser: argparse.ArgumentParser = subparsers.add_parser(
+        "verify",
+        help="Compare stored forecasts with observations & show errors per lead time.",
+    )
+    verify_parser.add_argument(
+        "--tolerance",
+        default="30min",
+        help="Max time between a forecast's target time & the observation it is compared with.",
+    )
+    verify_parser.add_argument(
+        "--variable",
+        default="temp",
+        help="Measurement to show errors for.",
+    )
+    verify_parser.add_argument(
+        "--by-location",
+        action="store_true",
+        help="Show errors per location, instead of over every location.",
+    )
+    verify_parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Discard stored errors & verify every stored forecast again.",
+    )
+    verify_parser.add_argument(
+        "--append-only",
+        action="store_true",
+        help="Read the partitioned history datasets instead of the Parquet files.",
+    )
+    verify_parser.set_defaults(func=verify_cmd)
@@ -1,9 +1,18 @@
-from .config import AppSettings, settings, OpenweathermapSettings, owm_settings
+from __future__ import annotations
+
+import typing as t
+
 from .constants import (
     OPENWEATHERMAP_BASE_URL,
     OPENWEATHERMAP_GEO_URL,
     OPENWEATHERMAP_ONECALL_URL,
+    ONECALL_EXCLUDE_PARTS,
+    OWM_UNITS,
     PQ_ENGINE,
+    PQ_ROW_GROUP_SIZE,
+    ON_DUPLICATE_MODES,
+    HTTP_CACHE_BACKENDS,
+    HTTP_CACHE_ENDPOINTS,
 )
 from .paths import (
     DATA_DIR,
@@ -14,7 +23,28 @@ from .paths import (
     ENSURE_DIRS,
     HTTP_CACHE_DIR,
     OWM_HTTP_CACHE_DIR,
+    GEOCODE_CACHE_DIR,
+    GEOCODE_CACHE_FILE,
     CURRENT_WEATHER_PQ_FILE,
     FORECAST_WEATHER_PQ_FILE,
+    FORECAST_VERIFICATION_PQ_FILE,
+    DAILY_SUMMARY_PQ_FILE,
     LOCATIONS_PQ_FILE,
+    CURRENT_WEATHER_PQ_DATASET_DIR,
+    FORECAST_WEATHER_PQ_DATASET_DIR,
+)
+
+from owm_bot.utils.lazy_imports import lazy_module
+
+if t.TYPE_CHECKING:
+    from .config import AppSettings, settings, OpenweathermapSettings, owm_settings
+
+__getattr__, __dir__ = lazy_module(
+    __name__,
+    attrs={
+        "AppSettings": ".config",
+        "settings": ".config",
+        "OpenweathermapSettings": ".config",
+        "owm_settings": ".config",
+    },
 )
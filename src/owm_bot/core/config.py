@@ -1,10 +1,15 @@
+import functools
 import typing as t
 from pathlib import Path
 
+from owm_bot.core.constants import HTTP_CACHE_BACKENDS
+
 from dynaconf import Dynaconf
 from pydantic import Field, ValidationError, field_validator
 from pydantic_settings import BaseSettings
 
+## Dynaconf only reads the settings files on first attribute access, and the settings
+#  below only read Dynaconf when they are built on first use (see __getattr__)
 DYNACONF_SETTINGS: Dynaconf = Dynaconf(
     environments=True,
     envvar_prefix="DYNACONF",
@@ -19,21 +24,137 @@ DYNACONF_OWM_SETTINGS: Dynaconf = Dynaconf(
 
 
 class AppSettings(BaseSettings):
-    env: str = Field(default=DYNACONF_SETTINGS.ENV, env="ENV")
+    env: str = Field(default_factory=lambda: DYNACONF_SETTINGS.ENV, env="ENV")
     container_env: bool = Field(
-        default=DYNACONF_SETTINGS.CONTAINER_ENV, env="CONTAINER_ENV"
+        default_factory=lambda: DYNACONF_SETTINGS.CONTAINER_ENV, env="CONTAINER_ENV"
+    )
+    log_level: str = Field(
+        default_factory=lambda: DYNACONF_SETTINGS.LOG_LEVEL, env="LOG_LEVEL"
+    )
+    http_cache_backend: str = Field(
+        default_factory=lambda: DYNACONF_SETTINGS.HTTP_CACHE_BACKEND,
+        env="HTTP_CACHE_BACKEND",
+    )
+    http_cache_max_entries: int = Field(
+        default_factory=lambda: DYNACONF_SETTINGS.HTTP_CACHE_MAX_ENTRIES,
+        env="HTTP_CACHE_MAX_ENTRIES",
+    )
+    http_cache_max_mb: int = Field(
+        default_factory=lambda: DYNACONF_SETTINGS.HTTP_CACHE_MAX_MB,
+        env="HTTP_CACHE_MAX_MB",
+    )
+    http_cache_geo_ttl: int = Field(
+        default_factory=lambda: DYNACONF_SETTINGS.HTTP_CACHE_GEO_TTL,
+        env="HTTP_CACHE_GEO_TTL",
+    )
+    http_cache_weather_ttl: int = Field(
+        default_factory=lambda: DYNACONF_SETTINGS.HTTP_CACHE_WEATHER_TTL,
+        env="HTTP_CACHE_WEATHER_TTL",
+    )
+    metrics_enabled: bool = Field(
+        default_factory=lambda: DYNACONF_SETTINGS.METRICS_ENABLED,
+        env="METRICS_ENABLED",
     )
-    log_level: str = Field(default=DYNACONF_SETTINGS.LOG_LEVEL, env="LOG_LEVEL")
+    metrics_port: int = Field(
+        default_factory=lambda: DYNACONF_SETTINGS.METRICS_PORT, env="METRICS_PORT"
+    )
+    metrics_file: str = Field(
+        default_factory=lambda: DYNACONF_SETTINGS.METRICS_FILE, env="METRICS_FILE"
+    )
+
+    @field_validator("http_cache_backend")
+    def validate_http_cache_backend(cls, v):
+        v = f"{v}".strip().lower()
+        if v not in HTTP_CACHE_BACKENDS:
+            raise ValueError(
+                f"Invalid http_cache_backend: '{v}'. Must be one of {HTTP_CACHE_BACKENDS}"
+            )
+
+        return v
 
 
 class OpenweathermapSettings(BaseSettings):
     api_key: str = Field(
-        default=DYNACONF_OWM_SETTINGS.OWM_API_KEY, env="OWM_API_KEY", repr=False
+        default_factory=lambda: DYNACONF_OWM_SETTINGS.OWM_API_KEY,
+        env="OWM_API_KEY",
+        repr=False,
     )
     location_file: t.Union[str, Path] = Field(
-        default=DYNACONF_OWM_SETTINGS.OWM_LOCATION_FILE, env="OWM_LOCATION_FILE"
+        default_factory=lambda: DYNACONF_OWM_SETTINGS.OWM_LOCATION_FILE,
+        env="OWM_LOCATION_FILE",
+    )
+    calls_per_minute: int = Field(
+        default_factory=lambda: DYNACONF_OWM_SETTINGS.OWM_CALLS_PER_MINUTE,
+        env="OWM_CALLS_PER_MINUTE",
+    )
+    calls_per_day: int = Field(
+        default_factory=lambda: DYNACONF_OWM_SETTINGS.OWM_CALLS_PER_DAY,
+        env="OWM_CALLS_PER_DAY",
+    )
+    max_concurrency: int = Field(
+        default_factory=lambda: DYNACONF_OWM_SETTINGS.OWM_MAX_CONCURRENCY,
+        env="OWM_MAX_CONCURRENCY",
+    )
+    max_attempts: int = Field(
+        default_factory=lambda: DYNACONF_OWM_SETTINGS.OWM_MAX_ATTEMPTS,
+        env="OWM_MAX_ATTEMPTS",
     )
+    max_wait: int = Field(
+        default_factory=lambda: DYNACONF_OWM_SETTINGS.OWM_MAX_WAIT,
+        env="OWM_MAX_WAIT",
+    )
+    circuit_failures: int = Field(
+        default_factory=lambda: DYNACONF_OWM_SETTINGS.OWM_CIRCUIT_FAILURES,
+        env="OWM_CIRCUIT_FAILURES",
+    )
+    circuit_reset: int = Field(
+        default_factory=lambda: DYNACONF_OWM_SETTINGS.OWM_CIRCUIT_RESET,
+        env="OWM_CIRCUIT_RESET",
+    )
+    units: str = Field(
+        default_factory=lambda: DYNACONF_OWM_SETTINGS.OWM_UNITS, env="OWM_UNITS"
+    )
+    onecall_exclude: list[str] = Field(
+        default_factory=lambda: DYNACONF_OWM_SETTINGS.OWM_ONECALL_EXCLUDE,
+        env="OWM_ONECALL_EXCLUDE",
+    )
+    geocode_ttl: int = Field(
+        default_factory=lambda: DYNACONF_OWM_SETTINGS.OWM_GEOCODE_TTL,
+        env="OWM_GEOCODE_TTL",
+    )
+    geocode_stale_ttl: int = Field(
+        default_factory=lambda: DYNACONF_OWM_SETTINGS.OWM_GEOCODE_STALE_TTL,
+        env="OWM_GEOCODE_STALE_TTL",
+    )
+    geocode_negative_ttl: int = Field(
+        default_factory=lambda: DYNACONF_OWM_SETTINGS.OWM_GEOCODE_NEGATIVE_TTL,
+        env="OWM_GEOCODE_NEGATIVE_TTL",
+    )
+    poll_interval: int = Field(
+        default_factory=lambda: DYNACONF_OWM_SETTINGS.OWM_POLL_INTERVAL,
+        env="OWM_POLL_INTERVAL",
+    )
+    poll_jitter: int = Field(
+        default_factory=lambda: DYNACONF_OWM_SETTINGS.OWM_POLL_JITTER,
+        env="OWM_POLL_JITTER",
+    )
+
+
+@functools.cache
+def get_settings() -> AppSettings:
+    return AppSettings()
+
+
+@functools.cache
+def get_owm_settings() -> OpenweathermapSettings:
+    return OpenweathermapSettings()
+
 
+def __getattr__(name: str) -> t.Any:
+    ## `settings` & `owm_settings` are built the first time they're imported/accessed
+    if name == "settings":
+        return get_settings()
+    if name == "owm_settings":
+        return get_owm_settings()
 
-settings: AppSettings = AppSettings()
-owm_settings: OpenweathermapSettings = OpenweathermapSettings()
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
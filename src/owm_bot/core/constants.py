@@ -1,5 +1,22 @@
-OPENWEATHERMAP_BASE_URL: str = "https://api.openweathermap.org"
+import os
+
+## Point every request at another host, i.e. a local `owm-bot standin` server
+OPENWEATHERMAP_BASE_URL: str = os.environ.get(
+    "OWM_BASE_URL", "https://api.openweathermap.org"
+).rstrip("/")
 OPENWEATHERMAP_ONECALL_URL: str = f"{OPENWEATHERMAP_BASE_URL}/data/3.0/onecall"
 OPENWEATHERMAP_GEO_URL: str = f"{OPENWEATHERMAP_BASE_URL}/geo/1.0"
+## Parts of a One Call response that can be dropped with the 'exclude' param
+ONECALL_EXCLUDE_PARTS: list[str] = ["current", "minutely", "hourly", "daily", "alerts"]
+## Unit systems of the 'units' param. Temperatures are K/°C/°F, wind speed m/s/m/s/mph
+OWM_UNITS: list[str] = ["standard", "metric", "imperial"]
 
 PQ_ENGINE: str = "pyarrow"
+## Rows per Parquet row group. Smaller groups let filtered reads skip more of a file.
+PQ_ROW_GROUP_SIZE: int = 65_536
+## What an upsert does with a row whose primary key is already stored
+ON_DUPLICATE_MODES: list[str] = ["drop", "replace"]
+
+## Supported HTTP cache backends, & the endpoints with their own cache & TTL
+HTTP_CACHE_BACKENDS: list[str] = ["sqlite", "memory", "file"]
+HTTP_CACHE_ENDPOINTS: list[str] = ["geo", "weather"]
@@ -1,4 +1,33 @@
-from ._dependencies import (
-    hishel_filestorage_dependency,
-    owm_hishel_filestorage_dependency,
+from __future__ import annotations
+
+import typing as t
+
+from owm_bot.utils.lazy_imports import lazy_module
+
+if t.TYPE_CHECKING:
+    from ._dependencies import (
+        hishel_filestorage_dependency,
+        owm_hishel_filestorage_dependency,
+        HTTP_CACHE_ENDPOINTS,
+        owm_http_cache_location,
+        owm_hishel_storage_dependency,
+        owm_async_client_dependency,
+        owm_http_client_dependency,
+        owm_hishel_client_dependency,
+        owm_request_layer_dependency,
+    )
+
+__getattr__, __dir__ = lazy_module(
+    __name__,
+    attrs={
+        "hishel_filestorage_dependency": "._dependencies",
+        "owm_hishel_filestorage_dependency": "._dependencies",
+        "HTTP_CACHE_ENDPOINTS": "._dependencies",
+        "owm_http_cache_location": "._dependencies",
+        "owm_hishel_storage_dependency": "._dependencies",
+        "owm_async_client_dependency": "._dependencies",
+        "owm_http_client_dependency": "._dependencies",
+        "owm_hishel_client_dependency": "._dependencies",
+        "owm_request_layer_dependency": "._dependencies",
+    },
 )
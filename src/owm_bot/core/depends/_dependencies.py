@@ -6,9 +6,20 @@ from pathlib import Path
 
 log = logging.getLogger("owm_bot.core.depends")
 
+from owm_bot.core.config import settings
+from owm_bot.core.http._cache_storages import (
+    CACHE_BACKENDS,
+    BoundedFileStorage,
+    BoundedSQLiteStorage,
+    LRUInMemoryStorage,
+    open_sqlite_cache_connection,
+)
+from owm_bot.core.constants import HTTP_CACHE_ENDPOINTS
+from owm_bot.core.http._request_layer import RequestLayer, RetryPolicy
 from owm_bot.core.paths import CACHE_DIR, HTTP_CACHE_DIR, OWM_HTTP_CACHE_DIR
 
 import hishel
+import httpx
 from red_utils.ext import httpx_utils
 
 
@@ -30,3 +41,174 @@ def owm_hishel_filestorage_dependency(
     )
 
     return cache_storage
+
+
+## Storages are shared per (backend, endpoint, cache_dir), so every client reuses one
+#  SQLite connection/in-memory cache instead of opening a new one per request
+_http_cache_storages: dict[tuple[str, str, str], hishel.BaseStorage] = {}
+
+
+def owm_http_cache_location(
+    endpoint: str = "geo",
+    backend: str | None = None,
+    cache_dir: t.Union[str, Path] = OWM_HTTP_CACHE_DIR,
+) -> Path | None:
+    """Path an endpoint's cache is stored at. `None` for the in-memory backend."""
+    backend = backend or settings.http_cache_backend
+
+    match backend:
+        case "sqlite":
+            return Path(f"{cache_dir}/{endpoint}.sqlite")
+        case "file":
+            return Path(f"{cache_dir}/{endpoint}")
+        case _:
+            return None
+
+
+def owm_hishel_storage_dependency(
+    endpoint: str = "geo",
+    backend: str | None = None,
+    cache_dir: t.Union[str, Path] = OWM_HTTP_CACHE_DIR,
+) -> hishel.BaseStorage:
+    """Get the shared hishel storage for an endpoint, using the configured cache backend.
+
+    Params:
+        endpoint (str): 'geo' or 'weather'. Each endpoint has its own storage & TTL.
+        backend (str | None): 'sqlite', 'memory' or 'file'. Defaults to `settings.http_cache_backend`.
+        cache_dir (str | Path): Directory the 'sqlite' & 'file' backends store their cache in.
+    """
+    backend = backend or settings.http_cache_backend
+    assert backend in CACHE_BACKENDS, ValueError(
+        f"Invalid cache backend: '{backend}'. Must be one of {CACHE_BACKENDS}"
+    )
+    assert endpoint in HTTP_CACHE_ENDPOINTS, ValueError(
+        f"Invalid cache endpoint: '{endpoint}'. Must be one of {HTTP_CACHE_ENDPOINTS}"
+    )
+
+    key: tuple[str, str, str] = (backend, endpoint, f"{cache_dir}")
+    if key in _http_cache_storages:
+        return _http_cache_storages[key]
+
+    ttl: int = (
+        settings.http_cache_geo_ttl
+        if endpoint == "geo"
+        else settings.http_cache_weather_ttl
+    )
+    max_entries: int = settings.http_cache_max_entries
+    max_bytes: int = settings.http_cache_max_mb * 1024 * 1024
+    location: Path | None = owm_http_cache_location(
+        endpoint=endpoint, backend=backend, cache_dir=cache_dir
+    )
+
+    match backend:
+        case "sqlite":
+            cache_storage = BoundedSQLiteStorage(
+                connection=open_sqlite_cache_connection(db_file=location),
+                ttl=ttl,
+                max_entries=max_entries,
+                max_bytes=max_bytes,
+            )
+        case "memory":
+            cache_storage = LRUInMemoryStorage(ttl=ttl, capacity=max_entries)
+        case "file":
+            cache_storage = BoundedFileStorage(
+                base_path=location,
+                ttl=ttl,
+                max_entries=max_entries,
+                max_bytes=max_bytes,
+            )
+
+    _http_cache_storages[key] = cache_storage
+
+    return cache_storage
+
+
+def owm_async_client_dependency(
+    max_connections: int = 10,
+    max_keepalive_connections: int = 10,
+    keepalive_expiry: float = 30.0,
+    timeout: float = 10.0,
+) -> httpx.AsyncClient:
+    limits: httpx.Limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry,
+    )
+
+    client: httpx.AsyncClient = httpx.AsyncClient(
+        limits=limits, timeout=timeout, follow_redirects=True
+    )
+
+    return client
+
+
+def owm_http_client_dependency(
+    max_connections: int = 10,
+    max_keepalive_connections: int = 10,
+    keepalive_expiry: float = 30.0,
+    timeout: float = 10.0,
+) -> httpx.Client:
+    limits: httpx.Limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry,
+    )
+
+    client: httpx.Client = httpx.Client(
+        limits=limits, timeout=timeout, follow_redirects=True
+    )
+
+    return client
+
+
+def owm_hishel_client_dependency(
+    cache_storage: hishel.BaseStorage | None = None,
+    endpoint: str = "weather",
+    max_connections: int = 10,
+    max_keepalive_connections: int = 10,
+    keepalive_expiry: float = 30.0,
+    timeout: float = 10.0,
+) -> hishel.CacheClient:
+    """Pooled `httpx.Client` that serves responses from the endpoint's HTTP cache until they expire."""
+    if cache_storage is None:
+        cache_storage = owm_hishel_storage_dependency(endpoint=endpoint)
+
+    limits: httpx.Limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry,
+    )
+
+    client: hishel.CacheClient = hishel.CacheClient(
+        storage=cache_storage,
+        controller=hishel.Controller(force_cache=True),
+        limits=limits,
+        timeout=timeout,
+        follow_redirects=True,
+    )
+
+    return client
+
+
+## Every OWM call in the process shares one layer, so budgets are per API key, not per caller
+_request_layer: RequestLayer | None = None
+
+
+def owm_request_layer_dependency() -> RequestLayer:
+    """Get the shared `RequestLayer`, built from the `owm_*` rate limit & retry settings."""
+    global _request_layer
+
+    if _request_layer is None:
+        ## Imported here, building `owm_settings` needs the API key in the secrets file/env
+        from owm_bot.core.config import owm_settings
+
+        _request_layer = RequestLayer(
+            calls_per_minute=owm_settings.calls_per_minute or None,
+            calls_per_day=owm_settings.calls_per_day or None,
+            retry=RetryPolicy(max_attempts=owm_settings.max_attempts),
+            failure_threshold=owm_settings.circuit_failures,
+            reset_timeout=owm_settings.circuit_reset,
+            max_wait=owm_settings.max_wait,
+        )
+
+    return _request_layer
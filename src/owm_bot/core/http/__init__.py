@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import typing as t
+
+from owm_bot.utils.lazy_imports import lazy_module
+
+if t.TYPE_CHECKING:
+    from ._ratelimit import AsyncTokenBucket
+    from ._request_layer import (
+        CIRCUIT_CLOSED,
+        CIRCUIT_HALF_OPEN,
+        CIRCUIT_OPEN,
+        BudgetExhaustedError,
+        CircuitBreaker,
+        CircuitOpenError,
+        ONLY_IF_CACHED,
+        KeyBudget,
+        RequestLayer,
+        RequestWaitError,
+        RetryPolicy,
+        parse_retry_after,
+    )
+    from ._singleflight import STRIP_PARAMS, SingleFlight, request_key
+    from ._cache_storages import (
+        CACHE_BACKENDS,
+        BoundedFileStorage,
+        BoundedSQLiteStorage,
+        HttpCacheStats,
+        LRUCache,
+        LRUInMemoryStorage,
+        file_cache_stats,
+        open_sqlite_cache_connection,
+        prune_file_cache,
+        prune_sqlite_cache,
+        sqlite_cache_stats,
+    )
+
+__getattr__, __dir__ = lazy_module(
+    __name__,
+    attrs={
+        "AsyncTokenBucket": "._ratelimit",
+        "CIRCUIT_CLOSED": "._request_layer",
+        "CIRCUIT_HALF_OPEN": "._request_layer",
+        "CIRCUIT_OPEN": "._request_layer",
+        "BudgetExhaustedError": "._request_layer",
+        "CircuitBreaker": "._request_layer",
+        "CircuitOpenError": "._request_layer",
+        "KeyBudget": "._request_layer",
+        "ONLY_IF_CACHED": "._request_layer",
+        "RequestLayer": "._request_layer",
+        "RequestWaitError": "._request_layer",
+        "RetryPolicy": "._request_layer",
+        "parse_retry_after": "._request_layer",
+        "STRIP_PARAMS": "._singleflight",
+        "SingleFlight": "._singleflight",
+        "request_key": "._singleflight",
+        "CACHE_BACKENDS": "._cache_storages",
+        "BoundedFileStorage": "._cache_storages",
+        "BoundedSQLiteStorage": "._cache_storages",
+        "HttpCacheStats": "._cache_storages",
+        "LRUCache": "._cache_storages",
+        "LRUInMemoryStorage": "._cache_storages",
+        "file_cache_stats": "._cache_storages",
+        "open_sqlite_cache_connection": "._cache_storages",
+        "prune_file_cache": "._cache_storages",
+        "prune_sqlite_cache": "._cache_storages",
+        "sqlite_cache_stats": "._cache_storages",
+    },
+)
@@ -0,0 +1,340 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+import logging
+from pathlib import Path
+import sqlite3
+import threading
+import time
+import typing as t
+
+log = logging.getLogger("owm_bot.core.http.cache_storages")
+
+from owm_bot.core.constants import HTTP_CACHE_BACKENDS as CACHE_BACKENDS
+
+import hishel
+
+
+@dataclass
+class HttpCacheStats:
+    backend: str
+    endpoint: str
+    location: str | None = None
+    entries: int = 0
+    size_bytes: int = 0
+    oldest: float | None = None
+    newest: float | None = None
+
+
+class LRUCache:
+    """Least-recently-used replacement for hishel's LFUCache, with the same interface."""
+
+    def __init__(self, capacity: int = 128):
+        if capacity <= 0:
+            raise ValueError("Capacity must be positive")
+
+        self.capacity = capacity
+        self.cache: OrderedDict[t.Any, t.Any] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    def __iter__(self) -> t.Iterator[t.Any]:
+        ## Iterate a snapshot, hishel calls get() (which reorders) while iterating
+        yield from list(self.cache)
+
+    def get(self, key: t.Any) -> t.Any:
+        if key not in self.cache:
+            raise KeyError(f"Key {key} not found")
+
+        self.cache.move_to_end(key)
+
+        return self.cache[key]
+
+    def put(self, key: t.Any, value: t.Any) -> None:
+        if key in self.cache:
+            self.cache.move_to_end(key)
+        elif len(self.cache) >= self.capacity:
+            self.cache.popitem(last=False)
+
+        self.cache[key] = value
+
+    def remove_key(self, key: t.Any) -> None:
+        self.cache.pop(key, None)
+
+
+class LRUInMemoryStorage(hishel.InMemoryStorage):
+    def __init__(
+        self,
+        serializer: hishel.BaseSerializer | None = None,
+        ttl: t.Union[int, float, None] = None,
+        capacity: int = 128,
+    ):
+        super().__init__(serializer=serializer, ttl=ttl, capacity=capacity)
+        self._cache = LRUCache(capacity=capacity)
+
+
+def open_sqlite_cache_connection(
+    db_file: t.Union[str, Path] = None, timeout: float = 5.0
+) -> sqlite3.Connection:
+    """Open a SQLite connection tuned for a shared HTTP cache.
+
+    WAL mode lets several readers run alongside a writer, so pollers in different
+    processes/threads don't block each other on the cache.
+    """
+    db_file: Path = Path(f"{db_file}")
+    db_file.parent.mkdir(parents=True, exist_ok=True)
+
+    try:
+        conn: sqlite3.Connection = sqlite3.connect(
+            f"{db_file}", timeout=timeout, check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    except Exception as exc:
+        msg = Exception(
+            f"Unhandled exception opening SQLite cache database '{db_file}'. Details: {exc}"
+        )
+        log.error(msg)
+
+        raise exc
+
+    return conn
+
+
+def _sqlite_has_cache_table(conn: sqlite3.Connection) -> bool:
+    return (
+        conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='cache'"
+        ).fetchone()
+        is not None
+    )
+
+
+def sqlite_cache_stats(
+    conn: sqlite3.Connection = None, endpoint: str = None, location: str | None = None
+) -> HttpCacheStats:
+    stats: HttpCacheStats = HttpCacheStats(
+        backend="sqlite", endpoint=endpoint, location=location
+    )
+    if not _sqlite_has_cache_table(conn):
+        return stats
+
+    entries, size_bytes, oldest, newest = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0), MIN(date_created), MAX(date_created) FROM cache"
+    ).fetchone()
+    stats.entries, stats.size_bytes = entries, size_bytes
+    stats.oldest, stats.newest = oldest, newest
+
+    return stats
+
+
+def prune_sqlite_cache(
+    conn: sqlite3.Connection = None,
+    max_entries: int | None = None,
+    max_bytes: int | None = None,
+    ttl: t.Union[int, float, None] = None,
+    lock: threading.Lock | None = None,
+) -> int:
+    """Evict expired entries, then the oldest entries until the cache fits the limits.
+
+    Returns:
+        (int): Number of entries removed.
+
+    """
+    if not _sqlite_has_cache_table(conn):
+        return 0
+
+    lock = lock or threading.Lock()
+    removed: int = 0
+
+    with lock:
+        if ttl is not None:
+            removed += conn.execute(
+                "DELETE FROM cache WHERE date_created + ? < ?", [ttl, time.time()]
+            ).rowcount
+
+        if max_entries is not None:
+            removed += conn.execute(
+                "DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache ORDER BY date_created DESC LIMIT -1 OFFSET ?)",
+                [max_entries],
+            ).rowcount
+
+        if max_bytes is not None:
+            ## Keep the newest entries whose running total fits in max_bytes
+            removed += conn.execute(
+                """
+                DELETE FROM cache WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, SUM(LENGTH(data)) OVER (
+                            ORDER BY date_created DESC ROWS UNBOUNDED PRECEDING
+                        ) AS running_size
+                        FROM cache
+                    ) WHERE running_size > ?
+                )
+                """,
+                [max_bytes],
+            ).rowcount
+
+        conn.commit()
+
+    if removed:
+        log.debug(f"Evicted {removed} HTTP cache entr(y/ies) from SQLite cache")
+
+    return removed
+
+
+class BoundedSQLiteStorage(hishel.SQLiteStorage):
+    """hishel `SQLiteStorage` that evicts the oldest entries past a size limit.
+
+    Limits are checked every `prune_every` stores, to keep writes cheap.
+    """
+
+    def __init__(
+        self,
+        serializer: hishel.BaseSerializer | None = None,
+        connection: sqlite3.Connection | None = None,
+        ttl: t.Union[int, float, None] = None,
+        max_entries: int | None = None,
+        max_bytes: int | None = None,
+        prune_every: int = 50,
+    ):
+        super().__init__(serializer=serializer, connection=connection, ttl=ttl)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.prune_every = prune_every
+
+        self._stores_since_prune: int = 0
+
+    def store(self, key, response, request, metadata=None) -> None:
+        super().store(key, response, request, metadata)
+
+        self._stores_since_prune += 1
+        if self._stores_since_prune >= self.prune_every:
+            self._stores_since_prune = 0
+            self.prune()
+
+    def close(self) -> None:
+        ## hishel closes the storage along with each client. The connection is shared by
+        #  every client using this storage, so keep it open until close_connection()
+        return
+
+    def close_connection(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+            self._setup_completed = False
+
+    def prune(self) -> int:
+        self._setup()
+
+        return prune_sqlite_cache(
+            conn=self._connection,
+            max_entries=self.max_entries,
+            max_bytes=self.max_bytes,
+            ttl=self._ttl,
+            lock=self._lock,
+        )
+
+
+def _cache_files(cache_dir: Path) -> list[tuple[Path, t.Any]]:
+    if not cache_dir.is_dir():
+        return []
+
+    return [
+        (f, f.stat())
+        for f in cache_dir.iterdir()
+        if f.is_file() and not f.name.startswith(".")
+    ]
+
+
+def file_cache_stats(
+    cache_dir: t.Union[str, Path] = None, endpoint: str = None
+) -> HttpCacheStats:
+    cache_dir: Path = Path(f"{cache_dir}")
+    files = _cache_files(cache_dir)
+    mtimes: list[float] = [st.st_mtime for _, st in files]
+
+    return HttpCacheStats(
+        backend="file",
+        endpoint=endpoint,
+        location=f"{cache_dir}",
+        entries=len(files),
+        size_bytes=sum(st.st_size for _, st in files),
+        oldest=min(mtimes) if mtimes else None,
+        newest=max(mtimes) if mtimes else None,
+    )
+
+
+def prune_file_cache(
+    cache_dir: t.Union[str, Path] = None,
+    max_entries: int | None = None,
+    max_bytes: int | None = None,
+    ttl: t.Union[int, float, None] = None,
+) -> int:
+    cache_dir: Path = Path(f"{cache_dir}")
+    ## Newest first, so everything past the limits is the oldest
+    files = sorted(_cache_files(cache_dir), key=lambda f: f[1].st_mtime, reverse=True)
+
+    now: float = time.time()
+    kept_bytes: int = 0
+    removed: int = 0
+
+    for idx, (f, st) in enumerate(files):
+        kept_bytes += st.st_size
+        if (
+            (ttl is not None and now - st.st_mtime > ttl)
+            or (max_entries is not None and idx >= max_entries)
+            or (max_bytes is not None and kept_bytes > max_bytes)
+        ):
+            f.unlink(missing_ok=True)
+            removed += 1
+
+    if removed:
+        log.debug(f"Evicted {removed} HTTP cache file(s) from '{cache_dir}'")
+
+    return removed
+
+
+class BoundedFileStorage(hishel.FileStorage):
+    """hishel `FileStorage` that evicts the oldest files past a size limit."""
+
+    def __init__(
+        self,
+        serializer: hishel.BaseSerializer | None = None,
+        base_path: t.Union[str, Path, None] = None,
+        ttl: t.Union[int, float, None] = None,
+        check_ttl_every: t.Union[int, float] = 60,
+        max_entries: int | None = None,
+        max_bytes: int | None = None,
+        prune_every: int = 50,
+    ):
+        super().__init__(
+            serializer=serializer,
+            base_path=Path(f"{base_path}") if base_path is not None else None,
+            ttl=ttl,
+            check_ttl_every=check_ttl_every,
+        )
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.prune_every = prune_every
+
+        self._stores_since_prune: int = 0
+
+    def store(self, key, response, request, metadata=None) -> None:
+        super().store(key, response, request, metadata)
+
+        self._stores_since_prune += 1
+        if self._stores_since_prune >= self.prune_every:
+            self._stores_since_prune = 0
+            self.prune()
+
+    def prune(self) -> int:
+        with self._lock:
+            return prune_file_cache(
+                cache_dir=self._base_path,
+                max_entries=self.max_entries,
+                max_bytes=self.max_bytes,
+                ttl=self._ttl,
+            )
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+log = logging.getLogger("owm_bot.core.http.ratelimit")
+
+
+class AsyncTokenBucket:
+    """Token bucket rate limiter for asyncio tasks.
+
+    Tokens refill continuously at `rate` per `period` seconds, up to `capacity`.
+    Each `acquire()` takes one token, sleeping until one is available.
+
+    Params:
+        rate (int): Number of calls allowed per `period`, i.e. an OWM plan's calls/minute.
+        period (float): Length of the refill period, in seconds.
+        capacity (int | None): Maximum burst size. Defaults to `rate`.
+    """
+
+    def __init__(
+        self, rate: int = 60, period: float = 60.0, capacity: int | None = None
+    ):
+        assert rate and rate > 0, ValueError("rate must be a positive integer")
+        assert period and period > 0, ValueError("period must be a positive number")
+
+        self.rate = rate
+        self.period = period
+        self.capacity = capacity or rate
+
+        self._tokens: float = float(self.capacity)
+        self._updated: float = time.monotonic()
+        self._lock: asyncio.Lock | None = None
+
+    @property
+    def fill_rate(self) -> float:
+        return self.rate / self.period
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.fill_rate
+        )
+        self._updated = now
+
+    async def acquire(self) -> None:
+        ## Create the lock lazily, so the bucket can be built outside a running loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                wait: float = (1 - self._tokens) / self.fill_rate
+                log.debug(f"Rate limit reached, waiting {wait:.2f}s for a token")
+                await asyncio.sleep(wait)
+                self._refill()
+
+            self._tokens -= 1
@@ -0,0 +1,629 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+import logging
+import random
+import threading
+import time
+import typing as t
+
+log = logging.getLogger("owm_bot.core.http.request_layer")
+
+from owm_bot.core import instrument
+
+from ._singleflight import SingleFlight
+
+import httpx
+
+## Circuit breaker states
+CIRCUIT_CLOSED: str = "closed"
+CIRCUIT_OPEN: str = "open"
+CIRCUIT_HALF_OPEN: str = "half_open"
+## Request headers asking an HTTP cache (hishel) for a stored response, never the network.
+#  A cache without one answers 504
+ONLY_IF_CACHED: dict[str, str] = {"Cache-Control": "only-if-cached"}
+
+_DAY: int = 86400
+
+
+class RequestWaitError(RuntimeError):
+    """A request would have to wait longer than the layer's `max_wait` to be sent.
+
+    Params:
+        retry_after (float): Seconds until the request could be sent.
+    """
+
+    def __init__(self, message: str = None, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class BudgetExhaustedError(RequestWaitError):
+    """The API key's calls/minute or calls/day budget is used up for longer than `max_wait`."""
+
+
+class CircuitOpenError(RequestWaitError):
+    """The endpoint's circuit breaker is open for longer than `max_wait`."""
+
+
+def parse_retry_after(value: str | None = None) -> float | None:
+    """Seconds to wait from a `Retry-After` header, in seconds or as an HTTP date."""
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        log.debug(f"Ignoring unparseable Retry-After header: '{value}'")
+
+        return None
+
+
+@dataclass
+class RetryPolicy:
+    """When & how long to wait before sending a failed request again.
+
+    Params:
+        max_attempts (int): Times a request is sent, including the first attempt.
+        backoff (float): Seconds waited before the first retry, doubled for each retry after.
+        max_backoff (float): Most seconds waited between two attempts.
+        jitter (float): Share (0-1) of each backoff that is randomized, so clients that
+            failed together don't retry together.
+        retry_statuses (tuple[int, ...]): Response status codes worth retrying.
+    """
+
+    max_attempts: int = 5
+    backoff: float = 1.0
+    max_backoff: float = 60.0
+    jitter: float = 0.5
+    retry_statuses: tuple[int, ...] = (429, 500, 502, 503, 504)
+
+    def delay(self, attempt: int = 1) -> float:
+        """Seconds to wait after failed attempt number `attempt` (starting at 1)."""
+        backoff: float = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+
+        return backoff * (1 - self.jitter * random.random())
+
+
+class KeyBudget:
+    """Calls/minute & calls/day budget of one API key, shared by sync & async callers.
+
+    The minute budget is a token bucket. It adapts to the server: a 429 empties the
+    bucket, pauses the key until `Retry-After` & halves the refill rate, which then
+    recovers by one call/minute per successful response. The day budget counts calls per
+    UTC day. Responses served from an HTTP cache are refunded.
+
+    Params:
+        calls_per_minute (int | None): Calls allowed per minute. `None` is unlimited.
+        calls_per_day (int | None): Calls allowed per UTC day. `None` is unlimited.
+    """
+
+    def __init__(
+        self, calls_per_minute: int | None = None, calls_per_day: int | None = None
+    ):
+        self.calls_per_minute = calls_per_minute
+        self.calls_per_day = calls_per_day
+
+        self.rate: float | None = float(calls_per_minute) if calls_per_minute else None
+        self._tokens: float = float(calls_per_minute or 0)
+        self._updated: float = time.monotonic()
+        self._paused_until: float = 0.0
+        self._day: int = int(time.time() // _DAY)
+        self._day_calls: int = 0
+        self._lock: threading.Lock = threading.Lock()
+
+    @property
+    def day_calls(self) -> int:
+        return self._day_calls
+
+    def _refill(self, now: float) -> None:
+        if self.rate is None:
+            return
+
+        self._tokens = min(
+            float(self.calls_per_minute),
+            self._tokens + (now - self._updated) * self.rate / 60,
+        )
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Take one call from the budget, or return the seconds until one is available.
+
+        Returns:
+            (float): `0` when the call was taken & can be sent now.
+
+        """
+        now: float = time.monotonic()
+        with self._lock:
+            if now < self._paused_until:
+                return self._paused_until - now
+
+            day: int = int(time.time() // _DAY)
+            if day != self._day:
+                self._day, self._day_calls = day, 0
+            if self.calls_per_day and self._day_calls >= self.calls_per_day:
+                return (day + 1) * _DAY - time.time()
+
+            self._refill(now)
+            if self.rate is not None and self._tokens < 1:
+                return (1 - self._tokens) * 60 / self.rate
+
+            if self.rate is not None:
+                self._tokens -= 1
+            self._day_calls += 1
+
+            return 0.0
+
+    def refund(self) -> None:
+        """Give back a call that never reached the server, i.e. an HTTP cache hit."""
+        with self._lock:
+            if self.rate is not None:
+                self._tokens = min(float(self.calls_per_minute), self._tokens + 1)
+            self._day_calls = max(0, self._day_calls - 1)
+
+    def throttle(self, retry_after: float = None) -> None:
+        """Back off after a 429: pause for `retry_after` seconds & halve the rate."""
+        with self._lock:
+            self._paused_until = max(
+                self._paused_until, time.monotonic() + (retry_after or 0)
+            )
+            if self.rate is not None:
+                self._tokens = 0.0
+                self.rate = max(1.0, self.rate / 2)
+                log.debug(f"Throttled, calls/minute reduced to {self.rate:.0f}")
+
+    def recover(self) -> None:
+        """Raise a throttled rate by one call/minute, up to `calls_per_minute`."""
+        if self.rate is None or self.rate >= self.calls_per_minute:
+            return
+
+        with self._lock:
+            self.rate = min(float(self.calls_per_minute), self.rate + 1)
+
+
+class CircuitBreaker:
+    """Stops sending requests to an endpoint that keeps failing.
+
+    After `failure_threshold` failures in a row (5xx responses or connection errors)
+    the circuit opens & requests wait. After `reset_timeout` seconds one trial request
+    is let through: if it succeeds the circuit closes, if it fails it opens again. A
+    trial that ends any other way (i.e. it is cancelled) is abandoned, so the next
+    request becomes the trial.
+
+    Params:
+        failure_threshold (int): Consecutive failures that open the circuit.
+        reset_timeout (float): Seconds the circuit stays open before a trial request.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        assert failure_threshold > 0, ValueError("failure_threshold must be positive")
+
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state: str = CIRCUIT_CLOSED
+        self.failures: int = 0
+        self._opened_at: float = 0.0
+        self._trial_in_flight: bool = False
+        self._lock: threading.Lock = threading.Lock()
+
+    def wait_time(self) -> float:
+        """Seconds until a request may be sent. `0` means it may be sent now."""
+        with self._lock:
+            if self.state == CIRCUIT_CLOSED:
+                return 0.0
+
+            now: float = time.monotonic()
+            if self.state == CIRCUIT_OPEN:
+                remaining: float = self._opened_at + self.reset_timeout - now
+                if remaining > 0:
+                    return remaining
+                self.state = CIRCUIT_HALF_OPEN
+                self._trial_in_flight = False
+
+            if self._trial_in_flight:
+                ## Check again soon, the trial request decides what happens next
+                return min(1.0, self.reset_timeout)
+            self._trial_in_flight = True
+
+            return 0.0
+
+    def abandon_trial(self) -> None:
+        """Let another request through as the trial, after one ended without a response."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != CIRCUIT_CLOSED:
+                log.info("Circuit closed, requests are succeeding again")
+            self.state = CIRCUIT_CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == CIRCUIT_HALF_OPEN or (
+                self.state == CIRCUIT_CLOSED and self.failures >= self.failure_threshold
+            ):
+                log.warning(
+                    f"Circuit opened after {self.failures} failure(s), pausing requests for {self.reset_timeout}s"
+                )
+                self.state = CIRCUIT_OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+class RequestLayer:
+    """Sends every OWM request: rate limits, retries & circuit breaking in one place.
+
+    Callers pass a function that sends the request once, the layer decides when to call
+    it & how often. Before each attempt it waits for the endpoint's circuit breaker &
+    the API key's budget. 429s pause the key for `Retry-After` (or a backoff) and are
+    sent again, 5xx responses & connection errors are retried with exponential backoff
+    & jitter. A response is returned as soon as it can't or shouldn't be retried, so
+    callers still see the last 4xx/5xx after `retry.max_attempts`.
+
+    Waits are bounded by `max_wait`: a request that would wait longer raises a
+    `RequestWaitError` instead, i.e. once the day's budget is used up. Callers behind
+    an HTTP cache can pass a `cached` lookup, asked before waiting or raising, so
+    responses the cache holds are still served while the budget or circuit blocks.
+
+    Callers coalesce identical concurrent requests with `single_flight`, keyed on
+    `request_key()`, so only one of them is sent & counted against the budget.
+
+    Params:
+        calls_per_minute (int | None): Per API key. `None` is unlimited.
+        calls_per_day (int | None): Per API key & UTC day. `None` is unlimited.
+        retry (RetryPolicy | None): Retry attempts & backoff. Defaults to `RetryPolicy()`.
+        failure_threshold (int): Consecutive failures that open an endpoint's circuit.
+        reset_timeout (float): Seconds an open circuit waits before a trial request.
+        max_wait (float): Most seconds a request waits for a budget or circuit.
+    """
+
+    def __init__(
+        self,
+        calls_per_minute: int | None = None,
+        calls_per_day: int | None = None,
+        retry: RetryPolicy | None = None,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        max_wait: float = 300.0,
+    ):
+        self.calls_per_minute = calls_per_minute
+        self.calls_per_day = calls_per_day
+        self.retry = retry or RetryPolicy()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_wait = max_wait
+
+        self.single_flight: SingleFlight = SingleFlight()
+
+        self._budgets: dict[str, KeyBudget] = {}
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    def budget(self, api_key: str | None = None) -> KeyBudget:
+        with self._lock:
+            budget: KeyBudget | None = self._budgets.get(api_key or "")
+            if budget is None:
+                budget = self._budgets[api_key or ""] = KeyBudget(
+                    calls_per_minute=self.calls_per_minute,
+                    calls_per_day=self.calls_per_day,
+                )
+
+        return budget
+
+    def breaker(self, endpoint: str = None) -> CircuitBreaker:
+        with self._lock:
+            breaker: CircuitBreaker | None = self._breakers.get(endpoint)
+            if breaker is None:
+                breaker = self._breakers[endpoint] = CircuitBreaker(
+                    failure_threshold=self.failure_threshold,
+                    reset_timeout=self.reset_timeout,
+                )
+
+        return breaker
+
+    def _next_wait(self, budget: KeyBudget, breaker: CircuitBreaker) -> float:
+        """Seconds to wait before sending, raising when that is more than `max_wait`.
+
+        Returns `0` once the request holds a call from the budget & may be sent.
+        """
+        wait: float = budget.reserve()
+        if wait > self.max_wait:
+            raise BudgetExhaustedError(
+                f"Request budget is used up for another {wait:.1f}s", retry_after=wait
+            )
+        if wait:
+            instrument.HTTP_WAIT_SECONDS.inc(wait, reason="budget")
+
+            return wait
+
+        ## Asked last, so a half-open circuit's trial request is never held up by the budget
+        wait = breaker.wait_time()
+        if wait:
+            budget.refund()
+        if wait > self.max_wait:
+            raise CircuitOpenError(
+                f"Circuit is open for another {wait:.1f}s", retry_after=wait
+            )
+        if wait:
+            instrument.HTTP_WAIT_SECONDS.inc(wait, reason="circuit")
+
+        return wait
+
+    def _record_cached(
+        self, res: httpx.Response, endpoint: str, cache: str | None, started: float
+    ) -> httpx.Response | None:
+        """`res` if the HTTP cache answered it, or `None` for a miss (a 504)."""
+        if not res.extensions.get("from_cache"):
+            return None
+
+        instrument.record_http_response(
+            endpoint=endpoint,
+            response=res,
+            seconds=time.perf_counter() - started,
+            cache=cache,
+        )
+        log.debug(f"Served {endpoint} request from cache instead of waiting to send it")
+
+        return res
+
+    def _from_cache(
+        self,
+        cached: t.Callable[[], httpx.Response],
+        endpoint: str,
+        cache: str | None,
+    ) -> httpx.Response | None:
+        """Ask the HTTP cache for a stored response. A failed lookup is only a miss."""
+        started: float = time.perf_counter()
+        try:
+            res: httpx.Response = cached()
+        except Exception as exc:
+            log.debug(f"Could not look up {endpoint} request in cache. Details: {exc}")
+
+            return None
+
+        return self._record_cached(res, endpoint, cache, started)
+
+    async def _from_cache_async(
+        self,
+        cached: t.Callable[[], t.Awaitable[httpx.Response]],
+        endpoint: str,
+        cache: str | None,
+    ) -> httpx.Response | None:
+        """Async variant of `_from_cache()`."""
+        started: float = time.perf_counter()
+        try:
+            res: httpx.Response = await cached()
+        except Exception as exc:
+            log.debug(f"Could not look up {endpoint} request in cache. Details: {exc}")
+
+            return None
+
+        return self._record_cached(res, endpoint, cache, started)
+
+    def _after_response(
+        self,
+        res: httpx.Response,
+        attempt: int,
+        endpoint: str,
+        budget: KeyBudget,
+        breaker: CircuitBreaker,
+    ) -> float | None:
+        """Update budgets & the breaker. Returns seconds to wait before a retry, or `None`."""
+        if res.extensions.get("from_cache"):
+            budget.refund()
+
+            return None
+
+        status: int = res.status_code
+        if status >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+        if status == 429:
+            retry_after: float | None = parse_retry_after(
+                res.headers.get("Retry-After")
+            )
+            budget.throttle(
+                retry_after if retry_after is not None else self.retry.delay(attempt)
+            )
+        elif status < 400:
+            budget.recover()
+
+        if (
+            status not in self.retry.retry_statuses
+            or attempt >= self.retry.max_attempts
+        ):
+            return None
+
+        instrument.HTTP_RETRIES.inc(endpoint=endpoint, reason=f"{status}")
+        log.warning(
+            f"[{status}: {res.reason_phrase}] from {endpoint}, retrying (attempt {attempt}/{self.retry.max_attempts})"
+        )
+
+        if status == 429:
+            ## Waited out on the key's budget, which now holds the pause
+            return 0.0
+
+        retry_after = parse_retry_after(res.headers.get("Retry-After"))
+
+        return self.retry.delay(attempt) if retry_after is None else retry_after
+
+    def _after_error(
+        self, exc: Exception, attempt: int, endpoint: str, breaker: CircuitBreaker
+    ) -> float:
+        """Seconds to wait before retrying a request that raised. Re-raises when out of attempts."""
+        breaker.record_failure()
+        if attempt >= self.retry.max_attempts:
+            raise exc
+
+        instrument.HTTP_RETRIES.inc(endpoint=endpoint, reason="error")
+        log.warning(
+            f"{type(exc).__name__} from {endpoint}, retrying (attempt {attempt}/{self.retry.max_attempts}). Details: {exc}"
+        )
+
+        return self.retry.delay(attempt)
+
+    def send(
+        self,
+        send: t.Callable[[], httpx.Response] = None,
+        api_key: str | None = None,
+        endpoint: str = None,
+        cache: str | None = None,
+        cached: t.Callable[[], httpx.Response] | None = None,
+    ) -> httpx.Response:
+        """Send a request with `send()`, waiting & retrying as needed.
+
+        Params:
+            send (Callable[[], httpx.Response]): Sends the request once.
+            api_key (str | None): Key whose budget the request is counted against.
+            endpoint (str): Short endpoint name for metrics, logs & the circuit breaker,
+                i.e. 'onecall' or 'geo_direct'.
+            cache (str | None): Name of the HTTP cache in front of the request, for metrics.
+            cached (Callable[[], httpx.Response] | None): Sends the request to the HTTP
+                cache only, i.e. with `ONLY_IF_CACHED` headers. Asked once, when the
+                budget or circuit would hold the request up, & returned on a hit without
+                counting against the budget.
+
+        Returns:
+            (httpx.Response): The first response that isn't retried.
+
+        """
+        budget: KeyBudget = self.budget(api_key)
+        breaker: CircuitBreaker = self.breaker(endpoint)
+
+        attempt: int = 0
+        ask_cache: bool = cached is not None
+        while True:
+            try:
+                wait: float = self._next_wait(budget, breaker)
+            except RequestWaitError:
+                if ask_cache:
+                    res: httpx.Response | None = self._from_cache(
+                        cached, endpoint, cache
+                    )
+                    if res is not None:
+                        return res
+
+                raise
+            if wait and ask_cache:
+                ## Asked once, a miss now is a miss until the response is stored
+                ask_cache = False
+                res: httpx.Response | None = self._from_cache(cached, endpoint, cache)
+                if res is not None:
+                    return res
+            if wait:
+                time.sleep(wait)
+
+                continue
+
+            attempt += 1
+            started: float = time.perf_counter()
+            try:
+                res: httpx.Response = send()
+            except httpx.TransportError as exc:
+                instrument.record_http_response(
+                    endpoint=endpoint, seconds=time.perf_counter() - started
+                )
+                time.sleep(self._after_error(exc, attempt, endpoint, breaker))
+
+                continue
+            except BaseException:
+                ## Never judged as a success or failure, so don't hold up the circuit
+                breaker.abandon_trial()
+
+                raise
+            instrument.record_http_response(
+                endpoint=endpoint,
+                response=res,
+                seconds=time.perf_counter() - started,
+                cache=cache,
+            )
+
+            retry_wait: float | None = self._after_response(
+                res, attempt, endpoint, budget, breaker
+            )
+            if retry_wait is None:
+                return res
+            if retry_wait:
+                time.sleep(retry_wait)
+
+    async def send_async(
+        self,
+        send: t.Callable[[], t.Awaitable[httpx.Response]] = None,
+        api_key: str | None = None,
+        endpoint: str = None,
+        cache: str | None = None,
+        cached: t.Callable[[], t.Awaitable[httpx.Response]] | None = None,
+    ) -> httpx.Response:
+        """Async variant of `send()`. Waits are awaited, so other requests keep going."""
+        budget: KeyBudget = self.budget(api_key)
+        breaker: CircuitBreaker = self.breaker(endpoint)
+
+        attempt: int = 0
+        ask_cache: bool = cached is not None
+        while True:
+            try:
+                wait: float = self._next_wait(budget, breaker)
+            except RequestWaitError:
+                if ask_cache:
+                    res: httpx.Response | None = await self._from_cache_async(
+                        cached, endpoint, cache
+                    )
+                    if res is not None:
+                        return res
+
+                raise
+            if wait and ask_cache:
+                ask_cache = False
+                res: httpx.Response | None = await self._from_cache_async(
+                    cached, endpoint, cache
+                )
+                if res is not None:
+                    return res
+            if wait:
+                await asyncio.sleep(wait)
+
+                continue
+
+            attempt += 1
+            started: float = time.perf_counter()
+            try:
+                res: httpx.Response = await send()
+            except httpx.TransportError as exc:
+                instrument.record_http_response(
+                    endpoint=endpoint, seconds=time.perf_counter() - started
+                )
+                await asyncio.sleep(self._after_error(exc, attempt, endpoint, breaker))
+
+                continue
+            except BaseException:
+                ## Never judged as a success or failure, so don't hold up the circuit
+                breaker.abandon_trial()
+
+                raise
+            instrument.record_http_response(
+                endpoint=endpoint,
+                response=res,
+                seconds=time.perf_counter() - started,
+                cache=cache,
+            )
+
+            retry_wait: float | None = self._after_response(
+                res, attempt, endpoint, budget, breaker
+            )
+            if retry_wait is None:
+                return res
+            if retry_wait:
+                await asyncio.sleep(retry_wait)
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass, field
+import logging
+import threading
+import typing as t
+
+log = logging.getLogger("owm_bot.core.http.singleflight")
+
+from owm_bot.core import instrument
+
+T = t.TypeVar("T")
+
+## Params that don't change a response, left out of request keys
+STRIP_PARAMS: tuple[str, ...] = ("appid",)
+
+
+def request_key(url: str = None, params: dict | None = None) -> str:
+    """Build a key for a request, ignoring param order, case & the API key."""
+    normalised: list[str] = [
+        f"{k}={f'{v}'.strip().casefold()}"
+        for k, v in sorted((params or {}).items())
+        if k not in STRIP_PARAMS and v is not None
+    ]
+
+    return f"{url.rstrip('/')}?{'&'.join(normalised)}"
+
+
+@dataclass
+class _Call:
+    done: threading.Event = field(default_factory=threading.Event)
+    result: t.Any = None
+    error: BaseException | None = None
+
+
+class SingleFlight:
+    """Coalesce identical concurrent calls into one.
+
+    The first caller for a key runs the function, callers that arrive while it is
+    running wait for it & get the same result (or exception). Once the call finishes
+    the key is forgotten, so nothing is cached: a later call runs the function again.
+
+    Sync & async callers are tracked separately, async calls are only shared within
+    one event loop.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, _Call] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._calls) + len(self._tasks)
+
+    def do(
+        self, key: str = None, fn: t.Callable[[], T] = None, endpoint: str = None
+    ) -> T:
+        """Run `fn()`, or wait for the call already running for `key` & share its result.
+
+        Params:
+            key (str): Identifies the call, i.e. from `request_key()`.
+            fn (Callable[[], T]): Makes the call.
+            endpoint (str): Endpoint name for metrics.
+
+        """
+        with self._lock:
+            call: _Call | None = self._calls.get(key)
+            leader: bool = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            instrument.HTTP_COALESCED.inc(endpoint=endpoint)
+            log.debug(f"Waiting on in-flight request '{key}'")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+
+            return call.result
+
+        try:
+            call.result = fn()
+
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+
+            raise exc
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(
+        self,
+        key: str = None,
+        fn: t.Callable[[], t.Awaitable[T]] = None,
+        endpoint: str = None,
+    ) -> T:
+        """Async variant of `do()`. The call runs in a task, so a cancelled caller
+        doesn't cancel it for the others.
+        """
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+
+        task: asyncio.Task | None = self._tasks.get(key)
+        if task is not None and not task.done() and task.get_loop() is loop:
+            instrument.HTTP_COALESCED.inc(endpoint=endpoint)
+            log.debug(f"Waiting on in-flight request '{key}'")
+
+            return await asyncio.shield(task)
+
+        task = loop.create_task(fn())
+        self._tasks[key] = task
+
+        def _forget(done: asyncio.Task) -> None:
+            if self._tasks.get(key) is done:
+                del self._tasks[key]
+
+        task.add_done_callback(_forget)
+
+        return await asyncio.shield(task)
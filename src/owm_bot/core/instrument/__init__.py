@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import typing as t
+
+from owm_bot.utils.lazy_imports import lazy_module
+
+## Recording is imported by hot paths & only needs the stdlib. Exporters pull in
+#  http.server, so they load on first use
+from ._registry import (
+    DEFAULT_BUCKETS,
+    REGISTRY,
+    Counter,
+    Gauge,
+    Histogram,
+    Metric,
+    MetricsRegistry,
+    enable_metrics,
+    metrics_enabled,
+)
+from ._instruments import (
+    CACHE_LOOKUPS,
+    HTTP_COALESCED,
+    HTTP_REQUEST_SECONDS,
+    HTTP_REQUESTS,
+    HTTP_RETRIES,
+    HTTP_WAIT_SECONDS,
+    PARQUET_BYTES,
+    PARQUET_ROWS,
+    PARQUET_SECONDS,
+    VALIDATION_SECONDS,
+    record_http_response,
+    record_parquet_io,
+)
+
+if t.TYPE_CHECKING:
+    from ._export import (
+        CONTENT_TYPE,
+        MetricsExporter,
+        MetricsServer,
+        render_prometheus,
+        write_metrics_file,
+    )
+
+__getattr__, __dir__ = lazy_module(
+    __name__,
+    attrs={
+        "CONTENT_TYPE": "._export",
+        "MetricsExporter": "._export",
+        "MetricsServer": "._export",
+        "render_prometheus": "._export",
+        "write_metrics_file": "._export",
+    },
+)
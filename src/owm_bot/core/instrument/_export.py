@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+from contextlib import AbstractContextManager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+from pathlib import Path
+import threading
+import typing as t
+
+log = logging.getLogger("owm_bot.core.instrument.export")
+
+from owm_bot.utils.file_utils import atomic_write
+
+from ._registry import REGISTRY, MetricsRegistry
+
+## Content type of the Prometheus text exposition format
+CONTENT_TYPE: str = "text/plain; version=0.0.4; charset=utf-8"
+METRICS_PATH: str = "/metrics"
+
+
+def render_prometheus(registry: MetricsRegistry | None = None) -> str:
+    return (registry or REGISTRY).render()
+
+
+def write_metrics_file(
+    metrics_file: t.Union[str, Path] = None, registry: MetricsRegistry | None = None
+) -> None:
+    """Atomically replace `metrics_file` with the current metrics.
+
+    Scrapers (i.e. node_exporter's textfile collector) never see a half-written file.
+    """
+    metrics_file: Path = Path(f"{metrics_file}")
+    metrics_file.parent.mkdir(parents=True, exist_ok=True)
+
+    with atomic_write(metrics_file, "w") as f:
+        f.write(render_prometheus(registry))
+
+
+def _handler_for(registry: MetricsRegistry) -> type[BaseHTTPRequestHandler]:
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?", 1)[0] not in (METRICS_PATH, "/"):
+                self.send_error(404)
+
+                return
+
+            body: bytes = render_prometheus(registry).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", f"{len(body)}")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+            log.debug(f"{self.address_string()} {format % args}")
+
+    return MetricsHandler
+
+
+class MetricsServer:
+    """Serve metrics at `http://{host}:{port}/metrics` from a background thread.
+
+    Params:
+        host (str): Address to bind. Defaults to localhost only.
+        port (int): Port to bind. `0` picks a free port, see `port` once started.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        registry: MetricsRegistry | None = None,
+    ):
+        self.host = host
+        self.registry = registry or REGISTRY
+
+        self._port = port
+        self._server: ThreadingHTTPServer | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_port if self._server is not None else self._port
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}{METRICS_PATH}"
+
+    def start(self) -> t.Self:
+        try:
+            self._server = ThreadingHTTPServer(
+                (self.host, self._port), _handler_for(self.registry)
+            )
+        except Exception as exc:
+            msg = Exception(
+                f"Unhandled exception starting metrics server on {self.host}:{self._port}. Details: {exc}"
+            )
+            log.error(msg)
+
+            raise exc
+
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="metrics-server", daemon=True
+        )
+        self._thread.start()
+        log.info(f"Serving metrics at {self.url}")
+
+        return self
+
+    def stop(self) -> None:
+        if self._server is None:
+            return
+
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+        self._thread = None
+
+
+class MetricsExporter(AbstractContextManager):
+    """Enable instrumentation & export metrics for the duration of a `with` block.
+
+    Metrics are served over HTTP when `port` is set, and/or written to `metrics_file`
+    every `interval` seconds & once more on exit.
+
+    Params:
+        port (int | None): Port to serve `/metrics` on. `None` disables the server.
+        metrics_file (str | Path | None): File to write metrics to. `None` disables it.
+        interval (float): Seconds between writes of `metrics_file`.
+        host (str): Address the server binds to.
+    """
+
+    def __init__(
+        self,
+        port: int | None = None,
+        metrics_file: t.Union[str, Path, None] = None,
+        interval: float = 15.0,
+        host: str = "127.0.0.1",
+        registry: MetricsRegistry | None = None,
+    ):
+        self.port = port
+        self.metrics_file: Path | None = (
+            Path(f"{metrics_file}") if metrics_file else None
+        )
+        self.interval = interval
+        self.host = host
+        self.registry = registry or REGISTRY
+
+        self.server: MetricsServer | None = None
+        self._stop: threading.Event = threading.Event()
+        self._writer: threading.Thread | None = None
+
+    def __enter__(self) -> t.Self:
+        self.registry.enabled = True
+
+        if self.port is not None:
+            self.server = MetricsServer(
+                host=self.host, port=self.port, registry=self.registry
+            ).start()
+
+        if self.metrics_file is not None:
+            self._stop.clear()
+            self._writer = threading.Thread(
+                target=self._write_periodically, name="metrics-writer", daemon=True
+            )
+            self._writer.start()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._writer is not None:
+            self._stop.set()
+            self._writer.join()
+            self._writer = None
+            self.write()
+
+        if self.server is not None:
+            self.server.stop()
+            self.server = None
+
+    def write(self) -> None:
+        if self.metrics_file is None:
+            return
+
+        try:
+            write_metrics_file(self.metrics_file, registry=self.registry)
+        except Exception as exc:
+            msg = Exception(
+                f"Unhandled exception writing metrics to '{self.metrics_file}'. Details: {exc}"
+            )
+            log.error(msg)
+
+    def _write_periodically(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.write()
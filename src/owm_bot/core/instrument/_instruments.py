@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import logging
+import typing as t
+
+log = logging.getLogger("owm_bot.core.instrument")
+
+from ._registry import REGISTRY, Counter, Histogram
+
+if t.TYPE_CHECKING:
+    import httpx
+
+## Metrics recorded by owm_bot's hot paths, exported with `owm_bot.core.instrument`
+HTTP_REQUESTS: Counter = REGISTRY.counter(
+    "owm_bot_http_requests_total",
+    "HTTP requests sent, by endpoint & response status ('error' when no response).",
+    labels=["endpoint", "status"],
+)
+HTTP_REQUEST_SECONDS: Histogram = REGISTRY.histogram(
+    "owm_bot_http_request_seconds",
+    "Seconds from sending an HTTP request to receiving its response, by endpoint.",
+    labels=["endpoint"],
+)
+HTTP_RETRIES: Counter = REGISTRY.counter(
+    "owm_bot_http_retries_total",
+    "HTTP requests sent again, by endpoint & the status code ('error' when no response) retried.",
+    labels=["endpoint", "reason"],
+)
+HTTP_WAIT_SECONDS: Counter = REGISTRY.counter(
+    "owm_bot_http_wait_seconds_total",
+    "Seconds requests waited before being sent, by reason ('budget' or 'circuit').",
+    labels=["reason"],
+)
+HTTP_COALESCED: Counter = REGISTRY.counter(
+    "owm_bot_http_coalesced_total",
+    "HTTP requests not sent because an identical request was in flight, by endpoint.",
+    labels=["endpoint"],
+)
+CACHE_LOOKUPS: Counter = REGISTRY.counter(
+    "owm_bot_cache_lookups_total",
+    "Cache lookups, by cache & result ('hit', 'miss' or 'stale').",
+    labels=["cache", "result"],
+)
+PARQUET_SECONDS: Histogram = REGISTRY.histogram(
+    "owm_bot_parquet_seconds",
+    "Seconds spent reading & writing Parquet tables, by table & operation.",
+    labels=["table", "op"],
+)
+PARQUET_BYTES: Counter = REGISTRY.counter(
+    "owm_bot_parquet_bytes_total",
+    "Bytes read & written, by table & operation. Loads, saves & appends count bytes on disk, queries count the Arrow bytes returned.",
+    labels=["table", "op"],
+)
+PARQUET_ROWS: Counter = REGISTRY.counter(
+    "owm_bot_parquet_rows_total",
+    "Rows read & written, by table & operation.",
+    labels=["table", "op"],
+)
+VALIDATION_SECONDS: Histogram = REGISTRY.histogram(
+    "owm_bot_model_validation_seconds",
+    "Seconds spent validating data with pydantic models, by model.",
+    labels=["model"],
+)
+
+
+def record_http_response(
+    endpoint: str = None,
+    response: httpx.Response | None = None,
+    seconds: float | None = None,
+    cache: str | None = None,
+) -> None:
+    """Count a request & its latency. Pass `response=None` for requests that raised.
+
+    Params:
+        endpoint (str): Short endpoint name, i.e. 'onecall' or 'geo_direct'.
+        response (httpx.Response | None): The response received.
+        seconds (float | None): Time the request took.
+        cache (str | None): Name of the hishel cache in front of the request. Counts a
+            hit or miss from the response's `from_cache` extension.
+    """
+    if not REGISTRY.enabled:
+        return
+
+    HTTP_REQUESTS.inc(
+        endpoint=endpoint,
+        status="error" if response is None else response.status_code,
+    )
+    if seconds is not None:
+        HTTP_REQUEST_SECONDS.observe(seconds, endpoint=endpoint)
+
+    from_cache: bool | None = (
+        None if response is None else response.extensions.get("from_cache")
+    )
+    if cache is not None and from_cache is not None:
+        CACHE_LOOKUPS.inc(cache=cache, result="hit" if from_cache else "miss")
+
+
+def record_parquet_io(
+    table: str = None, op: str = None, rows: int = 0, nbytes: int = 0
+) -> None:
+    """Count the rows & bytes a Parquet operation read or wrote."""
+    if not REGISTRY.enabled:
+        return
+
+    PARQUET_ROWS.inc(rows, table=table, op=op)
+    PARQUET_BYTES.inc(nbytes, table=table, op=op)
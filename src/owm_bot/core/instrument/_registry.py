@@ -0,0 +1,326 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from contextlib import nullcontext
+import logging
+import math
+import threading
+import time
+import typing as t
+
+log = logging.getLogger("owm_bot.core.instrument")
+
+## Histogram bucket upper bounds, in seconds. Covers cache hits (~ms) to slow requests
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+## Shared no-op context, returned by `timer()` while instrumentation is disabled
+_NULL_TIMER: nullcontext = nullcontext()
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return f"{int(value)}"
+
+    return f"{value}"
+
+
+def _escape_label(value: t.Any) -> str:
+    return f"{value}".replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+
+    return (
+        "{"
+        + ",".join(
+            f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)
+        )
+        + "}"
+    )
+
+
+class Metric:
+    """Base class for metrics held by a `MetricsRegistry`.
+
+    Values are kept per label set. Label values are passed as keyword arguments, labels
+    that aren't passed are exported as empty strings.
+    """
+
+    kind: str = "untyped"
+
+    def __init__(
+        self,
+        name: str = None,
+        help: str = "",
+        labels: t.Sequence[str] = (),
+        registry: MetricsRegistry | None = None,
+    ):
+        assert name, ValueError("Missing a metric name")
+
+        self.name = name
+        self.help = help
+        self.labels: tuple[str, ...] = tuple(labels)
+        self.registry = registry
+
+        self._values: dict[tuple[str, ...], t.Any] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.registry is None or self.registry.enabled
+
+    def _key(self, labels: dict[str, t.Any]) -> tuple[str, ...]:
+        return tuple(f"{labels.get(name, '')}" for name in self.labels)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def samples(self) -> list[tuple[str, tuple[str, ...], tuple[str, ...], float]]:
+        """`(name, label names, label values, value)` for every exported sample."""
+        with self._lock:
+            return [
+                (self.name, self.labels, key, value)
+                for key, value in sorted(self._values.items())
+            ]
+
+    def render(self) -> list[str]:
+        lines: list[str] = [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for name, label_names, label_values, value in self.samples():
+            lines.append(
+                f"{name}{_format_labels(label_names, label_values)} {_format_value(value)}"
+            )
+
+        return lines
+
+
+class Counter(Metric):
+    kind: str = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if not self.enabled:
+            return
+
+        key: tuple[str, ...] = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    kind: str = "gauge"
+
+    def set(self, value: float = None, **labels) -> None:
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if not self.enabled:
+            return
+
+        key: tuple[str, ...] = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(Metric):
+    """Counts observations into cumulative buckets, Prometheus-style.
+
+    Params:
+        buckets (Sequence[float]): Bucket upper bounds. A `+Inf` bucket is always added.
+    """
+
+    kind: str = "histogram"
+
+    def __init__(
+        self,
+        name: str = None,
+        help: str = "",
+        labels: t.Sequence[str] = (),
+        registry: MetricsRegistry | None = None,
+        buckets: t.Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name=name, help=help, labels=labels, registry=registry)
+        self.buckets: tuple[float, ...] = tuple(sorted(buckets))
+
+    def observe(self, value: float = None, **labels) -> None:
+        if not self.enabled:
+            return
+
+        key: tuple[str, ...] = self._key(labels)
+        ## Per-bucket counts, made cumulative on export. The last slot is +Inf
+        idx: int = bisect_left(self.buckets, value)
+        with self._lock:
+            state: list | None = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][idx] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels) -> t.ContextManager:
+        """Observe the seconds spent in a `with` block."""
+        if not self.enabled:
+            return _NULL_TIMER
+
+        return _Timer(self, labels)
+
+    def count(self, **labels) -> int:
+        state: list | None = self._values.get(self._key(labels))
+
+        return 0 if state is None else state[2]
+
+    def sum(self, **labels) -> float:
+        state: list | None = self._values.get(self._key(labels))
+
+        return 0.0 if state is None else state[1]
+
+    def samples(self) -> list[tuple[str, tuple[str, ...], tuple[str, ...], float]]:
+        with self._lock:
+            items: list = [
+                (key, list(state[0]), state[1], state[2])
+                for key, state in sorted(self._values.items())
+            ]
+
+        samples: list = []
+        for key, counts, total, count in items:
+            cumulative: int = 0
+            for bound, bucket_count in zip([*self.buckets, math.inf], counts):
+                cumulative += bucket_count
+                samples.append(
+                    (
+                        f"{self.name}_bucket",
+                        (*self.labels, "le"),
+                        (*key, _format_value(bound)),
+                        cumulative,
+                    )
+                )
+            samples.append((f"{self.name}_sum", self.labels, key, total))
+            samples.append((f"{self.name}_count", self.labels, key, count))
+
+        return samples
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+        self.started: float = 0.0
+
+    def __enter__(self) -> t.Self:
+        self.started = time.perf_counter()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class MetricsRegistry:
+    """Holds metrics & renders them in the Prometheus text exposition format.
+
+    Disabled registries drop every update before taking a lock or building a label key,
+    so instrumented code costs one attribute check when metrics are off.
+
+    Params:
+        enabled (bool): Record updates. Can be toggled later with `enabled`.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+
+        self._metrics: dict[str, Metric] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    def __iter__(self) -> t.Iterator[Metric]:
+        return iter(list(self._metrics.values()))
+
+    def get(self, name: str = None) -> Metric | None:
+        return self._metrics.get(name)
+
+    def _register(self, cls: type[Metric], name: str, **kwargs) -> Metric:
+        with self._lock:
+            metric: Metric | None = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name=name, registry=self, **kwargs)
+
+        assert isinstance(metric, cls), ValueError(
+            f"Metric '{name}' is already registered as a {metric.kind}"
+        )
+
+        return metric
+
+    def counter(
+        self, name: str = None, help: str = "", labels: t.Sequence[str] = ()
+    ) -> Counter:
+        return self._register(Counter, name, help=help, labels=labels)
+
+    def gauge(
+        self, name: str = None, help: str = "", labels: t.Sequence[str] = ()
+    ) -> Gauge:
+        return self._register(Gauge, name, help=help, labels=labels)
+
+    def histogram(
+        self,
+        name: str = None,
+        help: str = "",
+        labels: t.Sequence[str] = (),
+        buckets: t.Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(
+            Histogram, name, help=help, labels=labels, buckets=buckets
+        )
+
+    def clear(self) -> None:
+        """Reset every metric's values, keeping the metrics registered."""
+        for metric in self:
+            metric.clear()
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in sorted(self, key=lambda m: m.name):
+            lines.extend(metric.render())
+
+        return "\n".join(lines) + "\n"
+
+
+## Process-wide registry every instrumented module records to
+REGISTRY: MetricsRegistry = MetricsRegistry()
+
+
+def enable_metrics(enabled: bool = True) -> None:
+    REGISTRY.enabled = enabled
+
+
+def metrics_enabled() -> bool:
+    return REGISTRY.enabled
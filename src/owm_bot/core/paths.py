@@ -8,6 +8,10 @@ OUTPUT_DIR: Path = Path(f"{DATA_DIR}/output")
 
 HTTP_CACHE_DIR: Path = Path(f"{CACHE_DIR}/http")
 OWM_HTTP_CACHE_DIR: Path = Path(f"{HTTP_CACHE_DIR}/openweathermap")
+GEOCODE_CACHE_DIR: Path = Path(f"{CACHE_DIR}/geocode")
+GEOCODE_CACHE_FILE: Path = Path(f"{GEOCODE_CACHE_DIR}/geocode_cache.json")
+## Resolved places only, see owm_bot.location.geolocate.GeocodeMemo
+GEOCODE_MEMO_FILE: Path = Path(f"{GEOCODE_CACHE_DIR}/geocode_memo.sqlite")
 
 LOCATIONS_PQ_FILE: Path = Path(f"{PQ_DIR}/openweathermap/locations.parquet")
 CURRENT_WEATHER_PQ_FILE: Path = Path(
@@ -16,12 +20,26 @@ CURRENT_WEATHER_PQ_FILE: Path = Path(
 FORECAST_WEATHER_PQ_FILE: Path = Path(
     f"{PQ_DIR}/openweathermap/forecast_weather_history.parquet"
 )
+## Forecast error statistics, see owm_bot.weather.verification
+FORECAST_VERIFICATION_PQ_FILE: Path = Path(
+    f"{PQ_DIR}/openweathermap/forecast_verification.parquet"
+)
+## Per-location daily aggregates of current weather, see owm_bot.weather.summary
+DAILY_SUMMARY_PQ_FILE: Path = Path(f"{PQ_DIR}/openweathermap/daily_summary.parquet")
+## Append-only datasets, partitioned by location & date
+CURRENT_WEATHER_PQ_DATASET_DIR: Path = Path(
+    f"{PQ_DIR}/openweathermap/current_weather_history"
+)
+FORECAST_WEATHER_PQ_DATASET_DIR: Path = Path(
+    f"{PQ_DIR}/openweathermap/forecast_weather_history"
+)
 
 ENSURE_DIRS: list[Path] = [
     DATA_DIR,
     CACHE_DIR,
     HTTP_CACHE_DIR,
     OWM_HTTP_CACHE_DIR,
+    GEOCODE_CACHE_DIR,
     SERIALIZE_DIR,
     PQ_DIR,
     OUTPUT_DIR,
@@ -1 +1,6 @@
-from .schemas import JsonLocation, JsonLocationsLoader, OwmGeoLookup
+from .schemas import (
+    JSON_LOCATIONS_ADAPTER,
+    JsonLocation,
+    JsonLocationsLoader,
+    OwmGeoLookup,
+)
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from contextlib import contextmanager
 import json
 import logging
 from pathlib import Path
@@ -9,9 +10,18 @@ log = logging.getLogger("owm_bot.domain.owm.location")
 
 from decimal import Decimal
 
+from owm_bot.core import instrument
 from owm_bot.utils.encoders import DecimalJsonEncoder
+from owm_bot.utils.file_utils import FileLock, write_bytes_atomic
 
-from pydantic import BaseModel, Field, ValidationError, field_validator
+from pydantic import (
+    BaseModel,
+    Field,
+    PrivateAttr,
+    TypeAdapter,
+    ValidationError,
+    field_validator,
+)
 
 
 class JsonLocationBase(BaseModel):
@@ -28,25 +38,194 @@ class JsonLocation(JsonLocationBase):
     pass
 
 
+## Validates a whole list of locations in a single pass
+JSON_LOCATIONS_ADAPTER: TypeAdapter[list[JsonLocation]] = TypeAdapter(
+    list[JsonLocation]
+)
+## Number of decimal places lat/lon are rounded to for coordinate lookups (~1.1km)
+COORDS_INDEX_PRECISION: int = 2
+
+
+def _normalise(part: str | None) -> str:
+    return (part or "").strip().casefold()
+
+
+def _name_key(*parts: str | None) -> tuple:
+    return tuple(map(_normalise, parts))
+
+
 class JsonLocationsLoaderBase(BaseModel):
     pass
 
 
 class JsonLocationsLoader(JsonLocationsLoaderBase):
+    """Load, index & save the locations in a JSON file.
+
+    The file can hold a single location object (like `location.example.json`) or a
+    list of location objects. The whole file is validated in one pass, and lookups by
+    (city, state, country), (zip, country) or rounded lat/lon are dict lookups.
+
+    Changes that must not clobber another process' save go through `locked()`, which
+    holds the file's lock from the (re)load to the save.
+    """
+
     location_file: t.Union[str, Path] = Field(default=None)
-    location: JsonLocation | None = Field(default=None)
+    locations: list[JsonLocation] = Field(default_factory=list)
+    coords_precision: int = Field(default=COORDS_INDEX_PRECISION)
+
+    ## True when the file held a single location object instead of a list
+    _single_object: bool = PrivateAttr(default=False)
+    _by_name: dict[tuple, JsonLocation] = PrivateAttr(default_factory=dict)
+    _by_zip: dict[tuple, JsonLocation] = PrivateAttr(default_factory=dict)
+    _by_coords: dict[tuple, JsonLocation] = PrivateAttr(default_factory=dict)
+    _file_lock: FileLock | None = PrivateAttr(default=None)
+
+    def model_post_init(self, __context: t.Any) -> None:
+        self.rebuild_index()
 
     @property
     def file_exists(self) -> bool:
         return self.location_file.exists()
 
+    @property
+    def file_lock(self) -> FileLock:
+        """The loader's lock on `location_file`, reentrant so `locked()` can save."""
+        if self._file_lock is None:
+            self._file_lock = FileLock(self.location_file)
+
+        return self._file_lock
+
+    @property
+    def location(self) -> JsonLocation | None:
+        """The first location in the file, for single-location setups."""
+        return self.locations[0] if self.locations else None
+
+    @location.setter
+    def location(self, value: JsonLocation | None) -> None:
+        if value is None:
+            self.locations = []
+        elif self.locations:
+            self.locations[0] = value
+        else:
+            self.locations = [value]
+
+        self.rebuild_index()
+
     @field_validator("location_file")
     def validate_location_file(cls, v):
         v = Path(f"{v}")
 
         return v
 
-    def load_from_file(self) -> JsonLocation:
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    def _coords_key(self, lat: t.Any, lon: t.Any) -> tuple:
+        return (
+            round(float(lat), self.coords_precision),
+            round(float(lon), self.coords_precision),
+        )
+
+    def _index(
+        self,
+        locations: list[JsonLocation],
+        by_name: dict[tuple, JsonLocation],
+        by_zip: dict[tuple, JsonLocation],
+        by_coords: dict[tuple, JsonLocation],
+    ) -> None:
+        ## Work on plain local dicts, attribute access on a model is slow in a hot loop
+        precision: int = self.coords_precision
+        for location in locations:
+            ## First location wins when several share a key
+            if location.city_name:
+                by_name.setdefault(
+                    _name_key(
+                        location.city_name, location.state_code, location.country_code
+                    ),
+                    location,
+                )
+            if location.zip_code:
+                by_zip.setdefault(
+                    _name_key(location.zip_code, location.country_code), location
+                )
+            if location.lat is not None and location.lon is not None:
+                by_coords.setdefault(
+                    (
+                        round(float(location.lat), precision),
+                        round(float(location.lon), precision),
+                    ),
+                    location,
+                )
+
+    def rebuild_index(self) -> None:
+        by_name, by_zip, by_coords = {}, {}, {}
+        self._index(self.locations, by_name, by_zip, by_coords)
+
+        self._by_name = by_name
+        self._by_zip = by_zip
+        self._by_coords = by_coords
+
+    def add(self, location: JsonLocation = None) -> None:
+        self.locations.append(location)
+        self._index([location], self._by_name, self._by_zip, self._by_coords)
+
+    def extend(self, locations: list[JsonLocation] = None) -> None:
+        self.locations.extend(locations)
+        self._index(locations, self._by_name, self._by_zip, self._by_coords)
+
+    def upsert(
+        self, location: JsonLocation = None, match: JsonLocation | None = None
+    ) -> None:
+        """Replace the location matching `location`'s name or zip, or add it.
+
+        Params:
+            location (JsonLocation): The location to save.
+            match (JsonLocation | None): Find the entry to replace by this location's
+                name or zip instead, e.g. the location before geocoding renamed it.
+        """
+        match = match or location
+
+        existing: JsonLocation | None = None
+        if match.city_name:
+            existing = self.get_by_name(
+                match.city_name, match.state_code, match.country_code
+            )
+        if existing is None and match.zip_code:
+            existing = self.get_by_zip(match.zip_code, match.country_code)
+        if existing is None and self._single_object:
+            existing = self.location
+
+        if existing is None:
+            self.add(location)
+
+            return
+
+        for idx, _location in enumerate(self.locations):
+            if _location is existing:
+                self.locations[idx] = location
+                break
+
+        self.rebuild_index()
+
+    def get_by_name(
+        self,
+        city_name: str = None,
+        state_code: str | None = None,
+        country_code: str | None = None,
+    ) -> JsonLocation | None:
+        return self._by_name.get(_name_key(city_name, state_code, country_code))
+
+    def get_by_zip(
+        self, zip_code: str = None, country_code: str | None = None
+    ) -> JsonLocation | None:
+        return self._by_zip.get(_name_key(zip_code, country_code))
+
+    def get_by_coords(
+        self, lat: t.Any = None, lon: t.Any = None
+    ) -> JsonLocation | None:
+        return self._by_coords.get(self._coords_key(lat, lon))
+
+    def load_all_from_file(self) -> list[JsonLocation]:
         if not self.file_exists:
             msg = FileNotFoundError(
                 f"Could not find location file at {self.location_file}. Create a JSON file with data about the location you want weather for, before re-running."
@@ -56,33 +235,77 @@ class JsonLocationsLoader(JsonLocationsLoaderBase):
             raise msg
 
         try:
-            with open(self.location_file, "r") as f:
-                location_dict = json.loads(f.read())
-
+            raw: bytes = self.location_file.read_bytes()
         except Exception as exc:
             msg = Exception(
-                f"Unhandled exception reading location file into dict. Details: {exc}"
+                f"Unhandled exception reading location file '{self.location_file}'. Details: {exc}"
             )
             log.error(msg)
-            location_dict = None
 
             raise exc
 
+        ## Validate the whole file in one pass, straight from the JSON bytes
         try:
-            _location: JsonLocation = JsonLocation.model_validate(location_dict)
+            with instrument.VALIDATION_SECONDS.time(model="JsonLocation"):
+                if raw.lstrip().startswith(b"{"):
+                    self._single_object = True
+                    _locations: list[JsonLocation] = [
+                        JsonLocation.model_validate_json(raw)
+                    ]
+                else:
+                    self._single_object = False
+                    _locations: list[JsonLocation] = (
+                        JSON_LOCATIONS_ADAPTER.validate_json(raw)
+                    )
 
         except Exception as exc:
             msg = Exception(
-                f"Unhandled exception converting location dict loaded from JSON file '{self.location_file}'. Details: {exc}"
+                f"Unhandled exception validating locations loaded from JSON file '{self.location_file}'. Details: {exc}"
             )
-            log.warning(msg)
+            log.error(msg)
+
+            raise exc
+
+        self.locations = _locations
+        self.rebuild_index()
+
+        return _locations
+
+    def load_from_file(self) -> JsonLocation:
+        self.load_all_from_file()
+
+        return self.location
+
+    @contextmanager
+    def locked(self, save: bool = True) -> t.Generator[JsonLocationsLoader, None, None]:
+        """Lock `location_file` for a whole load -> change -> save.
+
+        The locations are reloaded from disk once the lock is held, so changes another
+        process saved in the meantime are kept. When the block exits cleanly the
+        locations are saved before the lock is released.
+
+        Params:
+            save (bool): Save the locations when the block exits.
+
+        Raises:
+            OSError: When the locations could not be saved.
+        """
+        with self.file_lock:
+            if self.file_exists:
+                self.load_all_from_file()
+
+            yield self
 
-        self.location = _location
+            if save and not self.save_to_file(overwrite=True):
+                msg = OSError(
+                    f"Could not save locations to file '{self.location_file}'"
+                )
+                log.error(msg)
 
-        return _location
+                raise msg
 
     def save_to_file(self, overwrite: bool = True) -> bool:
-        if self.location is None:
+        if not self.locations:
             log.warning(f"Locations list is empty.")
 
             return False
@@ -95,24 +318,34 @@ class JsonLocationsLoader(JsonLocationsLoaderBase):
             return False
 
         try:
-            json_data = self.location.model_dump()
+            ## Keep single-location files as a single object
+            if self._single_object and len(self.locations) == 1:
+                json_data: bytes = self.location.model_dump_json(indent=2).encode()
+            else:
+                json_data: bytes = JSON_LOCATIONS_ADAPTER.dump_json(
+                    self.locations, indent=2
+                )
         except Exception as exc:
             msg = Exception(
-                f"Unhandled exception dumping location to JSON string. Details: {exc}"
+                f"Unhandled exception dumping locations to JSON string. Details: {exc}"
             )
             log.error(msg)
 
             return False
 
-        log.debug(f"Saving location to file: {self.location_file}")
+        log.debug(
+            f"Saving {len(self.locations)} location(s) to file: {self.location_file}"
+        )
         try:
-            with open(self.location_file, "w") as f:
-                json.dump(json_data, f, indent=2, cls=DecimalJsonEncoder)
+            ## Write a temp file & rename it over the original, so a crash mid-save
+            #  can't leave a truncated file
+            with self.file_lock:
+                write_bytes_atomic(self.location_file, json_data)
 
             return True
         except Exception as exc:
             msg = Exception(
-                f"Unhandled exception dumping location to file '{self.location_file}'. Details: {exc}"
+                f"Unhandled exception dumping locations to file '{self.location_file}'. Details: {exc}"
             )
             log.error(msg)
 
@@ -0,0 +1,10 @@
+from .schemas import (
+    CurrentWeather,
+    DailyTemperature,
+    DailyWeather,
+    HourlyWeather,
+    MinutelyWeather,
+    OneCallResponse,
+    WeatherAlert,
+    WeatherCondition,
+)
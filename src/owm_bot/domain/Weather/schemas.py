@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import logging
+import typing as t
+
+log = logging.getLogger("owm_bot.domain.owm.weather")
+
+from pydantic import BaseModel, Field
+
+
+class WeatherConditionBase(BaseModel):
+    id: int | None = Field(default=None)
+    main: str | None = Field(default=None)
+    description: str | None = Field(default=None)
+    icon: str | None = Field(default=None)
+
+
+class WeatherCondition(WeatherConditionBase):
+    pass
+
+
+class CurrentWeatherBase(BaseModel):
+    dt: int | None = Field(default=None)
+    sunrise: int | None = Field(default=None)
+    sunset: int | None = Field(default=None)
+    temp: float | None = Field(default=None)
+    feels_like: float | None = Field(default=None)
+    pressure: int | None = Field(default=None)
+    humidity: int | None = Field(default=None)
+    dew_point: float | None = Field(default=None)
+    uvi: float | None = Field(default=None)
+    clouds: int | None = Field(default=None)
+    visibility: int | None = Field(default=None)
+    wind_speed: float | None = Field(default=None)
+    wind_deg: int | None = Field(default=None)
+    wind_gust: float | None = Field(default=None)
+    weather: list[WeatherCondition] = Field(default_factory=list)
+    ## i.e. {"1h": 0.25}
+    rain: dict[str, float] | None = Field(default=None)
+    snow: dict[str, float] | None = Field(default=None)
+
+
+class CurrentWeather(CurrentWeatherBase):
+    pass
+
+
+class MinutelyWeatherBase(BaseModel):
+    dt: int | None = Field(default=None)
+    precipitation: float | None = Field(default=None)
+
+
+class MinutelyWeather(MinutelyWeatherBase):
+    pass
+
+
+class HourlyWeatherBase(CurrentWeatherBase):
+    ## Probability of precipitation, 0-1
+    pop: float | None = Field(default=None)
+
+
+class HourlyWeather(HourlyWeatherBase):
+    pass
+
+
+class DailyTemperature(BaseModel):
+    morn: float | None = Field(default=None)
+    day: float | None = Field(default=None)
+    eve: float | None = Field(default=None)
+    night: float | None = Field(default=None)
+    min: float | None = Field(default=None)
+    max: float | None = Field(default=None)
+
+
+class DailyWeatherBase(BaseModel):
+    dt: int | None = Field(default=None)
+    sunrise: int | None = Field(default=None)
+    sunset: int | None = Field(default=None)
+    moonrise: int | None = Field(default=None)
+    moonset: int | None = Field(default=None)
+    moon_phase: float | None = Field(default=None)
+    summary: str | None = Field(default=None)
+    temp: DailyTemperature | None = Field(default=None)
+    feels_like: DailyTemperature | None = Field(default=None)
+    pressure: int | None = Field(default=None)
+    humidity: int | None = Field(default=None)
+    dew_point: float | None = Field(default=None)
+    wind_speed: float | None = Field(default=None)
+    wind_deg: int | None = Field(default=None)
+    wind_gust: float | None = Field(default=None)
+    weather: list[WeatherCondition] = Field(default_factory=list)
+    clouds: int | None = Field(default=None)
+    pop: float | None = Field(default=None)
+    rain: float | None = Field(default=None)
+    snow: float | None = Field(default=None)
+    uvi: float | None = Field(default=None)
+
+
+class DailyWeather(DailyWeatherBase):
+    pass
+
+
+class WeatherAlertBase(BaseModel):
+    sender_name: str | None = Field(default=None)
+    event: str | None = Field(default=None)
+    start: int | None = Field(default=None)
+    end: int | None = Field(default=None)
+    description: str | None = Field(default=None)
+    tags: list[str] = Field(default_factory=list)
+
+
+class WeatherAlert(WeatherAlertBase):
+    pass
+
+
+class OneCallResponseBase(BaseModel):
+    lat: float | None = Field(default=None)
+    lon: float | None = Field(default=None)
+    timezone: str | None = Field(default=None)
+    timezone_offset: int | None = Field(default=None)
+    ## Parts passed in the request's 'exclude' param are missing from the response
+    current: CurrentWeather | None = Field(default=None)
+    minutely: list[MinutelyWeather] | None = Field(default=None)
+    hourly: list[HourlyWeather] | None = Field(default=None)
+    daily: list[DailyWeather] | None = Field(default=None)
+    alerts: list[WeatherAlert] | None = Field(default=None)
+
+
+class OneCallResponse(OneCallResponseBase):
+    pass
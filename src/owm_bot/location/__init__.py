@@ -1,8 +1,35 @@
-from .__methods import (
-    load_location_from_file,
-    update_location_coords,
-    get_missing_coords,
-    save_location_dict_to_file,
-    init_location,
+from __future__ import annotations
+
+import typing as t
+
+from owm_bot.utils.lazy_imports import lazy_module
+
+if t.TYPE_CHECKING:
+    from .__methods import (
+        load_location_from_file,
+        update_location_coords,
+        get_missing_coords,
+        save_location_dict_to_file,
+        init_location,
+        init_locations,
+        geo_result_to_location,
+        place_to_location,
+        location_to_place,
+    )
+    from . import geolocate
+
+__getattr__, __dir__ = lazy_module(
+    __name__,
+    attrs={
+        "load_location_from_file": ".__methods",
+        "update_location_coords": ".__methods",
+        "get_missing_coords": ".__methods",
+        "save_location_dict_to_file": ".__methods",
+        "init_location": ".__methods",
+        "init_locations": ".__methods",
+        "geo_result_to_location": ".__methods",
+        "place_to_location": ".__methods",
+        "location_to_place": ".__methods",
+    },
+    submodules=["geolocate"],
 )
-from . import geolocate
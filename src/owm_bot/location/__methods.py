@@ -1,3 +1,8 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import nullcontext
+from decimal import Decimal
 import typing as t
 import logging
 from pathlib import Path
@@ -7,13 +12,11 @@ log = logging.getLogger("owm_bot.location.methods")
 from owm_bot.core.paths import LOCATIONS_PQ_FILE
 from owm_bot.domain.Location import JsonLocation, JsonLocationsLoader, OwmGeoLookup
 from owm_bot.core.config import owm_settings
-from owm_bot.core.depends import owm_hishel_filestorage_dependency
-from owm_bot.location.geolocate import get_coords
-from owm_bot.utils import data_utils
 
-import hishel
-import httpx
-import pandas as pd
+if t.TYPE_CHECKING:
+    from owm_bot.location.geolocate import GeocodeMemo, GeocodePlace, GeocodeResult
+
+    import hishel
 
 
 def load_location_from_file(
@@ -32,54 +35,116 @@ def load_location_from_file(
         raise exc
 
 
+def location_to_place(location: JsonLocation = None) -> GeocodePlace:
+    from owm_bot.location.geolocate import GeocodePlace
+
+    return GeocodePlace(
+        name=location.city_name,
+        state=location.state_code,
+        country=location.country_code,
+        zip=location.zip_code,
+        lat=float(location.lat),
+        lon=float(location.lon),
+    )
+
+
+def place_to_location(
+    location: JsonLocation = None, place: GeocodePlace = None
+) -> JsonLocation:
+    """Merge a memoized place into a copy of `location`, like `geo_result_to_location()`.
+
+    The place was validated when it was memoized, so the copy is built without
+    validating it again.
+    """
+    return JsonLocation.model_construct(
+        city_name=place.name or location.city_name,
+        local_names=location.local_names,
+        state_code=location.state_code or place.state,
+        country_code=place.country or location.country_code,
+        zip_code=place.zip or location.zip_code,
+        lat=Decimal(f"{place.lat}"),
+        lon=Decimal(f"{place.lon}"),
+    )
+
+
+def _location_memo_key(location: JsonLocation) -> str:
+    from owm_bot.location.geolocate import memo_key
+
+    return memo_key(
+        city_name=location.city_name,
+        state_code=location.state_code,
+        country_code=location.country_code,
+        zip_code=location.zip_code,
+    )
+
+
 def get_missing_coords(
     location_obj: JsonLocation = None,
     cache_storage: (
         hishel.FileStorage | hishel.SQLiteStorage | hishel.InMemoryStorage
     ) = None,
     debug_http_response: bool = False,
+    geocode_memo: GeocodeMemo | None = None,
+    use_geocode_memo: bool = True,
 ) -> JsonLocation:
+    """Fill in a location's lat/lon, if it is missing them.
+
+    Places that were resolved before are read from the `GeocodeMemo`, without touching
+    the HTTP stack. Anything else is requested with `get_coords()` & memoized.
+    """
+    if location_obj.lat is not None and location_obj.lon is not None:
+        return location_obj
+
+    if use_geocode_memo:
+        from owm_bot.location.geolocate import get_geocode_memo
+
+        geocode_memo = geocode_memo or get_geocode_memo()
+        key: str = _location_memo_key(location_obj)
+
+        place: GeocodePlace | None = geocode_memo.get(key)
+        if place is not None:
+            return place_to_location(location=location_obj, place=place)
+
+    ## The HTTP stack is only imported when a location actually needs geocoding
+    from owm_bot.core.depends import owm_hishel_storage_dependency
+    from owm_bot.location.geolocate import get_coords
+
     if cache_storage is None:
         # cache_storage = httpx_utils.get_hishel_file_storage(cache_dir=CACHE_DIR)
-        cache_storage = owm_hishel_filestorage_dependency()
+        cache_storage = owm_hishel_storage_dependency(endpoint="geo")
 
-    if location_obj.lat is None or location_obj.lon is None:
-        log.info(
-            f"Updating latitude & longitude for location '{location_obj.city_name}, '{location_obj.country_code}'"
-        )
-        _updated_location_dict = get_coords(
-            city_name=location_obj.city_name,
-            state_code=location_obj.state_code,
-            country_code=location_obj.country_code,
-            zip_code=location_obj.zip_code,
-            api_key=owm_settings.api_key,
-            debug_http_response=debug_http_response,
-        )
+    log.info(
+        f"Updating latitude & longitude for location '{location_obj.city_name}, '{location_obj.country_code}'"
+    )
+    _updated_location_dict = get_coords(
+        city_name=location_obj.city_name,
+        state_code=location_obj.state_code,
+        country_code=location_obj.country_code,
+        zip_code=location_obj.zip_code,
+        api_key=owm_settings.api_key,
+        cache_storage=cache_storage,
+        debug_http_response=debug_http_response,
+    )
 
-        try:
-            updated_location: JsonLocation = JsonLocation(
-                city_name=_updated_location_dict["name"],
-                zip_code=_updated_location_dict["zip"],
-                country_code=_updated_location_dict["country"],
-                lat=_updated_location_dict["lat"],
-                lon=_updated_location_dict["lon"],
-            )
-        except Exception as exc:
-            msg = Exception(
-                f"Unhandled exception updating location object. Details: {exc}"
-            )
-            log.error(msg)
+    try:
+        updated_location: JsonLocation | None = geo_result_to_location(
+            location=location_obj, geo_result=_updated_location_dict
+        )
+    except Exception as exc:
+        msg = Exception(f"Unhandled exception updating location object. Details: {exc}")
+        log.error(msg)
 
-            raise exc
+        raise exc
 
-        if updated_location.state_code is None:
-            updated_location.state_code = location_obj.state_code
+    if updated_location is None:
+        raise ValueError(
+            f"No geocoding matches for location '{location_obj.city_name}, {location_obj.country_code}'"
+        )
 
-        return updated_location
-    else:
-        return_location: JsonLocation = location_obj
+    if use_geocode_memo:
+        geocode_memo.put(key=key, place=location_to_place(updated_location))
 
-        return return_location
+    return updated_location
 
 
 def update_location_coords(
@@ -128,11 +193,12 @@ def save_location_dict_to_file(
 
         raise FileNotFoundError
 
+    ## Replace the matching entry under the file's lock, keeping any other locations
+    #  in the file, including ones another process saved since it was last read
     location_loader = JsonLocationsLoader(location_file=location_file)
-    location_loader.location = location
-
     try:
-        location_loader.save_to_file(overwrite=True)
+        with location_loader.locked():
+            location_loader.upsert(location)
     except Exception as exc:
         msg = Exception(
             f"Unhandled exception saving location to JSON file '{location_file}'. Details: {exc}"
@@ -142,6 +208,32 @@ def save_location_dict_to_file(
         raise exc
 
 
+def geo_result_to_location(
+    location: JsonLocation = None, geo_result: t.Union[dict, list, None] = None
+) -> JsonLocation | None:
+    """Merge a decoded geocoding response into a copy of `location`.
+
+    `/direct` responses are a list of matches (the first is used), `/zip` responses are a
+    single dict. Fields the response does not have are kept from `location`.
+    """
+    if isinstance(geo_result, list):
+        geo_result = geo_result[0] if geo_result else None
+
+    if not geo_result:
+        return None
+
+    return JsonLocation(
+        city_name=geo_result.get("name") or location.city_name,
+        local_names=geo_result.get("local_names") or location.local_names,
+        ## OWM returns full state names, keep the configured state code if there is one
+        state_code=location.state_code or geo_result.get("state"),
+        country_code=geo_result.get("country") or location.country_code,
+        zip_code=geo_result.get("zip") or location.zip_code,
+        lat=geo_result["lat"],
+        lon=geo_result["lon"],
+    )
+
+
 def init_location(
     location_file: t.Union[str, Path] = owm_settings.location_file,
     cache_storage: (
@@ -152,24 +244,30 @@ def init_location(
     assert location_file, ValueError("Missing a location_file path")
     location_file: Path = Path(f"{location_file}")
 
-    ## Load initial list of JsonLocation objects
-    location: list[JsonLocation] = load_location_from_file(location_file=location_file)
-    log.debug(f"Updating location coords")
-    ## Update location objects
+    ## Load the location file once, and work with the in-memory location after
+    location_loader = JsonLocationsLoader(location_file=location_file)
     try:
-        updated_location: list[JsonLocation] = update_location_coords(
-            location=location,
-            location_file=location_file,
-            cache_storage=cache_storage,
-            debug_http_response=debug_http_response,
-        )
-    except RecursionError as recur:
+        location: JsonLocation = location_loader.load_from_file()
+    except Exception as exc:
         msg = Exception(
-            f"update_location_coords() looped too many times. Check your code. Details: {recur}"
+            f"Unhandled exception loading location from file '{location_file}'. Details: {exc}"
         )
         log.error(msg)
 
-        raise recur
+        raise exc
+
+    if location.lat is not None and location.lon is not None:
+        log.debug(f"Location already has coordinates, skipping update")
+
+        return location
+
+    log.debug(f"Updating location coords")
+    try:
+        updated_location: JsonLocation = get_missing_coords(
+            location_obj=location,
+            cache_storage=cache_storage,
+            debug_http_response=debug_http_response,
+        )
     except Exception as exc:
         msg = Exception(f"Unhandled exception updating location coords. Details: {exc}")
         log.error(msg)
@@ -178,18 +276,104 @@ def init_location(
 
     log.debug(f"Saving updated location coords")
     try:
-        save_location_dict_to_file(
-            location=updated_location, location_file=location_file
-        )
+        with location_loader.locked():
+            location_loader.upsert(updated_location, match=location)
     except Exception as exc:
-        msg = Exception(
-            f"Unhandled exception saving updated location coordinates. Details: {exc}"
+        log.warning(
+            f"Could not save updated location to file '{location_file}'. Details: {exc}"
         )
-        log.error(msg)
 
-        raise exc
+    return updated_location
+
+
+def init_locations(
+    location_file: t.Union[str, Path] = owm_settings.location_file,
+    save: bool = True,
+) -> JsonLocationsLoader:
+    """Load every location in `location_file` and geocode the ones missing lat/lon.
+
+    Missing coordinates are requested in one batch with `geolocate.get_coords_many()`,
+    and the file is written once at the end if anything changed. The write reloads the
+    file under its lock first, so locations other processes saved meanwhile are kept.
+
+    Returns:
+        (JsonLocationsLoader): The loader, with all locations loaded & indexed.
+
+    """
+    assert location_file, ValueError("Missing a location_file path")
+    location_loader = JsonLocationsLoader(location_file=location_file)
+    location_loader.load_all_from_file()
+
+    missing_idx: list[int] = [
+        idx
+        for idx, location in enumerate(location_loader.locations)
+        if location.lat is None or location.lon is None
+    ]
+    if not missing_idx:
+        return location_loader
+
+    from owm_bot.location.geolocate import get_geocode_memo
+
+    geocode_memo: GeocodeMemo = get_geocode_memo()
+    ## (location as loaded, geocoded location), re-applied to the file under its lock
+    updated: list[tuple[JsonLocation, JsonLocation]] = []
+
+    ## Places resolved before are filled from the memo, only new places are requested
+    to_request: list[int] = []
+    for idx in missing_idx:
+        place: GeocodePlace | None = geocode_memo.get(
+            _location_memo_key(location_loader.locations[idx])
+        )
+        if place is None:
+            to_request.append(idx)
+            continue
+
+        updated.append(
+            (
+                location_loader.locations[idx],
+                place_to_location(location=location_loader.locations[idx], place=place),
+            )
+        )
+
+    if to_request:
+        from owm_bot.location.geolocate import get_coords_many
+
+        log.info(f"Requesting coordinates for {len(to_request)} location(s)")
+        results: list[GeocodeResult] = asyncio.run(
+            get_coords_many(
+                locations=[location_loader.locations[idx] for idx in to_request]
+            )
+        )
+
+        resolved: dict[str, GeocodePlace] = {}
+        for idx, result in zip(to_request, results):
+            if not result.ok:
+                log.warning(
+                    f"Could not geocode location {result.query}: {result.error}"
+                )
+                continue
+
+            updated_location: JsonLocation | None = geo_result_to_location(
+                location=location_loader.locations[idx], geo_result=result.result
+            )
+            if updated_location is None:
+                log.warning(f"No geocoding matches for location {result.query}")
+                continue
+
+            resolved[_location_memo_key(location_loader.locations[idx])] = (
+                location_to_place(updated_location)
+            )
+            updated.append((location_loader.locations[idx], updated_location))
+
+        geocode_memo.put_many(resolved)
+
+    if not updated:
+        return location_loader
 
-    ## Reload location from file
-    location: JsonLocation = load_location_from_file(location_file=location_file)
+    ## Geocoding ran without the lock, so reload the file under it before saving &
+    #  keep what other processes wrote in the meantime
+    with location_loader.locked() if save else nullcontext():
+        for location, updated_location in updated:
+            location_loader.upsert(updated_location, match=location)
 
-    return location
+    return location_loader
@@ -0,0 +1,11 @@
+from __future__ import annotations
+
+from ._controllers import (
+    LOCATIONS_SCHEMA,
+    CurrentWeatherPQFileController,
+    ForecastWeatherPQFileController,
+    LocationsJSONFileController,
+    LocationsPQFileController,
+    PQTableController,
+)
+from ._write_behind import WriteBehindBuffer
@@ -7,57 +7,134 @@ import typing as t
 
 log = logging.getLogger("owm_bot.location.controllers")
 
-from contextlib import AbstractContextManager, contextmanager
+from contextlib import AbstractContextManager, contextmanager, nullcontext
 
-from owm_bot.core.constants import PQ_ENGINE
+from owm_bot.core import instrument
+from owm_bot.core.constants import ON_DUPLICATE_MODES, PQ_ENGINE, PQ_ROW_GROUP_SIZE
 from owm_bot.core.paths import (
     CACHE_DIR,
     DATA_DIR,
     PQ_DIR,
     SERIALIZE_DIR,
     CURRENT_WEATHER_PQ_FILE,
+    CURRENT_WEATHER_PQ_DATASET_DIR,
     FORECAST_WEATHER_PQ_FILE,
+    FORECAST_WEATHER_PQ_DATASET_DIR,
     LOCATIONS_PQ_FILE,
 )
 from owm_bot.utils import data_utils
+from owm_bot.utils import file_utils
+from owm_bot.utils.data_utils import datasets, key_index, weather_tables
 from owm_bot.domain.Location import JsonLocation
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 from red_utils.ext.dataframe_utils import pandas_utils
 
 
-class LocationsPQFileController(AbstractContextManager):
+class PQTableController(AbstractContextManager):
+    """Read, update & query a Parquet table.
+
+    The table is only read in full when `df` is first accessed. `query()` reads just the
+    requested columns, and skips row groups (or dataset partitions) that can't match its
+    filters, so reading one location's last day doesn't load the whole history.
+
+    Subclasses set `schema`/`dataset_schema` to store typed tables, and `convert` to turn
+    new data (DataFrames, API response dicts) into a table matching `schema`.
+
+    Params:
+        pq_file (str | Path): Parquet file holding the table.
+        pq_engine (str): Engine used to read & write `pq_file`.
+        append_only (bool): When True, batches are appended to a partitioned dataset in
+            `dataset_dir` instead of rewriting `pq_file`, and `df` only holds rows not yet
+            saved. `query()` reads from the dataset.
+        dataset_dir (str | Path | None): Root directory of the append-only dataset.
+        on_duplicate (str | None): Upsert on `primary_key`. 'drop' skips new rows whose key
+            is already stored, 'replace' overwrites the stored row (not supported in
+            append-only mode). `None` appends every row.
+        primary_key (list[str] | None): Overrides the class' `primary_key` columns.
+        lock_timeout (float | None): Seconds to wait for another process' write lock on
+            `pq_file`/`dataset_dir` before raising `TimeoutError`. `None` waits forever.
+    """
+
+    ## Name used in log messages
+    table_name: str = "Parquet"
+    schema: pa.Schema | None = None
+    dataset_schema: pa.Schema | None = None
+    ## Timestamp column `query(time_range=...)` filters on
+    time_col: str | None = None
+    ## 'YYYY-MM-DD' partition column in the dataset matching `time_col`
+    date_partition_col: str | None = None
+    ## Columns that identify a row, for on_duplicate upserts
+    primary_key: list[str] | None = None
+
     def __init__(
         self,
-        pq_filepath: t.Union[str, Path] = LOCATIONS_PQ_FILE,
+        pq_file: t.Union[str, Path] = None,
         pq_engine: str = PQ_ENGINE,
+        append_only: bool = False,
+        dataset_dir: t.Union[str, Path, None] = None,
+        on_duplicate: str | None = None,
+        primary_key: list[str] | None = None,
+        lock_timeout: float | None = None,
     ):
-        self.pq_file = pq_filepath
+        assert pq_file or (append_only and dataset_dir), ValueError(
+            "Missing a pq_file path, or a dataset_dir in append-only mode"
+        )
+        self.pq_file: Path | None = Path(f"{pq_file}") if pq_file else None
         self.pq_engine = pq_engine
-
-        self.df: pd.DataFrame | None = None
-
-    def __enter__(self):
-        if not self.pq_file.exists():
-            log.warning(
-                f"Locations Parquet file does not exist at path '{self.pq_file}'. Creating empty DataFrame"
+        self.append_only = append_only
+        self.dataset_dir: Path | None = (
+            Path(f"{dataset_dir}") if dataset_dir is not None else None
+        )
+        assert not append_only or self.dataset_dir, ValueError(
+            "append_only requires a dataset_dir"
+        )
+        self.primary_key = primary_key or self.primary_key
+        self.on_duplicate = on_duplicate
+        if on_duplicate is not None:
+            assert on_duplicate in ON_DUPLICATE_MODES, ValueError(
+                f"Invalid on_duplicate: '{on_duplicate}'. Must be one of {ON_DUPLICATE_MODES}"
             )
-            _df = pd.DataFrame()
-            self.df = _df
-
-            return self
-
-        try:
-            _df = pd.read_parquet(self.pq_file, engine=self.pq_engine)
-
-            self.df = _df
-        except Exception as exc:
-            msg = Exception(
-                f"Unhandled exception loading DataFrame from file '{self.pq_file}'. Details: {exc}"
+            assert self.primary_key, ValueError(
+                f"{self.table_name} table has no primary_key to detect duplicates with"
+            )
+            assert not (append_only and on_duplicate == "replace"), ValueError(
+                "Append-only datasets are never rewritten, on_duplicate='replace' is not supported. Use 'drop'."
             )
-            log.error(msg)
 
-            raise exc
+        ## Saves are atomic renames, so readers never need these. Writers hold them for a
+        #  whole read-modify-write, so several processes can share the same files.
+        self.lock_timeout = lock_timeout
+        self._file_lock: file_utils.FileLock | None = (
+            file_utils.FileLock(self.pq_file, timeout=lock_timeout)
+            if self.pq_file
+            else None
+        )
+        self._dataset_lock: file_utils.FileLock | None = (
+            file_utils.FileLock(self.dataset_dir, timeout=lock_timeout)
+            if self.dataset_dir
+            else None
+        )
+
+        self._df: pd.DataFrame | None = None
+        self._key_index: key_index.KeyIndex | None = None
+        ## (mtime, size) of pq_file & the key index when last read or written, to detect
+        #  saves by other processes
+        self._file_state: tuple | None = None
+        self._key_index_state: tuple | None = None
+        ## New rows merged into df since the last save, re-applied if pq_file changes
+        self._unsaved: list[pd.DataFrame] = []
+
+    def __enter__(self) -> t.Self:
+        if self.append_only:
+            log.debug(
+                f"Append-only mode, skipping load of existing history. Appending to dataset: {self.dataset_dir}"
+            )
+            self._df = pd.DataFrame()
 
         return self
 
@@ -68,59 +145,70 @@ class LocationsPQFileController(AbstractContextManager):
         if traceback:
             raise traceback
 
-    def rows_to_dict(self, orient: str = "records") -> list[dict]:
-        if not self.df:
-            raise ValueError("DataFrame is empty or None")
-
-        try:
-            dicts: list[dict] = self.df.to_dict(orient="records")
-        except Exception as exc:
-            msg = Exception(
-                f"Unhandled exception converting DataFrame rows to list of dicts. Details: {exc}"
-            )
-            log.error(msg)
-
-            raise exc
+    @property
+    def df(self) -> pd.DataFrame:
+        ## Defer the full read until something needs every row
+        if self._df is None:
+            self._df = self.load()
 
-        return dicts
+        return self._df
 
+    @df.setter
+    def df(self, value: pd.DataFrame | None) -> None:
+        self._df = value
 
-class LocationsJSONFileController(AbstractContextManager):
-    def __init__(self):
-        pass
+    @property
+    def lock(self) -> file_utils.FileLock:
+        """Write lock on the table's storage (`dataset_dir` in append-only mode, else `pq_file`)."""
+        return self._dataset_lock if self.append_only else self._file_lock
 
-    def __enter__(self):
-        pass
+    @staticmethod
+    def _stat(path: Path | None) -> tuple | None:
+        try:
+            st = path.stat()
+        except (AttributeError, OSError):
+            return None
 
-    def __exit__(self, exc_type, exc_value, traceback):
-        pass
+        return st.st_mtime_ns, st.st_size
 
+    def convert(self, data: t.Union[pd.DataFrame, dict, list[dict]] = None) -> pa.Table:
+        """Convert new or legacy data to a table. Override to flatten/conform to `schema`."""
+        if isinstance(data, pd.DataFrame):
+            return pa.Table.from_pandas(data, schema=self.schema, preserve_index=False)
 
-class CurrentWeatherPQFileController(AbstractContextManager):
-    def __init__(
-        self,
-        current_weather_pq_file: t.Union[str, Path] = CURRENT_WEATHER_PQ_FILE,
-        pq_engine: str = PQ_ENGINE,
-    ):
-        self.pq_file = current_weather_pq_file
-        self.pq_engine = pq_engine
+        return pa.Table.from_pylist(
+            [data] if isinstance(data, dict) else data, schema=self.schema
+        )
 
-        self.df: pd.DataFrame | None = None
+    def load(self) -> pd.DataFrame:
+        """Read the whole of `pq_file` into a DataFrame."""
+        if self.append_only:
+            return pd.DataFrame()
 
-    def __enter__(self):
         if not self.pq_file.exists():
             log.warning(
-                f"Current weather Parquet file does not exist at path '{self.pq_file}'. Creating empty DataFrame"
+                f"{self.table_name} Parquet file does not exist at path '{self.pq_file}'. Creating empty DataFrame"
             )
-            _df = pd.DataFrame()
-            self.df = _df
 
-            return self
+            return pd.DataFrame()
 
         try:
-            _df = pd.read_parquet(self.pq_file, engine=self.pq_engine)
+            ## Stat before reading, a save that lands mid-read is picked up by the next sync
+            self._file_state = self._stat(self.pq_file)
+            with instrument.PARQUET_SECONDS.time(table=self.table_name, op="load"):
+                _df = pd.read_parquet(self.pq_file, engine=self.pq_engine)
+            instrument.record_parquet_io(
+                table=self.table_name,
+                op="load",
+                rows=len(_df),
+                nbytes=self._file_state[1] if self._file_state else 0,
+            )
+
+            if self.schema is None:
+                return _df
 
-            self.df = _df
+            ## History saved before the typed schema holds nested dicts, flatten it
+            return self.convert(_df).to_pandas()
         except Exception as exc:
             msg = Exception(
                 f"Unhandled exception loading DataFrame from file '{self.pq_file}'. Details: {exc}"
@@ -129,176 +217,312 @@ class CurrentWeatherPQFileController(AbstractContextManager):
 
             raise exc
 
-        return self
-
-    def __exit__(self, exc_type, exc_value, traceback):
-        if exc_value:
-            log.error(f"({exc_type}) {exc_value}")
-
-        if traceback:
-            raise traceback
+    def _has_typed_schema(self, names: list[str] = None) -> bool:
+        ## Files saved before the typed schema hold nested dicts instead of these columns
+        return self.schema is None or set(self.schema.names).issubset(names)
 
-    def update_df(
-        self,
-        new_data: t.Union[pd.DataFrame, dict, list[dict], list[pd.DataFrame]] = None,
-        save_pq: bool = True,
-    ):
-        ## If self.df is None or an empty DataFrame, set to True with if statement below
-        EMPTY_INIT_DF: bool = False
-        if (isinstance(self.df, pd.DataFrame) and self.df.empty) or self.df is None:
+    def _file_dataset(self) -> ds.Dataset | None:
+        if not self.pq_file.exists():
             log.warning(
-                f"DataFrame is empty. DataFrame will be initialized with new data."
+                f"{self.table_name} Parquet file does not exist at path '{self.pq_file}'"
             )
-            EMPTY_INIT_DF: bool = True
-
-        new_data_df: pd.DataFrame = None
 
-        if isinstance(new_data, pd.DataFrame):
-            new_data_df = new_data
+            return None
 
-        elif isinstance(new_data, dict):
-            ## Create DataFrame from single dict
-            try:
-                new_data_df = pd.DataFrame([new_data])
-            except Exception as exc:
-                msg = Exception(
-                    f"Unhandled exception converting dict to DataFrame. Details: {exc}"
-                )
-                log.error(msg)
-
-                raise exc
-
-        elif isinstance(new_data, list):
-            ## Ensure all items are dataframes or dicts
-            assert all(isinstance(item, pd.DataFrame) for item in new_data) or all(
-                isinstance(item, dict) for item in new_data
-            ), TypeError(
-                f"Every object in the new_data list must be either a dict or Pandas.DataFrame. At least 1 list object is of a different type."
+        dataset: ds.Dataset = ds.dataset(self.pq_file, format="parquet")
+        if not self._has_typed_schema(dataset.schema.names):
+            ## Legacy file without the typed schema, it can only be filtered after flattening
+            log.warning(
+                f"'{self.pq_file}' was saved before the typed schema. Reading the whole file to query it. Save the table again to enable filtered reads."
             )
+            dataset = ds.dataset(self.convert(dataset.to_table().to_pandas()))
 
-            ## Assemble dataframe from list
-            try:
-                new_data_df = pd.DataFrame(new_data)
-            except Exception as exc:
-                msg = Exception(
-                    f"Unhandled exception converting list of dicts or DataFrames to a DataFrame. Details: {exc}"
-                )
-                log.error(msg)
+        return dataset
 
-                raise exc
-
-        if EMPTY_INIT_DF:
-            log.debug(
-                f"Initial DataFrame was empty. Setting controller DataFrame to new_data"
+    def _dataset(self) -> ds.Dataset | None:
+        if self.append_only:
+            return datasets.load_dataset(
+                dataset_dir=self.dataset_dir, schema=self.dataset_schema
             )
-            self.df = new_data_df
-        else:
-            ## self.df was not None or empty, update data
-            log.info("Updating current weather updates history")
-            try:
-                updated_df = pd.concat([self.df, new_data_df])
-                self.df = updated_df
-            except Exception as exc:
-                msg = Exception(
-                    f"Unhandled exception joining existing current weather DataFrame data with new DataFrame data. Details: {exc}"
-                )
-                log.error(msg)
-
-                raise exc
-
-        if save_pq:
-            log.info(f"Saving DataFrame to file: {self.pq_file}")
-            try:
-                self.df.to_parquet(self.pq_file, engine=self.pq_engine)
-            except Exception as exc:
-                msg = Exception(
-                    f"Unhandled exception saving DataFrame to file '{self.pq_file}'. Details: {exc}"
-                )
-                log.error(msg)
 
-                raise exc
+        return self._file_dataset()
 
-    def rows_to_dict(self, orient: str = "records") -> list[dict]:
-        if not self.df:
-            raise ValueError("DataFrame is empty or None")
+    def _build_filter(
+        self,
+        filters: datasets.Filters | None = None,
+        time_range: tuple[datasets.TimeBound, datasets.TimeBound] | None = None,
+    ) -> ds.Expression | None:
+        assert time_range is None or self.time_col, ValueError(
+            f"{self.table_name} table has no time column to filter a time_range on"
+        )
+
+        return datasets.build_filter(
+            filters=filters,
+            time_range=time_range,
+            time_col=self.time_col,
+            date_partition_col=self.date_partition_col if self.append_only else None,
+        )
+
+    def query(
+        self,
+        columns: list[str] | None = None,
+        filters: datasets.Filters | None = None,
+        time_range: tuple[datasets.TimeBound, datasets.TimeBound] | None = None,
+        as_pandas: bool = False,
+    ) -> t.Union[pa.Table, pd.DataFrame]:
+        """Read matching rows from disk, without loading the whole table.
+
+        Column selection & filters are pushed down to pyarrow, so only the selected
+        columns of row groups (or partitions) that can match are read. Rows held in `df`
+        that haven't been saved yet are not included.
+
+        Params:
+            columns (list[str] | None): Columns to read. `None` reads every column.
+            filters (Filters | None): A `pyarrow.dataset.Expression`, DNF tuples like
+                `[("location_key", "=", "40.7128_-74.0060")]`, or a `{column: value(s)}` dict.
+            time_range (tuple | None): `(start, end)` on `time_col`, start inclusive & end
+                exclusive. Bounds can be datetimes, ISO strings, unix timestamps or `None`.
+            as_pandas (bool): Return a `pandas.DataFrame` instead of a `pyarrow.Table`.
+
+        Returns:
+            (pyarrow.Table | pandas.DataFrame): The matching rows.
+
+        """
+        expr: ds.Expression | None = self._build_filter(
+            filters=filters, time_range=time_range
+        )
+        dataset: ds.Dataset | None = self._dataset()
 
         try:
-            dicts: list[dict] = self.df.to_dict(orient="records")
+            if dataset is None:
+                schema: pa.Schema | None = (
+                    self.dataset_schema if self.append_only else self.schema
+                )
+                table: pa.Table = (
+                    pa.table({}) if schema is None else schema.empty_table()
+                )
+                if columns and schema is not None:
+                    table = table.select(columns)
+            else:
+                with instrument.PARQUET_SECONDS.time(table=self.table_name, op="query"):
+                    table: pa.Table = dataset.to_table(columns=columns, filter=expr)
+                instrument.record_parquet_io(
+                    table=self.table_name,
+                    op="query",
+                    rows=table.num_rows,
+                    nbytes=table.nbytes,
+                )
         except Exception as exc:
             msg = Exception(
-                f"Unhandled exception converting DataFrame rows to list of dicts. Details: {exc}"
+                f"Unhandled exception querying {self.table_name} table. Details: {exc}"
             )
             log.error(msg)
 
             raise exc
 
-        return dicts
-
+        return table.to_pandas() if as_pandas else table
 
-class ForecastWeatherPQFileController(AbstractContextManager):
-    def __init__(
+    def iter_batches(
         self,
-        forecast_weather_pq_file: t.Union[str, Path] = FORECAST_WEATHER_PQ_FILE,
-        pq_engine: str = PQ_ENGINE,
-    ):
-        self.pq_file = forecast_weather_pq_file
-        self.pq_engine = pq_engine
+        batch_size: int = 10_000,
+        columns: list[str] | None = None,
+        filters: datasets.Filters | None = None,
+        time_range: tuple[datasets.TimeBound, datasets.TimeBound] | None = None,
+    ) -> t.Iterator[pa.RecordBatch]:
+        """Stream rows saved to disk as record batches of up to `batch_size` rows.
+
+        Only one batch is held in memory at a time, so this can walk a history far
+        larger than memory. Accepts the same `columns`, `filters` & `time_range` as
+        `query()`. Rows held in `df` that haven't been saved yet are not included.
+        """
+        if self.append_only or filters is not None or time_range is not None:
+            expr: ds.Expression | None = self._build_filter(
+                filters=filters, time_range=time_range
+            )
+            dataset: ds.Dataset | None = self._dataset()
+            if dataset is None:
+                return
 
-        self.df: pd.DataFrame | None = None
+            yield from dataset.to_batches(
+                columns=columns, filter=expr, batch_size=batch_size
+            )
+
+            return
 
-    def __enter__(self):
         if not self.pq_file.exists():
             log.warning(
-                f"Weather Forecast Parquet file does not exist at path '{self.pq_file}'. Creating empty DataFrame"
+                f"{self.table_name} Parquet file does not exist at path '{self.pq_file}'"
             )
-            _df = pd.DataFrame()
-            self.df = _df
 
-            return self
+            return
 
-        try:
-            _df = pd.read_parquet(self.pq_file, engine=self.pq_engine)
+        with pq.ParquetFile(self.pq_file) as pq_file:
+            if self._has_typed_schema(pq_file.schema_arrow.names):
+                yield from pq_file.iter_batches(batch_size=batch_size, columns=columns)
 
-            self.df = _df
-        except Exception as exc:
-            msg = Exception(
-                f"Unhandled exception loading DataFrame from file '{self.pq_file}'. Details: {exc}"
+                return
+
+            ## Flatten legacy batches one at a time
+            for batch in pq_file.iter_batches(batch_size=batch_size):
+                table: pa.Table = self.convert(batch.to_pandas())
+
+                yield from (table.select(columns) if columns else table).to_batches()
+
+    def iter_records(
+        self,
+        batch_size: int = 10_000,
+        columns: list[str] | None = None,
+        filters: datasets.Filters | None = None,
+        time_range: tuple[datasets.TimeBound, datasets.TimeBound] | None = None,
+    ) -> t.Iterator[dict]:
+        """Stream rows saved to disk as dicts. See `iter_batches()`."""
+        for batch in self.iter_batches(
+            batch_size=batch_size,
+            columns=columns,
+            filters=filters,
+            time_range=time_range,
+        ):
+            yield from batch.to_pylist()
+
+    @property
+    def key_index_file(self) -> Path:
+        """Sidecar file holding the sorted hashes of every stored row's primary key."""
+        if self.append_only:
+            ## Underscore-prefixed files are skipped when reading the dataset
+            return self.dataset_dir / "_keys.npy"
+
+        return self.pq_file.with_name(f"{self.pq_file.stem}.keys.npy")
+
+    @property
+    def key_index(self) -> key_index.KeyIndex:
+        if self._key_index is None:
+            self._key_index = self._load_key_index()
+
+        return self._key_index
+
+    def _load_key_index(self) -> key_index.KeyIndex:
+        index: key_index.KeyIndex = key_index.KeyIndex(index_file=self.key_index_file)
+        data_path: Path = self.dataset_dir if self.append_only else self.pq_file
+
+        self._key_index_state = self._stat(self.key_index_file)
+        if not data_path.exists():
+            return index
+        ## The file was rewritten without updating the index, it can't be trusted
+        if index.exists and (
+            self.append_only
+            or index.index_file.stat().st_mtime >= data_path.stat().st_mtime
+        ):
+            return index.load()
+
+        log.info(
+            f"Building {self.table_name} key index from history, this only happens once"
+        )
+        hashes: list = [
+            key_index.hash_keys(batch, columns=self.primary_key)
+            for batch in self.iter_batches(batch_size=100_000, columns=self.primary_key)
+        ]
+        if hashes:
+            index.add(np.concatenate(hashes))
+
+        return index
+
+    def _save_key_index(self) -> None:
+        if self.on_duplicate is None:
+            ## Rows were written without updating the index, rebuild it on the next upsert
+            self.key_index_file.unlink(missing_ok=True)
+        elif self._key_index is not None:
+            self._key_index.save()
+            self._key_index_state = self._stat(self.key_index_file)
+
+    def _sync_with_disk(self) -> None:
+        """Reload df if another process saved `pq_file` since it was read. Hold `lock`.
+
+        Rows merged since the last save are re-applied on top of the reloaded table, so
+        concurrent writers don't drop each other's rows.
+        """
+        if self._df is None or self._stat(self.pq_file) == self._file_state:
+            return
+
+        log.info(
+            f"'{self.pq_file}' was saved by another process, reloading before writing"
+        )
+        unsaved: list[pd.DataFrame] = self._unsaved
+        self._df = None
+        self._key_index = None
+        self._unsaved = []
+
+        for new_data_df in unsaved:
+            self._merge(new_data_df)
+
+    def _sync_key_index(self) -> None:
+        """Drop pending rows another process appended since the key index was read. Hold `lock`."""
+        if (
+            self._key_index is None
+            or self._stat(self.key_index_file) == self._key_index_state
+        ):
+            return
+
+        disk_index: key_index.KeyIndex = self._load_key_index()
+        hashes: np.ndarray = key_index.hash_keys(self.df, columns=self.primary_key)
+        keep: np.ndarray = ~disk_index.contains(hashes)
+        if not keep.all():
+            log.debug(
+                f"{self.table_name} upsert: {int((~keep).sum())} row(s) were written by another process, dropping them"
             )
-            log.error(msg)
 
-            raise exc
+        self.df = self.df[keep]
+        disk_index.add(hashes[keep])
+        self._key_index = disk_index
+
+    def _drop_duplicates(self, new_data_df: pd.DataFrame = None) -> pd.DataFrame:
+        """Drop rows of a new batch whose key is already stored (or replace the stored row)."""
+        hashes: np.ndarray = key_index.hash_keys(new_data_df, columns=self.primary_key)
+        ## Within the batch, the first row wins when dropping & the last when replacing
+        mask: np.ndarray = (
+            ~pd.Series(hashes)
+            .duplicated(keep="last" if self.on_duplicate == "replace" else "first")
+            .to_numpy()
+        )
+        stored: np.ndarray = self.key_index.contains(hashes) & mask
+
+        if self.on_duplicate == "drop":
+            mask &= ~stored
+        elif stored.any():
+            ## Only hash the existing rows when something needs replacing
+            existing: np.ndarray = key_index.hash_keys(
+                self.df, columns=self.primary_key
+            )
+            self.df = self.df[~np.isin(existing, hashes[stored])]
 
-        return self
+        skipped: int = len(new_data_df) - int(mask.sum())
+        if skipped or stored.any():
+            log.debug(
+                f"{self.table_name} upsert: {skipped} duplicate row(s) dropped, {int(stored.sum()) if self.on_duplicate == 'replace' else 0} replaced"
+            )
 
-    def __exit__(self, exc_type, exc_value, traceback):
-        if exc_value:
-            log.error(f"({exc_type}) {exc_value}")
+        self.key_index.add(hashes[mask])
 
-        if traceback:
-            raise traceback
+        return new_data_df[mask]
 
     def update_df(
         self,
         new_data: t.Union[pd.DataFrame, dict, list[dict], list[pd.DataFrame]] = None,
         save_pq: bool = True,
     ):
-        ## If self.df is None or an empty DataFrame, set to True with if statement below
-        EMPTY_INIT_DF: bool = False
-        if (isinstance(self.df, pd.DataFrame) and self.df.empty) or self.df is None:
-            log.warning(
-                f"DataFrame is empty. DataFrame will be initialized with new data."
-            )
-            EMPTY_INIT_DF: bool = True
-
         new_data_df: pd.DataFrame = None
 
+        if new_data is None:
+            log.warning(f"No new {self.table_name} data to add, skipping update")
+
+            return
+
         if isinstance(new_data, pd.DataFrame):
-            new_data_df = new_data
+            new_data_df = self.convert(new_data).to_pandas()
 
         elif isinstance(new_data, dict):
-            ## Create DataFrame from single dict
+            ## Flatten a single API response into a typed DataFrame
             try:
-                new_data_df = pd.DataFrame([new_data])
+                new_data_df = self.convert(new_data).to_pandas()
             except Exception as exc:
                 msg = Exception(
                     f"Unhandled exception converting dict to DataFrame. Details: {exc}"
@@ -317,7 +541,10 @@ class ForecastWeatherPQFileController(AbstractContextManager):
 
             ## Assemble dataframe from list
             try:
-                new_data_df = pd.DataFrame(new_data)
+                if all(isinstance(item, pd.DataFrame) for item in new_data):
+                    new_data = pd.concat(new_data)
+
+                new_data_df = self.convert(new_data).to_pandas()
             except Exception as exc:
                 msg = Exception(
                     f"Unhandled exception converting list of dicts or DataFrames to a DataFrame. Details: {exc}"
@@ -326,29 +553,86 @@ class ForecastWeatherPQFileController(AbstractContextManager):
 
                 raise exc
 
-        if EMPTY_INIT_DF:
-            log.debug(
-                f"Initial DataFrame was empty. Setting controller DataFrame to new_data"
+        else:
+            msg = TypeError(
+                f"new_data must be a Pandas.DataFrame, a dict, or a list of either. Got type: ({type(new_data)})"
+            )
+            log.error(msg)
+
+            raise msg
+
+        if self.append_only:
+            if self.on_duplicate is not None and not new_data_df.empty:
+                new_data_df = self._drop_duplicates(new_data_df)
+            self._append_batch(new_data_df=new_data_df, save_pq=save_pq)
+
+            return
+
+        with self.lock if save_pq else nullcontext():
+            self._sync_with_disk()
+            if not self._merge(new_data_df):
+                log.debug(
+                    f"Every new {self.table_name} row is a duplicate, skipping save"
+                )
+
+                return
+
+            if save_pq:
+                self.save()
+
+    def _merge(self, new_data_df: pd.DataFrame = None) -> bool:
+        """Add new rows to df, dropping/replacing duplicates in upsert mode.
+
+        Returns:
+            (bool): `False` if there was nothing to add.
+
+        """
+        if self.on_duplicate is not None and not new_data_df.empty:
+            new_data_df = self._drop_duplicates(new_data_df)
+            if new_data_df.empty:
+                return False
+
+        if self.df is None or self.df.empty:
+            log.warning(
+                f"DataFrame is empty. DataFrame will be initialized with new data."
             )
             self.df = new_data_df
         else:
             ## self.df was not None or empty, update data
-            log.info("Updating current weather updates history")
+            log.info(f"Updating {self.table_name} history")
             try:
                 updated_df = pd.concat([self.df, new_data_df])
-                self.df = updated_df
+                ## Categories differ between frames, re-encode the combined columns
+                self.df = self.convert(updated_df).to_pandas()
             except Exception as exc:
                 msg = Exception(
-                    f"Unhandled exception joining existing current weather DataFrame data with new DataFrame data. Details: {exc}"
+                    f"Unhandled exception joining existing {self.table_name} DataFrame data with new DataFrame data. Details: {exc}"
                 )
                 log.error(msg)
 
                 raise exc
 
-        if save_pq:
+        self._unsaved.append(new_data_df)
+
+        return True
+
+    def save(self):
+        """Atomically replace `pq_file` with df, holding the file's write lock."""
+        with self.lock:
+            self._sync_with_disk()
+
             log.info(f"Saving DataFrame to file: {self.pq_file}")
             try:
-                self.df.to_parquet(self.pq_file, engine=self.pq_engine)
+                with (
+                    instrument.PARQUET_SECONDS.time(table=self.table_name, op="save"),
+                    file_utils.atomic_path(self.pq_file) as tmp_file,
+                ):
+                    self.df.to_parquet(
+                        tmp_file,
+                        engine=self.pq_engine,
+                        schema=self.schema,
+                        row_group_size=PQ_ROW_GROUP_SIZE,
+                    )
             except Exception as exc:
                 msg = Exception(
                     f"Unhandled exception saving DataFrame to file '{self.pq_file}'. Details: {exc}"
@@ -357,12 +641,109 @@ class ForecastWeatherPQFileController(AbstractContextManager):
 
                 raise exc
 
+            self._file_state = self._stat(self.pq_file)
+            instrument.record_parquet_io(
+                table=self.table_name,
+                op="save",
+                rows=len(self.df),
+                nbytes=self._file_state[1] if self._file_state else 0,
+            )
+            self._unsaved = []
+            self._save_key_index()
+
+    def _append_batch(self, new_data_df: pd.DataFrame = None, save_pq: bool = True):
+        ## Hold rows in self.df until they are saved, then write them as a new file
+        if self.df is None or self.df.empty:
+            self.df = new_data_df
+        else:
+            self.df = pd.concat([self.df, new_data_df])
+
+        if not save_pq:
+            return
+
+        self.flush()
+
+    @property
+    def pending_rows(self) -> int:
+        """Rows added with `update_df(save_pq=False)` in append-only mode, not yet written."""
+        if not self.append_only or self._df is None:
+            return 0
+
+        return len(self._df)
+
+    def flush(self):
+        """Append rows held by `update_df(save_pq=False)` to the dataset."""
+        if not self.append_only or self._df is None or self._df.empty:
+            return
+
+        ## Appends write new files, the lock only guards the key index & compaction
+        with self.lock:
+            if self.on_duplicate is not None:
+                self._sync_key_index()
+
+            if not self.df.empty:
+                log.info(
+                    f"Appending {len(self.df)} row(s) to dataset: {self.dataset_dir}"
+                )
+                try:
+                    with instrument.PARQUET_SECONDS.time(
+                        table=self.table_name, op="append"
+                    ):
+                        written: list[Path] = datasets.append_to_dataset(
+                            data=datasets.add_partition_cols(df=self.df),
+                            dataset_dir=self.dataset_dir,
+                            schema=self.dataset_schema,
+                        )
+                except Exception as exc:
+                    msg = Exception(
+                        f"Unhandled exception appending DataFrame to dataset '{self.dataset_dir}'. Details: {exc}"
+                    )
+                    log.error(msg)
+
+                    raise exc
+
+                if instrument.metrics_enabled():
+                    instrument.record_parquet_io(
+                        table=self.table_name,
+                        op="append",
+                        rows=len(self.df),
+                        nbytes=sum((self._stat(path) or (0, 0))[1] for path in written),
+                    )
+
+            self._save_key_index()
+
+        self.df = pd.DataFrame()
+
+    def read_dataset(
+        self, columns: list[str] | None = None, filter: ds.Expression | None = None
+    ) -> pa.Table:
+        return datasets.read_dataset(
+            dataset_dir=self.dataset_dir,
+            columns=columns,
+            filter=filter,
+            schema=self.dataset_schema,
+        )
+
+    def compact(self, min_files: int = 2, before: str | None = None) -> int:
+        """Merge each dataset partition's files into one, see `datasets.compact_dataset()`."""
+        log.info(f"Compacting dataset: {self.dataset_dir}")
+
+        with self._dataset_lock:
+            return datasets.compact_dataset(
+                dataset_dir=self.dataset_dir,
+                min_files=min_files,
+                schema=self.dataset_schema,
+                primary_key=self.primary_key,
+                before=before,
+            )
+
     def rows_to_dict(self, orient: str = "records") -> list[dict]:
-        if not self.df:
+        """Convert every row in `df` to a dict. Use `iter_records()` to stream large tables."""
+        if self.df is None or self.df.empty:
             raise ValueError("DataFrame is empty or None")
 
         try:
-            dicts: list[dict] = self.df.to_dict(orient="records")
+            dicts: list[dict] = self.df.to_dict(orient=orient)
         except Exception as exc:
             msg = Exception(
                 f"Unhandled exception converting DataFrame rows to list of dicts. Details: {exc}"
@@ -372,3 +753,100 @@ class ForecastWeatherPQFileController(AbstractContextManager):
             raise exc
 
         return dicts
+
+
+## Locations table, written by `owm_bot.location.importer`. Missing coordinates are null
+LOCATIONS_SCHEMA: pa.Schema = pa.schema(
+    [
+        ("city_name", pa.string()),
+        ("state_code", pa.string()),
+        ("country_code", pa.string()),
+        ("zip_code", pa.string()),
+        ("lat", pa.float64()),
+        ("lon", pa.float64()),
+    ]
+)
+
+
+class LocationsPQFileController(PQTableController):
+    table_name = "Locations"
+    schema = LOCATIONS_SCHEMA
+    primary_key = ["city_name", "state_code", "country_code", "zip_code"]
+
+    def __init__(
+        self,
+        pq_filepath: t.Union[str, Path] = LOCATIONS_PQ_FILE,
+        pq_engine: str = PQ_ENGINE,
+        on_duplicate: str | None = None,
+    ):
+        super().__init__(
+            pq_file=pq_filepath, pq_engine=pq_engine, on_duplicate=on_duplicate
+        )
+
+
+class LocationsJSONFileController(AbstractContextManager):
+    def __init__(self):
+        pass
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+class CurrentWeatherPQFileController(PQTableController):
+    table_name = "Current weather"
+    schema = weather_tables.CURRENT_WEATHER_SCHEMA
+    dataset_schema = weather_tables.CURRENT_WEATHER_DATASET_SCHEMA
+    time_col = "dt"
+    date_partition_col = "obs_date"
+    primary_key = ["location_key", "dt"]
+
+    def __init__(
+        self,
+        current_weather_pq_file: t.Union[str, Path] = CURRENT_WEATHER_PQ_FILE,
+        pq_engine: str = PQ_ENGINE,
+        append_only: bool = False,
+        dataset_dir: t.Union[str, Path] = CURRENT_WEATHER_PQ_DATASET_DIR,
+        on_duplicate: str | None = None,
+    ):
+        super().__init__(
+            pq_file=current_weather_pq_file,
+            pq_engine=pq_engine,
+            append_only=append_only,
+            dataset_dir=dataset_dir,
+            on_duplicate=on_duplicate,
+        )
+
+    def convert(self, data: t.Union[pd.DataFrame, dict, list[dict]] = None) -> pa.Table:
+        return weather_tables.to_current_weather_table(data)
+
+
+class ForecastWeatherPQFileController(PQTableController):
+    table_name = "Weather forecast"
+    schema = weather_tables.FORECAST_WEATHER_SCHEMA
+    dataset_schema = weather_tables.FORECAST_WEATHER_DATASET_SCHEMA
+    time_col = "dt"
+    date_partition_col = "obs_date"
+    ## A forecast is identified by when it was issued, as well as the time it is for
+    primary_key = ["location_key", "forecast_type", "issued_at", "dt"]
+
+    def __init__(
+        self,
+        forecast_weather_pq_file: t.Union[str, Path] = FORECAST_WEATHER_PQ_FILE,
+        pq_engine: str = PQ_ENGINE,
+        append_only: bool = False,
+        dataset_dir: t.Union[str, Path] = FORECAST_WEATHER_PQ_DATASET_DIR,
+        on_duplicate: str | None = None,
+    ):
+        super().__init__(
+            pq_file=forecast_weather_pq_file,
+            pq_engine=pq_engine,
+            append_only=append_only,
+            dataset_dir=dataset_dir,
+            on_duplicate=on_duplicate,
+        )
+
+    def convert(self, data: t.Union[pd.DataFrame, dict, list[dict]] = None) -> pa.Table:
+        return weather_tables.to_forecast_weather_table(data)
@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+from contextlib import AbstractContextManager
+import logging
+import queue
+import signal
+import threading
+import time
+import typing as t
+
+log = logging.getLogger("owm_bot.location.controllers.write_behind")
+
+from ._controllers import PQTableController
+
+import pandas as pd
+import pyarrow as pa
+
+## Queue markers for the writer thread
+_FLUSH: object = object()
+_STOP: object = object()
+
+
+def _is_marker(item: t.Any) -> bool:
+    return (
+        isinstance(item, tuple)
+        and len(item) == 2
+        and any(item[0] is m for m in (_FLUSH, _STOP))
+    )
+
+
+class WriteBehindBuffer(AbstractContextManager):
+    """Buffer new rows in memory & write them to a table controller from a background thread.
+
+    `put()` only enqueues data, so callers (i.e. HTTP fetches) never wait on flattening or
+    Parquet encoding. A dedicated writer thread converts queued data to Arrow tables and
+    writes them with `controller.update_df()` once `flush_rows` rows are buffered, or
+    `flush_interval` seconds after the last write.
+
+    The queue is bounded: when the writer falls behind by `max_queue` items, `put()`
+    blocks (or raises `queue.Full` after `put_timeout`) instead of growing without limit.
+    Buffered rows are always written on `__exit__`, and on SIGTERM when `handle_sigterm`
+    is set and the buffer was entered from the main thread.
+
+    Params:
+        controller (PQTableController): Controller rows are written with. It is entered &
+            exited with the buffer, and only used from the writer thread in between.
+        flush_rows (int): Write once this many rows are buffered.
+        flush_interval (float): Max seconds rows are buffered before being written.
+        max_queue (int): Max items waiting for the writer thread before `put()` blocks.
+        put_timeout (float | None): Seconds `put()` waits for space in a full queue.
+            `None` waits forever.
+        handle_sigterm (bool): Flush & exit cleanly on SIGTERM.
+        on_write (Callable[[pyarrow.Table], None] | None): Called from the writer thread
+            with each batch once it is written, i.e. to update derived tables.
+    """
+
+    def __init__(
+        self,
+        controller: PQTableController = None,
+        flush_rows: int = 500,
+        flush_interval: float = 60.0,
+        max_queue: int = 100,
+        put_timeout: float | None = None,
+        handle_sigterm: bool = True,
+        on_write: t.Callable[[pa.Table], None] | None = None,
+    ):
+        assert controller is not None, ValueError("Missing a controller to write to")
+        assert max_queue > 0, ValueError("max_queue must be a positive number")
+
+        self.controller = controller
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.handle_sigterm = handle_sigterm
+        self.on_write = on_write
+
+        self.rows_written: int = 0
+        self.write_errors: int = 0
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._tables: list[pa.Table] = []
+        self._buffered_rows: int = 0
+        self._last_write: float = time.monotonic()
+        self._thread: threading.Thread | None = None
+        self._prev_sigterm_handler: t.Any = None
+
+    def __enter__(self) -> t.Self:
+        self.controller.__enter__()
+
+        self._thread = threading.Thread(
+            target=self._run, name="write-behind", daemon=True
+        )
+        self._thread.start()
+
+        if self.handle_sigterm:
+            self._install_sigterm_handler()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_value:
+            log.error(f"({exc_type}) {exc_value}")
+
+        self._restore_sigterm_handler()
+        try:
+            self.close()
+        finally:
+            self.controller.__exit__(None, None, None)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def pending_rows(self) -> int:
+        """Rows converted & waiting to be written. Items still queued are not counted."""
+        return self._buffered_rows
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def put(
+        self,
+        new_data: t.Union[
+            pa.RecordBatch, pa.Table, pd.DataFrame, dict, list[dict]
+        ] = None,
+    ) -> None:
+        """Queue new rows to be written. Blocks while the queue is full."""
+        assert self.running, RuntimeError(
+            "Write-behind buffer is not running. Use it as a context manager."
+        )
+        if new_data is None:
+            return
+
+        self._queue.put(new_data, timeout=self.put_timeout)
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Write everything queued so far, and wait for it to finish.
+
+        Returns:
+            (bool): `False` if the write didn't finish within `timeout` seconds.
+
+        """
+        if not self.running:
+            return True
+
+        done: threading.Event = threading.Event()
+        self._queue.put((_FLUSH, done))
+
+        return done.wait(timeout=timeout)
+
+    def close(self) -> None:
+        """Write everything queued and stop the writer thread."""
+        if not self.running:
+            return
+
+        self._queue.put((_STOP, None))
+        self._thread.join()
+        self._thread = None
+
+    def _to_table(self, data: t.Any) -> pa.Table:
+        if isinstance(data, pa.RecordBatch):
+            data = pa.Table.from_batches([data])
+        if isinstance(data, pa.Table) and (
+            self.controller.schema is None or data.schema.equals(self.controller.schema)
+        ):
+            return data
+
+        return self.controller.convert(
+            data.to_pandas() if isinstance(data, pa.Table) else data
+        )
+
+    def _drain(self, first: t.Any) -> tuple[list, t.Any]:
+        """Take everything already waiting in the queue, up to the next marker."""
+        items: list = [first]
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return items, None
+
+            if _is_marker(item):
+                return items, item
+            items.append(item)
+
+    def _buffer(self, items: list = None) -> None:
+        ## Convert runs of dicts together, one flatten call is much cheaper than many
+        groups: list = []
+        for item in items:
+            if (
+                isinstance(item, (dict, list))
+                and groups
+                and isinstance(groups[-1], list)
+            ):
+                groups[-1].extend([item] if isinstance(item, dict) else item)
+            elif isinstance(item, (dict, list)):
+                groups.append([item] if isinstance(item, dict) else list(item))
+            else:
+                groups.append(item)
+
+        for group in groups:
+            try:
+                table: pa.Table = self._to_table(group)
+            except Exception as exc:
+                msg = Exception(
+                    f"Unhandled exception converting buffered data, dropping it. Details: {exc}"
+                )
+                log.error(msg)
+
+                continue
+
+            self._tables.append(table)
+            self._buffered_rows += table.num_rows
+
+    def _run(self) -> None:
+        while True:
+            timeout: float = max(
+                self.flush_interval - (time.monotonic() - self._last_write), 0.0
+            )
+            try:
+                item = self._queue.get(timeout=timeout if self._buffered_rows else None)
+            except queue.Empty:
+                self._write()
+
+                continue
+
+            marker: t.Any = item if _is_marker(item) else None
+            if marker is None:
+                items, marker = self._drain(item)
+                self._buffer(items)
+
+                if self._buffered_rows >= self.flush_rows or (
+                    time.monotonic() - self._last_write >= self.flush_interval
+                ):
+                    self._write()
+
+            if marker is not None:
+                marker_type, done = marker
+                self._write()
+                if done is not None:
+                    done.set()
+                if marker_type is _STOP:
+                    return
+
+    def _write(self) -> None:
+        self._last_write = time.monotonic()
+        if not self._tables:
+            return
+
+        table: pa.Table = pa.concat_tables(self._tables)
+        try:
+            self.controller.update_df(new_data=table.to_pandas(), save_pq=True)
+        except Exception as exc:
+            ## Keep the rows, they are retried with the next write
+            self.write_errors += 1
+            msg = Exception(
+                f"Unhandled exception writing {table.num_rows} buffered row(s). Details: {exc}"
+            )
+            log.error(msg)
+
+            return
+
+        log.debug(f"Wrote {table.num_rows} buffered row(s)")
+        self.rows_written += table.num_rows
+        self._tables = []
+        self._buffered_rows = 0
+
+        if self.on_write is None:
+            return
+        try:
+            self.on_write(table)
+        except Exception as exc:
+            ## The batch is already written, a failing hook must not retry it
+            msg = Exception(
+                f"Unhandled exception in on_write hook after writing {table.num_rows} row(s). Details: {exc}"
+            )
+            log.error(msg)
+
+    def _install_sigterm_handler(self) -> None:
+        if threading.current_thread() is not threading.main_thread():
+            log.debug("Not in the main thread, SIGTERM will not flush the buffer")
+
+            return
+
+        self._prev_sigterm_handler = signal.signal(signal.SIGTERM, self._on_sigterm)
+
+    def _restore_sigterm_handler(self) -> None:
+        if self._prev_sigterm_handler is None:
+            return
+
+        signal.signal(signal.SIGTERM, self._prev_sigterm_handler)
+        self._prev_sigterm_handler = None
+
+    def _on_sigterm(self, signum: int, frame: t.Any) -> None:
+        log.info("Received SIGTERM, flushing buffered rows")
+        prev_handler = self._prev_sigterm_handler
+        self._restore_sigterm_handler()
+        self.close()
+
+        if callable(prev_handler):
+            prev_handler(signum, frame)
+        elif prev_handler != signal.SIG_IGN:
+            ## Default action is to terminate, exit the same way once rows are written
+            raise SystemExit(128 + signum)
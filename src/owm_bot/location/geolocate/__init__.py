@@ -1 +1,36 @@
-from ._geolocate import get_coords, reverse_geocode
+from __future__ import annotations
+
+import typing as t
+
+from owm_bot.utils.lazy_imports import lazy_module
+
+if t.TYPE_CHECKING:
+    from ._cache import GeocodeCache, GeocodeCacheEntry, get_geocode_cache
+    from ._memo import GeocodeMemo, GeocodePlace, get_geocode_memo, memo_key
+    from ._geolocate import (
+        build_geocode_request,
+        get_coords,
+        reverse_geocode,
+        send_geocode_request,
+    )
+    from ._batch import GeocodeResult, get_coords_many, reverse_geocode_many
+
+__getattr__, __dir__ = lazy_module(
+    __name__,
+    attrs={
+        "GeocodeCache": "._cache",
+        "GeocodeCacheEntry": "._cache",
+        "get_geocode_cache": "._cache",
+        "GeocodeMemo": "._memo",
+        "GeocodePlace": "._memo",
+        "get_geocode_memo": "._memo",
+        "memo_key": "._memo",
+        "build_geocode_request": "._geolocate",
+        "get_coords": "._geolocate",
+        "reverse_geocode": "._geolocate",
+        "send_geocode_request": "._geolocate",
+        "GeocodeResult": "._batch",
+        "get_coords_many": "._batch",
+        "reverse_geocode_many": "._batch",
+    },
+)
@@ -0,0 +1,410 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass, field
+from functools import partial
+import logging
+import typing as t
+
+log = logging.getLogger("owm_bot.location.geolocate.batch")
+
+from owm_bot.core.config import owm_settings
+from owm_bot.core.constants import OPENWEATHERMAP_GEO_URL
+from owm_bot.core.depends import (
+    owm_async_client_dependency,
+    owm_request_layer_dependency,
+)
+from owm_bot.core.http import AsyncTokenBucket, RequestLayer, request_key
+from owm_bot.domain.Location import JsonLocation
+from owm_bot.location.spatial import dedupe_coords
+
+from ._cache import CACHE_MISS, CACHE_STALE, GeocodeCache, get_geocode_cache
+from ._geolocate import build_geocode_request, send_geocode_request
+
+import httpx
+
+
+@dataclass
+class GeocodeResult:
+    """Outcome of one item in a batched geocoding call.
+
+    Results are returned in the same order as the inputs. A failed item has
+    `result=None` and the exception or non-200 response stored in `error`, so
+    one bad location does not fail the whole batch.
+    """
+
+    index: int
+    query: dict = field(default_factory=dict)
+    result: t.Union[dict, list, None] = None
+    status_code: int | None = None
+    error: Exception | None = None
+    ## True when the result was served from the geocode cache
+    from_cache: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _resolve_cache(
+    geocode_cache: GeocodeCache | None, use_geocode_cache: bool
+) -> GeocodeCache | None:
+    if not use_geocode_cache:
+        return None
+
+    ## Not `or`: an empty cache has a length of 0, & is still the one to use
+    return geocode_cache if geocode_cache is not None else get_geocode_cache()
+
+
+def _location_to_query(location: t.Union[JsonLocation, dict]) -> dict:
+    if isinstance(location, JsonLocation):
+        return {
+            "city_name": location.city_name,
+            "state_code": location.state_code,
+            "country_code": location.country_code,
+            "zip_code": location.zip_code,
+        }
+
+    return dict(location)
+
+
+async def _fetch(
+    client: httpx.AsyncClient,
+    request_layer: RequestLayer,
+    rate_limiter: AsyncTokenBucket | None,
+    semaphore: asyncio.Semaphore,
+    url: str,
+    params: dict,
+    endpoint: str,
+) -> tuple[httpx.Response, t.Any]:
+    """Send one geocode request, returning the response & its decoded content (200s only)."""
+    async with semaphore:
+        if rate_limiter is not None:
+            await rate_limiter.acquire()
+
+        res: httpx.Response = await request_layer.send_async(
+            partial(client.get, url, params=params),
+            api_key=params.get("appid"),
+            endpoint=endpoint,
+        )
+
+    return res, (res.json() if res.status_code == 200 else None)
+
+
+async def _send(
+    client: httpx.AsyncClient,
+    request_layer: RequestLayer,
+    rate_limiter: AsyncTokenBucket | None,
+    semaphore: asyncio.Semaphore,
+    result: GeocodeResult,
+    url: str,
+    params: dict,
+) -> GeocodeResult:
+    ## i.e. 'geo_direct', 'geo_zip', 'geo_reverse'
+    endpoint: str = f"geo_{url.rstrip('/').rsplit('/', 1)[-1]}"
+
+    try:
+        ## Identical queries in flight, i.e. duplicate places in a batch, share one request.
+        #  Coalesced before taking a concurrency slot, so waiting callers don't hold one
+        res, decoded = await request_layer.single_flight.do_async(
+            request_key(url=url, params=params),
+            partial(
+                _fetch,
+                client,
+                request_layer,
+                rate_limiter,
+                semaphore,
+                url,
+                params,
+                endpoint,
+            ),
+            endpoint=endpoint,
+        )
+    except Exception as exc:
+        log.error(f"Error requesting geocode for {result.query}. Details: {exc}")
+        result.error = exc
+
+        return result
+
+    result.status_code = res.status_code
+
+    if res.status_code != 200:
+        log.warning(
+            f"Response non-successful: [{res.status_code}: {res.reason_phrase}]: {res.text}"
+        )
+        result.error = httpx.HTTPStatusError(
+            f"[{res.status_code}: {res.reason_phrase}]",
+            request=res.request,
+            response=res,
+        )
+
+        return result
+
+    result.result = decoded
+
+    return result
+
+
+def _serve_from_cache(
+    prepared: list[tuple[GeocodeResult, str | None, dict | None]],
+    geocode_cache: GeocodeCache,
+    request_layer: RequestLayer | None = None,
+) -> list[tuple[GeocodeResult, str | None, dict | None]]:
+    """Fill results from the geocode cache, returning the items that still need a request."""
+    to_send: list[tuple[GeocodeResult, str | None, dict | None]] = []
+
+    for result, url, params in prepared:
+        if result.error is not None:
+            continue
+
+        key: str = geocode_cache.make_key(url=url, params=params)
+        state, entry = geocode_cache.lookup(key)
+        if state == CACHE_MISS:
+            to_send.append((result, url, params))
+
+            continue
+
+        result.from_cache = True
+        result.result = entry.value
+        result.status_code = None if entry.negative else 200
+
+        if state == CACHE_STALE:
+            geocode_cache.refresh_in_background(
+                key=key,
+                fetch=partial(
+                    send_geocode_request,
+                    url=url,
+                    params=params,
+                    request_layer=request_layer,
+                ),
+            )
+
+    return to_send
+
+
+async def _run_batch(
+    prepared: list[tuple[GeocodeResult, str | None, dict | None]],
+    client: httpx.AsyncClient | None = None,
+    max_concurrency: int | None = None,
+    calls_per_minute: int | None = None,
+    rate_limiter: AsyncTokenBucket | None = None,
+    geocode_cache: GeocodeCache | None = None,
+    request_layer: RequestLayer | None = None,
+) -> list[GeocodeResult]:
+    if request_layer is None:
+        request_layer = owm_request_layer_dependency()
+
+    ## Items that failed validation already have an error set
+    to_send: list[tuple[GeocodeResult, str | None, dict | None]] = [
+        item for item in prepared if item[0].error is None
+    ]
+    if geocode_cache is not None:
+        to_send = _serve_from_cache(prepared, geocode_cache, request_layer)
+        log.debug(
+            f"{len(prepared) - len(to_send)} of {len(prepared)} geocode item(s) served from cache"
+        )
+
+    if not to_send:
+        return [result for result, _, _ in prepared]
+
+    max_concurrency = max_concurrency or owm_settings.max_concurrency
+    ## The request layer holds the API key's budget, a batch limit only narrows it further
+    if rate_limiter is None and calls_per_minute:
+        rate_limiter = AsyncTokenBucket(rate=calls_per_minute, period=60.0)
+
+    ## Only close the client if it was created here
+    owns_client: bool = client is None
+    if owns_client:
+        client = owm_async_client_dependency(
+            max_connections=max_concurrency, max_keepalive_connections=max_concurrency
+        )
+
+    semaphore: asyncio.Semaphore = asyncio.Semaphore(max_concurrency)
+
+    try:
+        tasks = [
+            _send(client, request_layer, rate_limiter, semaphore, result, url, params)
+            for result, url, params in to_send
+        ]
+        await asyncio.gather(*tasks)
+    finally:
+        if owns_client:
+            await client.aclose()
+
+    if geocode_cache is not None:
+        for result, url, params in to_send:
+            if result.status_code is None:
+                continue
+            geocode_cache.store_response(
+                key=geocode_cache.make_key(url=url, params=params),
+                status_code=result.status_code,
+                value=result.result,
+                persist=False,
+            )
+        ## Write the cache file once for the whole batch
+        geocode_cache.save()
+
+    return [result for result, _, _ in prepared]
+
+
+async def get_coords_many(
+    locations: list[t.Union[JsonLocation, dict]] = None,
+    limit: int = 5,
+    api_key: str | None = None,
+    client: httpx.AsyncClient | None = None,
+    max_concurrency: int | None = None,
+    calls_per_minute: int | None = None,
+    rate_limiter: AsyncTokenBucket | None = None,
+    geocode_cache: GeocodeCache | None = None,
+    use_geocode_cache: bool = True,
+    request_layer: RequestLayer | None = None,
+) -> list[GeocodeResult]:
+    """Geocode many locations concurrently over one pooled `httpx.AsyncClient`.
+
+    Params:
+        locations (list[JsonLocation | dict]): Locations to geocode. Dicts take the same
+            keys as `get_coords()` (`city_name`, `state_code`, `country_code`, `zip_code`).
+        limit (int): Max number of matches OWM should return for each location.
+        api_key (str | None): OWM API key. Defaults to `owm_settings.api_key`.
+        client (httpx.AsyncClient | None): A shared client to send requests with. When `None`,
+            a pooled client is created for the batch and closed afterwards.
+        max_concurrency (int | None): Max requests in flight at once. Defaults to
+            `owm_settings.max_concurrency`.
+        calls_per_minute (int | None): Extra rate limit for the batch, on top of the API
+            key's budget in the request layer. Ignored when `rate_limiter` is passed.
+        rate_limiter (AsyncTokenBucket | None): A limiter shared with other batches.
+        geocode_cache (GeocodeCache | None): Cache to serve known places from. Defaults to
+            the shared cache from `get_geocode_cache()`.
+        use_geocode_cache (bool): When `False`, every location is requested.
+        request_layer (RequestLayer | None): Layer that budgets & retries the requests.
+            Defaults to the shared `owm_request_layer_dependency()`.
+
+    Returns:
+        (list[GeocodeResult]): One result per location, in input order.
+
+    """
+    assert locations is not None, ValueError("Missing a list of locations to geocode")
+    api_key = api_key or owm_settings.api_key
+
+    prepared: list[tuple[GeocodeResult, str | None, dict | None]] = []
+    for idx, location in enumerate(locations):
+        query: dict = _location_to_query(location)
+        result: GeocodeResult = GeocodeResult(index=idx, query=query)
+
+        try:
+            url, params, _ = build_geocode_request(
+                **query, limit=limit, api_key=api_key
+            )
+        except (AssertionError, ValueError, TypeError) as exc:
+            log.warning(f"Skipping invalid geocode query {query}. Details: {exc}")
+            result.error = exc
+            url, params = None, None
+
+        prepared.append((result, url, params))
+
+    return await _run_batch(
+        prepared,
+        client=client,
+        max_concurrency=max_concurrency,
+        calls_per_minute=calls_per_minute,
+        rate_limiter=rate_limiter,
+        geocode_cache=_resolve_cache(geocode_cache, use_geocode_cache),
+        request_layer=request_layer,
+    )
+
+
+async def reverse_geocode_many(
+    coords: list[t.Union[tuple, JsonLocation]] = None,
+    limit: int = 5,
+    api_key: str | None = None,
+    client: httpx.AsyncClient | None = None,
+    max_concurrency: int | None = None,
+    calls_per_minute: int | None = None,
+    rate_limiter: AsyncTokenBucket | None = None,
+    dedupe_km: float | None = None,
+    geocode_cache: GeocodeCache | None = None,
+    use_geocode_cache: bool = True,
+    request_layer: RequestLayer | None = None,
+) -> list[GeocodeResult]:
+    """Reverse geocode many (lat, lon) pairs concurrently.
+
+    Accepts the same client, concurrency & rate limit options as `get_coords_many()`.
+    Like `reverse_geocode()`, a response with a single match is unwrapped to a dict,
+    and an empty response becomes `None`.
+
+    When `dedupe_km` is set, points within that distance of an earlier point reuse
+    its response instead of sending their own request.
+    """
+    assert coords is not None, ValueError("Missing a list of coordinates to geocode")
+    api_key = api_key or owm_settings.api_key
+
+    prepared: list[tuple[GeocodeResult, str | None, dict | None]] = []
+    for idx, coord in enumerate(coords):
+        if isinstance(coord, JsonLocation):
+            lat, lon = coord.lat, coord.lon
+        else:
+            lat, lon = coord
+
+        result: GeocodeResult = GeocodeResult(index=idx, query={"lat": lat, "lon": lon})
+        if lat is None or lon is None:
+            result.error = ValueError(f"Missing lat/lon for item {idx}")
+            prepared.append((result, None, None))
+
+            continue
+
+        prepared.append(
+            (
+                result,
+                f"{OPENWEATHERMAP_GEO_URL}/reverse",
+                {"lat": f"{lat}", "lon": f"{lon}", "limit": limit, "appid": api_key},
+            )
+        )
+
+    duplicate_of: list[int] = list(range(len(prepared)))
+    if dedupe_km:
+        located: list[int] = [
+            idx for idx, (result, _, _) in enumerate(prepared) if result.error is None
+        ]
+        mapping: list[int] = dedupe_coords(
+            lats=[float(prepared[idx][0].query["lat"]) for idx in located],
+            lons=[float(prepared[idx][0].query["lon"]) for idx in located],
+            max_km=dedupe_km,
+        )
+        for idx, first in zip(located, mapping):
+            duplicate_of[idx] = located[first]
+
+        log.debug(
+            f"Reverse geocoding {len(set(duplicate_of))} unique point(s) for {len(prepared)} input(s)"
+        )
+
+    unique: list[tuple[GeocodeResult, str | None, dict | None]] = [
+        item for idx, item in enumerate(prepared) if duplicate_of[idx] == idx
+    ]
+
+    await _run_batch(
+        unique,
+        client=client,
+        max_concurrency=max_concurrency,
+        calls_per_minute=calls_per_minute,
+        rate_limiter=rate_limiter,
+        geocode_cache=_resolve_cache(geocode_cache, use_geocode_cache),
+        request_layer=request_layer,
+    )
+
+    results: list[GeocodeResult] = []
+    for idx, (result, _, _) in enumerate(prepared):
+        if duplicate_of[idx] != idx:
+            first: GeocodeResult = prepared[duplicate_of[idx]][0]
+            result.result = first.result
+            result.status_code = first.status_code
+            result.error = first.error
+        results.append(result)
+
+    for result in results:
+        if isinstance(result.result, list):
+            if len(result.result) == 0:
+                result.result = None
+            elif len(result.result) == 1:
+                result.result = result.result[0]
+
+    return results
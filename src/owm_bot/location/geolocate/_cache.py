@@ -0,0 +1,349 @@
+from __future__ import annotations
+
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+import json
+import logging
+from pathlib import Path
+import threading
+import time
+import typing as t
+
+log = logging.getLogger("owm_bot.location.geolocate.cache")
+
+from owm_bot.core import instrument
+from owm_bot.core.config import owm_settings
+from owm_bot.core.http import request_key
+from owm_bot.core.paths import GEOCODE_CACHE_FILE
+from owm_bot.utils.file_utils import FileLock, atomic_write
+
+## Lookup states returned by GeocodeCache.lookup()
+CACHE_FRESH: str = "fresh"
+CACHE_STALE: str = "stale"
+CACHE_MISS: str = "miss"
+
+## Status codes that mean "this place does not exist", and can be cached as a negative
+NEGATIVE_STATUS_CODES: tuple[int, ...] = (400, 404)
+
+## A fetch function returns the response's status code & decoded content
+FetchFn = t.Callable[[], tuple[int, t.Any]]
+
+
+@dataclass
+class GeocodeCacheEntry:
+    value: t.Any = None
+    ## True when the lookup found nothing (empty result, 404)
+    negative: bool = False
+    stored_at: float = 0.0
+
+
+class GeocodeCache:
+    """Geocoding-specific cache in front of the hishel HTTP cache.
+
+    Entries are keyed on the normalised request (URL + params, minus the API key) and
+    hold the decoded response. Lookups that found nothing are stored as negative
+    entries with their own, shorter TTL. Once an entry is older than `ttl` it is still
+    served for up to `stale_ttl` more seconds while a background thread refreshes it.
+
+    New entries are persisted `save_delay` seconds after they are stored, so a run of
+    lookups rewrites the file once, and any left unsaved are persisted at exit. Expired
+    entries are dropped when saving.
+
+    Params:
+        cache_file (str | Path | None): JSON file the cache is persisted to. `None` keeps
+            the cache in memory only.
+        ttl (int | None): Seconds a positive entry is fresh for.
+        stale_ttl (int | None): Seconds after `ttl` that a stale entry can still be served.
+        negative_ttl (int | None): Seconds a negative entry is served for.
+        max_refresh_workers (int): Threads refreshing stale entries in the background.
+        save_delay (float): Seconds to wait after an entry is stored before persisting
+            the cache, batching the entries stored in the meantime into one save.
+    """
+
+    def __init__(
+        self,
+        cache_file: t.Union[str, Path, None] = GEOCODE_CACHE_FILE,
+        ttl: int | None = None,
+        stale_ttl: int | None = None,
+        negative_ttl: int | None = None,
+        max_refresh_workers: int = 2,
+        save_delay: float = 5.0,
+    ):
+        self.cache_file: Path | None = (
+            Path(f"{cache_file}") if cache_file is not None else None
+        )
+        self.ttl = owm_settings.geocode_ttl if ttl is None else ttl
+        self.stale_ttl = (
+            owm_settings.geocode_stale_ttl if stale_ttl is None else stale_ttl
+        )
+        self.negative_ttl = (
+            owm_settings.geocode_negative_ttl if negative_ttl is None else negative_ttl
+        )
+        self.max_refresh_workers = max_refresh_workers
+        self.save_delay = save_delay
+
+        self._entries: dict[str, GeocodeCacheEntry] | None = None
+        self._lock: threading.RLock = threading.RLock()
+        self._refreshing: set[str] = set()
+        self._executor: ThreadPoolExecutor | None = None
+        ## Entries stored since the last save, & the timer that will save them
+        self._dirty: bool = False
+        self._save_timer: threading.Timer | None = None
+        self._flush_at_exit: bool = False
+        self._file_lock: FileLock | None = (
+            FileLock(self.cache_file) if self.cache_file is not None else None
+        )
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @staticmethod
+    def make_key(url: str = None, params: dict | None = None) -> str:
+        """Build a cache key from a request, ignoring param order, case & the API key."""
+        return request_key(url=url, params=params)
+
+    @property
+    def entries(self) -> dict[str, GeocodeCacheEntry]:
+        ## Load the persisted cache on first use
+        if self._entries is None:
+            with self._lock:
+                if self._entries is None:
+                    self._entries = self._load()
+
+        return self._entries
+
+    def expired(
+        self, entry: GeocodeCacheEntry = None, now: float | None = None
+    ) -> bool:
+        """`True` once an entry is too old to be served, even as stale."""
+        age: float = (time.time() if now is None else now) - entry.stored_at
+        if entry.negative:
+            return age > self.negative_ttl
+
+        return age > self.ttl + self.stale_ttl
+
+    def _load(self) -> dict[str, GeocodeCacheEntry]:
+        if self.cache_file is None or not self.cache_file.exists():
+            return {}
+
+        try:
+            with open(self.cache_file, "r") as f:
+                raw: dict = json.load(f)
+
+            return {key: GeocodeCacheEntry(**entry) for key, entry in raw.items()}
+        except Exception as exc:
+            msg = Exception(
+                f"Unhandled exception loading geocode cache from '{self.cache_file}'. Starting with an empty cache. Details: {exc}"
+            )
+            log.warning(msg)
+
+            return {}
+
+    def save(self) -> None:
+        """Merge the cache into `cache_file`, keeping the newest entry for each key.
+
+        Other processes sharing the file are locked out during the merge, and the file is
+        replaced atomically, so concurrent savers don't lose each other's entries. Expired
+        entries are left out.
+        """
+        if self.cache_file is None:
+            return
+
+        try:
+            with self._file_lock:
+                merged: dict[str, GeocodeCacheEntry] = self._load()
+                with self._lock:
+                    self._dirty = False
+                    for key, entry in self.entries.items():
+                        if (
+                            key not in merged
+                            or entry.stored_at >= merged[key].stored_at
+                        ):
+                            merged[key] = entry
+                    now: float = time.time()
+                    merged = {
+                        key: entry
+                        for key, entry in merged.items()
+                        if not self.expired(entry, now)
+                    }
+                    ## Pick up entries saved by other processes too
+                    self._entries = merged
+
+                    data: dict = {key: asdict(entry) for key, entry in merged.items()}
+
+                with atomic_write(self.cache_file, "w") as f:
+                    json.dump(data, f)
+        except Exception as exc:
+            msg = Exception(
+                f"Unhandled exception saving geocode cache to '{self.cache_file}'. Details: {exc}"
+            )
+            log.error(msg)
+
+    def schedule_save(self) -> None:
+        """Save the cache in `save_delay` seconds, along with anything stored until then."""
+        if self.cache_file is None:
+            return
+
+        with self._lock:
+            self._dirty = True
+            if self._save_timer is not None:
+                return
+
+            if not self._flush_at_exit:
+                atexit.register(self.flush)
+                self._flush_at_exit = True
+
+            self._save_timer = threading.Timer(self.save_delay, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self) -> None:
+        """Save entries stored since the last save now, instead of waiting for the timer."""
+        with self._lock:
+            timer, self._save_timer = self._save_timer, None
+            dirty: bool = self._dirty
+        if timer is not None:
+            timer.cancel()
+
+        if dirty:
+            self.save()
+
+    def lookup(self, key: str = None) -> tuple[str, GeocodeCacheEntry | None]:
+        """Find the entry for `key` & whether it is fresh, stale or missing (or expired)."""
+        state, entry = self._lookup(key)
+        instrument.CACHE_LOOKUPS.inc(
+            cache="geocode", result="hit" if state == CACHE_FRESH else state
+        )
+
+        return state, entry
+
+    def _lookup(self, key: str = None) -> tuple[str, GeocodeCacheEntry | None]:
+        entry: GeocodeCacheEntry | None = self.entries.get(key)
+        if entry is None:
+            return CACHE_MISS, None
+
+        age: float = time.time() - entry.stored_at
+        if entry.negative:
+            return (
+                (CACHE_FRESH, entry) if age <= self.negative_ttl else (CACHE_MISS, None)
+            )
+
+        if age <= self.ttl:
+            return CACHE_FRESH, entry
+        if age <= self.ttl + self.stale_ttl:
+            return CACHE_STALE, entry
+
+        return CACHE_MISS, None
+
+    def store(
+        self,
+        key: str = None,
+        value: t.Any = None,
+        negative: bool = False,
+        persist: bool = True,
+    ) -> GeocodeCacheEntry:
+        entry: GeocodeCacheEntry = GeocodeCacheEntry(
+            value=None if negative else value, negative=negative, stored_at=time.time()
+        )
+        with self._lock:
+            self.entries[key] = entry
+
+        if persist:
+            self.schedule_save()
+
+        return entry
+
+    def store_response(
+        self,
+        key: str = None,
+        status_code: int = None,
+        value: t.Any = None,
+        persist: bool = True,
+    ) -> bool:
+        """Cache a response if it is a definite answer. Returns `True` if it was cached.
+
+        Successful responses with content are cached as positive entries; empty results
+        & not-found responses as negative entries. Anything else (429, 5xx) is not cached.
+        """
+        if status_code == 200 and value:
+            self.store(key=key, value=value, persist=persist)
+        elif status_code == 200 or status_code in NEGATIVE_STATUS_CODES:
+            log.debug(f"Caching negative geocode result for '{key}'")
+            self.store(key=key, negative=True, persist=persist)
+        else:
+            return False
+
+        return True
+
+    def _refresh(self, key: str, fetch: FetchFn) -> None:
+        try:
+            status_code, value = fetch()
+            self.store_response(key=key, status_code=status_code, value=value)
+        except Exception as exc:
+            log.warning(
+                f"Background refresh of geocode entry '{key}' failed. Details: {exc}"
+            )
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def refresh_in_background(self, key: str = None, fetch: FetchFn = None) -> None:
+        with self._lock:
+            ## Only one refresh per key at a time
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_refresh_workers,
+                    thread_name_prefix="geocode-refresh",
+                )
+
+        log.debug(f"Serving stale geocode entry '{key}', refreshing in background")
+        self._executor.submit(self._refresh, key, fetch)
+
+    def get_or_fetch(
+        self, url: str = None, params: dict | None = None, fetch: FetchFn = None
+    ) -> t.Any:
+        """Serve a request from the cache, calling `fetch` only when needed.
+
+        Fresh entries are returned as-is. Stale entries are returned immediately while
+        `fetch` runs in a background thread. On a miss, `fetch` runs inline and its
+        result is cached if it is a definite answer.
+        """
+        key: str = self.make_key(url=url, params=params)
+        state, entry = self.lookup(key)
+
+        if state == CACHE_FRESH:
+            return entry.value
+        if state == CACHE_STALE:
+            self.refresh_in_background(key=key, fetch=fetch)
+
+            return entry.value
+
+        status_code, value = fetch()
+        self.store_response(key=key, status_code=status_code, value=value)
+
+        return value
+
+    def wait_for_refreshes(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+        self.flush()
+
+
+## Process-wide cache, so every caller shares one in-memory copy
+_geocode_cache: GeocodeCache | None = None
+
+
+def get_geocode_cache() -> GeocodeCache:
+    global _geocode_cache
+
+    if _geocode_cache is None:
+        _geocode_cache = GeocodeCache()
+
+    return _geocode_cache
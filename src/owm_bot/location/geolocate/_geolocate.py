@@ -1,18 +1,25 @@
 import typing as t
+from functools import partial
 import logging
 
 log = logging.getLogger("owm_bot.location.geolocate")
 
-from owm_bot.core.depends import owm_hishel_filestorage_dependency
+from owm_bot.core.depends import (
+    owm_hishel_storage_dependency,
+    owm_request_layer_dependency,
+)
+from owm_bot.core.http import ONLY_IF_CACHED, RequestLayer, request_key
 from owm_bot.core.constants import OPENWEATHERMAP_GEO_URL
 from owm_bot.core.config import owm_settings
 
+from ._cache import GeocodeCache, get_geocode_cache
+
 import httpx
 import hishel
 from red_utils.ext import httpx_utils
 
 
-def get_coords(
+def build_geocode_request(
     city_name: str | None = None,
     state_code: str | None = None,
     country_code: str | None = None,
@@ -20,16 +27,7 @@ def get_coords(
     response_format: str = "json",
     limit: int = 5,
     api_key: str = owm_settings.api_key,
-    cache_storage: (
-        t.Union[hishel.FileStorage, hishel.SQLiteStorage, hishel.InMemoryStorage] | None
-    ) = None,
-    cache_ttl: int = 900,
-    debug_http_response: bool = False,
-) -> dict | None:
-
-    if cache_storage is None:
-        cache_storage = owm_hishel_filestorage_dependency()
-
+) -> tuple[str, dict, str]:
     ## Initialize USE_ZIP as False
     USE_ZIP: bool = False
 
@@ -51,9 +49,7 @@ def get_coords(
         ## Build query string
         q: str = f"{city_name},{state_code},{country_code}"
         ## Set log print message
-        print_msg: str = (
-            f"Requesting weather in {city_name.title()}, {state_code.upper()} {country_code.upper()}"
-        )
+        print_msg: str = f"Requesting weather in {city_name.title()}, {state_code.upper()} {country_code.upper()}"
         ## Tell request not to use zip_code query
         USE_ZIP = False
         ## Build params dict
@@ -73,18 +69,46 @@ def get_coords(
         ## Build params dict
         params = {"zip": q, "limit": limit, "appid": api_key, "format": response_format}
 
+    url: str = f"{OPENWEATHERMAP_GEO_URL}{'/zip' if USE_ZIP else '/direct'}"
+
+    return url, params, print_msg
+
+
+def _send_geocode_request(
+    url: str,
+    params: dict,
+    cache_storage: t.Union[
+        hishel.FileStorage, hishel.SQLiteStorage, hishel.InMemoryStorage
+    ],
+    request_layer: RequestLayer,
+    endpoint: str,
+    debug_http_response: bool = False,
+) -> tuple[int, t.Any]:
     with httpx_utils.HishelCacheClientController(
         force_cache=True, storage=cache_storage, follow_redirects=True
     ) as cache_ctl:
-        req: httpx.Request = cache_ctl.new_request(
-            url=f"{OPENWEATHERMAP_GEO_URL}{'/zip' if USE_ZIP else '/direct'}",
-            params=params,
+        req: httpx.Request = cache_ctl.new_request(url=url, params=params)
+        cached_req: httpx.Request = cache_ctl.new_request(
+            url=url, params=params, headers=ONLY_IF_CACHED
         )
 
-        try:
-            res: httpx.Response = cache_ctl.send_request(
+        def _send() -> httpx.Response:
+            res: httpx.Response | None = cache_ctl.send_request(
                 request=req, debug_response=debug_http_response
             )
+            if res is None:
+                raise httpx.ConnectError(f"Could not connect to {url}", request=req)
+
+            return res
+
+        try:
+            res: httpx.Response = request_layer.send(
+                _send,
+                api_key=params.get("appid"),
+                endpoint=endpoint,
+                cache="http_geo",
+                cached=partial(cache_ctl.client.send, cached_req),
+            )
 
         except Exception as exc:
             msg = Exception(
@@ -99,7 +123,7 @@ def get_coords(
             ## Success, decode response
             try:
                 _decode = cache_ctl.decode_res_content(res=res)
-                return _decode
+                return res.status_code, _decode
 
             except Exception as exc:
                 msg = Exception(
@@ -115,7 +139,97 @@ def get_coords(
                 f"Response non-successful: [{res.status_code}: {res.reason_phrase}]: {res.text}"
             )
 
-            return None
+            return res.status_code, None
+
+
+def send_geocode_request(
+    url: str = None,
+    params: dict = None,
+    cache_storage: (
+        t.Union[hishel.FileStorage, hishel.SQLiteStorage, hishel.InMemoryStorage] | None
+    ) = None,
+    debug_http_response: bool = False,
+    request_layer: RequestLayer | None = None,
+) -> tuple[int, t.Any]:
+    """Send a geocoding request through the hishel HTTP cache.
+
+    The request goes through the shared `RequestLayer`, which waits for the API key's
+    budget & retries 429/5xx responses. Identical requests sent while this one is in
+    flight (from other threads) wait for it & share its decoded result.
+
+    Returns:
+        (tuple[int, Any]): The response status code, and the decoded response content
+            (`None` for non-200 responses).
+
+    """
+    if cache_storage is None:
+        cache_storage = owm_hishel_storage_dependency(endpoint="geo")
+    if request_layer is None:
+        request_layer = owm_request_layer_dependency()
+
+    ## i.e. 'geo_direct', 'geo_zip', 'geo_reverse'
+    endpoint: str = f"geo_{url.rstrip('/').rsplit('/', 1)[-1]}"
+
+    return request_layer.single_flight.do(
+        request_key(url=url, params=params),
+        partial(
+            _send_geocode_request,
+            url,
+            params,
+            cache_storage,
+            request_layer,
+            endpoint,
+            debug_http_response=debug_http_response,
+        ),
+        endpoint=endpoint,
+    )
+
+
+def get_coords(
+    city_name: str | None = None,
+    state_code: str | None = None,
+    country_code: str | None = None,
+    zip_code: str | None = None,
+    response_format: str = "json",
+    limit: int = 5,
+    api_key: str = owm_settings.api_key,
+    cache_storage: (
+        t.Union[hishel.FileStorage, hishel.SQLiteStorage, hishel.InMemoryStorage] | None
+    ) = None,
+    cache_ttl: int = 900,
+    debug_http_response: bool = False,
+    geocode_cache: GeocodeCache | None = None,
+    use_geocode_cache: bool = True,
+    request_layer: RequestLayer | None = None,
+) -> dict | None:
+    url, params, print_msg = build_geocode_request(
+        city_name=city_name,
+        state_code=state_code,
+        country_code=country_code,
+        zip_code=zip_code,
+        response_format=response_format,
+        limit=limit,
+        api_key=api_key,
+    )
+
+    def _fetch() -> tuple[int, t.Any]:
+        return send_geocode_request(
+            url=url,
+            params=params,
+            cache_storage=cache_storage,
+            debug_http_response=debug_http_response,
+            request_layer=request_layer,
+        )
+
+    if not use_geocode_cache:
+        _, _decode = _fetch()
+
+        return _decode
+
+    if geocode_cache is None:
+        geocode_cache = get_geocode_cache()
+
+    return geocode_cache.get_or_fetch(url=url, params=params, fetch=_fetch)
 
 
 def reverse_geocode(
@@ -126,48 +240,32 @@ def reverse_geocode(
         t.Union[hishel.FileStorage, hishel.InMemoryStorage, hishel.SQLiteStorage] | None
     ) = None,
     api_key: str = owm_settings.api_key,
+    geocode_cache: GeocodeCache | None = None,
+    use_geocode_cache: bool = True,
+    request_layer: RequestLayer | None = None,
 ) -> dict | None:
-    if cache_storage is None:
-        cache_storage = owm_hishel_filestorage_dependency()
-
-    with httpx_utils.HishelCacheClientController(
-        force_cache=True, storage=cache_storage
-    ) as httpx_ctl:
-        req = httpx_ctl.new_request(
-            url=f"{OPENWEATHERMAP_GEO_URL}/reverse",
-            params={"lat": lat, "lon": lon, "limit": limit, "appid": api_key},
-        )
+    url: str = f"{OPENWEATHERMAP_GEO_URL}/reverse"
+    params: dict = {"lat": f"{lat}", "lon": f"{lon}", "limit": limit, "appid": api_key}
 
+    def _fetch() -> tuple[int, t.Any]:
         log.info(f"Reverse geocoding lat-{lat}, lon-{lon}")
-        # log.debug(f"URL: {req.url}")
-        try:
-            res = httpx_ctl.send_request(request=req)
-        except Exception as exc:
-            msg = Exception(
-                f"Unhandled exception sending geolocation request. Details: {exc}"
-            )
-            log.error(msg)
 
-            raise exc
-
-    # log.info(f"Reverse geocode response: [{res.status_code}: {res.reason_phrase}]")
-
-    if res.status_code == 200:
-        try:
-            _decode = httpx_ctl.decode_res_content(res=res)
-        except Exception as exc:
-            msg = Exception(
-                f"Unhandled exception decoding reverse geocode response content. Details: {exc}"
-            )
-            log.error(msg)
-
-            raise exc
+        return send_geocode_request(
+            url=url,
+            params=params,
+            cache_storage=cache_storage,
+            request_layer=request_layer,
+        )
 
+    if not use_geocode_cache:
+        _, _decode = _fetch()
     else:
-        log.warning(
-            f"Response non-successful: [{res.status_code}: {res.reason_phrase}]: {res.text}"
-        )
+        if geocode_cache is None:
+            geocode_cache = get_geocode_cache()
+
+        _decode = geocode_cache.get_or_fetch(url=url, params=params, fetch=_fetch)
 
+    if _decode is None:
         return None
 
     if isinstance(_decode, list):
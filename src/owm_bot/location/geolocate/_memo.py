@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+from dataclasses import astuple, dataclass
+import logging
+from pathlib import Path
+import sqlite3
+import threading
+import time
+import typing as t
+
+log = logging.getLogger("owm_bot.location.geolocate.memo")
+
+from owm_bot.core import instrument
+from owm_bot.core.paths import GEOCODE_MEMO_FILE
+
+_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS geocode_memo (
+    query TEXT PRIMARY KEY,
+    name TEXT,
+    state TEXT,
+    country TEXT,
+    zip TEXT,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    stored_at REAL NOT NULL
+) WITHOUT ROWID
+"""
+
+
+@dataclass(frozen=True)
+class GeocodePlace:
+    """A resolved place, as stored in the `GeocodeMemo`."""
+
+    name: str | None
+    state: str | None
+    country: str | None
+    zip: str | None
+    lat: float
+    lon: float
+
+
+def memo_key(
+    city_name: str | None = None,
+    state_code: str | None = None,
+    country_code: str | None = None,
+    zip_code: str | None = None,
+) -> str:
+    """Build a memo key from a geocoding query, ignoring case & surrounding whitespace.
+
+    Like `build_geocode_request()`, a zip code query ignores the city & state.
+    """
+    parts: tuple = (
+        ("zip", zip_code, country_code)
+        if zip_code
+        else ("q", city_name, state_code, country_code)
+    )
+
+    return "|".join(f"{part or ''}".strip().casefold() for part in parts)
+
+
+class GeocodeMemo:
+    """Decoded geocoding results, kept in one SQLite table: query -> place.
+
+    A lookup for a place that was already resolved is a primary key read, or a dict read
+    once the place has been looked up in this process, so it skips the HTTP cache &
+    response decoding entirely. Only resolved places are stored, & entries don't expire:
+    a place's coordinates don't change. Use `GeocodeCache` to cache raw responses,
+    not-found results & reverse lookups.
+
+    Params:
+        memo_file (str | Path | None): SQLite database the memo is kept in. `None` keeps
+            the memo in memory only.
+    """
+
+    def __init__(self, memo_file: t.Union[str, Path, None] = GEOCODE_MEMO_FILE):
+        self.memo_file: Path | None = (
+            Path(f"{memo_file}") if memo_file is not None else None
+        )
+
+        self._places: dict[str, GeocodePlace] = {}
+        self._conn: sqlite3.Connection | None = None
+        self._lock: threading.Lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM geocode_memo").fetchone()[0]
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        ## Open the database on first use
+        if self._conn is None:
+            self._conn = self._connect()
+
+        return self._conn
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.memo_file is None:
+            conn: sqlite3.Connection = sqlite3.connect(
+                ":memory:", check_same_thread=False
+            )
+            conn.execute(_SCHEMA)
+
+            return conn
+
+        self.memo_file.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            conn = sqlite3.connect(
+                f"{self.memo_file}", timeout=5.0, check_same_thread=False
+            )
+            ## WAL lets other processes read the memo while one writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(_SCHEMA)
+        except Exception as exc:
+            msg = Exception(
+                f"Unhandled exception opening geocode memo '{self.memo_file}'. Details: {exc}"
+            )
+            log.error(msg)
+
+            raise exc
+
+        return conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def get(self, key: str = None) -> GeocodePlace | None:
+        """Return the place memoized for `key` (see `memo_key()`), or `None`."""
+        place: GeocodePlace | None = self._places.get(key)
+        if place is None:
+            with self._lock:
+                row: tuple | None = self.conn.execute(
+                    "SELECT name, state, country, zip, lat, lon FROM geocode_memo WHERE query = ?",
+                    (key,),
+                ).fetchone()
+            if row is not None:
+                place = self._places[key] = GeocodePlace(*row)
+
+        instrument.CACHE_LOOKUPS.inc(
+            cache="geocode_memo", result="miss" if place is None else "hit"
+        )
+
+        return place
+
+    def put(self, key: str = None, place: GeocodePlace = None) -> None:
+        self.put_many({key: place})
+
+    def put_many(self, places: dict[str, GeocodePlace] = None) -> None:
+        """Memoize many places in one transaction."""
+        if not places:
+            return
+
+        stored_at: float = time.time()
+        try:
+            with self._lock, self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO geocode_memo VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (key, *astuple(place), stored_at)
+                        for key, place in places.items()
+                    ],
+                )
+        except Exception as exc:
+            msg = Exception(
+                f"Unhandled exception writing {len(places)} place(s) to geocode memo '{self.memo_file}'. Details: {exc}"
+            )
+            log.error(msg)
+
+            raise exc
+
+        self._places.update(places)
+
+    def clear(self) -> None:
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM geocode_memo")
+        self._places.clear()
+
+
+## Process-wide memo, so every caller shares one connection & in-memory copy
+_geocode_memo: GeocodeMemo | None = None
+
+
+def get_geocode_memo() -> GeocodeMemo:
+    global _geocode_memo
+
+    if _geocode_memo is None:
+        _geocode_memo = GeocodeMemo()
+
+    return _geocode_memo
@@ -0,0 +1,12 @@
+from __future__ import annotations
+
+from ._import import LocationImportStats, import_locations
+from ._sources import (
+    COLUMN_ALIASES,
+    COUNTRY_ALIASES,
+    LOCATION_COLUMNS,
+    LOCATION_FILE_FORMATS,
+    LOCATION_KEY_COLUMNS,
+    normalise_locations,
+    read_locations_file,
+)
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+import logging
+from pathlib import Path
+import time
+import typing as t
+
+log = logging.getLogger("owm_bot.location.importer")
+
+from owm_bot.core.paths import LOCATIONS_PQ_FILE
+from owm_bot.domain.Location import JsonLocation
+from owm_bot.location.controllers import LocationsPQFileController
+
+from ._sources import (
+    LOCATION_COLUMNS,
+    LOCATION_KEY_COLUMNS,
+    normalise_locations,
+    read_locations_file,
+)
+
+import pandas as pd
+
+if t.TYPE_CHECKING:
+    from owm_bot.location.geolocate import GeocodeMemo, GeocodePlace, GeocodeResult
+
+
+@dataclass
+class LocationImportStats:
+    ## Rows read from the import file
+    rows: int = 0
+    ## Rows without a country code, and a zip code or city & state
+    invalid: int = 0
+    ## Rows repeating an earlier row of the file, or a stored location
+    duplicates: int = 0
+    added: int = 0
+    geocoded: int = 0
+    ## Stored locations still missing coordinates after geocoding
+    not_geocoded: int = 0
+    seconds: float = 0.0
+
+
+def _missing_coords(df: pd.DataFrame) -> pd.Series:
+    if df.empty:
+        return pd.Series(False, index=df.index)
+
+    return df["lat"].isna() | df["lon"].isna()
+
+
+def _to_locations(places: pd.DataFrame) -> list[JsonLocation]:
+    ## Missing values must be `None`, not NaN/NA, for build_geocode_request()
+    keys: pd.DataFrame = places[LOCATION_KEY_COLUMNS].astype(object)
+    records: list[dict] = keys.where(keys.notna(), None).to_dict(orient="records")
+
+    return [JsonLocation.model_construct(**record) for record in records]
+
+
+def _geocode_batch(
+    places: pd.DataFrame, geocode_memo: GeocodeMemo, api_key: str | None = None
+) -> pd.DataFrame:
+    """Fill in the lat/lon of `places` from the geocode memo, or with one batched request."""
+    from owm_bot.location import geo_result_to_location, location_to_place
+    from owm_bot.location.geolocate import get_coords_many, memo_key
+
+    places = places.copy()
+    queries: list[JsonLocation] = _to_locations(places)
+    keys: list[str] = [
+        memo_key(
+            city_name=query.city_name,
+            state_code=query.state_code,
+            country_code=query.country_code,
+            zip_code=query.zip_code,
+        )
+        for query in queries
+    ]
+
+    memoized: list[GeocodePlace | None] = [geocode_memo.get(key) for key in keys]
+    for row, place in enumerate(memoized):
+        if place is not None:
+            places.iloc[row, places.columns.get_loc("lat")] = place.lat
+            places.iloc[row, places.columns.get_loc("lon")] = place.lon
+
+    to_request: list[int] = [row for row, place in enumerate(memoized) if place is None]
+    if not to_request:
+        return places
+
+    locations: list[JsonLocation] = [queries[row] for row in to_request]
+    results: list[GeocodeResult] = asyncio.run(
+        get_coords_many(locations=locations, api_key=api_key)
+    )
+
+    resolved: dict[str, GeocodePlace] = {}
+    for row, location, result in zip(to_request, locations, results):
+        if not result.ok:
+            log.warning(f"Could not geocode location {result.query}: {result.error}")
+            continue
+
+        updated_location: JsonLocation | None = geo_result_to_location(
+            location=location, geo_result=result.result
+        )
+        if updated_location is None:
+            log.warning(f"No geocoding matches for location {result.query}")
+            continue
+
+        resolved[keys[row]] = location_to_place(updated_location)
+        places.iloc[row, places.columns.get_loc("lat")] = float(updated_location.lat)
+        places.iloc[row, places.columns.get_loc("lon")] = float(updated_location.lon)
+
+    geocode_memo.put_many(resolved)
+
+    return places
+
+
+def import_locations(
+    path: t.Union[str, Path] = None,
+    file_format: str | None = None,
+    pq_file: t.Union[str, Path] = LOCATIONS_PQ_FILE,
+    geocode: bool = True,
+    batch_size: int = 1000,
+    api_key: str | None = None,
+) -> LocationImportStats:
+    """Add a CSV, JSONL or Parquet list of places to the locations table.
+
+    Places are normalised (see `normalise_locations()`), deduplicated within the file &
+    against the table on (city, state, country, zip), and the new ones appended in one
+    write. Then every stored location missing lat/lon, including ones left over from an
+    earlier import, is geocoded in batches of `batch_size`: places in the geocode memo
+    are filled in without a request, the rest go through `get_coords_many()`. The table
+    is saved after each batch, so an interrupted import picks up where it stopped.
+
+    Params:
+        path (str | Path): File to import.
+        file_format (str | None): 'csv', 'jsonl' or 'parquet'. Defaults to the file's suffix.
+        pq_file (str | Path): The locations table.
+        geocode (bool): When `False`, places are stored without requesting coordinates.
+        batch_size (int): Locations geocoded (& saved) at a time.
+        api_key (str | None): OWM API key. Defaults to `owm_settings.api_key`.
+
+    Returns:
+        (LocationImportStats): What was read, skipped, added & geocoded.
+
+    """
+    assert batch_size > 0, ValueError("batch_size must be a positive integer")
+
+    started: float = time.perf_counter()
+    stats: LocationImportStats = LocationImportStats()
+
+    places, valid = normalise_locations(read_locations_file(path, file_format))
+    stats.rows = len(places)
+    stats.invalid = int((~valid).sum())
+    if stats.invalid:
+        log.warning(
+            f"Skipping {stats.invalid} location(s) without a country code, and a zip code or city & state"
+        )
+    places = places[valid].drop_duplicates(subset=LOCATION_KEY_COLUMNS)
+
+    locations: LocationsPQFileController = LocationsPQFileController(
+        pq_filepath=pq_file, on_duplicate="drop"
+    )
+    stored: int = len(locations.df)
+    if not places.empty:
+        locations.update_df(places[LOCATION_COLUMNS])
+    stats.added = len(locations.df) - stored
+    stats.duplicates = stats.rows - stats.invalid - stats.added
+    log.info(
+        f"Added {stats.added} location(s) to '{pq_file}', {stats.duplicates} duplicate(s) skipped"
+    )
+
+    pending: pd.DataFrame = locations.df[_missing_coords(locations.df)]
+    if geocode and not pending.empty:
+        from owm_bot.location.geolocate import get_geocode_memo
+
+        geocode_memo: GeocodeMemo = get_geocode_memo()
+        ## Saved batches replace the stored rows without coordinates
+        locations.on_duplicate = "replace"
+
+        for offset in range(0, len(pending), batch_size):
+            log.info(
+                f"Geocoding locations {offset + 1}-{min(offset + batch_size, len(pending))} of {len(pending)}"
+            )
+            batch: pd.DataFrame = _geocode_batch(
+                pending.iloc[offset : offset + batch_size],
+                geocode_memo=geocode_memo,
+                api_key=api_key,
+            )
+            located: pd.DataFrame = batch[~_missing_coords(batch)]
+            if located.empty:
+                continue
+
+            locations.update_df(located)
+            stats.geocoded += len(located)
+
+    stats.not_geocoded = int(_missing_coords(locations.df).sum())
+    stats.seconds = time.perf_counter() - started
+
+    return stats
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+import typing as t
+
+log = logging.getLogger("owm_bot.location.importer.sources")
+
+import numpy as np
+import pandas as pd
+
+## Formats `read_locations_file()` can read, by file suffix
+LOCATION_FILE_FORMATS: dict[str, str] = {
+    ".csv": "csv",
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+    ".parquet": "parquet",
+    ".pq": "parquet",
+}
+LOCATION_COLUMNS: list[str] = [
+    "city_name",
+    "state_code",
+    "country_code",
+    "zip_code",
+    "lat",
+    "lon",
+]
+LOCATION_KEY_COLUMNS: list[str] = [
+    "city_name",
+    "state_code",
+    "country_code",
+    "zip_code",
+]
+## Other column names seen in place lists, lowercased
+COLUMN_ALIASES: dict[str, str] = {
+    "city": "city_name",
+    "name": "city_name",
+    "state": "state_code",
+    "province": "state_code",
+    "country": "country_code",
+    "zip": "zip_code",
+    "postcode": "zip_code",
+    "postal_code": "zip_code",
+    "latitude": "lat",
+    "longitude": "lon",
+    "lng": "lon",
+}
+## Country values that aren't ISO 3166 alpha-2 codes, after upper-casing
+COUNTRY_ALIASES: dict[str, str] = {
+    "USA": "US",
+    "UNITED STATES": "US",
+    "UNITED STATES OF AMERICA": "US",
+    "UK": "GB",
+    "UNITED KINGDOM": "GB",
+    "GREAT BRITAIN": "GB",
+    "CANADA": "CA",
+    "MEXICO": "MX",
+    "GERMANY": "DE",
+    "FRANCE": "FR",
+}
+
+
+def read_locations_file(
+    path: t.Union[str, Path] = None, file_format: str | None = None
+) -> pd.DataFrame:
+    """Read a CSV, JSONL or Parquet list of places into a DataFrame.
+
+    Text columns are read as strings, so zip codes keep their leading zeros.
+
+    Params:
+        path (str | Path): File to read.
+        file_format (str | None): 'csv', 'jsonl' or 'parquet'. Defaults to the format
+            matching the file's suffix.
+
+    """
+    path: Path = Path(f"{path}")
+    file_format = file_format or LOCATION_FILE_FORMATS.get(path.suffix.lower())
+    assert file_format in LOCATION_FILE_FORMATS.values(), ValueError(
+        f"Can't tell the format of '{path}', pass one of {sorted(set(LOCATION_FILE_FORMATS.values()))}"
+    )
+
+    try:
+        match file_format:
+            case "csv":
+                return pd.read_csv(path, dtype=str)
+            case "jsonl":
+                return pd.read_json(path, lines=True, dtype=False)
+            case "parquet":
+                return pd.read_parquet(path)
+    except Exception as exc:
+        msg = Exception(
+            f"Unhandled exception reading locations from '{path}'. Details: {exc}"
+        )
+        log.error(msg)
+
+        raise exc
+
+
+def _clean_text(values: pd.Series) -> pd.Series:
+    """Strip & collapse whitespace. Empty strings become missing values."""
+    values = values.astype("string")
+    values = values.str.strip().str.replace(r"\s+", " ", regex=True)
+
+    return values.mask(values == "")
+
+
+def _coordinate(values: pd.Series, limit: float) -> pd.Series:
+    values = pd.to_numeric(values, errors="coerce").astype("float64")
+
+    return values.where(values.abs() <= limit)
+
+
+def normalise_locations(df: pd.DataFrame = None) -> tuple[pd.DataFrame, pd.Series]:
+    """Normalise a list of places to the `LOCATION_COLUMNS`, with vectorised string ops.
+
+    - Column names are matched case-insensitively, with `COLUMN_ALIASES`.
+    - Whitespace is stripped & collapsed, empty values become missing.
+    - City names in all lower or all upper case are title cased, others are kept.
+    - State & country codes are upper cased, country names in `COUNTRY_ALIASES` mapped
+      to their code.
+    - Coordinates outside [-90, 90] / [-180, 180] are dropped.
+
+    A row is valid when it has a 2-letter country code, and a zip code or a city & state
+    (what `build_geocode_request()` needs).
+
+    Returns:
+        (tuple[pandas.DataFrame, pandas.Series]): The normalised places, and a boolean
+            mask of the valid rows.
+
+    """
+    df = df.rename(columns=lambda col: f"{col}".strip().lower())
+    df = df.rename(
+        columns={
+            alias: col
+            for alias, col in COLUMN_ALIASES.items()
+            if alias in df.columns and col not in df.columns
+        }
+    )
+
+    missing: pd.Series = pd.Series(pd.NA, index=df.index, dtype="string")
+    places: pd.DataFrame = pd.DataFrame(
+        {
+            col: _clean_text(df[col]) if col in df.columns else missing
+            for col in LOCATION_KEY_COLUMNS
+        },
+        index=df.index,
+    )
+
+    ## Zip codes stored as numbers (Parquet/JSONL) gain a '.0' when cast to strings
+    places["zip_code"] = places["zip_code"].str.replace(r"\.0$", "", regex=True)
+
+    city: pd.Series = places["city_name"]
+    recase: pd.Series = (city.str.islower() | city.str.isupper()).fillna(False)
+    places["city_name"] = city.mask(recase, city.str.title())
+
+    places["state_code"] = places["state_code"].str.upper()
+    places["country_code"] = places["country_code"].str.upper().replace(COUNTRY_ALIASES)
+
+    nan: pd.Series = pd.Series(np.nan, index=df.index)
+    places["lat"] = _coordinate(df["lat"] if "lat" in df.columns else nan, 90)
+    places["lon"] = _coordinate(df["lon"] if "lon" in df.columns else nan, 180)
+
+    valid: pd.Series = places["country_code"].str.fullmatch(r"[A-Z]{2}").fillna(
+        False
+    ) & (
+        places["zip_code"].notna()
+        | (places["city_name"].notna() & places["state_code"].notna())
+    )
+
+    return places, valid.astype(bool)
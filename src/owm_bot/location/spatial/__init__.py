@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+import typing as t
+
+from ._constants import (
+    DEFAULT_CELL_SIZE_DEG,
+    DEFAULT_MATCH_RADIUS_KM,
+    EARTH_RADIUS_KM,
+    KM_PER_DEG_LAT,
+)
+
+from owm_bot.utils.lazy_imports import lazy_module
+
+if t.TYPE_CHECKING:
+    from ._index import (
+        LocationGridIndex,
+        dedupe_coords,
+        haversine_km,
+    )
+
+__getattr__, __dir__ = lazy_module(
+    __name__,
+    attrs={
+        "LocationGridIndex": "._index",
+        "dedupe_coords": "._index",
+        "haversine_km": "._index",
+    },
+)
@@ -0,0 +1,8 @@
+## Mean Earth radius, in kilometers
+EARTH_RADIUS_KM: float = 6371.0088
+## Kilometers per degree of latitude
+KM_PER_DEG_LAT: float = 111.195
+## Default grid cell size, in degrees (~11km of latitude)
+DEFAULT_CELL_SIZE_DEG: float = 0.1
+## Default radius for treating two points as the same place
+DEFAULT_MATCH_RADIUS_KM: float = 5.0
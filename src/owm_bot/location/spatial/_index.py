@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import logging
+import math
+import typing as t
+
+log = logging.getLogger("owm_bot.location.spatial")
+
+from owm_bot.domain.Location import JsonLocation
+
+from ._constants import (
+    DEFAULT_CELL_SIZE_DEG,
+    DEFAULT_MATCH_RADIUS_KM,
+    EARTH_RADIUS_KM,
+    KM_PER_DEG_LAT,
+)
+
+import numpy as np
+
+
+def haversine_km(
+    lat: float, lon: float, lats: np.ndarray, lons: np.ndarray
+) -> np.ndarray:
+    """Great-circle distance (km) from one point to arrays of points, in one vectorised pass.
+
+    Params:
+        lat (float): Latitude of the origin point, in degrees.
+        lon (float): Longitude of the origin point, in degrees.
+        lats (numpy.ndarray): Latitudes to measure to, in degrees.
+        lons (numpy.ndarray): Longitudes to measure to, in degrees.
+
+    Returns:
+        (numpy.ndarray): Distances in kilometers, one per point in `lats`/`lons`.
+
+    """
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+
+    a = (
+        np.sin((lat2 - lat1) / 2.0) ** 2
+        + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2
+    )
+
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class LocationGridIndex:
+    """In-memory grid bucket index over known coordinates.
+
+    Points are bucketed into `cell_size_deg` x `cell_size_deg` cells. A lookup only
+    measures distances to points in the cells that can be within the search radius,
+    so queries stay sub-millisecond with 100k+ points.
+
+    Params:
+        cell_size_deg (float): Size of a grid cell, in degrees. Pick something close to the
+            usual search radius, i.e. 0.1 (~11km) for a 5km radius.
+    """
+
+    def __init__(self, cell_size_deg: float = DEFAULT_CELL_SIZE_DEG):
+        assert cell_size_deg and cell_size_deg > 0, ValueError(
+            "cell_size_deg must be a positive number"
+        )
+        self.cell_size_deg = cell_size_deg
+        self.n_lon_cells: int = math.ceil(360.0 / cell_size_deg)
+
+        self._lats: np.ndarray = np.empty(0, dtype=np.float64)
+        self._lons: np.ndarray = np.empty(0, dtype=np.float64)
+        self._size: int = 0
+        self._cells: dict[tuple[int, int], list[int]] = {}
+
+        ## Optional object stored for each point, i.e. the JsonLocation it came from
+        self.items: list[t.Any] = []
+
+    def __len__(self) -> int:
+        return self._size
+
+    @classmethod
+    def from_locations(
+        cls,
+        locations: list[JsonLocation] = None,
+        cell_size_deg: float = DEFAULT_CELL_SIZE_DEG,
+    ) -> LocationGridIndex:
+        """Build an index from every location with coordinates set."""
+        _located: list[JsonLocation] = [
+            location
+            for location in locations
+            if location.lat is not None and location.lon is not None
+        ]
+
+        index: LocationGridIndex = cls(cell_size_deg=cell_size_deg)
+        index.extend(
+            lats=[float(location.lat) for location in _located],
+            lons=[float(location.lon) for location in _located],
+            items=_located,
+        )
+
+        return index
+
+    def _cell_ids(
+        self, lats: np.ndarray, lons: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        lat_ids = np.floor((lats + 90.0) / self.cell_size_deg).astype(np.int64)
+        lon_ids = np.floor((lons + 180.0) / self.cell_size_deg).astype(np.int64) % (
+            self.n_lon_cells
+        )
+
+        return lat_ids, lon_ids
+
+    def _reserve(self, extra: int) -> None:
+        needed: int = self._size + extra
+        if needed <= len(self._lats):
+            return
+
+        capacity: int = max(needed, 2 * len(self._lats), 1024)
+        for attr in ("_lats", "_lons"):
+            grown = np.empty(capacity, dtype=np.float64)
+            grown[: self._size] = getattr(self, attr)[: self._size]
+            setattr(self, attr, grown)
+
+    def extend(
+        self,
+        lats: t.Sequence[float] = None,
+        lons: t.Sequence[float] = None,
+        items: t.Sequence[t.Any] | None = None,
+    ) -> None:
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        assert lats.shape == lons.shape, ValueError(
+            "lats and lons must have the same length"
+        )
+        if items is not None:
+            assert len(items) == len(lats), ValueError(
+                "items must have the same length as lats & lons"
+            )
+
+        n: int = len(lats)
+        if n == 0:
+            return
+
+        self._reserve(n)
+        start: int = self._size
+        self._lats[start : start + n] = lats
+        self._lons[start : start + n] = lons
+        self._size += n
+        self.items.extend(items if items is not None else [None] * n)
+
+        ## Group the new points by cell in one pass, instead of a dict lookup per point
+        lat_ids, lon_ids = self._cell_ids(lats, lons)
+        order = np.lexsort((lon_ids, lat_ids))
+        lat_sorted, lon_sorted = lat_ids[order], lon_ids[order]
+        boundaries = (
+            np.flatnonzero((np.diff(lat_sorted) != 0) | (np.diff(lon_sorted) != 0)) + 1
+        )
+        for group in np.split(order, boundaries):
+            key = (int(lat_ids[group[0]]), int(lon_ids[group[0]]))
+            self._cells.setdefault(key, []).extend((group + start).tolist())
+
+    def add(self, lat: float = None, lon: float = None, item: t.Any = None) -> int:
+        self.extend(lats=[lat], lons=[lon], items=[item])
+
+        return self._size - 1
+
+    def _candidates(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        lat_span: int = math.ceil(radius_km / (KM_PER_DEG_LAT * self.cell_size_deg))
+        ## Longitude cells shrink towards the poles, widen the search to match
+        cos_lat: float = max(
+            math.cos(math.radians(min(abs(lat) + lat_span * self.cell_size_deg, 90.0))),
+            1e-6,
+        )
+        lon_span: int = min(
+            math.ceil(radius_km / (KM_PER_DEG_LAT * cos_lat * self.cell_size_deg)),
+            self.n_lon_cells // 2,
+        )
+
+        lat_id, lon_id = self._cell_ids(np.array([lat]), np.array([lon]))
+        lat_id, lon_id = int(lat_id[0]), int(lon_id[0])
+
+        found: list[int] = []
+        for d_lat in range(-lat_span, lat_span + 1):
+            for d_lon in range(-lon_span, lon_span + 1):
+                cell = self._cells.get(
+                    (lat_id + d_lat, (lon_id + d_lon) % self.n_lon_cells)
+                )
+                if cell:
+                    found.extend(cell)
+
+        return np.fromiter(found, dtype=np.int64, count=len(found))
+
+    def within(
+        self, lat: float = None, lon: float = None, radius_km: float = None
+    ) -> list[tuple[int, float]]:
+        """Every indexed point within `radius_km`, as (index, distance_km), nearest first."""
+        idx = self._candidates(lat, lon, radius_km)
+        if len(idx) == 0:
+            return []
+
+        distances = haversine_km(lat, lon, self._lats[idx], self._lons[idx])
+        mask = distances <= radius_km
+        idx, distances = idx[mask], distances[mask]
+        order = np.argsort(distances)
+
+        return [(int(i), float(d)) for i, d in zip(idx[order], distances[order])]
+
+    def nearest(
+        self,
+        lat: float = None,
+        lon: float = None,
+        max_km: float = DEFAULT_MATCH_RADIUS_KM,
+    ) -> tuple[int, float] | None:
+        """The closest indexed point within `max_km`, as (index, distance_km), or `None`."""
+        idx = self._candidates(float(lat), float(lon), max_km)
+        if len(idx) == 0:
+            return None
+
+        distances = haversine_km(
+            float(lat), float(lon), self._lats[idx], self._lons[idx]
+        )
+        best: int = int(np.argmin(distances))
+        if distances[best] > max_km:
+            return None
+
+        return int(idx[best]), float(distances[best])
+
+    def nearest_item(
+        self,
+        lat: float = None,
+        lon: float = None,
+        max_km: float = DEFAULT_MATCH_RADIUS_KM,
+    ) -> t.Any | None:
+        match = self.nearest(lat=lat, lon=lon, max_km=max_km)
+
+        return None if match is None else self.items[match[0]]
+
+
+def dedupe_coords(
+    lats: t.Sequence[float] = None,
+    lons: t.Sequence[float] = None,
+    max_km: float = DEFAULT_MATCH_RADIUS_KM,
+    cell_size_deg: float = DEFAULT_CELL_SIZE_DEG,
+) -> list[int]:
+    """Map each point to the first earlier point within `max_km` of it.
+
+    Returns:
+        (list[int]): For each input point, the index of the point it duplicates, or its
+            own index if it is the first point in its neighbourhood.
+
+    """
+    index: LocationGridIndex = LocationGridIndex(cell_size_deg=cell_size_deg)
+    mapping: list[int] = []
+
+    for i, (lat, lon) in enumerate(zip(lats, lons)):
+        match = index.nearest(lat=lat, lon=lon, max_km=max_km)
+        if match is None:
+            index.add(lat=lat, lon=lon, item=i)
+            mapping.append(i)
+        else:
+            mapping.append(index.items[match[0]])
+
+    return mapping
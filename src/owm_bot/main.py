@@ -1,39 +1,51 @@
+from __future__ import annotations
+
 import logging
+import sys
+import typing as t
+
+## Only the CLI parser is imported up front. Settings, pandas, httpx etc. are loaded
+#  by the code paths that need them, so `owm-bot --help` & light commands start fast
+from owm_bot.cli import build_parser
+from owm_bot.location.spatial import DEFAULT_MATCH_RADIUS_KM
 
-from owm_bot.core.config import (
-    AppSettings,
-    settings,
-    OpenweathermapSettings,
-    owm_settings,
-)
-from owm_bot.domain.Location.schemas import JsonLocation
-from owm_bot.setup import setup_logging, setup_dirs
-from owm_bot.core.paths import (
-    CACHE_DIR,
-    DATA_DIR,
-    ENSURE_DIRS,
-    OUTPUT_DIR,
-    SERIALIZE_DIR,
-)
-from owm_bot.location import (
-    load_location_from_file,
-    get_missing_coords,
-    update_location_coords,
-    save_location_dict_to_file,
-    init_location,
-    geolocate,
-)
+if t.TYPE_CHECKING:
+    from owm_bot.domain.Location.schemas import JsonLocation
+    from owm_bot.location.spatial import LocationGridIndex
 
 log = logging.getLogger("owm_bot")
 
 
-def validate_location(location: JsonLocation = None) -> None:
+def validate_location(
+    location: JsonLocation = None,
+    location_index: LocationGridIndex | None = None,
+    max_km: float = DEFAULT_MATCH_RADIUS_KM,
+) -> None:
+    from owm_bot.domain.Location.schemas import JsonLocation
+    from owm_bot.location import geolocate
+
     assert location, ValueError("Missing a location to validate")
     assert isinstance(location, JsonLocation), TypeError(
         f"location must be a JsonLocation object. Got type: ({type(location)})"
     )
 
     log.info(f"Validating location")
+    if location_index is not None:
+        ## Skip the reverse geocode request when a known location with the same name is close by
+        known_location: JsonLocation | None = location_index.nearest_item(
+            lat=location.lat, lon=location.lon, max_km=max_km
+        )
+        if (
+            known_location is not None
+            and (known_location.city_name or "").casefold()
+            == (location.city_name or "").casefold()
+        ):
+            log.debug(
+                f"Location matches known location within {max_km}km, skipping reverse geocode"
+            )
+
+            return
+
     reverse_lookup = geolocate.reverse_geocode(lat=location.lat, lon=location.lon)
     log.debug(f"Reverse lookup ({type(reverse_lookup)}): {reverse_lookup}")
 
@@ -47,12 +59,33 @@ def validate_location(location: JsonLocation = None) -> None:
     )
 
 
-if __name__ == "__main__":
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    from owm_bot.core.config import owm_settings, settings
+    from owm_bot.setup import setup_dirs, setup_logging, setup_metrics
+
     setup_logging(name="owm_bot", log_level=settings.log_level)
     setup_dirs()
 
     log.debug(f"Settings: {settings}")
     log.debug(f"OWM Settings: {owm_settings}")
 
-    location: JsonLocation = init_location()
-    log.debug(f"Location: {location}")
+    with setup_metrics(
+        enabled=settings.metrics_enabled,
+        port=settings.metrics_port,
+        metrics_file=settings.metrics_file,
+    ):
+        if getattr(args, "func", None) is not None:
+            return args.func(args)
+
+        from owm_bot.location import init_location
+
+        location: JsonLocation = init_location()
+        log.debug(f"Location: {location}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+import typing as t
+
+from owm_bot.utils.lazy_imports import lazy_module
+
+if t.TYPE_CHECKING:
+    from ._scheduler import PollScheduler
+    from ._daemon import WeatherPollDaemon
+
+__getattr__, __dir__ = lazy_module(
+    __name__,
+    attrs={
+        "PollScheduler": "._scheduler",
+        "WeatherPollDaemon": "._daemon",
+    },
+)
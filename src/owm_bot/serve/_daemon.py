@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import logging
+from pathlib import Path
+import signal
+import typing as t
+
+log = logging.getLogger("owm_bot.serve.daemon")
+
+from owm_bot.core.config import owm_settings
+from owm_bot.core.paths import (
+    CURRENT_WEATHER_PQ_DATASET_DIR,
+    DAILY_SUMMARY_PQ_FILE,
+    FORECAST_WEATHER_PQ_DATASET_DIR,
+)
+from owm_bot.domain.Location import JsonLocation
+from owm_bot.location.controllers import (
+    CurrentWeatherPQFileController,
+    ForecastWeatherPQFileController,
+    WriteBehindBuffer,
+)
+from owm_bot.utils.data_utils.datasets import build_location_key
+from owm_bot.weather.controllers import AsyncOneCallClientController
+from owm_bot.weather.summary import update_daily_summary
+
+from ._scheduler import PollScheduler
+
+if t.TYPE_CHECKING:
+    import pyarrow as pa
+
+## Signals that trigger a clean shutdown
+SHUTDOWN_SIGNALS: tuple[signal.Signals, ...] = (signal.SIGINT, signal.SIGTERM)
+
+
+class WeatherPollDaemon:
+    """Long-running poller that fetches weather for many locations on a schedule.
+
+    One pooled, rate-limited HTTP client & one pair of append-only Parquet dataset
+    controllers are kept open for the life of the daemon. Locations that come due in
+    the same tick are fetched concurrently. Their responses are handed to a
+    `WriteBehindBuffer`, which writes them from a background thread as a single batch
+    every `flush_interval` seconds or `flush_rows` rows, so polling never waits on
+    Parquet encoding. Buffered rows are flushed on shutdown (SIGINT/SIGTERM or `stop()`).
+    Rows already stored, i.e. when a location is polled again before OWM updates its
+    observation, are dropped on their primary key instead of appended again.
+
+    Each flush adds a file to every partition it touches, so at startup & every
+    `compact_interval` seconds the partitions of past days are compacted in a
+    background thread, leaving one file per location & day.
+
+    Params:
+        locations (list[JsonLocation]): Locations to poll. Locations without lat/lon are skipped.
+        interval (float | None): Seconds between polls of a location. Defaults to `owm_settings.poll_interval`.
+        jitter (float | None): Max seconds each poll is moved earlier/later. Defaults to `owm_settings.poll_jitter`.
+        batch_window (float): Locations due within this many seconds of each other are polled together.
+        flush_interval (float): Max seconds rows are buffered before being written.
+        flush_rows (int): Write buffered rows once this many are waiting.
+        store_forecast (bool): Also store the hourly/daily forecasts from each response.
+        daily_summary_file (str | Path | None): Daily summary table updated after each
+            observation write, see `owm_bot.weather.summary`. `None` disables it.
+        compact_interval (float | None): Seconds between compactions of the datasets.
+            `None` disables compaction.
+    """
+
+    def __init__(
+        self,
+        locations: list[JsonLocation] = None,
+        interval: float | None = None,
+        jitter: float | None = None,
+        batch_window: float = 1.0,
+        flush_interval: float = 60.0,
+        flush_rows: int = 500,
+        store_forecast: bool = True,
+        current_dataset_dir: t.Union[str, Path] = CURRENT_WEATHER_PQ_DATASET_DIR,
+        forecast_dataset_dir: t.Union[str, Path] = FORECAST_WEATHER_PQ_DATASET_DIR,
+        daily_summary_file: t.Union[str, Path, None] = DAILY_SUMMARY_PQ_FILE,
+        client_controller: AsyncOneCallClientController | None = None,
+        compact_interval: float | None = 86400.0,
+    ):
+        self.locations: dict[str, JsonLocation] = {}
+        for location in locations or []:
+            if location.lat is None or location.lon is None:
+                log.warning(
+                    f"Location '{location.city_name}' is missing lat/lon, it will not be polled"
+                )
+                continue
+            self.locations[build_location_key(location.lat, location.lon)] = location
+
+        self.scheduler: PollScheduler = PollScheduler(
+            interval=interval or owm_settings.poll_interval,
+            jitter=owm_settings.poll_jitter if jitter is None else jitter,
+        )
+        self.batch_window = batch_window
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.store_forecast = store_forecast
+        self.current_dataset_dir = current_dataset_dir
+        self.forecast_dataset_dir = forecast_dataset_dir
+        self.daily_summary_file = daily_summary_file
+        self.client_controller = client_controller or AsyncOneCallClientController()
+        self.compact_interval = compact_interval
+
+        self.polls: int = 0
+        self.failures: int = 0
+
+        self._stop: asyncio.Event | None = None
+        self._current_buffer: WriteBehindBuffer | None = None
+        self._forecast_buffer: WriteBehindBuffer | None = None
+
+    def stop(self) -> None:
+        if self._stop is not None:
+            self._stop.set()
+
+    def _install_signal_handlers(self) -> list[signal.Signals]:
+        loop = asyncio.get_running_loop()
+        installed: list[signal.Signals] = []
+
+        for sig in SHUTDOWN_SIGNALS:
+            try:
+                loop.add_signal_handler(sig, self._on_signal, sig)
+                installed.append(sig)
+            except (NotImplementedError, RuntimeError):
+                ## Windows event loops & non-main threads can't install handlers
+                log.debug(f"Could not install a handler for {sig.name}")
+
+        return installed
+
+    def _on_signal(self, sig: signal.Signals) -> None:
+        log.info(f"Received {sig.name}, shutting down")
+        self.stop()
+
+    @property
+    def _buffers(self) -> list[WriteBehindBuffer]:
+        return [
+            buffer
+            for buffer in (self._current_buffer, self._forecast_buffer)
+            if buffer is not None
+        ]
+
+    @property
+    def pending_rows(self) -> int:
+        return sum(buffer.pending_rows for buffer in self._buffers)
+
+    def flush(self) -> None:
+        """Write buffered rows now, and wait for the writes to finish."""
+        for buffer in self._buffers:
+            buffer.flush()
+
+    def compact(self) -> int:
+        """Compact the partitions of days before today (UTC), which are no longer written to.
+
+        Returns:
+            (int): The number of partitions that were compacted.
+
+        """
+        today: str = dt.datetime.now(dt.timezone.utc).date().isoformat()
+
+        return sum(buffer.controller.compact(before=today) for buffer in self._buffers)
+
+    def _update_summary(self, table: pa.Table) -> None:
+        ## Called from the writer thread, once each batch of observations is appended
+        update_daily_summary(
+            current_controller=self._current_buffer.controller,
+            summary_file=self.daily_summary_file,
+            new_data=table,
+        )
+
+    async def poll(self, keys: list[str] = None) -> None:
+        """Fetch weather for a batch of locations & buffer the results."""
+        locations: list[JsonLocation] = [self.locations[key] for key in keys]
+        log.debug(f"Polling {len(locations)} location(s)")
+
+        results = await self.client_controller.get_weather_many(
+            locations=locations, raw=True
+        )
+
+        responses: list[dict] = []
+        for key, result in zip(keys, results):
+            if isinstance(result, Exception) or result is None:
+                self.failures += 1
+                log.warning(f"Polling location '{key}' failed: {result}")
+                continue
+
+            result["location_key"] = key
+            responses.append(result)
+
+        self.polls += len(responses)
+        if not responses:
+            return
+
+        self._current_buffer.put(responses)
+        if self.store_forecast:
+            self._forecast_buffer.put(responses)
+
+    async def _wait(self, timeout: float | None) -> None:
+        try:
+            await asyncio.wait_for(self._stop.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self) -> None:
+        if not self.locations:
+            log.warning("No locations with coordinates to poll")
+
+            return
+
+        self._stop = asyncio.Event()
+        installed: list[signal.Signals] = self._install_signal_handlers()
+
+        for key in self.locations:
+            self.scheduler.add(key)
+
+        log.info(
+            f"Polling {len(self.locations)} location(s) every {self.scheduler.interval}s (+/- {self.scheduler.jitter}s)"
+        )
+
+        try:
+            async with self.client_controller:
+                ## Buffers write everything left on exit. Shutdown signals are handled
+                #  by the event loop, so the buffers don't install their own handler.
+                with (
+                    WriteBehindBuffer(
+                        controller=CurrentWeatherPQFileController(
+                            append_only=True,
+                            dataset_dir=self.current_dataset_dir,
+                            on_duplicate="drop",
+                        ),
+                        flush_rows=self.flush_rows,
+                        flush_interval=self.flush_interval,
+                        handle_sigterm=False,
+                        on_write=self._update_summary
+                        if self.daily_summary_file is not None
+                        else None,
+                    ) as self._current_buffer,
+                    WriteBehindBuffer(
+                        controller=ForecastWeatherPQFileController(
+                            append_only=True,
+                            dataset_dir=self.forecast_dataset_dir,
+                            on_duplicate="drop",
+                        ),
+                        flush_rows=self.flush_rows,
+                        flush_interval=self.flush_interval,
+                        handle_sigterm=False,
+                    ) as self._forecast_buffer,
+                ):
+                    compact_task: asyncio.Task | None = (
+                        asyncio.create_task(self._compact_loop())
+                        if self.compact_interval
+                        else None
+                    )
+                    try:
+                        await self._run_loop()
+                    finally:
+                        ## Let a running compaction finish before the buffers close
+                        self._stop.set()
+                        if compact_task is not None:
+                            await compact_task
+        finally:
+            loop = asyncio.get_running_loop()
+            for sig in installed:
+                loop.remove_signal_handler(sig)
+
+            log.info(
+                f"Stopped after {self.polls} successful & {self.failures} failed poll(s)"
+            )
+
+    async def _compact_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                compacted: int = await asyncio.to_thread(self.compact)
+                log.info(f"Compacted {compacted} dataset partition(s)")
+            except Exception as exc:
+                msg = Exception(
+                    f"Unhandled exception compacting datasets. Details: {exc}"
+                )
+                log.error(msg)
+
+            await self._wait(self.compact_interval)
+
+    async def _run_loop(self) -> None:
+        while not self._stop.is_set():
+            wait: float | None = self.scheduler.seconds_until_next()
+            if wait is None or wait > 0:
+                await self._wait(wait)
+
+                continue
+
+            due: list[str] = self.scheduler.pop_due(window=self.batch_window)
+            try:
+                await self.poll(keys=due)
+            except Exception as exc:
+                msg = Exception(
+                    f"Unhandled exception polling {len(due)} location(s). Details: {exc}"
+                )
+                log.error(msg)
+            finally:
+                for key in due:
+                    self.scheduler.reschedule(key)
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import random
+import time
+import typing as t
+
+log = logging.getLogger("owm_bot.serve.scheduler")
+
+
+class PollScheduler:
+    """Priority queue of keys, each due again `interval` seconds after it was last polled.
+
+    Every reschedule is offset by a random +/- `jitter` seconds, so keys added at the
+    same time drift apart instead of all coming due in the same tick.
+
+    Params:
+        interval (float): Default seconds between polls of a key.
+        jitter (float): Max seconds a due time is moved earlier or later.
+        clock (Callable[[], float]): Monotonic clock, swappable for tests.
+    """
+
+    def __init__(
+        self,
+        interval: float = 600.0,
+        jitter: float = 0.0,
+        clock: t.Callable[[], float] = time.monotonic,
+        rng: random.Random | None = None,
+    ):
+        assert interval and interval > 0, ValueError(
+            "interval must be a positive number"
+        )
+        self.interval = interval
+        self.jitter = max(jitter or 0.0, 0.0)
+        self.clock = clock
+        self.rng = rng or random.Random()
+
+        ## (due_at, sequence, key). The sequence keeps heap order stable for equal due times
+        self._heap: list[tuple[float, int, t.Hashable]] = []
+        self._counter = itertools.count()
+        self._intervals: dict[t.Hashable, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._intervals)
+
+    def __contains__(self, key: t.Hashable) -> bool:
+        return key in self._intervals
+
+    def _jittered(self, seconds: float) -> float:
+        if not self.jitter:
+            return seconds
+
+        return max(seconds + self.rng.uniform(-self.jitter, self.jitter), 0.0)
+
+    def add(
+        self,
+        key: t.Hashable = None,
+        interval: float | None = None,
+        delay: float | None = None,
+    ) -> float:
+        """Schedule a new key. Returns the time it is first due.
+
+        Params:
+            interval (float | None): This key's own poll interval. Defaults to `self.interval`.
+            delay (float | None): Seconds until the first poll. Defaults to a random
+                point within `jitter`, to spread out keys added together.
+        """
+        if key in self._intervals:
+            raise ValueError(f"Key '{key}' is already scheduled")
+
+        self._intervals[key] = interval or self.interval
+        if delay is None:
+            delay = self.rng.uniform(0.0, self.jitter) if self.jitter else 0.0
+
+        due_at: float = self.clock() + delay
+        heapq.heappush(self._heap, (due_at, next(self._counter), key))
+
+        return due_at
+
+    def remove(self, key: t.Hashable = None) -> None:
+        ## Entries left in the heap are skipped when they are popped
+        self._intervals.pop(key, None)
+
+    def reschedule(self, key: t.Hashable = None, delay: float | None = None) -> float:
+        """Schedule the next poll of `key`, one (jittered) interval from now."""
+        if key not in self._intervals:
+            raise KeyError(f"Key '{key}' is not scheduled")
+
+        if delay is None:
+            delay = self._jittered(self._intervals[key])
+
+        due_at: float = self.clock() + delay
+        heapq.heappush(self._heap, (due_at, next(self._counter), key))
+
+        return due_at
+
+    def _drop_removed(self) -> None:
+        while self._heap and self._heap[0][2] not in self._intervals:
+            heapq.heappop(self._heap)
+
+    def next_due(self) -> float | None:
+        self._drop_removed()
+
+        return self._heap[0][0] if self._heap else None
+
+    def seconds_until_next(self) -> float | None:
+        due_at: float | None = self.next_due()
+
+        return None if due_at is None else max(due_at - self.clock(), 0.0)
+
+    def pop_due(self, window: float = 0.0) -> list[t.Hashable]:
+        """Pop every key due now, or within `window` seconds, so they can be polled as one batch.
+
+        Popped keys are not due again until they are rescheduled.
+        """
+        cutoff: float = self.clock() + window
+        due: list[t.Hashable] = []
+
+        while self._heap and self._heap[0][0] <= cutoff:
+            _, _, key = heapq.heappop(self._heap)
+            if key in self._intervals:
+                due.append(key)
+
+        return due
@@ -1,4 +1,5 @@
 from __future__ import annotations
 
 from .__logging import setup_logging
+from .__metrics import setup_metrics
 from .__paths import setup_dirs
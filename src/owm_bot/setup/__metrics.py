@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+from contextlib import AbstractContextManager, nullcontext
+import logging
+
+log = logging.getLogger("owm_bot.setup")
+
+
+def setup_metrics(
+    enabled: bool = False, port: int = 0, metrics_file: str | None = None
+) -> AbstractContextManager:
+    """Context that records & exports metrics while a command runs.
+
+    Returns a no-op context when metrics are disabled, so nothing is recorded.
+    """
+    if not enabled:
+        return nullcontext()
+
+    from owm_bot.core.instrument import MetricsExporter
+
+    return MetricsExporter(port=port or None, metrics_file=metrics_file or None)
@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+import typing as t
+
+from owm_bot.utils.lazy_imports import lazy_module
+
+if t.TYPE_CHECKING:
+    from ._responses import NOT_FOUND_NAME, geo_direct, geo_reverse, geo_zip, onecall
+    from ._server import StandinServer
+    from ._standin import OWMStandin, StandinResponse
+    from ._transport import AsyncStandinTransport, StandinTransport
+
+__getattr__, __dir__ = lazy_module(
+    __name__,
+    attrs={
+        "NOT_FOUND_NAME": "._responses",
+        "geo_direct": "._responses",
+        "geo_reverse": "._responses",
+        "geo_zip": "._responses",
+        "onecall": "._responses",
+        "StandinServer": "._server",
+        "OWMStandin": "._standin",
+        "StandinResponse": "._standin",
+        "AsyncStandinTransport": "._transport",
+        "StandinTransport": "._transport",
+    },
+)
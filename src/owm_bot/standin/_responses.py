@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import logging
+import math
+import random
+import time
+import typing as t
+import zlib
+
+log = logging.getLogger("owm_bot.standin.responses")
+
+from owm_bot.core.constants import ONECALL_EXCLUDE_PARTS
+
+## Place name that geocodes to nothing, to exercise not-found paths
+NOT_FOUND_NAME: str = "nowhere"
+
+_CONDITIONS: list[dict] = [
+    {"id": 800, "main": "Clear", "description": "clear sky", "icon": "01d"},
+    {"id": 801, "main": "Clouds", "description": "few clouds", "icon": "02d"},
+    {"id": 804, "main": "Clouds", "description": "overcast clouds", "icon": "04d"},
+    {"id": 500, "main": "Rain", "description": "light rain", "icon": "10d"},
+    {"id": 600, "main": "Snow", "description": "light snow", "icon": "13d"},
+]
+
+
+def _seed(*parts: t.Any) -> int:
+    return zlib.crc32(",".join(f"{part}".lower() for part in parts).encode())
+
+
+def _coords_for(*parts: t.Any) -> tuple[float, float]:
+    """Stable, made-up coordinates for a place name or zip code."""
+    seed: int = _seed(*parts)
+
+    return (
+        round(-60 + (seed % 130_000) / 1000, 4),
+        round(-180 + ((seed // 130_000) % 360_000) / 1000, 4),
+    )
+
+
+def _temp(celsius: float, units: str) -> float:
+    match units:
+        case "metric":
+            return round(celsius, 2)
+        case "imperial":
+            return round(celsius * 9 / 5 + 32, 2)
+        case _:
+            return round(celsius + 273.15, 2)
+
+
+def geo_direct(q: str = None, limit: int = 5) -> list[dict]:
+    """A `/geo/1.0/direct` response for `q='{city},{state},{country}'`."""
+    city, state, country = ([*q.split(","), "", ""])[:3]
+    if city.strip().lower() == NOT_FOUND_NAME or limit < 1:
+        return []
+
+    lat, lon = _coords_for(city, state, country)
+
+    return [
+        {
+            "name": city.strip().title(),
+            "local_names": {"en": city.strip().title()},
+            "lat": lat,
+            "lon": lon,
+            "country": country.strip().upper(),
+            "state": state.strip().upper(),
+        }
+    ]
+
+
+def geo_zip(zip_query: str = None) -> dict | None:
+    """A `/geo/1.0/zip` response for `zip='{zip code},{country}'`. `None` when not found."""
+    zip_code, country = ([*zip_query.split(","), ""])[:2]
+    if zip_code.strip().lower() == NOT_FOUND_NAME:
+        return None
+
+    lat, lon = _coords_for(zip_code, country)
+
+    return {
+        "zip": zip_code.strip(),
+        "name": f"Zip {zip_code.strip()}",
+        "lat": lat,
+        "lon": lon,
+        "country": country.strip().upper(),
+    }
+
+
+def geo_reverse(lat: float = None, lon: float = None, limit: int = 5) -> list[dict]:
+    """A `/geo/1.0/reverse` response, naming the place after its coordinates."""
+    if limit < 1:
+        return []
+
+    return [
+        {
+            "name": f"Place {lat:.2f} {lon:.2f}",
+            "local_names": {"en": f"Place {lat:.2f} {lon:.2f}"},
+            "lat": lat,
+            "lon": lon,
+            "country": "XX",
+            "state": "Standin",
+        }
+    ]
+
+
+def _observation(rng: random.Random, dt: int, base_temp: float, units: str) -> dict:
+    temp: float = base_temp + rng.uniform(-3, 3)
+    condition: dict = rng.choice(_CONDITIONS)
+    observation: dict = {
+        "dt": dt,
+        "temp": _temp(temp, units),
+        "feels_like": _temp(temp - rng.uniform(0, 2), units),
+        "pressure": rng.randint(990, 1030),
+        "humidity": rng.randint(20, 100),
+        "dew_point": _temp(temp - rng.uniform(2, 10), units),
+        "uvi": round(rng.uniform(0, 9), 2),
+        "clouds": rng.randint(0, 100),
+        "visibility": 10000,
+        "wind_speed": round(rng.uniform(0, 12), 2),
+        "wind_deg": rng.randint(0, 359),
+        "wind_gust": round(rng.uniform(0, 18), 2),
+        "weather": [condition],
+    }
+    if condition["main"] == "Rain":
+        observation["rain"] = {"1h": round(rng.uniform(0.1, 4), 2)}
+    elif condition["main"] == "Snow":
+        observation["snow"] = {"1h": round(rng.uniform(0.1, 2), 2)}
+
+    return observation
+
+
+def onecall(
+    lat: float = None,
+    lon: float = None,
+    units: str = "standard",
+    exclude: t.Union[str, list[str], None] = None,
+    now: int = None,
+) -> dict:
+    """A `/data/3.0/onecall` response for `lat`/`lon` at unix time `now` (default: the current time).
+
+    Values are random but repeatable: the same place, time & units give the same response.
+    Parts named in `exclude` are left out, like the real API.
+    """
+    if now is None:
+        now = int(time.time())
+    if isinstance(exclude, str):
+        exclude = [part.strip() for part in exclude.split(",") if part.strip()]
+    exclude = set(exclude or [])
+
+    rng: random.Random = random.Random(_seed(lat, lon, now))
+    ## Warmer near the equator
+    base_temp: float = 30 - abs(lat) / 2
+    ## Observations are reported on the minute, forecasts on the hour & the day
+    current_dt: int = now - now % 60
+    hour: int = now - now % 3600
+    day: int = now - now % 86400 + 43200
+
+    response: dict = {
+        "lat": lat,
+        "lon": lon,
+        "timezone": "UTC",
+        "timezone_offset": 0,
+    }
+    for part in ONECALL_EXCLUDE_PARTS:
+        if part in exclude:
+            continue
+
+        match part:
+            case "current":
+                response["current"] = {
+                    **_observation(rng, current_dt, base_temp, units),
+                    "sunrise": day - 21600,
+                    "sunset": day + 21600,
+                }
+            case "minutely":
+                response["minutely"] = [
+                    {"dt": current_dt + 60 * m, "precipitation": 0.0} for m in range(60)
+                ]
+            case "hourly":
+                response["hourly"] = [
+                    {
+                        **_observation(
+                            rng,
+                            hour + 3600 * h,
+                            base_temp + 4 * math.sin(h / 24 * 2 * math.pi),
+                            units,
+                        ),
+                        "pop": round(rng.uniform(0, 1), 2),
+                    }
+                    for h in range(48)
+                ]
+            case "daily":
+                response["daily"] = []
+                for d in range(8):
+                    low: float = base_temp - rng.uniform(3, 8)
+                    high: float = base_temp + rng.uniform(3, 8)
+                    response["daily"].append(
+                        {
+                            "dt": day + 86400 * d,
+                            "sunrise": day + 86400 * d - 21600,
+                            "sunset": day + 86400 * d + 21600,
+                            "temp": {
+                                "morn": _temp(low + 2, units),
+                                "day": _temp(high - 1, units),
+                                "eve": _temp(high - 3, units),
+                                "night": _temp(low, units),
+                                "min": _temp(low, units),
+                                "max": _temp(high, units),
+                            },
+                            "feels_like": {
+                                "morn": _temp(low + 1, units),
+                                "day": _temp(high - 2, units),
+                                "eve": _temp(high - 4, units),
+                                "night": _temp(low - 1, units),
+                            },
+                            "pressure": rng.randint(990, 1030),
+                            "humidity": rng.randint(20, 100),
+                            "wind_speed": round(rng.uniform(0, 12), 2),
+                            "wind_deg": rng.randint(0, 359),
+                            "weather": [rng.choice(_CONDITIONS)],
+                            "clouds": rng.randint(0, 100),
+                            "pop": round(rng.uniform(0, 1), 2),
+                            "uvi": round(rng.uniform(0, 9), 2),
+                        }
+                    )
+            case "alerts":
+                ## Most places have no alerts, the real API leaves the key out
+                continue
+
+    return response
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import threading
+import time
+import typing as t
+from urllib.parse import parse_qsl, urlsplit
+
+log = logging.getLogger("owm_bot.standin.server")
+
+from ._standin import OWMStandin, StandinResponse
+
+
+def _handler_for(standin: OWMStandin) -> type[BaseHTTPRequestHandler]:
+    class StandinHandler(BaseHTTPRequestHandler):
+        ## Keep-alive, so pooled clients reuse connections like they would with OWM
+        protocol_version: str = "HTTP/1.1"
+        ## Headers & body are written separately, Nagle would hold the body back ~40ms
+        disable_nagle_algorithm: bool = True
+
+        def do_GET(self) -> None:
+            url = urlsplit(self.path)
+            delay: float = standin.delay()
+            if delay:
+                time.sleep(delay)
+
+            response: StandinResponse = standin.handle(
+                url.path, dict(parse_qsl(url.query))
+            )
+            self.send_response(response.status_code)
+            for name, value in response.headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", f"{len(response.body)}")
+            self.end_headers()
+            self.wfile.write(response.body)
+
+        def log_message(self, format: str, *args) -> None:
+            log.debug(f"{self.address_string()} {format % args}")
+
+    return StandinHandler
+
+
+class StandinServer:
+    """Serve an `OWMStandin` at `http://{host}:{port}` from a background thread.
+
+    Set `OWM_BASE_URL` to `url` before starting owm_bot to send every request to it.
+
+    Params:
+        standin (OWMStandin | None): The stand-in to serve. Defaults to one without
+            latency or faults.
+        host (str): Address to bind. Defaults to localhost only.
+        port (int): Port to bind. `0` picks a free port, see `port` once started.
+    """
+
+    def __init__(
+        self,
+        standin: OWMStandin | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.standin = standin or OWMStandin()
+        self.host = host
+
+        self._port = port
+        self._server: ThreadingHTTPServer | None = None
+        self._thread: threading.Thread | None = None
+
+    def __enter__(self) -> t.Self:
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def port(self) -> int:
+        return self._server.server_port if self._server is not None else self._port
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self) -> t.Self:
+        try:
+            self._server = ThreadingHTTPServer(
+                (self.host, self._port), _handler_for(self.standin)
+            )
+        except Exception as exc:
+            msg = Exception(
+                f"Unhandled exception starting OWM stand-in server on {self.host}:{self._port}. Details: {exc}"
+            )
+            log.error(msg)
+
+            raise exc
+
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="owm-standin", daemon=True
+        )
+        self._thread.start()
+        log.info(f"Serving OWM stand-in at {self.url}")
+
+        return self
+
+    def stop(self) -> None:
+        if self._server is None:
+            return
+
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+        self._thread = None
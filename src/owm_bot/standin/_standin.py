@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+import json
+import logging
+import random
+import threading
+import time
+import typing as t
+
+log = logging.getLogger("owm_bot.standin")
+
+from owm_bot.core.constants import OWM_UNITS
+
+from . import _responses
+
+## Paths the stand-in answers, mapped to the endpoint names used in metrics & stats
+GEO_PATHS: dict[str, str] = {
+    "/geo/1.0/direct": "geo_direct",
+    "/geo/1.0/zip": "geo_zip",
+    "/geo/1.0/reverse": "geo_reverse",
+}
+ONECALL_PATH: str = "/data/3.0/onecall"
+
+## What OWM sends with a 429
+_THROTTLED_MESSAGE: str = (
+    "Your account is temporary blocked due to exceeding of requests limitation of your"
+    " subscription type."
+)
+_JSON_HEADERS: dict[str, str] = {"Content-Type": "application/json; charset=utf-8"}
+
+
+@dataclass
+class StandinResponse:
+    status_code: int = 200
+    body: bytes = b""
+    headers: dict[str, str] = field(default_factory=lambda: dict(_JSON_HEADERS))
+
+
+def _json_response(
+    status_code: int, content: t.Any, headers: dict[str, str] | None = None
+) -> StandinResponse:
+    return StandinResponse(
+        status_code=status_code,
+        body=json.dumps(content).encode(),
+        headers={**_JSON_HEADERS, **(headers or {})},
+    )
+
+
+def _error(status_code: int, message: str, **headers) -> StandinResponse:
+    return _json_response(
+        status_code, {"cod": status_code, "message": message}, headers=headers
+    )
+
+
+class OWMStandin:
+    """Offline stand-in for the OpenWeatherMap geocoding & One Call APIs.
+
+    Answers `/geo/1.0/direct`, `/geo/1.0/zip`, `/geo/1.0/reverse` & `/data/3.0/onecall`
+    with made-up but repeatable data shaped like the real responses. Faults are injected
+    in the order a real request would meet them: missing API key (401), the per-key
+    `calls_per_minute` limit (429), random throttling (429) & random server errors (500).
+
+    The stand-in only builds responses. Serve it with `StandinServer`, or plug it into an
+    `httpx` client with `StandinTransport`/`AsyncStandinTransport`, which also wait out
+    `latency`.
+
+    Params:
+        latency (float): Seconds each response is delayed by.
+        jitter (float): Max seconds added to or removed from `latency`, at random.
+        error_rate (float): Share of requests (0-1) answered with a 500.
+        throttle_rate (float): Share of requests (0-1) answered with a 429.
+        calls_per_minute (int | None): Requests allowed per API key & minute before every
+            request is answered with a 429, like an exhausted OWM plan. `None` is unlimited.
+        retry_after (int): Seconds sent in the `Retry-After` header of random 429s.
+        seed (int | None): Seed for latency jitter & injected faults, for repeatable runs.
+        clock (Callable[[], float]): Returns the current unix time, which One Call
+            responses are built for.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        calls_per_minute: int | None = None,
+        retry_after: int = 1,
+        seed: int | None = None,
+        clock: t.Callable[[], float] = time.time,
+    ):
+        assert latency >= 0 and jitter >= 0, ValueError(
+            "latency & jitter must be 0 or more seconds"
+        )
+        for name, rate in (
+            ("error_rate", error_rate),
+            ("throttle_rate", throttle_rate),
+        ):
+            assert 0 <= rate <= 1, ValueError(
+                f"{name} must be between 0 & 1, got {rate}"
+            )
+
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.calls_per_minute = calls_per_minute
+        self.retry_after = retry_after
+        self.clock = clock
+
+        ## Requests answered, by endpoint & status code
+        self.stats: dict[tuple[str, int], int] = {}
+
+        self._random: random.Random = random.Random(seed)
+        ## Per API key, the minute being counted & the requests sent in it
+        self._windows: dict[str, tuple[int, int]] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    @property
+    def requests(self) -> int:
+        return sum(self.stats.values())
+
+    def count(self, endpoint: str | None = None, status_code: int | None = None) -> int:
+        """Requests answered, optionally only for one endpoint and/or status code."""
+        return sum(
+            n
+            for (_endpoint, _status), n in self.stats.items()
+            if endpoint in (None, _endpoint) and status_code in (None, _status)
+        )
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stats.clear()
+            self._windows.clear()
+
+    def delay(self) -> float:
+        """Seconds the next response should be held back."""
+        if not self.jitter:
+            return self.latency
+
+        with self._lock:
+            return max(
+                0.0, self.latency + self._random.uniform(-self.jitter, self.jitter)
+            )
+
+    def _over_limit(self, api_key: str, now: float) -> int | None:
+        """Seconds until `api_key` may send again, or `None` when it is under the limit."""
+        if self.calls_per_minute is None:
+            return None
+
+        minute: int = int(now // 60)
+        with self._lock:
+            window, calls = self._windows.get(api_key, (minute, 0))
+            if window != minute:
+                window, calls = minute, 0
+            self._windows[api_key] = (window, calls + 1)
+
+        if calls < self.calls_per_minute:
+            return None
+
+        return max(1, 60 * (minute + 1) - int(now))
+
+    def _roll(self, rate: float) -> bool:
+        if not rate:
+            return False
+
+        with self._lock:
+            return self._random.random() < rate
+
+    def handle(
+        self, path: str = None, params: dict[str, str] | None = None
+    ) -> StandinResponse:
+        """Answer a GET request for `path` with query `params`."""
+        params = params or {}
+        path = path.rstrip("/")
+        endpoint: str = GEO_PATHS.get(
+            path, "onecall" if path == ONECALL_PATH else "unknown"
+        )
+
+        response: StandinResponse = self._respond(endpoint, params)
+        with self._lock:
+            key: tuple[str, int] = (endpoint, response.status_code)
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+        return response
+
+    def _respond(self, endpoint: str, params: dict[str, str]) -> StandinResponse:
+        if endpoint == "unknown":
+            return _error(404, "Internal error")
+
+        api_key: str | None = params.get("appid")
+        if not api_key:
+            return _error(
+                401,
+                "Invalid API key. Please see https://openweathermap.org/faq#error401 for more info.",
+            )
+
+        now: float = self.clock()
+        wait: int | None = self._over_limit(api_key, now)
+        if wait is not None:
+            return _error(
+                429,
+                _THROTTLED_MESSAGE,
+                **{"Retry-After": f"{wait}"},
+            )
+        if self._roll(self.throttle_rate):
+            return _error(
+                429,
+                _THROTTLED_MESSAGE,
+                **{"Retry-After": f"{self.retry_after}"},
+            )
+        if self._roll(self.error_rate):
+            return _error(500, "Internal error")
+
+        try:
+            return self._build(endpoint, params, now)
+        except (KeyError, ValueError) as exc:
+            log.debug(f"Bad {endpoint} request {params}. Details: {exc}")
+
+            return _error(
+                400, "Nothing to geocode" if endpoint != "onecall" else "wrong latitude"
+            )
+
+    def _build(
+        self, endpoint: str, params: dict[str, str], now: float
+    ) -> StandinResponse:
+        limit: int = int(params.get("limit", 5))
+
+        match endpoint:
+            case "geo_direct":
+                return _json_response(
+                    200, _responses.geo_direct(params["q"], limit=limit)
+                )
+            case "geo_zip":
+                content: dict | None = _responses.geo_zip(params["zip"])
+                if content is None:
+                    return _json_response(404, {"cod": "404", "message": "not found"})
+
+                return _json_response(200, content)
+            case "geo_reverse":
+                return _json_response(
+                    200,
+                    _responses.geo_reverse(
+                        float(params["lat"]), float(params["lon"]), limit=limit
+                    ),
+                )
+            case "onecall":
+                units: str = params.get("units", "standard")
+                if units not in OWM_UNITS:
+                    units = "standard"
+
+                return _json_response(
+                    200,
+                    _responses.onecall(
+                        lat=float(params["lat"]),
+                        lon=float(params["lon"]),
+                        units=units,
+                        exclude=params.get("exclude"),
+                        now=int(now),
+                    ),
+                )
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+log = logging.getLogger("owm_bot.standin.transport")
+
+from ._standin import OWMStandin, StandinResponse
+
+import httpx
+
+
+def _to_httpx(response: StandinResponse, request: httpx.Request) -> httpx.Response:
+    return httpx.Response(
+        response.status_code,
+        headers=response.headers,
+        content=response.body,
+        request=request,
+    )
+
+
+class StandinTransport(httpx.BaseTransport):
+    """Answer an `httpx.Client`'s requests from an `OWMStandin`, without a socket.
+
+    The request's host is ignored, so code that builds real OWM URLs is served as-is:
+    `httpx.Client(transport=StandinTransport(standin))`.
+    """
+
+    def __init__(self, standin: OWMStandin | None = None):
+        self.standin = standin or OWMStandin()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        delay: float = self.standin.delay()
+        if delay:
+            time.sleep(delay)
+
+        return _to_httpx(
+            self.standin.handle(request.url.path, dict(request.url.params)), request
+        )
+
+
+class AsyncStandinTransport(httpx.AsyncBaseTransport):
+    """Async variant of `StandinTransport`. Latency is awaited, so requests overlap."""
+
+    def __init__(self, standin: OWMStandin | None = None):
+        self.standin = standin or OWMStandin()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        delay: float = self.standin.delay()
+        if delay:
+            await asyncio.sleep(delay)
+
+        return _to_httpx(
+            self.standin.handle(request.url.path, dict(request.url.params)), request
+        )
@@ -1 +1,13 @@
-from . import dataframes
+from __future__ import annotations
+
+import typing as t
+
+from owm_bot.utils.lazy_imports import lazy_module
+
+if t.TYPE_CHECKING:
+    from . import dataframes, datasets, key_index, weather_tables
+
+__getattr__, __dir__ = lazy_module(
+    __name__,
+    submodules=["dataframes", "datasets", "key_index", "weather_tables"],
+)
@@ -8,9 +8,9 @@ log = logging.getLogger("owm_bot.utils.data_utils.dataframes")
 
 from owm_bot.core.constants import PQ_ENGINE
 from owm_bot.core.paths import PQ_DIR
+from owm_bot.utils.file_utils import FileLock, atomic_path
 
 import pandas as pd
-from red_utils.ext.dataframe_utils import pandas_utils
 
 
 def set_pandas_decimal_precision(precision: int = 2):
@@ -45,9 +45,19 @@ def save_locations_df_to_pq(
     df: pd.DataFrame = None, pq_file: t.Union[str, Path] = None, dedupe: bool = True
 ):
     assert pq_file, ValueError("Missing path to .parquet file")
+    if df is None or df.empty:
+        log.warning("DataFrame is None or empty")
+
+        return
 
     try:
-        pandas_utils.save_pq(df=df, pq_file=pq_file, dedupe=dedupe)
+        if dedupe:
+            df = df.drop_duplicates()
+
+        ## Write a temp file & rename it over the original, so a crash mid-save
+        #  can't leave a truncated file
+        with FileLock(pq_file), atomic_path(pq_file) as tmp_file:
+            df.to_parquet(tmp_file, engine=PQ_ENGINE)
     except Exception as exc:
         msg = Exception(
             f"Unhandled exception saving DataFrame to Parquet file '{pq_file}'. Details: {exc}"
@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+from .__methods import (
+    PARTITION_COLS,
+    PARTITIONING,
+    Filters,
+    TimeBound,
+    add_partition_cols,
+    append_to_dataset,
+    build_filter,
+    build_location_key,
+    compact_dataset,
+    load_dataset,
+    read_dataset,
+    sort_table,
+    to_utc_timestamp,
+)
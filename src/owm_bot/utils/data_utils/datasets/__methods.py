@@ -0,0 +1,463 @@
+from __future__ import annotations
+
+import datetime as dt
+import json
+import logging
+from pathlib import Path
+import typing as t
+import uuid
+
+log = logging.getLogger("owm_bot.utils.data_utils.datasets")
+
+from owm_bot.utils.data_utils.key_index import hash_keys
+from owm_bot.utils.file_utils import (
+    fsync_dir,
+    fsync_file,
+    replace_atomic,
+    temp_path_for,
+    write_bytes_atomic,
+)
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+## Columns each append-only dataset is partitioned by, in directory order
+PARTITION_COLS: list[str] = ["location_key", "obs_date"]
+## Explicit Hive partitioning, so '2024-06-01' and '40.71_-74.01' stay strings
+PARTITIONING: ds.Partitioning = ds.partitioning(
+    pa.schema([("location_key", pa.string()), ("obs_date", pa.string())]),
+    flavor="hive",
+)
+## Sidecar listing the files a compaction replaces, until they are removed
+COMPACTION_MANIFEST: str = "_compaction.json"
+## Number of decimal places kept when building a location key from lat/lon
+LOCATION_KEY_PRECISION: int = 4
+
+## Filters accepted by build_filter(): an expression, DNF tuples, or {column: value(s)}
+Filters = t.Union[ds.Expression, list[tuple], list[list[tuple]], dict[str, t.Any]]
+## A point in time, as a datetime, an ISO date/time string or a unix timestamp
+TimeBound = t.Union[dt.datetime, dt.date, pd.Timestamp, str, int, float, None]
+
+
+def build_location_key(
+    lat: t.Union[float, str],
+    lon: t.Union[float, str],
+    precision: int = LOCATION_KEY_PRECISION,
+) -> str:
+    return f"{float(lat):.{precision}f}_{float(lon):.{precision}f}"
+
+
+def add_partition_cols(df: pd.DataFrame = None) -> pd.DataFrame:
+    """Derive the `location_key` & `obs_date` partition columns for a batch.
+
+    Params:
+        df (pandas.DataFrame): A batch of weather observations. `location_key` is built from
+            `lat`/`lon` when missing. `obs_date` is built from the `dt` unix timestamp or UTC
+            datetime (or `current.dt` for raw One Call responses), falling back to the
+            current UTC date.
+
+    Returns:
+        (pandas.DataFrame): A copy of `df` with both partition columns set.
+
+    """
+    assert df is not None, ValueError("Missing a DataFrame to partition")
+    df = df.copy()
+
+    if "location_key" not in df.columns:
+        assert "lat" in df.columns and "lon" in df.columns, ValueError(
+            "DataFrame must have a 'location_key' column, or 'lat' and 'lon' columns to build one from."
+        )
+        df["location_key"] = [
+            build_location_key(lat, lon) for lat, lon in zip(df["lat"], df["lon"])
+        ]
+
+    if "obs_date" not in df.columns:
+        if "dt" in df.columns:
+            _dt = df["dt"]
+        elif "current" in df.columns:
+            _dt = df["current"].map(
+                lambda c: c.get("dt") if isinstance(c, dict) else None
+            )
+        else:
+            _dt = None
+
+        if _dt is None:
+            obs_dates = pd.Series(
+                pd.Timestamp.now(tz="UTC").strftime("%Y-%m-%d"), index=df.index
+            )
+        elif pd.api.types.is_datetime64_any_dtype(_dt):
+            obs_dates = _dt.dt.tz_convert("UTC").dt.strftime("%Y-%m-%d")
+        else:
+            obs_dates = pd.to_datetime(_dt, unit="s", utc=True).dt.strftime("%Y-%m-%d")
+
+        df["obs_date"] = obs_dates.fillna(
+            pd.Timestamp.now(tz="UTC").strftime("%Y-%m-%d")
+        )
+
+    return df
+
+
+def to_utc_timestamp(value: TimeBound = None) -> pd.Timestamp | None:
+    """Parse a time bound to a UTC `pandas.Timestamp`. Naive values are treated as UTC."""
+    if value is None:
+        return None
+
+    if isinstance(value, (int, float)):
+        return pd.Timestamp(value, unit="s", tz="UTC")
+
+    ts: pd.Timestamp = pd.Timestamp(value)
+
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+
+def build_filter(
+    filters: Filters | None = None,
+    time_range: tuple[TimeBound, TimeBound] | None = None,
+    time_col: str | None = "dt",
+    date_partition_col: str | None = None,
+) -> ds.Expression | None:
+    """Build a pyarrow dataset filter expression, so reads can skip files & row groups.
+
+    Params:
+        filters (Filters | None): A `pyarrow.dataset.Expression`, DNF tuples as accepted by
+            `pyarrow.parquet.read_table()` (i.e. `[("location_key", "=", "40.71_-74.01")]`),
+            or a dict of `{column: value}` / `{column: [values]}` equality filters.
+        time_range (tuple | None): `(start, end)` bounds on `time_col`. The start is
+            inclusive, the end exclusive. Either can be `None` for an open range.
+        time_col (str | None): Timestamp column `time_range` applies to.
+        date_partition_col (str | None): A 'YYYY-MM-DD' string partition column (i.e.
+            `obs_date`) to also filter on, so whole partitions outside the range are skipped.
+
+    Returns:
+        (pyarrow.dataset.Expression | None): The combined filter, or `None` when there is
+            nothing to filter on.
+
+    """
+    exprs: list[ds.Expression] = []
+
+    if isinstance(filters, ds.Expression):
+        exprs.append(filters)
+    elif isinstance(filters, dict):
+        for col, value in filters.items():
+            if isinstance(value, (list, tuple, set)):
+                exprs.append(ds.field(col).isin(list(value)))
+            else:
+                exprs.append(ds.field(col) == value)
+    elif filters:
+        exprs.append(pq.filters_to_expression(filters))
+
+    if time_range is not None:
+        assert time_col, ValueError("A time_col is required to filter by time_range")
+        start, end = (to_utc_timestamp(bound) for bound in time_range)
+
+        if start is not None:
+            exprs.append(ds.field(time_col) >= pa.scalar(start.to_pydatetime()))
+            if date_partition_col:
+                exprs.append(ds.field(date_partition_col) >= start.strftime("%Y-%m-%d"))
+        if end is not None:
+            exprs.append(ds.field(time_col) < pa.scalar(end.to_pydatetime()))
+            if date_partition_col:
+                exprs.append(ds.field(date_partition_col) <= end.strftime("%Y-%m-%d"))
+
+    if not exprs:
+        return None
+
+    expr: ds.Expression = exprs[0]
+    for _expr in exprs[1:]:
+        expr = expr & _expr
+
+    return expr
+
+
+def append_to_dataset(
+    data: t.Union[pd.DataFrame, pa.Table] = None,
+    dataset_dir: t.Union[str, Path] = None,
+    schema: pa.Schema | None = None,
+) -> list[Path]:
+    """Write a batch as new Parquet file(s) in a location/date partitioned dataset.
+
+    Existing files are never read or rewritten, so the cost of an append only
+    depends on the size of the batch. Files are written under hidden temporary names
+    (skipped by dataset reads) and renamed into place once complete, so a crash
+    mid-write never leaves a partial file in the dataset.
+
+    Params:
+        data (pandas.DataFrame | pyarrow.Table): The batch to append. Must include the
+            `PARTITION_COLS` columns (see `add_partition_cols()`).
+        dataset_dir (str | Path): Root directory of the dataset.
+        schema (pyarrow.Schema | None): Optional schema to cast the batch to before writing.
+
+    Returns:
+        (list[Path]): Paths of the files written for this batch.
+
+    """
+    assert dataset_dir, ValueError("Missing a dataset_dir path")
+    dataset_dir: Path = Path(f"{dataset_dir}")
+
+    if isinstance(data, pd.DataFrame):
+        table: pa.Table = pa.Table.from_pandas(
+            data, schema=schema, preserve_index=False
+        )
+    else:
+        table: pa.Table = data if schema is None else data.cast(schema)
+
+    if table.num_rows == 0:
+        log.warning("Batch is empty, nothing to append.")
+
+        return []
+
+    tmp_files: list[Path] = []
+    written: list[Path] = []
+
+    try:
+        ds.write_dataset(
+            table,
+            base_dir=dataset_dir,
+            format="parquet",
+            partitioning=PARTITIONING,
+            basename_template=f".part-{uuid.uuid4().hex}-{{i}}.parquet.tmp",
+            existing_data_behavior="overwrite_or_ignore",
+            ## One poll's forecasts span ~9 days per location, past pyarrow's default
+            #  of 1024 partitions. A batch can't touch more partitions than it has rows.
+            max_partitions=max(1024, table.num_rows),
+            file_visitor=lambda f: tmp_files.append(Path(f.path)),
+        )
+
+        for tmp_file in tmp_files:
+            pq_file: Path = tmp_file.with_name(tmp_file.name[1 : -len(".tmp")])
+            replace_atomic(tmp_file, pq_file)
+            written.append(pq_file)
+    except Exception as exc:
+        msg = Exception(
+            f"Unhandled exception appending batch to dataset '{dataset_dir}'. Details: {exc}"
+        )
+        log.error(msg)
+
+        for tmp_file in tmp_files:
+            tmp_file.unlink(missing_ok=True)
+
+        raise exc
+
+    log.debug(f"Appended {table.num_rows} row(s) to dataset '{dataset_dir}'")
+
+    return written
+
+
+def load_dataset(
+    dataset_dir: t.Union[str, Path] = None, schema: pa.Schema | None = None
+) -> ds.Dataset | None:
+    assert dataset_dir, ValueError("Missing a dataset_dir path")
+    dataset_dir: Path = Path(f"{dataset_dir}")
+
+    if not dataset_dir.exists():
+        log.warning(f"Dataset does not exist at path '{dataset_dir}'")
+
+        return None
+
+    try:
+        return ds.dataset(
+            dataset_dir, format="parquet", partitioning=PARTITIONING, schema=schema
+        )
+    except Exception as exc:
+        msg = Exception(
+            f"Unhandled exception opening dataset '{dataset_dir}'. Details: {exc}"
+        )
+        log.error(msg)
+
+        raise exc
+
+
+def read_dataset(
+    dataset_dir: t.Union[str, Path] = None,
+    columns: list[str] | None = None,
+    filter: ds.Expression | None = None,
+    schema: pa.Schema | None = None,
+) -> pa.Table:
+    dataset: ds.Dataset | None = load_dataset(dataset_dir=dataset_dir, schema=schema)
+
+    if dataset is None:
+        return pa.table({}) if schema is None else schema.empty_table()
+
+    return dataset.to_table(columns=columns, filter=filter)
+
+
+def sort_table(table: pa.Table = None, columns: list[str] = None) -> pa.Table:
+    """Sort a table by `columns` (ascending), skipping columns it doesn't have.
+
+    Arrow can't sort on dictionary-encoded columns, so those are sorted by their
+    decoded values. The returned table keeps the original column types.
+    """
+    columns = [col for col in columns or [] if col in table.column_names]
+    if not columns or table.num_rows < 2:
+        return table
+
+    keys: pa.Table = pa.table(
+        {
+            col: (
+                table[col].cast(table.schema.field(col).type.value_type)
+                if pa.types.is_dictionary(table.schema.field(col).type)
+                else table[col]
+            )
+            for col in columns
+        }
+    )
+
+    return table.take(
+        pc.sort_indices(keys, sort_keys=[(col, "ascending") for col in columns])
+    )
+
+
+def _finish_compaction(partition_dir: Path = None) -> None:
+    """Finish, or roll back, a compaction of `partition_dir` that was interrupted.
+
+    If the compacted file was already renamed into place the files it replaces are
+    removed, otherwise the hidden compacted file is removed & the originals are kept.
+    """
+    manifest_file: Path = partition_dir / COMPACTION_MANIFEST
+    manifest: dict = json.loads(manifest_file.read_text())
+
+    if (partition_dir / manifest["compacted"]).exists():
+        for name in manifest["replaces"]:
+            (partition_dir / name).unlink(missing_ok=True)
+        log.info(f"Finished an interrupted compaction of partition '{partition_dir}'")
+    else:
+        (partition_dir / manifest["tmp"]).unlink(missing_ok=True)
+        log.info(
+            f"Rolled back an interrupted compaction of partition '{partition_dir}'"
+        )
+    fsync_dir(partition_dir)
+
+    manifest_file.unlink()
+    fsync_dir(partition_dir)
+
+
+def compact_dataset(
+    dataset_dir: t.Union[str, Path] = None,
+    min_files: int = 2,
+    sort_by: str | None = "dt",
+    schema: pa.Schema | None = None,
+    primary_key: list[str] | None = None,
+    before: str | None = None,
+) -> int:
+    """Merge the small per-batch files in each partition into a single file.
+
+    The compacted file is written under a hidden name, then the files it replaces are
+    recorded in a `_compaction.json` manifest before it is renamed into place & they are
+    removed. A compaction interrupted after the manifest was written is finished (or
+    rolled back, if the rename didn't happen) by the next `compact_dataset()` run.
+
+    Readers never see a partition with rows missing, but a reader listing the partition
+    between the rename & the removals sees its rows twice. Rows are deduplicated on
+    `primary_key` when compacting, so duplicates don't outlive the next compaction.
+
+    Params:
+        dataset_dir (str | Path): Root directory of the dataset.
+        min_files (int): Only compact partitions holding at least this many files.
+        sort_by (str | None): Column to sort compacted rows by, if present.
+        schema (pyarrow.Schema | None): Optional schema to read the partition's files with.
+        primary_key (list[str] | None): Columns identifying a row. Only the first row
+            (from the oldest file) of each key is kept. `None` keeps every row.
+        before (str | None): Only compact partitions with an `obs_date` before this
+            'YYYY-MM-DD' date, i.e. days that are no longer written to. `None` compacts
+            every partition.
+
+    Returns:
+        (int): The number of partitions that were compacted.
+
+    """
+    assert dataset_dir, ValueError("Missing a dataset_dir path")
+    dataset_dir: Path = Path(f"{dataset_dir}")
+
+    if not dataset_dir.exists():
+        log.warning(
+            f"Dataset does not exist at path '{dataset_dir}'. Nothing to compact."
+        )
+
+        return 0
+
+    for manifest_file in dataset_dir.rglob(COMPACTION_MANIFEST):
+        _finish_compaction(manifest_file.parent)
+
+    partitions: dict[Path, list[Path]] = {}
+    for pq_file in dataset_dir.rglob("*.parquet"):
+        if pq_file.name.startswith((".", "_")):
+            continue
+        partitions.setdefault(pq_file.parent, []).append(pq_file)
+
+    compacted: int = 0
+
+    for partition_dir, files in partitions.items():
+        if len(files) < min_files:
+            continue
+        if before is not None:
+            partition: dict[str, str] = dict(
+                part.split("=", 1)
+                for part in partition_dir.relative_to(dataset_dir).parts
+                if "=" in part
+            )
+            if partition.get("obs_date", before) >= before:
+                continue
+
+        files = sorted(files, key=lambda f: (f.stat().st_mtime_ns, f.name))
+        compacted_file: Path = partition_dir / f"compacted-{uuid.uuid4().hex}.parquet"
+        tmp_file: Path = temp_path_for(compacted_file)
+
+        try:
+            table: pa.Table = ds.dataset(
+                [str(f) for f in files], format="parquet", schema=schema
+            ).to_table()
+
+            ## Partition columns aren't stored in the files, & are the same for every row
+            key_cols: list[str] = [
+                col for col in primary_key or [] if col in table.column_names
+            ]
+            if key_cols:
+                keep: np.ndarray = ~(
+                    pd.Series(hash_keys(table, columns=key_cols))
+                    .duplicated()
+                    .to_numpy()
+                )
+                if not keep.all():
+                    log.warning(
+                        f"Dropping {int((~keep).sum())} duplicate row(s) from partition '{partition_dir}'"
+                    )
+                    table = table.filter(pa.array(keep))
+
+            if sort_by and sort_by in table.column_names:
+                table = table.sort_by(sort_by)
+
+            pq.write_table(table, tmp_file)
+            fsync_file(tmp_file)
+
+            write_bytes_atomic(
+                partition_dir / COMPACTION_MANIFEST,
+                json.dumps(
+                    {
+                        "compacted": compacted_file.name,
+                        "tmp": tmp_file.name,
+                        "replaces": [f.name for f in files],
+                    }
+                ).encode(),
+            )
+        except Exception as exc:
+            msg = Exception(
+                f"Unhandled exception compacting partition '{partition_dir}'. Details: {exc}"
+            )
+            log.error(msg)
+
+            tmp_file.unlink(missing_ok=True)
+
+            raise exc
+
+        ## From here on, an interrupted compaction is finished by the next run
+        replace_atomic(tmp_file, compacted_file)
+        _finish_compaction(partition_dir)
+
+        log.debug(f"Compacted {len(files)} file(s) in partition '{partition_dir}'")
+        compacted += 1
+
+    return compacted
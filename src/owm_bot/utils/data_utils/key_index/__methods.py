@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+import typing as t
+
+log = logging.getLogger("owm_bot.utils.data_utils.key_index")
+
+from owm_bot.utils.file_utils import atomic_write
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+KEY_DTYPE: np.dtype = np.dtype(np.uint64)
+
+
+def hash_keys(
+    data: t.Union[pd.DataFrame, pa.Table, pa.RecordBatch] = None,
+    columns: list[str] = None,
+) -> np.ndarray:
+    """Hash each row's primary key columns to a single uint64.
+
+    Hashes are stable across processes & don't depend on how a column is stored, i.e.
+    a categorical and a string column, or second & nanosecond timestamps, of the same
+    values hash the same.
+
+    Params:
+        data (pandas.DataFrame | pyarrow.Table | pyarrow.RecordBatch): Rows to hash.
+        columns (list[str]): The primary key columns.
+
+    Returns:
+        (numpy.ndarray): One uint64 hash per row.
+
+    """
+    assert columns, ValueError("Missing primary key columns to hash")
+
+    if not isinstance(data, pd.DataFrame):
+        data = data.select(columns).to_pandas()
+
+    keys: pd.DataFrame = data[columns].copy()
+    for col in columns:
+        if pd.api.types.is_datetime64_any_dtype(keys[col]):
+            _dt: pd.Series = keys[col]
+            if _dt.dt.tz is not None:
+                _dt = _dt.dt.tz_convert("UTC").dt.tz_localize(None)
+            keys[col] = _dt.astype("datetime64[ns]")
+
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy(dtype=KEY_DTYPE)
+
+
+class KeyIndex:
+    """A sorted array of primary key hashes, persisted as a `.npy` sidecar file.
+
+    8 bytes per row, so the keys of a multi-GB history fit in a few MB, and membership
+    checks are a binary search instead of loading & hashing the whole history.
+    Two different keys colliding on the same 64-bit hash is possible, but unlikely
+    enough (~1 in 10^8 at 1M rows) to ignore for weather history.
+
+    Params:
+        index_file (str | Path | None): File the index is loaded from & saved to.
+    """
+
+    def __init__(self, index_file: t.Union[str, Path, None] = None):
+        self.index_file: Path | None = (
+            Path(f"{index_file}") if index_file is not None else None
+        )
+
+        self.keys: np.ndarray = np.empty(0, dtype=KEY_DTYPE)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @property
+    def exists(self) -> bool:
+        return self.index_file is not None and self.index_file.exists()
+
+    def load(self) -> KeyIndex:
+        if not self.exists:
+            return self
+
+        try:
+            self.keys = np.load(self.index_file).astype(KEY_DTYPE, copy=False)
+        except Exception as exc:
+            msg = Exception(
+                f"Unhandled exception loading key index from '{self.index_file}'. Details: {exc}"
+            )
+            log.error(msg)
+
+            raise exc
+
+        return self
+
+    def save(self) -> None:
+        if self.index_file is None:
+            return
+
+        try:
+            ## Readers never see a partial index
+            with atomic_write(self.index_file, "wb") as f:
+                np.save(f, self.keys)
+        except Exception as exc:
+            msg = Exception(
+                f"Unhandled exception saving key index to '{self.index_file}'. Details: {exc}"
+            )
+            log.error(msg)
+
+            raise exc
+
+    def contains(self, hashes: np.ndarray = None) -> np.ndarray:
+        """Boolean mask of which `hashes` are already in the index."""
+        hashes = np.asarray(hashes, dtype=KEY_DTYPE)
+        if len(self.keys) == 0:
+            return np.zeros(len(hashes), dtype=bool)
+
+        pos: np.ndarray = np.searchsorted(self.keys, hashes)
+        pos[pos == len(self.keys)] = 0
+
+        return self.keys[pos] == hashes
+
+    def add(self, hashes: np.ndarray = None) -> None:
+        hashes = np.asarray(hashes, dtype=KEY_DTYPE)
+        if len(hashes) == 0:
+            return
+
+        ## Insert into place instead of re-sorting the whole index
+        new: np.ndarray = np.unique(hashes[~self.contains(hashes)])
+        self.keys = np.insert(self.keys, np.searchsorted(self.keys, new), new)
+
+    def clear(self) -> None:
+        self.keys = np.empty(0, dtype=KEY_DTYPE)
@@ -0,0 +1,13 @@
+from __future__ import annotations
+
+from .__methods import (
+    CURRENT_WEATHER_DATASET_SCHEMA,
+    CURRENT_WEATHER_SCHEMA,
+    FORECAST_WEATHER_DATASET_SCHEMA,
+    FORECAST_WEATHER_SCHEMA,
+    dataset_schema,
+    flatten_current_weather,
+    flatten_forecast_weather,
+    to_current_weather_table,
+    to_forecast_weather_table,
+)
@@ -0,0 +1,408 @@
+from __future__ import annotations
+
+import logging
+import time
+import typing as t
+
+log = logging.getLogger("owm_bot.utils.data_utils.weather_tables")
+
+from owm_bot.utils.data_utils.datasets import PARTITION_COLS, build_location_key
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+## Unix timestamps are stored as timezone-aware seconds
+TIMESTAMP_TYPE: pa.DataType = pa.timestamp("s", tz="UTC")
+## Low-cardinality strings/codes are stored once per file, rows hold an index
+DICT_STRING_TYPE: pa.DataType = pa.dictionary(pa.int32(), pa.string())
+
+## Measurements shared by current observations & forecasts
+_MEASUREMENT_FIELDS: list[pa.Field] = [
+    pa.field("temp", pa.float32()),
+    pa.field("feels_like", pa.float32()),
+    pa.field("pressure", pa.float32()),
+    pa.field("humidity", pa.float32()),
+    pa.field("dew_point", pa.float32()),
+    pa.field("uvi", pa.float32()),
+    pa.field("clouds", pa.float32()),
+    pa.field("visibility", pa.float32()),
+    pa.field("wind_speed", pa.float32()),
+    pa.field("wind_deg", pa.float32()),
+    pa.field("wind_gust", pa.float32()),
+    pa.field("rain", pa.float32()),
+    pa.field("snow", pa.float32()),
+]
+## The first entry of a response's 'weather' list
+_CONDITION_FIELDS: list[pa.Field] = [
+    ## Numeric codes are already 2 bytes per row, & Parquet dictionary-encodes them on disk
+    pa.field("condition_id", pa.int16()),
+    pa.field("condition_main", DICT_STRING_TYPE),
+    pa.field("condition_description", DICT_STRING_TYPE),
+    pa.field("condition_icon", DICT_STRING_TYPE),
+]
+
+CURRENT_WEATHER_SCHEMA: pa.Schema = pa.schema(
+    [
+        pa.field("location_key", DICT_STRING_TYPE),
+        pa.field("lat", pa.float64()),
+        pa.field("lon", pa.float64()),
+        pa.field("timezone", DICT_STRING_TYPE),
+        pa.field("dt", TIMESTAMP_TYPE),
+        pa.field("sunrise", TIMESTAMP_TYPE),
+        pa.field("sunset", TIMESTAMP_TYPE),
+        *_MEASUREMENT_FIELDS,
+        *_CONDITION_FIELDS,
+    ]
+)
+
+FORECAST_WEATHER_SCHEMA: pa.Schema = pa.schema(
+    [
+        pa.field("location_key", DICT_STRING_TYPE),
+        pa.field("lat", pa.float64()),
+        pa.field("lon", pa.float64()),
+        pa.field("timezone", DICT_STRING_TYPE),
+        ## 'hourly' or 'daily'
+        pa.field("forecast_type", DICT_STRING_TYPE),
+        ## When the forecast was made (the response's current.dt), and the time it is for
+        pa.field("issued_at", TIMESTAMP_TYPE),
+        pa.field("dt", TIMESTAMP_TYPE),
+        *_MEASUREMENT_FIELDS,
+        pa.field("temp_min", pa.float32()),
+        pa.field("temp_max", pa.float32()),
+        pa.field("pop", pa.float32()),
+        *_CONDITION_FIELDS,
+    ]
+)
+
+
+def dataset_schema(schema: pa.Schema = None) -> pa.Schema:
+    """Schema of a partitioned dataset of `schema` rows.
+
+    The partition columns are read back from directory names, as plain strings.
+    """
+    for name in PARTITION_COLS:
+        field: pa.Field = pa.field(name, pa.string())
+        idx: int = schema.get_field_index(name)
+        schema = schema.set(idx, field) if idx >= 0 else schema.append(field)
+
+    return schema
+
+
+CURRENT_WEATHER_DATASET_SCHEMA: pa.Schema = dataset_schema(CURRENT_WEATHER_SCHEMA)
+FORECAST_WEATHER_DATASET_SCHEMA: pa.Schema = dataset_schema(FORECAST_WEATHER_SCHEMA)
+
+## Shapes of the raw API records. Converting with a known type is ~2x faster than
+#  letting Arrow infer it, skips keys that aren't stored, and rejects wrongly-typed values
+_CONDITIONS_INPUT_TYPE: pa.DataType = pa.list_(
+    pa.struct(
+        [
+            ("id", pa.int64()),
+            ("main", pa.string()),
+            ("description", pa.string()),
+            ("icon", pa.string()),
+        ]
+    )
+)
+_PRECIPITATION_INPUT_TYPE: pa.DataType = pa.struct([("1h", pa.float64())])
+_DAILY_TEMP_INPUT_TYPE: pa.DataType = pa.struct(
+    [(name, pa.float64()) for name in ["day", "min", "max", "night", "eve", "morn"]]
+)
+_OBSERVATION_INPUT_FIELDS: list[tuple[str, pa.DataType]] = [
+    ("dt", pa.int64()),
+    ("sunrise", pa.int64()),
+    ("sunset", pa.int64()),
+    *[
+        (name, pa.float64())
+        for name in [
+            "pressure",
+            "humidity",
+            "dew_point",
+            "uvi",
+            "clouds",
+            "visibility",
+            "wind_speed",
+            "wind_deg",
+            "wind_gust",
+            "pop",
+        ]
+    ],
+    ("weather", _CONDITIONS_INPUT_TYPE),
+]
+_OBSERVATION_INPUT_TYPE: pa.DataType = pa.struct(
+    [
+        *_OBSERVATION_INPUT_FIELDS,
+        ("temp", pa.float64()),
+        ("feels_like", pa.float64()),
+        ("rain", _PRECIPITATION_INPUT_TYPE),
+        ("snow", _PRECIPITATION_INPUT_TYPE),
+    ]
+)
+_DAILY_INPUT_TYPE: pa.DataType = pa.struct(
+    [
+        *_OBSERVATION_INPUT_FIELDS,
+        ("temp", _DAILY_TEMP_INPUT_TYPE),
+        ("feels_like", _DAILY_TEMP_INPUT_TYPE),
+        ("rain", pa.float64()),
+        ("snow", pa.float64()),
+    ]
+)
+_LOCATION_INPUT_FIELDS: list[tuple[str, pa.DataType]] = [
+    ("location_key", pa.string()),
+    ("lat", pa.float64()),
+    ("lon", pa.float64()),
+    ("timezone", pa.string()),
+]
+## A bare observation, i.e. a One Call response's 'current' object with lat/lon added
+_CURRENT_INPUT_TYPE: pa.DataType = pa.struct(
+    [*_LOCATION_INPUT_FIELDS, *_OBSERVATION_INPUT_TYPE]
+)
+_ONECALL_CURRENT_INPUT_TYPE: pa.DataType = pa.struct(
+    [*_LOCATION_INPUT_FIELDS, ("current", _OBSERVATION_INPUT_TYPE)]
+)
+_ONECALL_FORECAST_INPUT_TYPE: pa.DataType = pa.struct(
+    [
+        *_LOCATION_INPUT_FIELDS,
+        ("current", pa.struct([("dt", pa.int64())])),
+        ("hourly", pa.list_(_OBSERVATION_INPUT_TYPE)),
+        ("daily", pa.list_(_DAILY_INPUT_TYPE)),
+    ]
+)
+
+WeatherData = t.Union[pa.Table, pd.DataFrame, dict, list[dict]]
+
+
+def _to_records(data: WeatherData = None) -> list[dict]:
+    if isinstance(data, dict):
+        return [data]
+    if isinstance(data, pd.DataFrame):
+        return data.to_dict(orient="records")
+
+    return data
+
+
+def _to_struct_array(records: list[dict], input_type: pa.DataType) -> pa.StructArray:
+    """Convert every record to one nested Arrow array in a single pass."""
+    try:
+        return pa.array(records, type=input_type)
+    except Exception as exc:
+        msg = Exception(
+            f"Unhandled exception converting weather records to an Arrow array. Details: {exc}"
+        )
+        log.error(msg)
+
+        raise exc
+
+
+def _field(arr: pa.Array, name: str) -> pa.Array:
+    """A child of a struct array, or all nulls when no record had that key."""
+    if not pa.types.is_struct(arr.type) or arr.type.get_field_index(name) < 0:
+        return pa.nulls(len(arr))
+
+    ## Unlike StructArray.field(), respects slicing & nulls of the parent array
+    return pc.struct_field(arr, [arr.type.get_field_index(name)])
+
+
+def _scalar_or_field(arr: pa.Array, name: str) -> pa.Array:
+    """Numbers sent either as-is or nested, like rain: 0.5 (daily) and rain: {"1h": 0.5}."""
+    if pa.types.is_struct(arr.type):
+        return _field(arr, name)
+
+    return arr
+
+
+def _cast(arr: pa.Array, to_type: pa.DataType) -> pa.Array:
+    if pa.types.is_dictionary(to_type):
+        if pa.types.is_dictionary(arr.type):
+            arr = arr.dictionary_decode()
+
+        return pc.dictionary_encode(pc.cast(arr, to_type.value_type)).cast(to_type)
+
+    return pc.cast(arr, to_type)
+
+
+def _first_condition(weather: pa.Array) -> pa.Array:
+    """The first item of each row's 'weather' list, null for empty or missing lists."""
+    if not pa.types.is_list(weather.type):
+        return pa.nulls(len(weather), type=pa.struct([]))
+
+    offsets = weather.offsets.to_numpy()[: len(weather)]
+    empty = pc.fill_null(pc.equal(pc.list_value_length(weather), 0), True)
+
+    return pc.take(
+        weather.values, pa.array(offsets, mask=empty.to_numpy(zero_copy_only=False))
+    )
+
+
+def _location_keys(records: pa.StructArray) -> pa.Array:
+    """Records' `location_key`, built from lat/lon where it is missing."""
+    location_key: pa.Array = _field(records, "location_key")
+    if location_key.null_count == 0:
+        return location_key
+
+    lat, lon = _field(records, "lat"), _field(records, "lon")
+    built: pa.Array = pa.array(
+        [
+            None if _lat is None or _lon is None else build_location_key(_lat, _lon)
+            for _lat, _lon in zip(lat.to_pylist(), lon.to_pylist())
+        ],
+        type=pa.string(),
+    )
+
+    return pc.coalesce(location_key, built)
+
+
+def _measurement_columns(obs: pa.Array) -> dict[str, pa.Array]:
+    columns: dict[str, pa.Array] = {
+        name: _field(obs, name)
+        for name in [
+            "pressure",
+            "humidity",
+            "dew_point",
+            "uvi",
+            "clouds",
+            "visibility",
+            "wind_speed",
+            "wind_deg",
+            "wind_gust",
+        ]
+    }
+    ## Daily forecasts nest temperatures by time of day
+    columns["temp"] = _scalar_or_field(_field(obs, "temp"), "day")
+    columns["feels_like"] = _scalar_or_field(_field(obs, "feels_like"), "day")
+    columns["rain"] = _scalar_or_field(_field(obs, "rain"), "1h")
+    columns["snow"] = _scalar_or_field(_field(obs, "snow"), "1h")
+
+    condition: pa.Array = _first_condition(_field(obs, "weather"))
+    columns["condition_id"] = _field(condition, "id")
+    columns["condition_main"] = _field(condition, "main")
+    columns["condition_description"] = _field(condition, "description")
+    columns["condition_icon"] = _field(condition, "icon")
+
+    return columns
+
+
+def _build_table(columns: dict[str, pa.Array], schema: pa.Schema) -> pa.Table:
+    """Cast each column to its schema type. Columns not in the schema are dropped."""
+    n_rows: int = len(next(iter(columns.values()))) if columns else 0
+
+    try:
+        return pa.Table.from_arrays(
+            [
+                _cast(columns.get(field.name, pa.nulls(n_rows)), field.type)
+                for field in schema
+            ],
+            schema=schema,
+        )
+    except Exception as exc:
+        msg = Exception(
+            f"Unhandled exception validating weather data against schema. Details: {exc}"
+        )
+        log.error(msg)
+
+        raise exc
+
+
+def flatten_current_weather(data: WeatherData = None) -> pa.Table:
+    """Flatten One Call responses (or bare 'current' objects) into `CURRENT_WEATHER_SCHEMA`.
+
+    Records are converted to one nested Arrow array and columns are pulled out of it
+    with Arrow compute functions, instead of building a Python dict per row.
+    """
+    records: list[dict] = _to_records(data)
+    ## Raw One Call responses nest the observation under 'current'
+    if records and "current" in records[0]:
+        records: pa.StructArray = _to_struct_array(records, _ONECALL_CURRENT_INPUT_TYPE)
+        obs: pa.Array = _field(records, "current")
+    else:
+        records: pa.StructArray = _to_struct_array(records, _CURRENT_INPUT_TYPE)
+        obs: pa.Array = records
+
+    columns: dict[str, pa.Array] = _measurement_columns(obs)
+    columns["lat"] = _field(records, "lat")
+    columns["lon"] = _field(records, "lon")
+    columns["timezone"] = _field(records, "timezone")
+    for name in ["dt", "sunrise", "sunset"]:
+        columns[name] = _field(obs, name)
+    columns["location_key"] = _location_keys(records)
+
+    return _build_table(columns, CURRENT_WEATHER_SCHEMA)
+
+
+def flatten_forecast_weather(data: WeatherData = None) -> pa.Table:
+    """Flatten the 'hourly' & 'daily' lists of One Call responses into `FORECAST_WEATHER_SCHEMA`.
+
+    Every forecast item becomes a row, tagged with its `forecast_type` & the time the
+    forecast was `issued_at`.
+    """
+    records: pa.StructArray = _to_struct_array(
+        _to_records(data), _ONECALL_FORECAST_INPUT_TYPE
+    )
+    issued_at: pa.Array = _field(_field(records, "current"), "dt")
+    ## Responses without 'current' were issued when they were fetched
+    issued_at = pc.fill_null(pc.cast(issued_at, pa.int64()), int(time.time()))
+
+    lat: pa.Array = _field(records, "lat")
+    lon: pa.Array = _field(records, "lon")
+    location_key: pa.Array = _location_keys(records)
+
+    tables: list[pa.Table] = []
+    for forecast_type in ["hourly", "daily"]:
+        forecasts: pa.Array = _field(records, forecast_type)
+        if not pa.types.is_list(forecasts.type):
+            continue
+
+        ## Repeat each response's columns for every item in its list
+        parents: pa.Array = pc.list_parent_indices(forecasts)
+        items: pa.Array = pc.list_flatten(forecasts)
+
+        columns: dict[str, pa.Array] = _measurement_columns(items)
+        columns["dt"] = _field(items, "dt")
+        columns["pop"] = _field(items, "pop")
+        columns["temp_min"] = _scalar_or_field(_field(items, "temp"), "min")
+        columns["temp_max"] = _scalar_or_field(_field(items, "temp"), "max")
+        if forecast_type == "hourly":
+            columns["temp_min"] = columns["temp_max"] = pa.nulls(len(items))
+        columns["location_key"] = pc.take(location_key, parents)
+        columns["lat"] = pc.take(lat, parents)
+        columns["lon"] = pc.take(lon, parents)
+        columns["timezone"] = pc.take(_field(records, "timezone"), parents)
+        columns["issued_at"] = pc.take(issued_at, parents)
+        columns["forecast_type"] = pa.array(
+            np.full(len(items), forecast_type, dtype=object), type=pa.string()
+        )
+
+        tables.append(_build_table(columns, FORECAST_WEATHER_SCHEMA))
+
+    if not tables:
+        return FORECAST_WEATHER_SCHEMA.empty_table()
+
+    return pa.concat_tables(tables).unify_dictionaries().combine_chunks()
+
+
+def _conform(
+    data: WeatherData, schema: pa.Schema, flatten: t.Callable[[WeatherData], pa.Table]
+) -> pa.Table:
+    ## Data that is already flat only needs casting, anything else is flattened
+    if isinstance(data, pa.Table):
+        if set(schema.names).issubset(data.column_names):
+            return data.select(schema.names).cast(schema)
+        data = data.to_pylist()
+    elif isinstance(data, pd.DataFrame):
+        if set(schema.names).issubset(data.columns):
+            return pa.Table.from_pandas(
+                data[schema.names], schema=schema, preserve_index=False
+            )
+
+    return flatten(data)
+
+
+def to_current_weather_table(data: WeatherData = None) -> pa.Table:
+    """Validate current weather data against `CURRENT_WEATHER_SCHEMA`, flattening it if needed."""
+    return _conform(data, CURRENT_WEATHER_SCHEMA, flatten_current_weather)
+
+
+def to_forecast_weather_table(data: WeatherData = None) -> pa.Table:
+    """Validate forecast data against `FORECAST_WEATHER_SCHEMA`, flattening it if needed."""
+    return _conform(data, FORECAST_WEATHER_SCHEMA, flatten_forecast_weather)
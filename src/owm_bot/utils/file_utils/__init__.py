@@ -0,0 +1,13 @@
+from __future__ import annotations
+
+from .__methods import (
+    FileLock,
+    atomic_path,
+    atomic_write,
+    fsync_dir,
+    fsync_file,
+    lock_path_for,
+    replace_atomic,
+    temp_path_for,
+    write_bytes_atomic,
+)
@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+import logging
+import os
+from pathlib import Path
+import threading
+import time
+import typing as t
+import uuid
+
+log = logging.getLogger("owm_bot.utils.file_utils")
+
+try:
+    import fcntl
+except ImportError:
+    ## Windows has no fcntl, locks become no-ops there
+    fcntl = None
+
+
+def fsync_dir(dir_path: t.Union[str, Path] = None) -> None:
+    """Fsync a directory, so a rename inside it survives a crash."""
+    try:
+        fd: int = os.open(f"{dir_path}", os.O_RDONLY)
+    except OSError:
+        ## Directories can't be opened on some platforms (i.e. Windows)
+        return
+
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def fsync_file(file_path: t.Union[str, Path] = None) -> None:
+    with open(file_path, "rb") as f:
+        os.fsync(f.fileno())
+
+
+def temp_path_for(path: t.Union[str, Path] = None) -> Path:
+    """A hidden, unique temporary path in the same directory as `path`.
+
+    Renaming only replaces a file atomically within the same filesystem, so the
+    temporary file is created next to the target.
+    """
+    path: Path = Path(f"{path}")
+
+    return path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+
+
+def replace_atomic(
+    tmp_path: t.Union[str, Path] = None, path: t.Union[str, Path] = None
+) -> None:
+    """Fsync `tmp_path`, rename it over `path`, then fsync the directory."""
+    fsync_file(tmp_path)
+    os.replace(tmp_path, path)
+    fsync_dir(Path(f"{path}").parent)
+
+
+@contextmanager
+def atomic_path(path: t.Union[str, Path] = None) -> t.Generator[Path, None, None]:
+    """Yield a temporary path to write to, then atomically move it to `path`.
+
+    For writers that take a path instead of a file object, i.e. `DataFrame.to_parquet()`.
+    Readers see either the old file or the complete new one, never a partial write. If
+    the block raises, the temporary file is removed and `path` is left untouched.
+
+    Usage:
+        with atomic_path(pq_file) as tmp_file:
+            df.to_parquet(tmp_file)
+
+    """
+    assert path, ValueError("Missing a path to write to")
+    path: Path = Path(f"{path}")
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp_path: Path = temp_path_for(path)
+    try:
+        yield tmp_path
+
+        replace_atomic(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+@contextmanager
+def atomic_write(
+    path: t.Union[str, Path] = None, mode: str = "wb", **kwargs
+) -> t.Generator[t.IO, None, None]:
+    """`open()` a temporary file for writing, then atomically move it to `path`."""
+    assert "w" in mode, ValueError(
+        f"atomic_write only supports write modes, got '{mode}'"
+    )
+
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, mode, **kwargs) as f:
+            yield f
+
+            f.flush()
+
+
+def write_bytes_atomic(path: t.Union[str, Path] = None, data: bytes = None) -> None:
+    with atomic_write(path, "wb") as f:
+        f.write(data)
+
+
+def lock_path_for(path: t.Union[str, Path] = None) -> Path:
+    return Path(f"{path}.lock")
+
+
+class FileLock:
+    """Advisory, inter-process lock on a path, using `fcntl.flock` on a `<path>.lock` file.
+
+    Only processes that also take the lock are kept out, the locked file itself can still
+    be read. Locks are reentrant within the same `FileLock` object, so a method holding
+    the lock can call another that takes it. On platforms without `fcntl` the lock does
+    nothing.
+
+    Params:
+        path (str | Path): The file or directory to lock.
+        timeout (float | None): Seconds to wait for the lock before raising `TimeoutError`.
+            `None` waits forever.
+        poll_interval (float): Seconds between attempts while waiting with a timeout.
+    """
+
+    def __init__(
+        self,
+        path: t.Union[str, Path] = None,
+        timeout: float | None = None,
+        poll_interval: float = 0.05,
+    ):
+        assert path, ValueError("Missing a path to lock")
+        self.path: Path = Path(f"{path}")
+        self.lock_file: Path = lock_path_for(self.path)
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+
+        self._fd: int | None = None
+        self._depth: int = 0
+        self._shared: bool = False
+        ## flock is per open file, so threads sharing this object must be serialized
+        self._thread_lock: threading.RLock = threading.RLock()
+
+    @property
+    def locked(self) -> bool:
+        return self._depth > 0
+
+    def acquire(self, shared: bool = False) -> FileLock:
+        self._thread_lock.acquire()
+        if self._depth > 0:
+            if self._shared and not shared:
+                self._thread_lock.release()
+
+                raise RuntimeError(
+                    f"Can't take an exclusive lock on '{self.path}' while holding a shared lock"
+                )
+            self._depth += 1
+
+            return self
+
+        if fcntl is None:
+            self._depth = 1
+
+            return self
+
+        self.lock_file.parent.mkdir(parents=True, exist_ok=True)
+        fd: int = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        operation: int = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+
+        try:
+            if self.timeout is None:
+                fcntl.flock(fd, operation)
+            else:
+                deadline: float = time.monotonic() + self.timeout
+                while True:
+                    try:
+                        fcntl.flock(fd, operation | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if time.monotonic() >= deadline:
+                            raise TimeoutError(
+                                f"Timed out after {self.timeout}s waiting for lock on '{self.path}'"
+                            )
+                        time.sleep(self.poll_interval)
+        except BaseException:
+            os.close(fd)
+            self._thread_lock.release()
+
+            raise
+
+        self._fd = fd
+        self._depth = 1
+        self._shared = shared
+
+        return self
+
+    def release(self) -> None:
+        if self._depth == 0:
+            return
+
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+
+        self._thread_lock.release()
+
+    def __enter__(self) -> FileLock:
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    @contextmanager
+    def shared(self) -> t.Generator[FileLock, None, None]:
+        """Hold a shared (read) lock, several processes can hold one at a time."""
+        self.acquire(shared=True)
+        try:
+            yield self
+        finally:
+            self.release()
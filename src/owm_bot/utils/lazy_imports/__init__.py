@@ -0,0 +1,3 @@
+from __future__ import annotations
+
+from .__methods import lazy_module
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import importlib
+import sys
+import typing as t
+
+
+def lazy_module(
+    module_name: str = None,
+    attrs: dict[str, str] | None = None,
+    submodules: list[str] | None = None,
+) -> tuple[t.Callable[[str], t.Any], t.Callable[[], list[str]]]:
+    """Build a module-level `__getattr__` & `__dir__` that import names on first access.
+
+    Usage, in a package's `__init__.py`:
+        `__getattr__, __dir__ = lazy_module(__name__, attrs={"JsonLocation": ".schemas"})`
+
+    The first `pkg.JsonLocation` (or `from pkg import JsonLocation`) imports `pkg.schemas`
+    and caches the value in the package's globals, so later lookups skip `__getattr__`.
+
+    Params:
+        module_name (str): The package's `__name__`.
+        attrs (dict[str, str]): Map of attribute name to the (relative) module it is defined in.
+        submodules (list[str]): Names of submodules that are attributes of the package.
+
+    """
+    attrs = attrs or {}
+    submodules = submodules or []
+
+    def __getattr__(name: str) -> t.Any:
+        if name in submodules:
+            value = importlib.import_module(f".{name}", module_name)
+        elif name in attrs:
+            value = getattr(importlib.import_module(attrs[name], module_name), name)
+        else:
+            raise AttributeError(f"module '{module_name}' has no attribute '{name}'")
+
+        setattr(sys.modules[module_name], name, value)
+
+        return value
+
+    def __dir__() -> list[str]:
+        return sorted({*vars(sys.modules[module_name]), *attrs, *submodules})
+
+    return __getattr__, __dir__
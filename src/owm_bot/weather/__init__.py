@@ -0,0 +1,20 @@
+from __future__ import annotations
+
+import typing as t
+
+from owm_bot.utils.lazy_imports import lazy_module
+
+if t.TYPE_CHECKING:
+    from . import controllers, ingest, metrics, summary, verification
+    from .controllers import AsyncOneCallClientController, OneCallClientController
+    from .ingest import ingest_archives
+
+__getattr__, __dir__ = lazy_module(
+    __name__,
+    attrs={
+        "AsyncOneCallClientController": ".controllers",
+        "OneCallClientController": ".controllers",
+        "ingest_archives": ".ingest",
+    },
+    submodules=["controllers", "ingest", "metrics", "summary", "verification"],
+)
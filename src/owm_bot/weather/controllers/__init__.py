@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+import typing as t
+
+from owm_bot.utils.lazy_imports import lazy_module
+
+if t.TYPE_CHECKING:
+    from ._controllers import (
+        AsyncOneCallClientController,
+        OneCallClientController,
+        build_onecall_params,
+        onecall_request_key,
+        parse_onecall_response,
+    )
+
+__getattr__, __dir__ = lazy_module(
+    __name__,
+    attrs={
+        "AsyncOneCallClientController": "._controllers",
+        "OneCallClientController": "._controllers",
+        "build_onecall_params": "._controllers",
+        "onecall_request_key": "._controllers",
+        "parse_onecall_response": "._controllers",
+    },
+)
@@ -0,0 +1,358 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import AbstractAsyncContextManager, AbstractContextManager
+from functools import partial
+import logging
+import typing as t
+
+log = logging.getLogger("owm_bot.weather.controllers")
+
+from owm_bot.core.config import owm_settings
+from owm_bot.core.constants import ONECALL_EXCLUDE_PARTS, OPENWEATHERMAP_ONECALL_URL
+from owm_bot.core.depends import (
+    owm_async_client_dependency,
+    owm_hishel_client_dependency,
+    owm_http_client_dependency,
+    owm_request_layer_dependency,
+)
+from owm_bot.core import instrument
+from owm_bot.core.http import (
+    ONLY_IF_CACHED,
+    AsyncTokenBucket,
+    RequestLayer,
+    request_key,
+)
+from owm_bot.domain.Location import JsonLocation
+from owm_bot.domain.Weather import OneCallResponse
+
+import hishel
+import httpx
+
+
+def build_onecall_params(
+    location: JsonLocation = None,
+    exclude: t.Union[str, list[str], None] = None,
+    units: str | None = None,
+    lang: str | None = None,
+    api_key: str | None = None,
+) -> dict:
+    assert location, ValueError("Missing a location to request weather for")
+    assert location.lat is not None and location.lon is not None, ValueError(
+        f"Location '{location.city_name}' is missing lat/lon. Geocode it before requesting weather."
+    )
+
+    if isinstance(exclude, str):
+        exclude = [part.strip() for part in exclude.split(",") if part.strip()]
+    exclude = owm_settings.onecall_exclude if exclude is None else exclude
+
+    invalid_parts: list[str] = [
+        part for part in exclude if part not in ONECALL_EXCLUDE_PARTS
+    ]
+    assert not invalid_parts, ValueError(
+        f"Invalid exclude part(s): {invalid_parts}. Must be one of {ONECALL_EXCLUDE_PARTS}"
+    )
+
+    params: dict = {
+        "lat": f"{location.lat}",
+        "lon": f"{location.lon}",
+        "units": units or owm_settings.units,
+        "appid": api_key or owm_settings.api_key,
+    }
+    if exclude:
+        params["exclude"] = ",".join(exclude)
+    if lang:
+        params["lang"] = lang
+
+    return params
+
+
+def onecall_request_key(params: dict = None, raw: bool = False) -> str:
+    """Single-flight key for a One Call request. Raw & validated results aren't shared."""
+    key: str = request_key(url=OPENWEATHERMAP_ONECALL_URL, params=params)
+
+    return f"{key}#raw" if raw else key
+
+
+def parse_onecall_response(
+    res: httpx.Response = None, raw: bool = False
+) -> t.Union[OneCallResponse, dict, None]:
+    if res.status_code != 200:
+        log.warning(
+            f"Response non-successful: [{res.status_code}: {res.reason_phrase}]: {res.text}"
+        )
+
+        return None
+
+    try:
+        if raw:
+            return res.json()
+
+        with instrument.VALIDATION_SECONDS.time(model="OneCallResponse"):
+            return OneCallResponse.model_validate_json(res.content)
+    except Exception as exc:
+        msg = Exception(
+            f"Unhandled exception decoding One Call response content. Details: {exc}"
+        )
+        log.error(msg)
+
+        raise exc
+
+
+class OneCallClientController(AbstractContextManager):
+    """Fetch One Call weather data over a single long-lived, pooled `httpx.Client`.
+
+    Params:
+        client (httpx.Client | None): A client to reuse. When `None`, a pooled client is
+            created on `__enter__` and closed on `__exit__`.
+        api_key (str | None): OWM API key. Defaults to `owm_settings.api_key`.
+        units (str | None): 'standard', 'metric' or 'imperial'. Defaults to `owm_settings.units`.
+        exclude (str | list[str] | None): One Call parts to skip downloading. Defaults to
+            `owm_settings.onecall_exclude`.
+        use_cache (bool): Serve repeat requests from the 'weather' HTTP cache until they
+            are older than `settings.http_cache_weather_ttl`.
+        request_layer (RequestLayer | None): Layer that budgets & retries every request.
+            Defaults to the shared `owm_request_layer_dependency()`.
+    """
+
+    def __init__(
+        self,
+        client: httpx.Client | None = None,
+        api_key: str | None = None,
+        units: str | None = None,
+        exclude: t.Union[str, list[str], None] = None,
+        max_connections: int = 10,
+        timeout: float = 10.0,
+        use_cache: bool = False,
+        request_layer: RequestLayer | None = None,
+    ):
+        self.client = client
+        self.api_key = api_key
+        self.units = units
+        self.exclude = exclude
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.use_cache = use_cache
+        self.request_layer = request_layer or owm_request_layer_dependency()
+
+        ## Only close the client if it was created by this controller
+        self._owns_client: bool = client is None
+
+    def __enter__(self) -> t.Self:
+        if self.client is None and self.use_cache:
+            self.client = owm_hishel_client_dependency(
+                endpoint="weather",
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                timeout=self.timeout,
+            )
+        elif self.client is None:
+            self.client = owm_http_client_dependency(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                timeout=self.timeout,
+            )
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_value:
+            log.error(f"({exc_type}) {exc_value}")
+
+        if self._owns_client and self.client is not None:
+            self.client.close()
+            self.client = None
+
+    def get_weather(
+        self,
+        location: JsonLocation = None,
+        exclude: t.Union[str, list[str], None] = None,
+        units: str | None = None,
+        lang: str | None = None,
+        raw: bool = False,
+    ) -> t.Union[OneCallResponse, dict, None]:
+        params: dict = build_onecall_params(
+            location=location,
+            exclude=self.exclude if exclude is None else exclude,
+            units=units or self.units,
+            lang=lang,
+            api_key=self.api_key,
+        )
+
+        def _request() -> t.Union[OneCallResponse, dict, None]:
+            log.debug(f"Requesting weather for lat-{location.lat}, lon-{location.lon}")
+            try:
+                res: httpx.Response = self.request_layer.send(
+                    partial(self.client.get, OPENWEATHERMAP_ONECALL_URL, params=params),
+                    api_key=params["appid"],
+                    endpoint="onecall",
+                    cache="http_weather",
+                    ## A plain client would send the cache-only request to OWM
+                    cached=(
+                        partial(
+                            self.client.get,
+                            OPENWEATHERMAP_ONECALL_URL,
+                            params=params,
+                            headers=ONLY_IF_CACHED,
+                        )
+                        if isinstance(self.client, hishel.CacheClient)
+                        else None
+                    ),
+                )
+            except Exception as exc:
+                msg = Exception(
+                    f"Unhandled exception sending One Call request. Details: {exc}"
+                )
+                log.error(msg)
+
+                raise exc
+
+            return parse_onecall_response(res=res, raw=raw)
+
+        return self.request_layer.single_flight.do(
+            onecall_request_key(params=params, raw=raw), _request, endpoint="onecall"
+        )
+
+    def get_weather_many(
+        self,
+        locations: list[JsonLocation] = None,
+        exclude: t.Union[str, list[str], None] = None,
+        units: str | None = None,
+        lang: str | None = None,
+        raw: bool = False,
+    ) -> list[t.Union[OneCallResponse, dict, None]]:
+        return [
+            self.get_weather(
+                location=location, exclude=exclude, units=units, lang=lang, raw=raw
+            )
+            for location in locations
+        ]
+
+
+class AsyncOneCallClientController(AbstractAsyncContextManager):
+    """Async variant of `OneCallClientController`.
+
+    `get_weather_many()` requests locations concurrently, limited by `max_concurrency`
+    and the API key's budget in the shared `RequestLayer`. Passing `calls_per_minute` or
+    a `rate_limiter` adds an `AsyncTokenBucket` on top, i.e. to leave room for other jobs.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient | None = None,
+        api_key: str | None = None,
+        units: str | None = None,
+        exclude: t.Union[str, list[str], None] = None,
+        max_concurrency: int | None = None,
+        calls_per_minute: int | None = None,
+        rate_limiter: AsyncTokenBucket | None = None,
+        timeout: float = 10.0,
+        request_layer: RequestLayer | None = None,
+    ):
+        self.client = client
+        self.api_key = api_key
+        self.units = units
+        self.exclude = exclude
+        self.max_concurrency = max_concurrency or owm_settings.max_concurrency
+        self.rate_limiter = rate_limiter or (
+            AsyncTokenBucket(rate=calls_per_minute, period=60.0)
+            if calls_per_minute
+            else None
+        )
+        self.timeout = timeout
+        self.request_layer = request_layer or owm_request_layer_dependency()
+
+        self._owns_client: bool = client is None
+        self._semaphore: asyncio.Semaphore | None = None
+
+    async def __aenter__(self) -> t.Self:
+        if self.client is None:
+            self.client = owm_async_client_dependency(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+                timeout=self.timeout,
+            )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if exc_value:
+            log.error(f"({exc_type}) {exc_value}")
+
+        if self._owns_client and self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def get_weather(
+        self,
+        location: JsonLocation = None,
+        exclude: t.Union[str, list[str], None] = None,
+        units: str | None = None,
+        lang: str | None = None,
+        raw: bool = False,
+    ) -> t.Union[OneCallResponse, dict, None]:
+        params: dict = build_onecall_params(
+            location=location,
+            exclude=self.exclude if exclude is None else exclude,
+            units=units or self.units,
+            lang=lang,
+            api_key=self.api_key,
+        )
+
+        async def _request() -> t.Union[OneCallResponse, dict, None]:
+            async with self._semaphore:
+                if self.rate_limiter is not None:
+                    await self.rate_limiter.acquire()
+
+                log.debug(
+                    f"Requesting weather for lat-{location.lat}, lon-{location.lon}"
+                )
+                try:
+                    res: httpx.Response = await self.request_layer.send_async(
+                        partial(
+                            self.client.get, OPENWEATHERMAP_ONECALL_URL, params=params
+                        ),
+                        api_key=params["appid"],
+                        endpoint="onecall",
+                        cache="http_weather",
+                    )
+                except Exception as exc:
+                    msg = Exception(
+                        f"Unhandled exception sending One Call request. Details: {exc}"
+                    )
+                    log.error(msg)
+
+                    raise exc
+
+            return parse_onecall_response(res=res, raw=raw)
+
+        ## Coalesced before taking a concurrency slot, so waiting callers don't hold one
+        return await self.request_layer.single_flight.do_async(
+            onecall_request_key(params=params, raw=raw), _request, endpoint="onecall"
+        )
+
+    async def get_weather_many(
+        self,
+        locations: list[JsonLocation] = None,
+        exclude: t.Union[str, list[str], None] = None,
+        units: str | None = None,
+        lang: str | None = None,
+        raw: bool = False,
+    ) -> list[t.Union[OneCallResponse, dict, Exception, None]]:
+        """Request weather for many locations concurrently.
+
+        Returns:
+            (list): One item per location, in input order. Failed requests are returned
+                as the raised exception instead of failing the whole batch.
+
+        """
+        return await asyncio.gather(
+            *[
+                self.get_weather(
+                    location=location, exclude=exclude, units=units, lang=lang, raw=raw
+                )
+                for location in locations
+            ],
+            return_exceptions=True,
+        )
@@ -0,0 +1,4 @@
+from __future__ import annotations
+
+from ._ingest import INGEST_TABLES, IngestStats, ingest_archives, ingest_task
+from ._sources import ArchiveChunk, extract_responses, find_archives, read_responses
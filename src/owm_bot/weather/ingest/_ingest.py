@@ -0,0 +1,435 @@
+from __future__ import annotations
+
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+import logging
+import multiprocessing
+import os
+from pathlib import Path
+import shutil
+import time
+import typing as t
+
+log = logging.getLogger("owm_bot.weather.ingest")
+
+from owm_bot.core.constants import PQ_ROW_GROUP_SIZE
+from owm_bot.core.paths import (
+    CURRENT_WEATHER_PQ_DATASET_DIR,
+    CURRENT_WEATHER_PQ_FILE,
+    FORECAST_WEATHER_PQ_DATASET_DIR,
+    FORECAST_WEATHER_PQ_FILE,
+)
+from owm_bot.utils import file_utils
+from owm_bot.utils.data_utils import datasets, key_index, weather_tables
+
+from ._sources import ArchiveChunk, find_archives, read_responses
+
+import pandas as pd
+import pyarrow as pa
+
+if t.TYPE_CHECKING:
+    from owm_bot.location.controllers import PQTableController
+
+## Tables an ingest can write, and the function flattening responses into each
+INGEST_TABLES: dict[str, t.Callable[[list[dict]], pa.Table]] = {
+    "current": weather_tables.flatten_current_weather,
+    "forecast": weather_tables.flatten_forecast_weather,
+}
+
+
+@dataclass
+class IngestStats:
+    archives: int = 0
+    responses: int = 0
+    errors: int = 0
+    ## Rows written per table, after dropping duplicates
+    rows: dict[str, int] = field(default_factory=dict)
+    seconds: float = 0.0
+
+
+@dataclass
+class _TaskResult:
+    responses: int
+    errors: int
+    tables: dict[str, pa.Table]
+
+
+def _has_rows_for(table_name: str, response: dict) -> bool:
+    if table_name == "current":
+        return isinstance(response.get("current"), dict)
+
+    return bool(response.get("hourly") or response.get("daily"))
+
+
+def _flatten(
+    responses: list[dict], flatten: t.Callable[[list[dict]], pa.Table]
+) -> tuple[pa.Table | None, int]:
+    if not responses:
+        return None, 0
+
+    try:
+        return flatten(responses), 0
+    except Exception:
+        ## One malformed response fails the whole batch, retry one at a time to keep the rest
+        tables: list[pa.Table] = []
+        errors: int = 0
+        for response in responses:
+            try:
+                tables.append(flatten([response]))
+            except Exception:
+                errors += 1
+
+        return (pa.concat_tables(tables) if tables else None), errors
+
+
+def ingest_task(
+    chunks: list[ArchiveChunk] = None,
+    tables: dict[str, list[str]] = None,
+) -> _TaskResult:
+    """Parse & flatten a group of archive chunks. Runs in a worker process.
+
+    Params:
+        chunks (list[ArchiveChunk]): Archive chunks to read.
+        tables (dict[str, list[str]]): Tables to build, mapped to the columns to sort them by.
+
+    Returns:
+        (_TaskResult): One sorted Arrow table per requested table.
+
+    """
+    responses: list[dict] = []
+    errors: int = 0
+    for chunk in chunks:
+        _responses, _errors = read_responses(chunk)
+        responses.extend(_responses)
+        errors += _errors
+
+    flat: dict[str, pa.Table] = {}
+    for table_name, sort_cols in tables.items():
+        table, _errors = _flatten(
+            [res for res in responses if _has_rows_for(table_name, res)],
+            INGEST_TABLES[table_name],
+        )
+        errors += _errors
+        if table is not None and table.num_rows:
+            flat[table_name] = datasets.sort_table(table, columns=sort_cols)
+
+    return _TaskResult(responses=len(responses), errors=errors, tables=flat)
+
+
+def _group_chunks(
+    chunks: list[ArchiveChunk], task_size: int
+) -> list[list[ArchiveChunk]]:
+    """Group chunks into tasks of about `task_size` responses each."""
+    tasks: list[list[ArchiveChunk]] = []
+    task: list[ArchiveChunk] = []
+    weight: int = 0
+
+    for chunk in chunks:
+        task.append(chunk)
+        weight += chunk.weight
+        if weight >= task_size:
+            tasks.append(task)
+            task, weight = [], 0
+
+    if task:
+        tasks.append(task)
+
+    return tasks
+
+
+def _build_controller(
+    table_name: str,
+    pq_file: Path,
+    dataset_dir: Path,
+    append_only: bool,
+) -> PQTableController:
+    from owm_bot.location.controllers import (
+        CurrentWeatherPQFileController,
+        ForecastWeatherPQFileController,
+    )
+
+    match table_name:
+        case "current":
+            return CurrentWeatherPQFileController(
+                current_weather_pq_file=pq_file,
+                append_only=append_only,
+                dataset_dir=dataset_dir,
+                on_duplicate="drop",
+            )
+        case "forecast":
+            return ForecastWeatherPQFileController(
+                forecast_weather_pq_file=pq_file,
+                append_only=append_only,
+                dataset_dir=dataset_dir,
+                on_duplicate="drop",
+            )
+        case _:
+            raise ValueError(
+                f"Invalid table: '{table_name}'. Must be one of {list(INGEST_TABLES)}"
+            )
+
+
+class _TableWriter:
+    """Merge worker output for one table & write it, from the main process only.
+
+    Rows already stored are dropped with the controller's key index, so ingesting the
+    same archives twice is a no-op. A rebuild writes to a staging file/dataset and
+    swaps it in at the end, so readers see the old table until the new one is complete.
+    """
+
+    def __init__(
+        self,
+        table_name: str = None,
+        pq_file: Path = None,
+        dataset_dir: Path = None,
+        append_only: bool = False,
+        rebuild: bool = False,
+        batch_rows: int = 1_000_000,
+    ):
+        self.table_name = table_name
+        self.pq_file = Path(f"{pq_file}")
+        self.dataset_dir = Path(f"{dataset_dir}")
+        self.append_only = append_only
+        self.rebuild = rebuild
+        self.batch_rows = batch_rows
+
+        self.rows_written: int = 0
+        self._tables: list[pa.Table] = []
+        self._buffered_rows: int = 0
+
+        ## A rebuilt dataset is written next to the live one & renamed over it
+        self._staging_dir: Path | None = (
+            file_utils.temp_path_for(self.dataset_dir)
+            if append_only and rebuild
+            else None
+        )
+        self.controller: PQTableController = _build_controller(
+            table_name,
+            pq_file=self.pq_file,
+            dataset_dir=self._staging_dir or self.dataset_dir,
+            append_only=append_only,
+        )
+
+    @property
+    def sort_cols(self) -> list[str]:
+        return self.controller.primary_key
+
+    def add(self, table: pa.Table = None) -> None:
+        self._tables.append(table)
+        self._buffered_rows += table.num_rows
+
+        ## A Parquet file is rewritten in full on every save, so only datasets write early
+        if self.append_only and self._buffered_rows >= self.batch_rows:
+            self._write_batch()
+
+    def _take_buffered(self) -> pd.DataFrame:
+        table: pa.Table = datasets.sort_table(
+            pa.concat_tables(self._tables), columns=self.sort_cols
+        )
+        self._tables, self._buffered_rows = [], 0
+
+        return table.to_pandas()
+
+    def _write_batch(self) -> None:
+        if not self._tables:
+            return
+
+        df: pd.DataFrame = self._take_buffered()
+        with self.controller.lock:
+            stored_before: int = len(self.controller.key_index)
+            self.controller.update_df(new_data=df, save_pq=True)
+            self.rows_written += len(self.controller.key_index) - stored_before
+
+    def _rebuild_file(self) -> None:
+        df: pd.DataFrame = (
+            self._take_buffered()
+            if self._tables
+            else self.controller.schema.empty_table().to_pandas()
+        )
+        hashes = key_index.hash_keys(df, columns=self.controller.primary_key)
+        df = df[~pd.Series(hashes).duplicated().to_numpy()]
+
+        log.info(f"Replacing '{self.pq_file}' with {len(df)} rebuilt row(s)")
+        with self.controller.lock:
+            with file_utils.atomic_path(self.pq_file) as tmp_file:
+                df.to_parquet(
+                    tmp_file,
+                    engine=self.controller.pq_engine,
+                    schema=self.controller.schema,
+                    row_group_size=PQ_ROW_GROUP_SIZE,
+                )
+            ## Rebuilt from the new file on the next upsert
+            self.controller.key_index_file.unlink(missing_ok=True)
+
+        self.rows_written = len(df)
+
+    def _swap_dataset(self) -> None:
+        if not self._staging_dir.exists():
+            self._staging_dir.mkdir(parents=True)
+        self.controller.compact()
+
+        log.info(f"Replacing dataset '{self.dataset_dir}' with rebuilt dataset")
+        with file_utils.FileLock(self.dataset_dir):
+            old_dir: Path = file_utils.temp_path_for(self.dataset_dir)
+            if self.dataset_dir.exists():
+                self.dataset_dir.rename(old_dir)
+            self._staging_dir.rename(self.dataset_dir)
+            file_utils.fsync_dir(self.dataset_dir.parent)
+
+        shutil.rmtree(old_dir, ignore_errors=True)
+        file_utils.lock_path_for(self._staging_dir).unlink(missing_ok=True)
+
+    def close(self) -> None:
+        """Write everything still buffered, and swap in a rebuilt table."""
+        if not self.append_only:
+            if self.rebuild:
+                self._rebuild_file()
+            else:
+                self._write_batch()
+
+            return
+
+        self._write_batch()
+        if self.rebuild:
+            self._swap_dataset()
+
+    def abort(self) -> None:
+        """Drop a partially rebuilt dataset, leaving the live one untouched."""
+        if self._staging_dir is not None:
+            shutil.rmtree(self._staging_dir, ignore_errors=True)
+            file_utils.lock_path_for(self._staging_dir).unlink(missing_ok=True)
+
+
+def ingest_archives(
+    paths: t.Union[str, Path, list[t.Union[str, Path]]] = None,
+    tables: list[str] | None = None,
+    workers: int | None = None,
+    chunk_size: int = 256,
+    rebuild: bool = False,
+    append_only: bool = False,
+    batch_rows: int = 1_000_000,
+    current_weather_pq_file: t.Union[str, Path] = CURRENT_WEATHER_PQ_FILE,
+    forecast_weather_pq_file: t.Union[str, Path] = FORECAST_WEATHER_PQ_FILE,
+    current_dataset_dir: t.Union[str, Path] = CURRENT_WEATHER_PQ_DATASET_DIR,
+    forecast_dataset_dir: t.Union[str, Path] = FORECAST_WEATHER_PQ_DATASET_DIR,
+) -> IngestStats:
+    """Load raw One Call responses from archives into the weather history tables.
+
+    Archives (hishel file/SQLite caches, JSON & JSONL dumps) are split into tasks of
+    about `chunk_size` responses, which a process pool parses & flattens to sorted
+    Arrow tables in parallel. The main process is the only writer: it merges worker
+    output and writes it through the table controllers, dropping rows already stored.
+
+    Params:
+        paths (str | Path | list): Archive files or directories (searched recursively).
+        tables (list[str] | None): Tables to write, 'current' and/or 'forecast'. Defaults to both.
+        workers (int | None): Worker processes. Defaults to the number of CPUs. With 1
+            worker, archives are parsed in the current process.
+        chunk_size (int): Approximate number of responses per task.
+        rebuild (bool): Replace the tables with what is in the archives, instead of
+            adding to them.
+        append_only (bool): Write to the partitioned datasets instead of the Parquet files.
+        batch_rows (int): In append-only mode, append once this many rows are buffered.
+
+    Returns:
+        (IngestStats): Counts of archives, responses, errors & rows written per table.
+
+    """
+    tables = tables or list(INGEST_TABLES)
+    invalid_tables: list[str] = [name for name in tables if name not in INGEST_TABLES]
+    assert not invalid_tables, ValueError(
+        f"Invalid table(s): {invalid_tables}. Must be one of {list(INGEST_TABLES)}"
+    )
+    workers = workers or os.cpu_count() or 1
+    assert workers > 0, ValueError("workers must be a positive number")
+
+    started: float = time.perf_counter()
+    chunks: list[ArchiveChunk] = find_archives(paths, chunk_size=chunk_size)
+    tasks: list[list[ArchiveChunk]] = _group_chunks(chunks, task_size=chunk_size)
+    stats: IngestStats = IngestStats(archives=len({chunk.path for chunk in chunks}))
+    log.info(
+        f"Ingesting {stats.archives} archive(s) as {len(tasks)} task(s) with {workers} worker(s)"
+    )
+
+    targets: dict[str, tuple[Path, Path]] = {
+        "current": (current_weather_pq_file, current_dataset_dir),
+        "forecast": (forecast_weather_pq_file, forecast_dataset_dir),
+    }
+    writers: dict[str, _TableWriter] = {
+        name: _TableWriter(
+            table_name=name,
+            pq_file=targets[name][0],
+            dataset_dir=targets[name][1],
+            append_only=append_only,
+            rebuild=rebuild,
+            batch_rows=batch_rows,
+        )
+        for name in tables
+    }
+    sort_cols: dict[str, list[str]] = {
+        name: writer.sort_cols for name, writer in writers.items()
+    }
+
+    def _collect(result: _TaskResult) -> None:
+        stats.responses += result.responses
+        stats.errors += result.errors
+        for name, table in result.tables.items():
+            writers[name].add(table)
+
+    try:
+        if workers == 1 or len(tasks) <= 1:
+            for task in tasks:
+                _collect(ingest_task(task, tables=sort_cols))
+        else:
+            _run_pool(tasks, sort_cols=sort_cols, workers=workers, collect=_collect)
+
+        for writer in writers.values():
+            writer.close()
+    except BaseException:
+        for writer in writers.values():
+            writer.abort()
+
+        raise
+
+    stats.rows = {name: writer.rows_written for name, writer in writers.items()}
+    stats.seconds = time.perf_counter() - started
+    log.info(
+        f"Ingested {stats.responses} response(s) from {stats.archives} archive(s) in {stats.seconds:.1f}s, {stats.errors} error(s). Rows written: {stats.rows}"
+    )
+
+    return stats
+
+
+def _run_pool(
+    tasks: list[list[ArchiveChunk]],
+    sort_cols: dict[str, list[str]],
+    workers: int,
+    collect: t.Callable[[_TaskResult], None],
+) -> None:
+    ## 'spawn' workers don't inherit Arrow's thread pools or open files from the writer,
+    #  which 'fork' can deadlock on
+    context = multiprocessing.get_context("spawn")
+    ## Cap results waiting to be merged, so memory doesn't grow with the archive size
+    max_pending: int = workers * 2
+    remaining: t.Iterator[list[ArchiveChunk]] = iter(tasks)
+    pending: set[Future] = set()
+    done_tasks: int = 0
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+
+        def _submit() -> None:
+            for task in remaining:
+                pending.add(pool.submit(ingest_task, task, sort_cols))
+                if len(pending) >= max_pending:
+                    return
+
+        _submit()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                collect(future.result())
+                done_tasks += 1
+
+            log.debug(f"Ingest progress: {done_tasks}/{len(tasks)} task(s)")
+            _submit()
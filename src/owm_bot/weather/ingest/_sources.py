@@ -0,0 +1,304 @@
+from __future__ import annotations
+
+import base64
+from dataclasses import dataclass
+import gzip
+import json
+import logging
+from pathlib import Path
+import sqlite3
+import typing as t
+import zlib
+
+log = logging.getLogger("owm_bot.weather.ingest.sources")
+
+from owm_bot.core.constants import OPENWEATHERMAP_ONECALL_URL
+
+## orjson parses API responses ~3-5x faster than the stdlib. It is optional, install the
+#  'speedups' extra to use it
+try:
+    import orjson
+
+    loads: t.Callable[[t.Union[str, bytes]], t.Any] = orjson.loads
+except ImportError:
+    loads: t.Callable[[t.Union[str, bytes]], t.Any] = json.loads
+
+## Files holding one JSON document per line
+JSONL_SUFFIXES: list[str] = [".jsonl", ".ndjson"]
+## hishel SQLite cache databases
+SQLITE_SUFFIXES: list[str] = [".sqlite", ".sqlite3", ".db"]
+## Never archives, i.e. lock files, key-index sidecars & SQLite journals
+SKIP_SUFFIXES: list[str] = [".lock", ".npy", ".parquet", ".tmp"]
+SKIP_NAME_ENDINGS: tuple[str, ...] = ("-wal", "-shm", "-journal")
+## Lines read from the start of a JSONL file to estimate its bytes per response
+JSONL_SAMPLE_LINES: int = 64
+
+_ONECALL_PATH: str = OPENWEATHERMAP_ONECALL_URL.split("://", 1)[-1].split("/", 1)[-1]
+
+
+@dataclass(frozen=True)
+class ArchiveChunk:
+    """A slice of a raw response archive, small enough to hand to one worker.
+
+    Params:
+        path (Path): The archive file.
+        kind (str): 'json', 'jsonl' or 'sqlite'.
+        start (int | None): First SQLite rowid, or byte offset of the first JSONL line,
+            in the slice (inclusive). `None` reads the whole file.
+        stop (int | None): Last SQLite rowid, or JSONL byte offset, in the slice (exclusive).
+        responses (int | None): Estimated number of responses in a JSONL byte range.
+    """
+
+    path: Path
+    kind: str
+    start: int | None = None
+    stop: int | None = None
+    responses: int | None = None
+
+    @property
+    def weight(self) -> int:
+        """Approximate number of responses in the chunk, used to balance tasks."""
+        if self.kind == "sqlite":
+            return self.stop - self.start
+
+        return self.responses or 1
+
+
+def _archive_kind(path: Path) -> str | None:
+    suffixes: list[str] = [s.lower() for s in path.suffixes]
+    if (
+        path.name.startswith(".")
+        or path.name.endswith(SKIP_NAME_ENDINGS)
+        or any(s in SKIP_SUFFIXES for s in suffixes)
+    ):
+        return None
+    if suffixes and suffixes[-1] in SQLITE_SUFFIXES:
+        return "sqlite"
+    if any(s in JSONL_SUFFIXES for s in suffixes):
+        return "jsonl"
+
+    ## Plain JSON dumps, and hishel file cache entries (which have no extension)
+    return "json"
+
+
+def _sqlite_chunks(path: Path, chunk_size: int) -> list[ArchiveChunk]:
+    conn: sqlite3.Connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        has_cache: bool = (
+            conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='cache'"
+            ).fetchone()
+            is not None
+        )
+        if not has_cache:
+            log.warning(f"No hishel 'cache' table in SQLite file '{path}', skipping")
+
+            return []
+
+        lo, hi = conn.execute("SELECT MIN(rowid), MAX(rowid) FROM cache").fetchone()
+    finally:
+        conn.close()
+
+    if lo is None:
+        return []
+
+    return [
+        ArchiveChunk(path=path, kind="sqlite", start=start, stop=start + chunk_size)
+        for start in range(lo, hi + 1, chunk_size)
+    ]
+
+
+def _jsonl_chunks(path: Path, chunk_size: int) -> list[ArchiveChunk]:
+    """Split a JSONL file into byte ranges of about `chunk_size` lines, each starting at a line."""
+    if path.suffix.lower() == ".gz":
+        ## A gzip stream can't be read from the middle
+        return [ArchiveChunk(path=path, kind="jsonl")]
+
+    size: int = path.stat().st_size
+    with open(path, "rb") as f:
+        sample: list[bytes] = [
+            line for line in (f.readline() for _ in range(JSONL_SAMPLE_LINES)) if line
+        ]
+        line_bytes: float = max(1.0, sum(map(len, sample)) / max(1, len(sample)))
+        chunk_bytes: int = max(1, int(line_bytes * chunk_size))
+
+        starts: list[int] = [0]
+        while starts[-1] + chunk_bytes < size:
+            ## Move the split to the start of the next line
+            f.seek(starts[-1] + chunk_bytes)
+            f.readline()
+            if f.tell() >= size:
+                break
+            starts.append(f.tell())
+
+    stops: list[int] = [*starts[1:], size]
+
+    return [
+        ArchiveChunk(
+            path=path,
+            kind="jsonl",
+            start=start,
+            stop=stop,
+            responses=max(1, round((stop - start) / line_bytes)),
+        )
+        for start, stop in zip(starts, stops)
+    ]
+
+
+def find_archives(
+    paths: t.Union[str, Path, list[t.Union[str, Path]]] = None,
+    chunk_size: int = 256,
+) -> list[ArchiveChunk]:
+    """List the raw response archives under `paths`, split into chunks.
+
+    Directories are searched recursively. SQLite cache databases are split into rowid
+    ranges of `chunk_size` entries, and JSONL files into byte ranges of about
+    `chunk_size` lines, so one large cache or dump still spreads across workers.
+    """
+    if isinstance(paths, (str, Path)):
+        paths = [paths]
+
+    chunks: list[ArchiveChunk] = []
+    for path in paths or []:
+        path: Path = Path(f"{path}")
+        if not path.exists():
+            log.warning(f"Archive path does not exist: '{path}'")
+            continue
+
+        files: list[Path] = (
+            sorted(f for f in path.rglob("*") if f.is_file())
+            if path.is_dir()
+            else [path]
+        )
+        for f in files:
+            kind: str | None = _archive_kind(f)
+            if kind == "sqlite":
+                chunks.extend(_sqlite_chunks(f, chunk_size=chunk_size))
+            elif kind == "jsonl":
+                chunks.extend(_jsonl_chunks(f, chunk_size=chunk_size))
+            elif kind is not None:
+                chunks.append(ArchiveChunk(path=f, kind=kind))
+
+    return chunks
+
+
+def _decode_content(content: bytes, headers: list) -> bytes:
+    encoding: str = next(
+        (
+            value.lower()
+            for key, value in headers or []
+            if key.lower() == "content-encoding"
+        ),
+        "identity",
+    )
+
+    match encoding:
+        case "gzip" | "x-gzip":
+            return gzip.decompress(content)
+        case "deflate":
+            try:
+                return zlib.decompress(content)
+            except zlib.error:
+                return zlib.decompress(content, -zlib.MAX_WBITS)
+        case "identity" | "":
+            return content
+        case _:
+            raise ValueError(f"Unsupported Content-Encoding: '{encoding}'")
+
+
+def _unwrap_cached_response(doc: dict) -> t.Any | None:
+    """The JSON body of a hishel cache entry, or `None` if it isn't a One Call response."""
+    url: str = f"{doc.get('request', {}).get('url', '')}"
+    response: dict = doc["response"]
+
+    if _ONECALL_PATH not in url or response.get("status") != 200:
+        return None
+
+    content: bytes = base64.b64decode(response.get("content", ""))
+
+    return loads(_decode_content(content, response.get("headers")))
+
+
+def extract_responses(doc: t.Any = None) -> list[dict]:
+    """Find the One Call responses in a parsed JSON document.
+
+    Accepts a response, a list of responses, or a hishel cache entry wrapping one.
+    """
+    if isinstance(doc, list):
+        return [res for item in doc for res in extract_responses(item)]
+    if not isinstance(doc, dict):
+        return []
+
+    if "response" in doc and "request" in doc:
+        return extract_responses(_unwrap_cached_response(doc))
+
+    if (
+        "lat" in doc
+        and "lon" in doc
+        and any(k in doc for k in ("current", "hourly", "daily"))
+    ):
+        return [doc]
+
+    return []
+
+
+def _read_documents(chunk: ArchiveChunk) -> t.Iterator[t.Union[str, bytes]]:
+    match chunk.kind:
+        case "sqlite":
+            conn: sqlite3.Connection = sqlite3.connect(
+                f"file:{chunk.path}?mode=ro", uri=True
+            )
+            try:
+                for (data,) in conn.execute(
+                    "SELECT data FROM cache WHERE rowid >= ? AND rowid < ?",
+                    [chunk.start, chunk.stop],
+                ):
+                    yield data
+            finally:
+                conn.close()
+        case "jsonl" if chunk.start is not None:
+            with open(chunk.path, "rb") as f:
+                f.seek(chunk.start)
+                while f.tell() < chunk.stop:
+                    line: bytes = f.readline()
+                    if not line:
+                        break
+                    if line.strip():
+                        yield line
+        case "jsonl":
+            opener = gzip.open if chunk.path.suffix == ".gz" else open
+            with opener(chunk.path, "rb") as f:
+                for line in f:
+                    if line.strip():
+                        yield line
+        case _:
+            data: bytes = chunk.path.read_bytes()
+            yield gzip.decompress(data) if chunk.path.suffix == ".gz" else data
+
+
+def read_responses(chunk: ArchiveChunk = None) -> tuple[list[dict], int]:
+    """Parse every One Call response in a chunk.
+
+    Returns:
+        (tuple[list[dict], int]): The responses, and the number of documents that
+            couldn't be parsed.
+
+    """
+    responses: list[dict] = []
+    errors: int = 0
+
+    try:
+        for data in _read_documents(chunk):
+            try:
+                responses.extend(extract_responses(loads(data)))
+            except Exception as exc:
+                log.debug(f"Skipping unreadable document in '{chunk.path}': {exc}")
+                errors += 1
+    except Exception as exc:
+        msg = Exception(
+            f"Unhandled exception reading archive '{chunk.path}'. Details: {exc}"
+        )
+        log.error(msg)
+        errors += 1
+
+    return responses, errors
@@ -0,0 +1,15 @@
+from __future__ import annotations
+
+from ._metrics import (
+    RESAMPLE_FREQS,
+    add_derived_metrics,
+    compute_metrics,
+    dew_point,
+    heat_index,
+    latest_forecasts,
+    precipitation_accumulation,
+    resample,
+    rolling,
+    to_numpy,
+    wind_chill,
+)
@@ -0,0 +1,548 @@
+from __future__ import annotations
+
+import logging
+import typing as t
+
+log = logging.getLogger("owm_bot.weather.metrics")
+
+from owm_bot.core.constants import OWM_UNITS
+from owm_bot.utils.data_utils import datasets
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+ArrayLike = t.Union[pa.Array, pa.ChunkedArray, np.ndarray, pd.Series, list]
+## A window length, as seconds, a pandas Timedelta or a string like '24h'
+Window = t.Union[int, float, str, pd.Timedelta]
+
+## `resample()` frequencies, and the pyarrow.compute.floor_temporal unit of each
+RESAMPLE_FREQS: dict[str, str] = {"hourly": "hour", "daily": "day"}
+
+## Aggregations `resample()` applies to each column found in the table
+_HOURLY_AGGREGATIONS: list[tuple[str, str, str]] = [
+    ## (column, function, output column)
+    ("temp", "mean", "temp"),
+    ("temp", "min", "temp_min"),
+    ("temp", "max", "temp_max"),
+    ("feels_like", "mean", "feels_like"),
+    ("pressure", "mean", "pressure"),
+    ("humidity", "mean", "humidity"),
+    ("dew_point", "mean", "dew_point"),
+    ("heat_index", "max", "heat_index"),
+    ("wind_chill", "min", "wind_chill"),
+    ("clouds", "mean", "clouds"),
+    ("wind_speed", "mean", "wind_speed"),
+    ("wind_speed", "max", "wind_speed_max"),
+    ("wind_gust", "max", "wind_gust"),
+    ("pop", "max", "pop"),
+    ## Rain & snow are 1h volumes, so the hour's accumulation is their mean over the hour
+    ("rain", "mean", "rain"),
+    ("snow", "mean", "snow"),
+]
+## Daily values are built from hourly ones, so each hour is weighted the same
+_DAILY_AGGREGATIONS: list[tuple[str, str, str]] = [
+    ("temp", "mean", "temp"),
+    ("temp_min", "min", "temp_min"),
+    ("temp_max", "max", "temp_max"),
+    ("feels_like", "mean", "feels_like"),
+    ("pressure", "mean", "pressure"),
+    ("humidity", "mean", "humidity"),
+    ("dew_point", "mean", "dew_point"),
+    ("heat_index", "max", "heat_index"),
+    ("wind_chill", "min", "wind_chill"),
+    ("clouds", "mean", "clouds"),
+    ("wind_speed", "mean", "wind_speed"),
+    ("wind_speed_max", "max", "wind_speed_max"),
+    ("wind_gust", "max", "wind_gust"),
+    ("pop", "max", "pop"),
+    ("rain", "sum", "rain"),
+    ("snow", "sum", "snow"),
+]
+
+
+def _resolve_units(units: str | None) -> str:
+    if units is None:
+        from owm_bot.core.config import owm_settings
+
+        units = owm_settings.units
+
+    assert units in OWM_UNITS, ValueError(
+        f"Invalid units: '{units}'. Must be one of {OWM_UNITS}"
+    )
+
+    return units
+
+
+def to_numpy(values: ArrayLike = None) -> np.ndarray:
+    """A float64 copy of `values`, with nulls as NaN."""
+    if isinstance(values, (pa.Array, pa.ChunkedArray)):
+        return pc.cast(values, pa.float64()).to_numpy(zero_copy_only=False)
+
+    return np.asarray(values, dtype=np.float64)
+
+
+def _to_celsius(temp: np.ndarray, units: str) -> np.ndarray:
+    match units:
+        case "standard":
+            return temp - 273.15
+        case "imperial":
+            return (temp - 32.0) * 5.0 / 9.0
+        case _:
+            return temp
+
+
+def _from_celsius(temp_c: np.ndarray, units: str) -> np.ndarray:
+    match units:
+        case "standard":
+            return temp_c + 273.15
+        case "imperial":
+            return temp_c * 9.0 / 5.0 + 32.0
+        case _:
+            return temp_c
+
+
+def _to_fahrenheit(temp: np.ndarray, units: str) -> np.ndarray:
+    return temp if units == "imperial" else _to_celsius(temp, units) * 9.0 / 5.0 + 32.0
+
+
+def _from_fahrenheit(temp_f: np.ndarray, units: str) -> np.ndarray:
+    return (
+        temp_f
+        if units == "imperial"
+        else _from_celsius((temp_f - 32.0) * 5.0 / 9.0, units)
+    )
+
+
+def dew_point(
+    temp: ArrayLike = None, humidity: ArrayLike = None, units: str | None = None
+) -> np.ndarray:
+    """Dew point from temperature & relative humidity (%), with the Magnus formula.
+
+    Params:
+        temp (ArrayLike): Air temperatures, in `units`.
+        humidity (ArrayLike): Relative humidity, 0-100.
+        units (str | None): 'standard', 'metric' or 'imperial'. Defaults to `owm_settings.units`.
+
+    Returns:
+        (numpy.ndarray): Dew points in `units`. NaN where either input is missing or
+            humidity is 0.
+
+    """
+    units = _resolve_units(units)
+    temp_c: np.ndarray = _to_celsius(to_numpy(temp), units)
+    rh: np.ndarray = to_numpy(humidity)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gamma: np.ndarray = np.log(np.where(rh > 0, rh, np.nan) / 100.0) + (
+            17.625 * temp_c
+        ) / (243.04 + temp_c)
+        dew_point_c: np.ndarray = 243.04 * gamma / (17.625 - gamma)
+
+    return _from_celsius(dew_point_c, units)
+
+
+def heat_index(
+    temp: ArrayLike = None, humidity: ArrayLike = None, units: str | None = None
+) -> np.ndarray:
+    """Heat index ("feels like" in heat & humidity), with the US NWS formulas.
+
+    Below ~80°F the NWS simple formula is used, which stays close to the air
+    temperature. Above it, the Rothfusz regression & its low/high humidity adjustments.
+
+    Returns:
+        (numpy.ndarray): Heat index in `units`.
+
+    """
+    units = _resolve_units(units)
+    temp_f: np.ndarray = _to_fahrenheit(to_numpy(temp), units)
+    rh: np.ndarray = to_numpy(humidity)
+
+    simple: np.ndarray = 0.5 * (temp_f + 61.0 + (temp_f - 68.0) * 1.2 + rh * 0.094)
+    rothfusz: np.ndarray = (
+        -42.379
+        + 2.04901523 * temp_f
+        + 10.14333127 * rh
+        - 0.22475541 * temp_f * rh
+        - 0.00683783 * temp_f**2
+        - 0.05481717 * rh**2
+        + 0.00122874 * temp_f**2 * rh
+        + 0.00085282 * temp_f * rh**2
+        - 0.00000199 * temp_f**2 * rh**2
+    )
+
+    with np.errstate(invalid="ignore"):
+        dry: np.ndarray = (rh < 13) & (temp_f >= 80) & (temp_f <= 112)
+        rothfusz = np.where(
+            dry,
+            rothfusz - ((13 - rh) / 4) * np.sqrt((17 - np.abs(temp_f - 95.0)) / 17),
+            rothfusz,
+        )
+        humid: np.ndarray = (rh > 85) & (temp_f >= 80) & (temp_f <= 87)
+        rothfusz = np.where(
+            humid, rothfusz + ((rh - 85) / 10) * ((87 - temp_f) / 5), rothfusz
+        )
+
+    heat_index_f: np.ndarray = np.where(
+        (simple + temp_f) / 2.0 >= 80.0, rothfusz, simple
+    )
+
+    return _from_fahrenheit(heat_index_f, units)
+
+
+def wind_chill(
+    temp: ArrayLike = None, wind_speed: ArrayLike = None, units: str | None = None
+) -> np.ndarray:
+    """Wind chill, with the US NWS (2001) formula.
+
+    The formula only applies at or below 50°F with wind of at least 3mph. Elsewhere the
+    air temperature is returned, as there is no wind chill.
+
+    Returns:
+        (numpy.ndarray): Wind chill in `units`.
+
+    """
+    units = _resolve_units(units)
+    temp_f: np.ndarray = _to_fahrenheit(to_numpy(temp), units)
+    ## m/s for metric & standard units
+    wind_mph: np.ndarray = to_numpy(wind_speed) * (
+        1.0 if units == "imperial" else 2.2369363
+    )
+
+    with np.errstate(invalid="ignore"):
+        wind_factor: np.ndarray = np.power(wind_mph, 0.16)
+        chill_f: np.ndarray = (
+            35.74
+            + 0.6215 * temp_f
+            - 35.75 * wind_factor
+            + 0.4275 * temp_f * wind_factor
+        )
+        applies: np.ndarray = (temp_f <= 50.0) & (wind_mph >= 3.0)
+
+    return _from_fahrenheit(np.where(applies, chill_f, temp_f), units)
+
+
+def _set_column(table: pa.Table, name: str, values: np.ndarray) -> pa.Table:
+    ## float32, like the stored measurements
+    column: pa.Array = pa.array(values.astype(np.float32), from_pandas=True)
+    idx: int = table.schema.get_field_index(name)
+
+    return (
+        table.set_column(idx, name, column)
+        if idx >= 0
+        else table.append_column(name, column)
+    )
+
+
+def add_derived_metrics(table: pa.Table = None, units: str | None = None) -> pa.Table:
+    """Add `heat_index` & `wind_chill` columns, and fill in missing `dew_point` values.
+
+    Params:
+        table (pyarrow.Table): Current weather or forecast rows, i.e. from
+            `controller.query(as_pandas=False)`.
+        units (str | None): Units the table was stored in. Defaults to `owm_settings.units`.
+
+    """
+    units = _resolve_units(units)
+    temp: pa.ChunkedArray = table["temp"]
+    humidity: pa.ChunkedArray = table["humidity"]
+
+    computed: np.ndarray = dew_point(temp, humidity, units=units)
+    if "dew_point" in table.column_names:
+        computed = np.where(
+            np.isnan(to_numpy(table["dew_point"])),
+            computed,
+            to_numpy(table["dew_point"]),
+        )
+    table = _set_column(table, "dew_point", computed)
+    table = _set_column(table, "heat_index", heat_index(temp, humidity, units=units))
+
+    return _set_column(
+        table, "wind_chill", wind_chill(temp, table["wind_speed"], units=units)
+    )
+
+
+def _key_array(column: pa.ChunkedArray) -> np.ndarray:
+    if pa.types.is_dictionary(column.type):
+        column = column.cast(column.type.value_type)
+
+    return column.to_numpy(zero_copy_only=False)
+
+
+def _group_starts(keys: list[np.ndarray]) -> np.ndarray:
+    """Mask of rows starting a new group, for rows sorted by `keys`."""
+    n: int = len(keys[0]) if keys else 0
+    starts: np.ndarray = np.zeros(n, dtype=bool)
+    if n:
+        starts[0] = True
+    for key in keys:
+        starts[1:] |= key[1:] != key[:-1]
+
+    return starts
+
+
+def latest_forecasts(table: pa.Table = None) -> pa.Table:
+    """Keep only the most recently issued forecast for each location, type & time."""
+    key_cols: list[str] = [
+        col
+        for col in ["location_key", "forecast_type", "dt"]
+        if col in table.column_names
+    ]
+    if "issued_at" not in table.column_names or table.num_rows == 0:
+        return table
+
+    ## Sorted by key then issue time, the latest issue is the last row of each key
+    table = datasets.sort_table(table, columns=[*key_cols, "issued_at"])
+    starts: np.ndarray = _group_starts([_key_array(table[col]) for col in key_cols])
+    is_last: np.ndarray = np.append(starts[1:], True)
+
+    return table.filter(pa.array(is_last))
+
+
+def _aggregate(
+    table: pa.Table,
+    freq: str,
+    aggregations: list[tuple[str, str, str]],
+    by: list[str],
+    time_col: str,
+) -> pa.Table:
+    aggregations = [agg for agg in aggregations if agg[0] in table.column_names]
+    bucketed: pa.Table = table.select([*by, *{agg[0] for agg in aggregations}])
+    bucketed = bucketed.append_column(
+        "_bucket", pc.floor_temporal(table[time_col], unit=RESAMPLE_FREQS[freq])
+    )
+
+    grouped: pa.Table = bucketed.group_by([*by, "_bucket"]).aggregate(
+        [(col, func) for col, func, _ in aggregations]
+    )
+    columns: dict[str, pa.ChunkedArray] = {col: grouped[col] for col in by}
+    columns[time_col] = grouped["_bucket"]
+    for col, func, name in aggregations:
+        columns[name] = grouped[f"{col}_{func}"]
+
+    return datasets.sort_table(pa.table(columns), columns=[*by, time_col])
+
+
+def resample(
+    table: pa.Table = None,
+    freq: str = "hourly",
+    by: list[str] | None = None,
+    time_col: str = "dt",
+    units: str | None = None,
+) -> pa.Table:
+    """Aggregate rows into hourly or daily (UTC) buckets per location.
+
+    Derived metrics are added first (see `add_derived_metrics()`). Forecast tables are
+    reduced to the latest issued forecast for each time, and only their hourly rows are
+    used: daily forecast rows are already daily summaries.
+
+    Params:
+        table (pyarrow.Table): Current weather or forecast rows.
+        freq (str): 'hourly' or 'daily'.
+        by (list[str] | None): Columns to group by, besides the time bucket. Defaults to
+            `['location_key']`.
+        time_col (str): Timestamp column to bucket on.
+        units (str | None): Units the table was stored in. Defaults to `owm_settings.units`.
+
+    Returns:
+        (pyarrow.Table): One row per group & bucket, sorted by `by` then `time_col`.
+            Temperatures have mean/min/max columns, rain & snow are the volume that fell
+            in the bucket.
+
+    """
+    assert freq in RESAMPLE_FREQS, ValueError(
+        f"Invalid freq: '{freq}'. Must be one of {list(RESAMPLE_FREQS)}"
+    )
+    by = by or ["location_key"]
+
+    if "forecast_type" in table.column_names:
+        table = latest_forecasts(table)
+        table = table.filter(
+            pc.equal(table["forecast_type"].cast(pa.string()), "hourly")
+        )
+
+    table = add_derived_metrics(table, units=units)
+    hourly: pa.Table = _aggregate(
+        table, "hourly", _HOURLY_AGGREGATIONS, by=by, time_col=time_col
+    )
+    if freq == "hourly":
+        return hourly
+
+    return _aggregate(hourly, "daily", _DAILY_AGGREGATIONS, by=by, time_col=time_col)
+
+
+def _window_seconds(window: Window) -> int:
+    if isinstance(window, (int, float)):
+        return int(window)
+
+    return int(pd.Timedelta(window).total_seconds())
+
+
+def _window_starts(
+    table: pa.Table, window: Window, by: list[str], time_col: str
+) -> np.ndarray:
+    """Index of the first row in each row's trailing window, for rows sorted by `by` & time.
+
+    Windows cover `(t - window, t]` and never cross into another group.
+    """
+    times: np.ndarray = (
+        pc.cast(table[time_col], pa.timestamp("s"))
+        .cast(pa.int64())
+        .to_numpy(zero_copy_only=False)
+    )
+    if len(times) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    window_s: int = _window_seconds(window)
+    ## Without `by` columns the whole table is one group
+    group_ids: np.ndarray = (
+        np.cumsum(_group_starts([_key_array(table[col]) for col in by]))
+        if by
+        else np.zeros(len(times), dtype=np.int64)
+    )
+    ## Push each group's times past the previous group's, so one search covers every group
+    span: int = int(times.max() - times.min()) + window_s + 1
+    offset_times: np.ndarray = (times - times.min()) + group_ids * span
+
+    return np.searchsorted(offset_times, offset_times - window_s, side="right")
+
+
+def _range_reduce(
+    values: np.ndarray, starts: np.ndarray, ufunc: np.ufunc
+) -> np.ndarray:
+    """Reduce `values[starts[i]:i + 1]` for every row, with a sparse table.
+
+    Level `k` holds the reduction of every run of 2**k values, so each window is
+    covered by two (overlapping) runs. Cost is O(n log w) for windows of up to w rows.
+    """
+    n: int = len(values)
+    if n == 0:
+        return values
+
+    ends: np.ndarray = np.arange(n)
+    lengths: np.ndarray = ends - starts + 1
+    levels_needed: np.ndarray = np.floor(np.log2(lengths)).astype(np.int64)
+
+    result: np.ndarray = np.empty(n, dtype=np.float64)
+    level: np.ndarray = values
+    for k in range(int(levels_needed.max()) + 1):
+        if k:
+            half: int = 1 << (k - 1)
+            level = ufunc(level[:-half], level[half:])
+
+        rows: np.ndarray = np.flatnonzero(levels_needed == k)
+        if len(rows):
+            result[rows] = ufunc(level[starts[rows]], level[ends[rows] - (1 << k) + 1])
+
+    return result
+
+
+def rolling(
+    table: pa.Table = None,
+    columns: list[str] = None,
+    window: Window = "24h",
+    aggregations: list[str] | None = None,
+    by: list[str] | None = None,
+    time_col: str = "dt",
+) -> pa.Table:
+    """Add trailing-window aggregates of `columns`, per location.
+
+    Each row's window covers the `window` up to and including it, so gaps in the data
+    shorten the window instead of borrowing older rows. Adds `{column}_{window}_{agg}`
+    columns, i.e. `temp_24h_max`.
+
+    Params:
+        table (pyarrow.Table): Rows to aggregate, i.e. the output of `resample()`.
+        columns (list[str]): Columns to aggregate.
+        window (Window): Window length, as seconds or a pandas Timedelta string like '24h'.
+        aggregations (list[str] | None): Any of 'min', 'max' & 'sum'. Defaults to min & max.
+        by (list[str] | None): Columns windows never cross. Defaults to `['location_key']`.
+        time_col (str): Timestamp column the window applies to.
+
+    """
+    aggregations = aggregations or ["min", "max"]
+    invalid: list[str] = [
+        agg for agg in aggregations if agg not in ("min", "max", "sum")
+    ]
+    assert not invalid, ValueError(
+        f"Invalid aggregation(s): {invalid}. Must be 'min', 'max' or 'sum'"
+    )
+    by = [col for col in by or ["location_key"] if col in table.column_names]
+
+    table = datasets.sort_table(table, columns=[*by, time_col])
+    starts: np.ndarray = _window_starts(table, window, by=by, time_col=time_col)
+    label: str = window if isinstance(window, str) else f"{_window_seconds(window)}s"
+
+    for column in columns:
+        values: np.ndarray = to_numpy(table[column])
+        for agg in aggregations:
+            match agg:
+                case "min":
+                    result = _range_reduce(values, starts, np.fmin)
+                case "max":
+                    result = _range_reduce(values, starts, np.fmax)
+                case "sum":
+                    ## Missing values add nothing to a sum
+                    cumulative: np.ndarray = np.concatenate(
+                        [[0.0], np.cumsum(np.nan_to_num(values))]
+                    )
+                    result = cumulative[1:] - cumulative[starts]
+
+            table = _set_column(table, f"{column}_{label}_{agg}", result)
+
+    return table
+
+
+def precipitation_accumulation(
+    table: pa.Table = None,
+    window: Window = "24h",
+    by: list[str] | None = None,
+    time_col: str = "dt",
+) -> pa.Table:
+    """Add the rain & snow that fell over each row's trailing `window`, i.e. `rain_24h_sum`.
+
+    Expects resampled rows (see `resample()`), where `rain`/`snow` are the volume that
+    fell in each bucket.
+    """
+    return rolling(
+        table,
+        columns=[col for col in ["rain", "snow"] if col in table.column_names],
+        window=window,
+        aggregations=["sum"],
+        by=by,
+        time_col=time_col,
+    )
+
+
+def compute_metrics(
+    table: pa.Table = None,
+    freq: str = "hourly",
+    window: Window = "24h",
+    units: str | None = None,
+) -> pa.Table:
+    """Resample a history table & add rolling temperature extremes and precipitation totals.
+
+    Params:
+        table (pyarrow.Table): Current weather or forecast rows from a Parquet controller.
+        freq (str): 'hourly' or 'daily'.
+        window (Window): Trailing window for the rolling columns.
+        units (str | None): Units the table was stored in. Defaults to `owm_settings.units`.
+
+    Returns:
+        (pyarrow.Table): The `resample()` output, plus `temp_min`/`temp_max` rolling
+            min/max and `rain`/`snow` rolling sums over `window`.
+
+    """
+    if isinstance(table, pd.DataFrame):
+        table = pa.Table.from_pandas(table, preserve_index=False)
+
+    resampled: pa.Table = resample(table, freq=freq, units=units)
+    resampled = rolling(
+        resampled, columns=["temp_min"], window=window, aggregations=["min"]
+    )
+    resampled = rolling(
+        resampled, columns=["temp_max"], window=window, aggregations=["max"]
+    )
+
+    return precipitation_accumulation(resampled, window=window)
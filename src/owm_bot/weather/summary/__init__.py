@@ -0,0 +1,9 @@
+from __future__ import annotations
+
+from ._daily_summary import (
+    SUMMARY_KEY_COLS,
+    SummaryUpdate,
+    read_daily_summary,
+    summarize_days,
+    update_daily_summary,
+)
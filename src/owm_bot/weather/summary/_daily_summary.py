@@ -0,0 +1,303 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+import json
+import logging
+from pathlib import Path
+import typing as t
+
+log = logging.getLogger("owm_bot.weather.summary")
+
+from owm_bot.core.paths import DAILY_SUMMARY_PQ_FILE
+from owm_bot.utils import file_utils
+from owm_bot.utils.data_utils import datasets
+from owm_bot.weather.metrics import resample
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+if t.TYPE_CHECKING:
+    from owm_bot.location.controllers import PQTableController
+
+## One summary row per location & UTC day, `dt` is the start of the day
+SUMMARY_KEY_COLS: list[str] = ["location_key", "dt"]
+## Schema metadata key holding the last summarized observation time of each location
+_WATERMARKS_KEY: bytes = b"owm_bot.daily_summary.watermarks"
+_DAY: pd.Timedelta = pd.Timedelta(days=1)
+
+
+@dataclass
+class SummaryUpdate:
+    """Outcome of an `update_daily_summary()` run.
+
+    Params:
+        observations (int): New observation rows found in this run.
+        days (int): Location-days re-aggregated in this run.
+        rows (int): Location-days in the summary after this run.
+        watermarks (dict[str, pandas.Timestamp]): Per location, the observation time up to
+            which observations have been summarized.
+    """
+
+    observations: int = 0
+    days: int = 0
+    rows: int = 0
+    watermarks: dict[str, pd.Timestamp] = field(default_factory=dict)
+
+
+def _to_frame(data: t.Union[pa.Table, pd.DataFrame]) -> pd.DataFrame:
+    df: pd.DataFrame = data.to_pandas() if isinstance(data, pa.Table) else data.copy()
+    ## Categories differ between tables, plain strings can be compared & concatenated
+    df["location_key"] = df["location_key"].astype(str)
+
+    return df
+
+
+def _day_keys(df: pd.DataFrame) -> pd.MultiIndex:
+    return pd.MultiIndex.from_arrays(
+        [df["location_key"], df["dt"].dt.floor("D")], names=SUMMARY_KEY_COLS
+    )
+
+
+def summarize_days(
+    observations: t.Union[pa.Table, pd.DataFrame] = None, units: str | None = None
+) -> pd.DataFrame:
+    """Aggregate current weather rows into one row per location & UTC day.
+
+    Params:
+        observations (pyarrow.Table | pandas.DataFrame): Current weather rows.
+        units (str | None): Units the rows were stored in. Defaults to `owm_settings.units`.
+
+    Returns:
+        (pandas.DataFrame): The `resample(freq='daily')` columns, plus the number of
+            `observations` each day was built from & the time of its `last_observation`.
+
+    """
+    df: pd.DataFrame = _to_frame(observations)
+    if df.empty:
+        return pd.DataFrame(
+            columns=[*SUMMARY_KEY_COLS, "observations", "last_observation"]
+        )
+
+    daily: pd.DataFrame = _to_frame(
+        resample(
+            pa.Table.from_pandas(df, preserve_index=False), freq="daily", units=units
+        )
+    )
+    counts: pd.DataFrame = (
+        df.groupby([df["location_key"], df["dt"].dt.floor("D")])["dt"]
+        .agg(observations="count", last_observation="max")
+        .reset_index()
+    )
+    counts["dt"] = counts["dt"].astype(daily["dt"].dtype)
+
+    return daily.merge(counts, on=SUMMARY_KEY_COLS, how="left")
+
+
+def _load_summary(
+    summary_file: Path,
+) -> tuple[pd.DataFrame, dict[str, pd.Timestamp]]:
+    if not summary_file.exists():
+        return pd.DataFrame(), {}
+
+    table: pa.Table = pq.read_table(summary_file)
+    metadata: dict = table.schema.metadata or {}
+    watermarks: dict[str, pd.Timestamp] = {
+        key: pd.Timestamp(value, unit="s", tz="UTC")
+        for key, value in json.loads(metadata.get(_WATERMARKS_KEY, b"{}")).items()
+    }
+
+    return _to_frame(table), watermarks
+
+
+def _save_summary(
+    summary_file: Path,
+    summary: pd.DataFrame,
+    watermarks: dict[str, pd.Timestamp],
+) -> None:
+    table: pa.Table = pa.Table.from_pandas(summary, preserve_index=False)
+    table = table.replace_schema_metadata(
+        {
+            **(table.schema.metadata or {}),
+            _WATERMARKS_KEY: json.dumps(
+                {key: int(ts.timestamp()) for key, ts in watermarks.items()}
+            ).encode(),
+        }
+    )
+
+    ## Rows & watermarks are replaced together, so a crash never skips observations
+    summary_file.parent.mkdir(parents=True, exist_ok=True)
+    with file_utils.atomic_path(summary_file) as tmp_file:
+        pq.write_table(table, tmp_file)
+
+
+def read_daily_summary(
+    summary_file: t.Union[str, Path] = DAILY_SUMMARY_PQ_FILE,
+    columns: list[str] | None = None,
+    filters: datasets.Filters | None = None,
+    time_range: tuple[datasets.TimeBound, datasets.TimeBound] | None = None,
+) -> pd.DataFrame:
+    """Read stored daily summaries, without touching the observation history.
+
+    Params:
+        summary_file (str | Path): Parquet file written by `update_daily_summary()`.
+        columns (list[str] | None): Columns to read. `None` reads every column.
+        filters (Filters | None): A `pyarrow.dataset.Expression`, DNF tuples or a
+            `{column: value(s)}` dict, i.e. `{"location_key": [...]}`.
+        time_range (tuple | None): `(start, end)` on the day's `dt`, start inclusive & end
+            exclusive.
+
+    Returns:
+        (pandas.DataFrame): One row per location & day, sorted by location then day.
+
+    """
+    summary_file: Path = Path(f"{summary_file}")
+    if not summary_file.exists():
+        return pd.DataFrame(columns=columns or SUMMARY_KEY_COLS)
+
+    expr: ds.Expression | None = datasets.build_filter(
+        filters=filters, time_range=time_range, time_col="dt"
+    )
+
+    return _to_frame(pq.read_table(summary_file, columns=columns, filters=expr))
+
+
+def _new_observations(
+    controller: PQTableController, watermarks: dict[str, pd.Timestamp]
+) -> pd.DataFrame:
+    """Keys of observations past their location's watermark, or of new locations.
+
+    Locations are read from their own watermark's day, one query per distinct day, so a
+    location that stopped being polled never drags the others back to its old watermark.
+    """
+    if not watermarks:
+        return _to_frame(controller.query(columns=SUMMARY_KEY_COLS))
+
+    known: list[str] = list(watermarks)
+    by_day: dict[pd.Timestamp, list[str]] = {}
+    for key, ts in watermarks.items():
+        by_day.setdefault(ts.floor("D"), []).append(key)
+
+    found: pd.DataFrame = pd.concat(
+        [
+            *(
+                _to_frame(
+                    controller.query(
+                        columns=SUMMARY_KEY_COLS,
+                        filters={"location_key": keys},
+                        time_range=(day, None),
+                    )
+                )
+                for day, keys in sorted(by_day.items())
+            ),
+            _to_frame(
+                controller.query(
+                    columns=SUMMARY_KEY_COLS,
+                    filters=~ds.field("location_key").isin(known),
+                )
+            ),
+        ],
+        ignore_index=True,
+    )
+    ## Queries start at the watermark's day, trim each location to its exact watermark
+    watermark: pd.Series = found["location_key"].map(watermarks)
+
+    return found[watermark.isna() | (found["dt"] > watermark)]
+
+
+def update_daily_summary(
+    current_controller: PQTableController | None = None,
+    summary_file: t.Union[str, Path] = DAILY_SUMMARY_PQ_FILE,
+    new_data: t.Union[pa.Table, pd.DataFrame, None] = None,
+    full: bool = False,
+    append_only: bool = False,
+    units: str | None = None,
+) -> SummaryUpdate:
+    """Bring `summary_file` up to date with the current weather history.
+
+    Updates are incremental: observations newer than each location's watermark mark the
+    location-days they fall on as changed, and only those days are read back from the
+    history & aggregated again. Rows appended for times before the watermark (i.e. a late
+    backfill) are only picked up when passed as `new_data`, or with `full`.
+
+    Params:
+        current_controller (PQTableController | None): Observations to summarize. Defaults
+            to a `CurrentWeatherPQFileController`.
+        summary_file (str | Path): Parquet file holding the daily summaries.
+        new_data (pyarrow.Table | pandas.DataFrame | None): Rows just written to the
+            history, i.e. a write-behind batch. Their days are re-aggregated, whatever
+            their time.
+        full (bool): Discard stored summaries & aggregate the whole history.
+        append_only (bool): Read the default controller's partitioned dataset instead of
+            its Parquet file.
+        units (str | None): Units the history was stored in. Defaults to `owm_settings.units`.
+
+    Returns:
+        (SummaryUpdate): This run's counts & the new watermarks.
+
+    """
+    from owm_bot.location.controllers import CurrentWeatherPQFileController
+
+    current_controller = current_controller or CurrentWeatherPQFileController(
+        append_only=append_only
+    )
+    summary_file: Path = Path(f"{summary_file}")
+
+    with file_utils.FileLock(summary_file):
+        summary, watermarks = (
+            (pd.DataFrame(), {}) if full else _load_summary(summary_file)
+        )
+
+        new_rows: pd.DataFrame = _new_observations(current_controller, watermarks)
+        if new_data is not None and len(new_data):
+            new_rows = pd.concat(
+                [new_rows, _to_frame(new_data)[SUMMARY_KEY_COLS]], ignore_index=True
+            )
+        if new_rows.empty:
+            log.debug("No new observations to summarize")
+
+            return SummaryUpdate(rows=len(summary), watermarks=watermarks)
+
+        changed: pd.MultiIndex = _day_keys(new_rows).unique()
+        changed_days: pd.DataFrame = changed.to_frame(index=False)
+        observations: pd.DataFrame = _to_frame(
+            current_controller.query(
+                filters={
+                    "location_key": changed_days["location_key"].unique().tolist()
+                },
+                time_range=(changed_days["dt"].min(), changed_days["dt"].max() + _DAY),
+            )
+        )
+        ## The query covers every changed day of every changed location, keep only pairs
+        observations = observations[_day_keys(observations).isin(changed)]
+        updated: pd.DataFrame = summarize_days(observations, units=units)
+
+        if not summary.empty:
+            summary = pd.concat(
+                [summary[~_day_keys(summary).isin(changed)], updated],
+                ignore_index=True,
+            )
+        else:
+            summary = updated
+        summary = summary.sort_values(SUMMARY_KEY_COLS, kind="stable").reset_index(
+            drop=True
+        )
+
+        latest: pd.Series = new_rows.groupby("location_key")["dt"].max()
+        watermarks = {
+            key: max(ts, watermarks[key]) if key in watermarks else ts
+            for key, ts in latest.items()
+        } | {key: ts for key, ts in watermarks.items() if key not in latest}
+        _save_summary(summary_file, summary=summary, watermarks=watermarks)
+
+    log.info(
+        f"Summarized {len(updated)} location-day(s) from {len(new_rows)} new observation(s)"
+    )
+
+    return SummaryUpdate(
+        observations=len(new_rows),
+        days=len(updated),
+        rows=len(summary),
+        watermarks=watermarks,
+    )
@@ -0,0 +1,13 @@
+from __future__ import annotations
+
+from ._verification import (
+    GROUP_COLS,
+    LEAD_BUCKET_HOURS,
+    VERIFY_VARIABLES,
+    VerificationResult,
+    error_sums,
+    load_verification,
+    match_observations,
+    summarize,
+    verify_forecasts,
+)
@@ -0,0 +1,402 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+import json
+import logging
+from pathlib import Path
+import typing as t
+
+log = logging.getLogger("owm_bot.weather.verification")
+
+from owm_bot.core.paths import FORECAST_VERIFICATION_PQ_FILE
+from owm_bot.utils import file_utils
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+if t.TYPE_CHECKING:
+    from owm_bot.location.controllers import PQTableController
+
+## Measurements compared between forecasts & observations
+VERIFY_VARIABLES: list[str] = [
+    "temp",
+    "feels_like",
+    "pressure",
+    "humidity",
+    "dew_point",
+    "clouds",
+    "wind_speed",
+]
+## Width of the lead-time buckets errors are grouped in, per forecast type
+LEAD_BUCKET_HOURS: dict[str, int] = {"hourly": 1, "daily": 24}
+
+## Error sums are stored per group, so each run only adds the rows it matched
+GROUP_COLS: list[str] = ["location_key", "forecast_type", "lead_hours"]
+_SUM_SUFFIXES: list[str] = ["n", "sum", "abs_sum", "sq_sum"]
+## Schema metadata key holding the last verified time of each location
+_WATERMARKS_KEY: bytes = b"owm_bot.verification.watermarks"
+
+
+@dataclass
+class VerificationResult:
+    """Outcome of a `verify_forecasts()` run.
+
+    Params:
+        forecasts (int): Forecast rows checked in this run.
+        matched (int): Forecast rows matched with an observation in this run.
+        sums (pandas.DataFrame): Error sums over every run, per location, forecast type &
+            lead-time bucket.
+        watermarks (dict[str, pandas.Timestamp]): Per location, the forecast time up to
+            which forecasts have been verified.
+    """
+
+    forecasts: int = 0
+    matched: int = 0
+    sums: pd.DataFrame = field(default_factory=pd.DataFrame)
+    watermarks: dict[str, pd.Timestamp] = field(default_factory=dict)
+
+    def summary(
+        self,
+        by: list[str] | None = None,
+        variables: list[str] | None = None,
+    ) -> pd.DataFrame:
+        return summarize(self.sums, by=by, variables=variables)
+
+
+def _to_frame(data: t.Union[pa.Table, pd.DataFrame]) -> pd.DataFrame:
+    df: pd.DataFrame = data.to_pandas() if isinstance(data, pa.Table) else data.copy()
+    ## merge_asof needs the same dtype on both sides, categories differ between tables
+    df["location_key"] = df["location_key"].astype(str)
+
+    return df
+
+
+def match_observations(
+    forecasts: t.Union[pa.Table, pd.DataFrame] = None,
+    observations: t.Union[pa.Table, pd.DataFrame] = None,
+    tolerance: t.Union[str, pd.Timedelta] = "30min",
+    variables: list[str] | None = None,
+) -> pd.DataFrame:
+    """As-of join each forecast row to the observation nearest its target time.
+
+    Params:
+        forecasts (pyarrow.Table | pandas.DataFrame): Forecast rows, with `location_key`,
+            `forecast_type`, `issued_at` & `dt` columns.
+        observations (pyarrow.Table | pandas.DataFrame): Current weather rows.
+        tolerance (str | pandas.Timedelta): Max distance between a forecast's `dt` and the
+            observation it is matched with. Rows without an observation that close are dropped.
+        variables (list[str] | None): Measurements to compare. Defaults to `VERIFY_VARIABLES`.
+
+    Returns:
+        (pandas.DataFrame): Matched rows, with `{variable}_forecast` &
+            `{variable}_observed` columns, `observed_at`, and the `lead_hours` between
+            when a forecast was issued & the time it is for.
+
+    """
+    forecast_df: pd.DataFrame = _to_frame(forecasts)
+    variables = [var for var in variables or VERIFY_VARIABLES if var in forecast_df]
+
+    forecast_df = forecast_df[
+        ["location_key", "forecast_type", "issued_at", "dt", *variables]
+    ].rename(columns={var: f"{var}_forecast" for var in variables})
+    observed_df: pd.DataFrame = _to_frame(observations)
+    observed_df = observed_df[
+        ["location_key", "dt", *[var for var in variables if var in observed_df]]
+    ].rename(columns={var: f"{var}_observed" for var in variables})
+    observed_df["observed_at"] = observed_df["dt"]
+
+    if forecast_df.empty or observed_df.empty:
+        return forecast_df.iloc[0:0]
+
+    ## Both sides must be sorted on the join key
+    matched: pd.DataFrame = pd.merge_asof(
+        forecast_df.sort_values("dt", kind="stable"),
+        observed_df.sort_values("dt", kind="stable"),
+        on="dt",
+        by="location_key",
+        direction="nearest",
+        tolerance=pd.Timedelta(tolerance),
+    )
+    matched = matched.dropna(subset=["observed_at"])
+
+    matched["lead_hours"] = (
+        matched["dt"] - matched["issued_at"]
+    ).dt.total_seconds() / 3600.0
+
+    return matched.reset_index(drop=True)
+
+
+def error_sums(
+    matched: pd.DataFrame = None, variables: list[str] | None = None
+) -> pd.DataFrame:
+    """Sum forecast errors per location, forecast type & lead-time bucket.
+
+    Counts, sums, absolute sums & squared sums can be added across runs, and turned into
+    bias/MAE/RMSE at any grouping with `summarize()`.
+    """
+    variables = [
+        var
+        for var in variables or VERIFY_VARIABLES
+        if f"{var}_forecast" in matched and f"{var}_observed" in matched
+    ]
+    forecast_type: pd.Series = matched["forecast_type"].astype(str)
+    width: np.ndarray = (
+        forecast_type.map(LEAD_BUCKET_HOURS).fillna(1).to_numpy(dtype=np.float64)
+    )
+    ## The first hourly forecast is for the start of the current hour, count it as lead 0
+    lead_hours: np.ndarray = (
+        np.floor(np.clip(matched["lead_hours"].to_numpy(), 0, None) / width) * width
+    ).astype(np.int32)
+
+    columns: dict[str, t.Any] = {
+        "location_key": matched["location_key"].to_numpy(),
+        "forecast_type": forecast_type.to_numpy(),
+        "lead_hours": lead_hours,
+    }
+    for var in variables:
+        error: np.ndarray = matched[f"{var}_forecast"].to_numpy(
+            dtype=np.float64
+        ) - matched[f"{var}_observed"].to_numpy(dtype=np.float64)
+        valid: np.ndarray = ~np.isnan(error)
+        error = np.where(valid, error, 0.0)
+
+        columns[f"{var}_n"] = valid.astype(np.int64)
+        columns[f"{var}_sum"] = error
+        columns[f"{var}_abs_sum"] = np.abs(error)
+        columns[f"{var}_sq_sum"] = error**2
+
+    return pd.DataFrame(columns).groupby(GROUP_COLS, as_index=False, sort=True).sum()
+
+
+def _add_sums(existing: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+    if existing.empty:
+        return new
+    if new.empty:
+        return existing
+
+    return (
+        pd.concat([existing, new], ignore_index=True)
+        .fillna(0)
+        .groupby(GROUP_COLS, as_index=False, sort=True)
+        .sum()
+    )
+
+
+def summarize(
+    sums: pd.DataFrame = None,
+    by: list[str] | None = None,
+    variables: list[str] | None = None,
+) -> pd.DataFrame:
+    """Turn error sums into bias, MAE & RMSE per group.
+
+    Params:
+        sums (pandas.DataFrame): Output of `error_sums()`, or `VerificationResult.sums`.
+        by (list[str] | None): Columns to group by. Defaults to forecast type & lead time,
+            over every location.
+        variables (list[str] | None): Measurements to summarize. Defaults to every
+            variable in `sums`.
+
+    Returns:
+        (pandas.DataFrame): `{variable}_n`, `{variable}_bias`, `{variable}_mae` &
+            `{variable}_rmse` columns per group.
+
+    """
+    by = by or ["forecast_type", "lead_hours"]
+    variables = variables or [
+        var for var in VERIFY_VARIABLES if f"{var}_n" in sums.columns
+    ]
+    if sums.empty:
+        return pd.DataFrame(columns=by)
+
+    grouped: pd.DataFrame = sums.groupby(by, sort=True)[
+        [f"{var}_{suffix}" for var in variables for suffix in _SUM_SUFFIXES]
+    ].sum()
+
+    summary: pd.DataFrame = pd.DataFrame(index=grouped.index)
+    for var in variables:
+        n: pd.Series = grouped[f"{var}_n"]
+        count: pd.Series = n.where(n > 0)
+        summary[f"{var}_n"] = n
+        summary[f"{var}_bias"] = grouped[f"{var}_sum"] / count
+        summary[f"{var}_mae"] = grouped[f"{var}_abs_sum"] / count
+        summary[f"{var}_rmse"] = np.sqrt(grouped[f"{var}_sq_sum"] / count)
+
+    return summary.reset_index()
+
+
+def load_verification(
+    output_file: t.Union[str, Path] = FORECAST_VERIFICATION_PQ_FILE,
+) -> tuple[pd.DataFrame, dict[str, pd.Timestamp]]:
+    """Read stored error sums, and the time each location has been verified up to."""
+    output_file: Path = Path(f"{output_file}")
+    if not output_file.exists():
+        return pd.DataFrame(), {}
+
+    table: pa.Table = pq.read_table(output_file)
+    metadata: dict = table.schema.metadata or {}
+    watermarks: dict[str, pd.Timestamp] = {
+        key: pd.Timestamp(value, unit="s", tz="UTC")
+        for key, value in json.loads(metadata.get(_WATERMARKS_KEY, b"{}")).items()
+    }
+
+    return table.to_pandas(), watermarks
+
+
+def _save_verification(
+    output_file: Path,
+    sums: pd.DataFrame,
+    watermarks: dict[str, pd.Timestamp],
+) -> None:
+    table: pa.Table = pa.Table.from_pandas(sums, preserve_index=False)
+    table = table.replace_schema_metadata(
+        {
+            **(table.schema.metadata or {}),
+            _WATERMARKS_KEY: json.dumps(
+                {key: int(ts.timestamp()) for key, ts in watermarks.items()}
+            ).encode(),
+        }
+    )
+
+    ## Sums & watermarks are replaced together, so a crash never counts rows twice
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    with file_utils.atomic_path(output_file) as tmp_file:
+        pq.write_table(table, tmp_file)
+
+
+def _verify_windows(
+    observed_until: pd.Series,
+    watermarks: dict[str, pd.Timestamp],
+    tolerance: pd.Timedelta,
+) -> pd.DataFrame:
+    """The `(start, end]` range of forecast times each location can be verified for now.
+
+    A forecast is only verified once observations exist up to `tolerance` past its time,
+    so the nearest observation can no longer change.
+    """
+    windows: pd.DataFrame = pd.DataFrame({"end": observed_until - tolerance})
+    windows["start"] = pd.Series(watermarks, dtype="datetime64[ns, UTC]").reindex(
+        windows.index
+    )
+
+    return windows[windows["start"].isna() | (windows["end"] > windows["start"])]
+
+
+def verify_forecasts(
+    forecast_controller: PQTableController | None = None,
+    current_controller: PQTableController | None = None,
+    output_file: t.Union[str, Path] = FORECAST_VERIFICATION_PQ_FILE,
+    tolerance: t.Union[str, pd.Timedelta] = "30min",
+    variables: list[str] | None = None,
+    full: bool = False,
+    append_only: bool = False,
+) -> VerificationResult:
+    """Match stored forecasts with observations & add their errors to `output_file`.
+
+    Runs are incremental: each location's forecasts are only verified once, up to the
+    latest time observations cover, and the next run picks up from there. Forecasts
+    stored for times that were already verified (i.e. a late backfill) are skipped,
+    use `full` to recompute everything.
+
+    Params:
+        forecast_controller (PQTableController | None): Forecast table to read. Defaults to
+            a `ForecastWeatherPQFileController`.
+        current_controller (PQTableController | None): Observations to compare with.
+            Defaults to a `CurrentWeatherPQFileController`.
+        output_file (str | Path): Parquet file holding the error sums.
+        tolerance (str | pandas.Timedelta): Max distance between a forecast's time & the
+            observation it is compared with.
+        variables (list[str] | None): Measurements to compare. Defaults to `VERIFY_VARIABLES`.
+        full (bool): Discard stored sums & verify every stored forecast.
+        append_only (bool): Read the default controllers' partitioned datasets instead
+            of their Parquet files.
+
+    Returns:
+        (VerificationResult): This run's counts, and the sums over every run.
+
+    """
+    from owm_bot.location.controllers import (
+        CurrentWeatherPQFileController,
+        ForecastWeatherPQFileController,
+    )
+
+    forecast_controller = forecast_controller or ForecastWeatherPQFileController(
+        append_only=append_only
+    )
+    current_controller = current_controller or CurrentWeatherPQFileController(
+        append_only=append_only
+    )
+    variables = variables or VERIFY_VARIABLES
+    output_file: Path = Path(f"{output_file}")
+    tolerance: pd.Timedelta = pd.Timedelta(tolerance)
+
+    with file_utils.FileLock(output_file):
+        sums, watermarks = (
+            (pd.DataFrame(), {}) if full else load_verification(output_file)
+        )
+
+        observed_until: pd.Series = (
+            _to_frame(current_controller.query(columns=["location_key", "dt"]))
+            .groupby("location_key")["dt"]
+            .max()
+        )
+        windows: pd.DataFrame = _verify_windows(observed_until, watermarks, tolerance)
+        if windows.empty:
+            log.info("No new forecasts to verify")
+
+            return VerificationResult(sums=sums, watermarks=watermarks)
+
+        first_start: pd.Timestamp | None = (
+            None if windows["start"].isna().any() else windows["start"].min()
+        )
+        last_end: pd.Timestamp = windows["end"].max()
+        locations: list[str] = windows.index.tolist()
+
+        forecasts: pd.DataFrame = _to_frame(
+            forecast_controller.query(
+                columns=[
+                    "location_key",
+                    "forecast_type",
+                    "issued_at",
+                    "dt",
+                    *variables,
+                ],
+                filters={"location_key": locations},
+                time_range=(first_start, last_end + pd.Timedelta(seconds=1)),
+            )
+        )
+        ## Each location has its own window, the query only bounds them all
+        start: pd.Series = forecasts["location_key"].map(windows["start"])
+        end: pd.Series = forecasts["location_key"].map(windows["end"])
+        forecasts = forecasts[
+            (forecasts["dt"] <= end) & (start.isna() | (forecasts["dt"] > start))
+        ]
+
+        observations: pd.DataFrame = current_controller.query(
+            columns=["location_key", "dt", *variables],
+            filters={"location_key": locations},
+            time_range=(
+                None if first_start is None else first_start - tolerance,
+                last_end + 2 * tolerance + pd.Timedelta(seconds=1),
+            ),
+        )
+
+        matched: pd.DataFrame = match_observations(
+            forecasts, observations, tolerance=tolerance, variables=variables
+        )
+        log.info(
+            f"Matched {len(matched)}/{len(forecasts)} forecast row(s) with an observation"
+        )
+
+        if not matched.empty:
+            sums = _add_sums(sums, error_sums(matched, variables=variables))
+        watermarks = {**watermarks, **windows["end"].to_dict()}
+        _save_verification(output_file, sums=sums, watermarks=watermarks)
+
+    return VerificationResult(
+        forecasts=len(forecasts),
+        matched=len(matched),
+        sums=sums,
+        watermarks=watermarks,
+    )
@@ -0,0 +1,48 @@
+"""Fixtures for the throughput benchmarks.
+
+Every request is answered by an in-process `OWMStandin`, so the benchmarks run offline
+and measure owm_bot rather than the network.
+"""
+
+from __future__ import annotations
+
+import os
+
+from .helpers import API_KEY, LATENCY, LOCATIONS, START_TIME, StandinClock, coords
+
+import pandas as pd
+import pytest
+
+## The stand-in takes any key, so the suite runs without config/openweathermap/.secrets.toml
+os.environ.setdefault("OWM_OWM_API_KEY", API_KEY)
+
+
+@pytest.fixture
+def standin_clock() -> StandinClock:
+    return StandinClock()
+
+
+@pytest.fixture
+def standin(standin_clock: StandinClock):
+    from owm_bot.standin import OWMStandin
+
+    return OWMStandin(latency=LATENCY, seed=0, clock=standin_clock)
+
+
+@pytest.fixture(scope="session")
+def onecall_responses() -> list[dict]:
+    """One raw One Call response per location, like the daemon buffers them."""
+    from owm_bot.standin import onecall
+
+    return [
+        onecall(lat=lat, lon=lon, units="metric", now=START_TIME)
+        for lat, lon in coords(LOCATIONS)
+    ]
+
+
+@pytest.fixture(scope="session")
+def history_template(onecall_responses: list[dict]) -> pd.DataFrame:
+    """One current weather row per location, tiled into histories of any size."""
+    from owm_bot.utils.data_utils import weather_tables
+
+    return weather_tables.flatten_current_weather(onecall_responses).to_pandas()
@@ -0,0 +1,82 @@
+"""Settings & data builders shared by the throughput benchmarks.
+
+Tune the benchmarks with environment variables:
+
+- `OWM_BOT_BENCH_LATENCY`: seconds the stand-in holds each response (default 0.01).
+- `OWM_BOT_BENCH_ROWS`: comma-separated history sizes for the Parquet append
+  benchmarks (default `1000,100000,1000000`).
+"""
+
+from __future__ import annotations
+
+import os
+
+import numpy as np
+import pandas as pd
+
+## Sent as `appid`, the stand-in answers requests without one with a 401
+API_KEY: str = "standin"
+LATENCY: float = float(os.environ.get("OWM_BOT_BENCH_LATENCY", 0.01))
+HISTORY_ROWS: list[int] = [
+    int(rows)
+    for rows in os.environ.get("OWM_BOT_BENCH_ROWS", "1000,100000,1000000").split(",")
+]
+## Locations in the synthetic history, & in each appended batch
+LOCATIONS: int = 1000
+BATCH_LOCATIONS: int = 100
+## Unix time the stand-in's clock starts at
+START_TIME: int = 1_700_000_000
+
+
+class StandinClock:
+    """Unix time for the stand-in, moved forward by hand so each poll returns new rows."""
+
+    def __init__(self, now: float = START_TIME):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def tick(self, seconds: float = 60) -> None:
+        self.now += seconds
+
+
+def per_second(benchmark, items: int) -> float | None:
+    """Items handled per second in the mean round, or `None` when benchmarks are disabled."""
+    if benchmark.stats is None:
+        return None
+
+    return items / benchmark.stats.stats.mean
+
+
+def coords(count: int) -> list[tuple[float, float]]:
+    """`count` distinct points, spread over the globe."""
+    return [
+        (round(-60 + (i * 7.919) % 130, 4), round(-180 + (i * 13.37) % 360, 4))
+        for i in range(count)
+    ]
+
+
+def rows_id(rows: int) -> str:
+    """Test id for a row count, i.e. '100k'."""
+    for size, suffix in ((1_000_000, "M"), (1_000, "k")):
+        if rows >= size and rows % size == 0:
+            return f"{rows // size}{suffix}"
+
+    return f"{rows}"
+
+
+def build_history(
+    template: pd.DataFrame, rows: int, start_minute: int = 0
+) -> pd.DataFrame:
+    """`rows` current weather rows: the template's locations, observed once a minute."""
+    repeats: int = -(-rows // len(template))
+    positions: np.ndarray = np.tile(np.arange(len(template)), repeats)[:rows]
+    minutes: np.ndarray = (
+        np.repeat(np.arange(repeats), len(template))[:rows] + start_minute
+    )
+
+    history: pd.DataFrame = template.iloc[positions].reset_index(drop=True)
+    history["dt"] = history["dt"] + pd.to_timedelta(minutes, unit="min")
+
+    return history
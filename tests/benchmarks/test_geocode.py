@@ -0,0 +1,134 @@
+"""Geocoding throughput against the OWM stand-in, reported as `geocodes_per_second`."""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from .helpers import API_KEY, coords, per_second
+
+## Places geocoded per round
+BATCH: int = 500
+SYNC_BATCH: int = 50
+CONCURRENCY: int = 50
+
+PLACES: list[dict] = [
+    {"city_name": f"city {i}", "state_code": "NY", "country_code": "US"}
+    for i in range(BATCH)
+]
+
+
+def _geocode_batch(standin, places: list[dict], geocode_cache=None) -> list:
+    from owm_bot.core.http import RequestLayer
+    from owm_bot.location.geolocate import get_coords_many
+    from owm_bot.standin import AsyncStandinTransport
+
+    import httpx
+
+    async def _run() -> list:
+        async with httpx.AsyncClient(
+            transport=AsyncStandinTransport(standin)
+        ) as client:
+            return await get_coords_many(
+                places,
+                api_key=API_KEY,
+                client=client,
+                max_concurrency=CONCURRENCY,
+                ## Unlimited, so the configured calls/minute budget never waits
+                request_layer=RequestLayer(),
+                geocode_cache=geocode_cache,
+                use_geocode_cache=geocode_cache is not None,
+            )
+
+    return asyncio.run(_run())
+
+
+def test_geocode_batch(benchmark, standin):
+    results: list = benchmark(_geocode_batch, standin, PLACES)
+
+    assert all(result.ok for result in results)
+    benchmark.extra_info["geocodes_per_second"] = per_second(benchmark, BATCH)
+
+
+def test_geocode_batch_cached(benchmark, standin, tmp_path):
+    from owm_bot.location.geolocate import GeocodeCache
+
+    geocode_cache = GeocodeCache(cache_file=tmp_path / "geocode_cache.json")
+    _geocode_batch(standin, PLACES, geocode_cache=geocode_cache)
+    standin.reset()
+
+    results: list = benchmark(
+        _geocode_batch, standin, PLACES, geocode_cache=geocode_cache
+    )
+
+    assert all(result.from_cache for result in results)
+    assert standin.requests == 0
+    benchmark.extra_info["geocodes_per_second"] = per_second(benchmark, BATCH)
+
+
+def test_reverse_geocode_batch(benchmark, standin):
+    from owm_bot.core.http import RequestLayer
+    from owm_bot.location.geolocate import reverse_geocode_many
+    from owm_bot.standin import AsyncStandinTransport
+
+    import httpx
+
+    points: list[tuple[float, float]] = coords(BATCH)
+
+    async def _run() -> list:
+        async with httpx.AsyncClient(
+            transport=AsyncStandinTransport(standin)
+        ) as client:
+            return await reverse_geocode_many(
+                points,
+                api_key=API_KEY,
+                client=client,
+                max_concurrency=CONCURRENCY,
+                request_layer=RequestLayer(),
+                use_geocode_cache=False,
+            )
+
+    results: list = benchmark(lambda: asyncio.run(_run()))
+
+    assert all(result.ok for result in results)
+    benchmark.extra_info["geocodes_per_second"] = per_second(benchmark, BATCH)
+
+
+def test_geocode_sync_over_http(benchmark, standin, monkeypatch):
+    """`get_coords()` one place at a time, through a real socket & the hishel cache."""
+    from owm_bot.core.http import RequestLayer
+    from owm_bot.location.geolocate import _geolocate, get_coords
+    from owm_bot.standin import StandinServer
+
+    import hishel
+
+    places: list[dict] = PLACES[:SYNC_BATCH]
+
+    with StandinServer(standin=standin) as server:
+        monkeypatch.setattr(
+            _geolocate, "OPENWEATHERMAP_GEO_URL", f"{server.url}/geo/1.0"
+        )
+
+        def _run() -> list:
+            ## A fresh cache each round, so every place is requested
+            storage = hishel.InMemoryStorage()
+            request_layer = RequestLayer()
+
+            return [
+                get_coords(
+                    **place,
+                    api_key=API_KEY,
+                    cache_storage=storage,
+                    use_geocode_cache=False,
+                    request_layer=request_layer,
+                )
+                for place in places
+            ]
+
+        results: list = benchmark(_run)
+
+    assert all(results)
+    benchmark.extra_info["geocodes_per_second"] = per_second(benchmark, SYNC_BATCH)
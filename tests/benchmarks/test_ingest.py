@@ -0,0 +1,117 @@
+"""Observation ingest throughput, reported as `observations_per_second`.
+
+Each round polls every location from the OWM stand-in, like one tick of the poll
+daemon, and appends the observations & forecasts to the partitioned datasets.
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from .helpers import API_KEY, coords, per_second
+
+## Locations polled per round
+LOCATIONS: int = 500
+CONCURRENCY: int = 50
+ROUNDS: int = 5
+
+
+@pytest.fixture
+def locations() -> list:
+    from owm_bot.domain.Location import JsonLocation
+
+    return [JsonLocation(lat=lat, lon=lon) for lat, lon in coords(LOCATIONS)]
+
+
+def _controllers(tmp_path) -> tuple:
+    from owm_bot.location.controllers import (
+        CurrentWeatherPQFileController,
+        ForecastWeatherPQFileController,
+    )
+
+    return (
+        CurrentWeatherPQFileController(
+            append_only=True, dataset_dir=tmp_path / "current", on_duplicate="drop"
+        ),
+        ForecastWeatherPQFileController(
+            append_only=True, dataset_dir=tmp_path / "forecast", on_duplicate="drop"
+        ),
+    )
+
+
+def _poll(standin, locations: list) -> list[dict]:
+    from owm_bot.core.http import RequestLayer
+    from owm_bot.standin import AsyncStandinTransport
+    from owm_bot.weather.controllers import AsyncOneCallClientController
+
+    import httpx
+
+    async def _run() -> list[dict]:
+        async with httpx.AsyncClient(
+            transport=AsyncStandinTransport(standin)
+        ) as client:
+            async with AsyncOneCallClientController(
+                client=client,
+                api_key=API_KEY,
+                units="metric",
+                exclude=["minutely", "alerts"],
+                max_concurrency=CONCURRENCY,
+                ## Unlimited, so the configured calls/minute budget never waits
+                request_layer=RequestLayer(),
+            ) as controller:
+                return await controller.get_weather_many(locations, raw=True)
+
+    return asyncio.run(_run())
+
+
+def test_poll_and_append(benchmark, standin, standin_clock, locations, tmp_path):
+    current, forecast = _controllers(tmp_path)
+
+    def _setup() -> tuple[tuple, dict]:
+        ## New observation times each round, so no row is dropped as a duplicate
+        standin_clock.tick(60)
+
+        return (), {}
+
+    def _run() -> None:
+        responses: list[dict] = _poll(standin, locations)
+        with current, forecast:
+            current.update_df(responses)
+            forecast.update_df(responses)
+
+    benchmark.pedantic(_run, setup=_setup, rounds=ROUNDS, warmup_rounds=1)
+
+    assert current.read_dataset().num_rows == (ROUNDS + 1) * LOCATIONS
+    benchmark.extra_info["observations_per_second"] = per_second(benchmark, LOCATIONS)
+
+
+def test_append_polled_responses(benchmark, onecall_responses, tmp_path):
+    """The write half of a poll on its own: flatten & append already-fetched responses."""
+    current, _ = _controllers(tmp_path)
+    rounds: dict[str, int] = {"n": 0}
+
+    def _setup() -> tuple[tuple, dict]:
+        rounds["n"] += 1
+        responses: list[dict] = [
+            {**response, "current": {**response["current"]}}
+            for response in onecall_responses
+        ]
+        for response in responses:
+            response["current"]["dt"] += 60 * rounds["n"]
+
+        return (responses,), {}
+
+    def _run(responses: list[dict]) -> None:
+        with current:
+            current.update_df(responses)
+
+    benchmark.pedantic(_run, setup=_setup, rounds=ROUNDS, warmup_rounds=1)
+
+    assert current.read_dataset().num_rows == (ROUNDS + 1) * len(onecall_responses)
+    benchmark.extra_info["observations_per_second"] = per_second(
+        benchmark, len(onecall_responses)
+    )
@@ -0,0 +1,71 @@
+"""Latency of appending one poll's observations to histories of growing size.
+
+Parquet files are rewritten on every save, so their append latency grows with the
+history. Partitioned datasets only write the new rows, so theirs shouldn't.
+"""
+
+from __future__ import annotations
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from .helpers import BATCH_LOCATIONS, HISTORY_ROWS, build_history, rows_id
+
+ROUNDS: int = 5
+
+
+def _controller(mode: str, tmp_path):
+    from owm_bot.location.controllers import CurrentWeatherPQFileController
+
+    if mode == "dataset":
+        return CurrentWeatherPQFileController(
+            append_only=True, dataset_dir=tmp_path / "current", on_duplicate="drop"
+        )
+
+    return CurrentWeatherPQFileController(
+        current_weather_pq_file=tmp_path / "current.parquet", on_duplicate="drop"
+    )
+
+
+@pytest.mark.parametrize("mode", ["file", "dataset"])
+@pytest.mark.parametrize("history_rows", HISTORY_ROWS, ids=rows_id)
+def test_append_latency(
+    benchmark, history_template: pd.DataFrame, tmp_path, mode: str, history_rows: int
+):
+    controller = _controller(mode, tmp_path)
+    history: pd.DataFrame = build_history(history_template, rows=history_rows)
+    ## Minutes already in the history, new batches are observed after them
+    last_minute: int = -(-history_rows // len(history_template))
+    with controller:
+        controller.update_df(history)
+
+    batch_template: pd.DataFrame = history_template.iloc[:BATCH_LOCATIONS]
+    rounds: dict[str, int] = {"n": 0}
+
+    def _setup() -> tuple[tuple, dict]:
+        rounds["n"] += 1
+
+        return (
+            build_history(
+                batch_template,
+                rows=BATCH_LOCATIONS,
+                start_minute=last_minute + rounds["n"],
+            ),
+        ), {}
+
+    def _append(batch: pd.DataFrame) -> None:
+        with controller:
+            controller.update_df(batch)
+
+    benchmark.pedantic(_append, setup=_setup, rounds=ROUNDS, warmup_rounds=1)
+
+    stored: int = (
+        controller.read_dataset().num_rows
+        if mode == "dataset"
+        else controller.query(columns=["dt"]).num_rows
+    )
+    assert stored == history_rows + (ROUNDS + 1) * BATCH_LOCATIONS
+    benchmark.extra_info["history_rows"] = history_rows
+    benchmark.extra_info["batch_rows"] = BATCH_LOCATIONS
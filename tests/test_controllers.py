@@ -0,0 +1,226 @@
+"""Duplicate handling of the Parquet controllers, & crash recovery of dataset compaction.
+
+Rows are built from the OWM stand-in's One Call responses, & every table is written
+under pytest's `tmp_path`.
+"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from owm_bot.location.controllers import CurrentWeatherPQFileController
+from owm_bot.standin import onecall
+from owm_bot.utils.data_utils import weather_tables
+from owm_bot.utils.data_utils.datasets import __methods as dataset_methods
+
+## Unix time of the first observation, every row is observed on the same UTC day
+START_TIME: int = 1_700_000_000
+
+
+def _rows(minutes: range, temp: float | None = None) -> pd.DataFrame:
+    """Current weather rows for two locations, observed at each of `minutes`."""
+    rows: pd.DataFrame = weather_tables.flatten_current_weather(
+        [
+            onecall(lat=lat, lon=lon, units="metric", now=START_TIME + minute * 60)
+            for minute in minutes
+            for lat, lon in [(40.7128, -74.006), (51.5072, -0.1276)]
+        ]
+    ).to_pandas()
+    if temp is not None:
+        rows["temp"] = temp
+
+    return rows
+
+
+def _dataset_controller(
+    tmp_path: Path, on_duplicate: str | None = "drop"
+) -> CurrentWeatherPQFileController:
+    return CurrentWeatherPQFileController(
+        append_only=True, dataset_dir=tmp_path / "current", on_duplicate=on_duplicate
+    )
+
+
+def _file_controller(
+    tmp_path: Path, on_duplicate: str | None = "drop"
+) -> CurrentWeatherPQFileController:
+    return CurrentWeatherPQFileController(
+        current_weather_pq_file=tmp_path / "current.parquet", on_duplicate=on_duplicate
+    )
+
+
+def _stored(controller: CurrentWeatherPQFileController) -> pd.DataFrame:
+    return controller.query(columns=["location_key", "dt", "temp"], as_pandas=True)
+
+
+def _partition_files(dataset_dir: Path) -> list[Path]:
+    return [
+        f for f in dataset_dir.rglob("*.parquet") if not f.name.startswith((".", "_"))
+    ]
+
+
+## Dedupe on write
+
+
+@pytest.mark.parametrize("mode", ["file", "dataset"])
+def test_second_append_of_the_same_keys_is_dropped(tmp_path: Path, mode: str):
+    controller = (
+        _dataset_controller(tmp_path)
+        if mode == "dataset"
+        else _file_controller(tmp_path)
+    )
+
+    with controller:
+        controller.update_df(_rows(range(3)))
+        controller.update_df(_rows(range(3)))
+        controller.update_df(_rows(range(2, 4)))
+
+    stored: pd.DataFrame = _stored(controller)
+    assert len(stored) == 8
+    assert not stored.duplicated(["location_key", "dt"]).any()
+
+
+def test_appends_from_two_controllers_sharing_a_key_index_are_deduped(tmp_path: Path):
+    first = _dataset_controller(tmp_path)
+    second = _dataset_controller(tmp_path)
+
+    with first, second:
+        ## Both load the key index before either writes the shared batch
+        first.update_df(_rows(range(1)))
+        second.update_df(_rows(range(1, 2)))
+
+        first.update_df(_rows(range(2, 4)))
+        second.update_df(_rows(range(2, 5)))
+
+    assert (tmp_path / "current" / "_keys.npy").exists()
+    stored: pd.DataFrame = _stored(first)
+    assert len(stored) == 10
+    assert not stored.duplicated(["location_key", "dt"]).any()
+
+
+def test_pending_rows_written_by_another_controller_are_dropped_on_flush(
+    tmp_path: Path,
+):
+    first = _dataset_controller(tmp_path)
+    second = _dataset_controller(tmp_path)
+
+    with first, second:
+        first.update_df(_rows(range(1)))
+        ## Held until the flush, by which time `first` has written the same keys
+        second.update_df(_rows(range(1, 3)), save_pq=False)
+        first.update_df(_rows(range(1, 3)))
+        second.flush()
+
+    stored: pd.DataFrame = _stored(first)
+    assert len(stored) == 6
+    assert not stored.duplicated(["location_key", "dt"]).any()
+
+
+def test_replace_overwrites_the_stored_row(tmp_path: Path):
+    controller = _file_controller(tmp_path, on_duplicate="replace")
+
+    with controller:
+        controller.update_df(_rows(range(2), temp=10.0))
+        controller.update_df(_rows(range(1), temp=20.0))
+
+    stored: pd.DataFrame = _stored(controller).sort_values("dt")
+    assert len(stored) == 4
+    assert stored["temp"].tolist() == [20.0, 20.0, 10.0, 10.0]
+
+    ## A fresh controller reads the replaced rows back from disk
+    assert len(_stored(_file_controller(tmp_path, on_duplicate="replace"))) == 4
+
+
+## Compaction
+
+
+def _fragmented_dataset(tmp_path: Path) -> CurrentWeatherPQFileController:
+    """A dataset with one file per poll, plus a duplicate poll written without dedupe."""
+    controller = _dataset_controller(tmp_path)
+    with controller:
+        for minute in range(3):
+            controller.update_df(_rows(range(minute, minute + 1)))
+
+    with _dataset_controller(tmp_path, on_duplicate=None) as unchecked:
+        unchecked.update_df(_rows(range(1)))
+
+    return controller
+
+
+def test_compaction_merges_files_and_drops_duplicates(tmp_path: Path):
+    controller = _fragmented_dataset(tmp_path)
+    assert len(_stored(controller)) == 8
+
+    assert controller.compact() == 2
+
+    assert len(_partition_files(controller.dataset_dir)) == 2
+    stored: pd.DataFrame = _stored(controller)
+    assert len(stored) == 6
+    assert not stored.duplicated(["location_key", "dt"]).any()
+
+
+def test_compaction_interrupted_before_the_rename_is_rolled_back(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    controller = _fragmented_dataset(tmp_path)
+    files: list[Path] = _partition_files(controller.dataset_dir)
+
+    def _crash(*args, **kwargs):
+        raise KeyboardInterrupt("Killed before the rename")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(dataset_methods, "replace_atomic", _crash)
+        with pytest.raises(KeyboardInterrupt):
+            controller.compact()
+
+    manifests: list[Path] = list(
+        controller.dataset_dir.rglob(dataset_methods.COMPACTION_MANIFEST)
+    )
+    assert len(manifests) == 1
+    ## Only the originals are visible, the compacted file is still hidden
+    assert sorted(_partition_files(controller.dataset_dir)) == sorted(files)
+    assert len(_stored(controller)) == 8
+
+    ## Rolled back by the next run, which then compacts as usual
+    assert controller.compact(min_files=100) == 0
+    assert not list(controller.dataset_dir.rglob(dataset_methods.COMPACTION_MANIFEST))
+    assert not [f for f in manifests[0].parent.iterdir() if f.name.startswith(".")]
+    assert sorted(_partition_files(controller.dataset_dir)) == sorted(files)
+
+    controller.compact()
+    assert len(_stored(controller)) == 6
+
+
+def test_compaction_interrupted_after_the_rename_is_finished(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    controller = _fragmented_dataset(tmp_path)
+
+    def _crash(partition_dir: Path) -> None:
+        raise KeyboardInterrupt("Killed before the old files were removed")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(dataset_methods, "_finish_compaction", _crash)
+        with pytest.raises(KeyboardInterrupt):
+            controller.compact()
+
+    manifest_file: Path = next(
+        controller.dataset_dir.rglob(dataset_methods.COMPACTION_MANIFEST)
+    )
+    manifest: dict = json.loads(manifest_file.read_text())
+    assert (manifest_file.parent / manifest["compacted"]).exists()
+
+    ## The next run removes the files the compacted one replaced, then compacts the
+    #  partition the crash never got to
+    assert controller.compact() == 1
+
+    assert not manifest_file.exists()
+    assert not any(
+        (manifest_file.parent / name).exists() for name in manifest["replaces"]
+    )
+    stored: pd.DataFrame = _stored(controller)
+    assert len(stored) == 6
+    assert not stored.duplicated(["location_key", "dt"]).any()
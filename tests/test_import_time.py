@@ -0,0 +1,75 @@
+"""Regression checks for CLI startup time.
+
+Runs `python -X importtime -c "import owm_bot.main"` in a subprocess and fails if a
+heavy dependency is imported at startup, or if importing the entrypoint takes longer
+than the budget (`OWM_BOT_IMPORT_BUDGET_MS`, default 150ms).
+"""
+
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+ENTRYPOINT: str = "owm_bot.main"
+## Modules that must only load when a command actually needs them
+HEAVY_MODULES: tuple[str, ...] = (
+    "pandas",
+    "pyarrow",
+    "numpy",
+    "hishel",
+    "httpx",
+    "dynaconf",
+    "pydantic",
+    "red_utils",
+)
+IMPORT_BUDGET_MS: float = float(os.environ.get("OWM_BOT_IMPORT_BUDGET_MS", 150))
+RUNS: int = 3
+
+
+def run_importtime(module: str = ENTRYPOINT) -> dict[str, int]:
+    """Import `module` in a fresh interpreter.
+
+    Returns:
+        (dict[str, int]): Cumulative import time (microseconds) of every imported module.
+
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    timings: dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, name = line.split("|")
+        timings[name.strip()] = int(cumulative)
+
+    return timings
+
+
+@pytest.fixture(scope="module")
+def import_timings() -> list[dict[str, int]]:
+    return [run_importtime() for _ in range(RUNS)]
+
+
+def test_no_heavy_imports(import_timings: list[dict[str, int]]):
+    loaded: set[str] = {name.split(".")[0] for name in import_timings[0]}
+
+    assert not loaded.intersection(HEAVY_MODULES), (
+        f"Importing {ENTRYPOINT} loaded heavy module(s): {sorted(loaded.intersection(HEAVY_MODULES))}"
+    )
+
+
+def test_import_time_budget(import_timings: list[dict[str, int]]):
+    best_ms: float = min(timings[ENTRYPOINT] for timings in import_timings) / 1000
+
+    assert best_ms <= IMPORT_BUDGET_MS, (
+        f"Importing {ENTRYPOINT} took {best_ms:.1f}ms, budget is {IMPORT_BUDGET_MS}ms"
+    )
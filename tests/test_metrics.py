@@ -0,0 +1,83 @@
+"""Trailing windows of `weather.metrics.rolling`, checked against a brute-force window."""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from owm_bot.weather.metrics import rolling
+
+WINDOW: str = "3h"
+
+
+def _table(locations: list[str] | None, rows: int = 24, seed: int = 0) -> pa.Table:
+    """Irregularly spaced `temp`/`rain` rows, for each of `locations` or without keys."""
+    rng: np.random.Generator = np.random.default_rng(seed)
+    frames: list[pd.DataFrame] = []
+    for location in locations or [None]:
+        minutes: np.ndarray = np.sort(rng.choice(24 * 60, size=rows, replace=False))
+        frame: pd.DataFrame = pd.DataFrame(
+            {
+                "dt": pd.Timestamp("2024-01-01", tz="UTC")
+                + pd.to_timedelta(minutes, unit="min"),
+                "temp": rng.normal(10, 5, size=rows),
+                "rain": rng.uniform(0, 2, size=rows),
+            }
+        )
+        if location is not None:
+            frame.insert(0, "location_key", location)
+        frames.append(frame)
+
+    return pa.Table.from_pandas(
+        pd.concat(frames, ignore_index=True), preserve_index=False
+    )
+
+
+def _brute_force(df: pd.DataFrame, column: str, agg: str) -> list[float]:
+    window: pd.Timedelta = pd.Timedelta(WINDOW)
+    groups = (
+        df.groupby("location_key", sort=False) if "location_key" in df else [(None, df)]
+    )
+    results: list[float] = []
+    for _, group in groups:
+        for dt in group["dt"]:
+            in_window: pd.Series = group[
+                (group["dt"] > dt - window) & (group["dt"] <= dt)
+            ][column]
+            results.append(getattr(in_window, agg)())
+
+    return results
+
+
+@pytest.mark.parametrize("locations", [None, ["a", "b", "c"]], ids=["no-key", "keyed"])
+def test_rolling_matches_brute_force(locations: list[str] | None):
+    result: pd.DataFrame = rolling(
+        _table(locations),
+        columns=["temp", "rain"],
+        window=WINDOW,
+        aggregations=["min", "max", "sum"],
+    ).to_pandas()
+
+    for column in ["temp", "rain"]:
+        for agg in ["min", "max", "sum"]:
+            np.testing.assert_allclose(
+                result[f"{column}_{WINDOW}_{agg}"],
+                _brute_force(result, column, agg),
+            )
+
+
+def test_rolling_windows_do_not_cross_locations():
+    ## Both locations observed at the same times, the windows must stay apart
+    table: pa.Table = _table(["a"], rows=5)
+    other: pa.Table = table.set_column(
+        0, "location_key", pa.array(["b"] * table.num_rows)
+    ).set_column(2, "temp", pa.array([100.0] * table.num_rows))
+
+    result: pd.DataFrame = rolling(
+        pa.concat_tables([table, other]), columns=["temp"], window="1d"
+    ).to_pandas()
+
+    assert (result.loc[result["location_key"] == "a", "temp_1d_max"] < 100).all()
+    assert (result.loc[result["location_key"] == "b", "temp_1d_min"] == 100).all()
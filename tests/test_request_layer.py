@@ -0,0 +1,436 @@
+"""Retries, budgets & circuit breaking of the shared `RequestLayer`, against the OWM stand-in.
+
+Requests are served in-process by `StandinTransport`, so nothing leaves the machine.
+Backoffs & circuit timeouts are shrunk to milliseconds to keep the suite fast.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from email.utils import formatdate
+import threading
+import time
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from owm_bot.core.constants import OPENWEATHERMAP_GEO_URL
+from owm_bot.core.http import (
+    CIRCUIT_CLOSED,
+    CIRCUIT_HALF_OPEN,
+    CIRCUIT_OPEN,
+    ONLY_IF_CACHED,
+    BudgetExhaustedError,
+    CircuitBreaker,
+    CircuitOpenError,
+    KeyBudget,
+    RequestLayer,
+    RetryPolicy,
+    parse_retry_after,
+)
+from owm_bot.standin import AsyncStandinTransport, OWMStandin, StandinTransport
+
+API_KEY: str = "standin"
+GEO_DIRECT_URL: str = f"{OPENWEATHERMAP_GEO_URL}/direct"
+## Retries without waiting, so only budgets & circuits decide how long a test takes
+FAST_RETRY: RetryPolicy = RetryPolicy(max_attempts=10, backoff=0.001, jitter=0.0)
+
+
+def _geocode(client: httpx.Client, city: str = "springfield"):
+    return lambda: client.get(
+        GEO_DIRECT_URL, params={"q": f"{city},us", "limit": 1, "appid": API_KEY}
+    )
+
+
+def _run_with_timeout(fn, timeout: float = 5.0):
+    """Run `fn()` in a thread, failing the test instead of hanging if it doesn't return."""
+    outcome: dict = {}
+
+    def _target() -> None:
+        try:
+            outcome["result"] = fn()
+        except BaseException as exc:
+            outcome["error"] = exc
+
+    thread: threading.Thread = threading.Thread(target=_target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), f"Request still waiting after {timeout}s"
+
+    if "error" in outcome:
+        raise outcome["error"]
+
+    return outcome["result"]
+
+
+## RetryPolicy & Retry-After
+
+
+def test_retry_delay_doubles_up_to_max_backoff():
+    policy: RetryPolicy = RetryPolicy(backoff=1.0, max_backoff=5.0, jitter=0.0)
+
+    assert [policy.delay(attempt) for attempt in range(1, 6)] == [1, 2, 4, 5, 5]
+
+
+def test_retry_delay_jitter_only_shortens():
+    policy: RetryPolicy = RetryPolicy(backoff=2.0, jitter=0.5)
+
+    assert all(1.0 <= policy.delay(1) <= 2.0 for _ in range(100))
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("7") == 7.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    assert 25 <= parse_retry_after(formatdate(time.time() + 30, usegmt=True)) <= 30
+
+
+def test_server_errors_are_retried():
+    standin: OWMStandin = OWMStandin(error_rate=0.3, seed=0)
+    layer: RequestLayer = RequestLayer(retry=FAST_RETRY, failure_threshold=100)
+
+    with httpx.Client(transport=StandinTransport(standin)) as client:
+        responses = [
+            layer.send(_geocode(client, f"city {i}"), api_key=API_KEY, endpoint="geo")
+            for i in range(20)
+        ]
+
+    assert all(res.status_code == 200 for res in responses)
+    assert standin.count(status_code=500) > 0
+
+
+def test_last_response_is_returned_after_max_attempts():
+    standin: OWMStandin = OWMStandin(error_rate=1.0)
+    layer: RequestLayer = RequestLayer(
+        retry=RetryPolicy(max_attempts=3, backoff=0.001, jitter=0.0),
+        failure_threshold=100,
+    )
+
+    with httpx.Client(transport=StandinTransport(standin)) as client:
+        res = layer.send(_geocode(client), api_key=API_KEY, endpoint="geo")
+
+    assert res.status_code == 500
+    assert standin.requests == 3
+
+
+def test_client_errors_are_not_retried():
+    standin: OWMStandin = OWMStandin()
+    layer: RequestLayer = RequestLayer(retry=FAST_RETRY)
+
+    with httpx.Client(transport=StandinTransport(standin)) as client:
+        ## The stand-in answers a request without an API key with a 401
+        res = layer.send(
+            lambda: client.get(GEO_DIRECT_URL, params={"q": "springfield,us"}),
+            endpoint="geo",
+        )
+
+    assert res.status_code == 401
+    assert standin.requests == 1
+
+
+def test_retry_after_pauses_the_key():
+    standin: OWMStandin = OWMStandin(throttle_rate=1.0, retry_after=30)
+    layer: RequestLayer = RequestLayer(
+        calls_per_minute=60, retry=FAST_RETRY, max_wait=1.0
+    )
+
+    with httpx.Client(transport=StandinTransport(standin)) as client:
+        with pytest.raises(BudgetExhaustedError) as exc_info:
+            layer.send(_geocode(client), api_key=API_KEY, endpoint="geo")
+
+    ## Paused for the server's Retry-After, not the (millisecond) backoff
+    assert 25 <= exc_info.value.retry_after <= 30
+    assert standin.count(status_code=429) == 1
+
+    budget: KeyBudget = layer.budget(API_KEY)
+    assert budget.rate == 30
+    ## Other keys keep their own budget
+    assert layer.budget("other key").reserve() == 0
+
+
+## KeyBudget
+
+
+def test_budget_waits_once_the_minute_is_used_up():
+    budget: KeyBudget = KeyBudget(calls_per_minute=2)
+
+    assert budget.reserve() == 0
+    assert budget.reserve() == 0
+    assert 29 <= budget.reserve() <= 30
+
+
+def test_budget_refund():
+    budget: KeyBudget = KeyBudget(calls_per_minute=1, calls_per_day=10)
+
+    assert budget.reserve() == 0
+    budget.refund()
+
+    assert budget.reserve() == 0
+    assert budget.day_calls == 1
+
+
+def test_budget_throttle_halves_the_rate_and_recovers():
+    budget: KeyBudget = KeyBudget(calls_per_minute=60)
+
+    budget.throttle(retry_after=0)
+    assert budget.rate == 30
+
+    for _ in range(40):
+        budget.recover()
+    assert budget.rate == 60
+
+
+def test_day_budget_raises_when_used_up():
+    standin: OWMStandin = OWMStandin()
+    layer: RequestLayer = RequestLayer(calls_per_day=3)
+
+    with httpx.Client(transport=StandinTransport(standin)) as client:
+        for i in range(3):
+            layer.send(_geocode(client, f"city {i}"), api_key=API_KEY, endpoint="geo")
+
+        with pytest.raises(BudgetExhaustedError):
+            layer.send(_geocode(client), api_key=API_KEY, endpoint="geo")
+
+    assert standin.requests == 3
+
+
+## CircuitBreaker
+
+
+def test_circuit_opens_after_threshold_and_recovers():
+    breaker: CircuitBreaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+
+    breaker.record_failure()
+    assert breaker.state == CIRCUIT_CLOSED
+    breaker.record_failure()
+    assert breaker.state == CIRCUIT_OPEN
+    assert breaker.wait_time() > 0
+
+    time.sleep(0.06)
+    ## One trial request is let through, the others wait for it
+    assert breaker.wait_time() == 0
+    assert breaker.state == CIRCUIT_HALF_OPEN
+    assert breaker.wait_time() > 0
+
+    breaker.record_success()
+    assert breaker.state == CIRCUIT_CLOSED
+    assert breaker.wait_time() == 0
+
+
+def test_failed_trial_opens_the_circuit_again():
+    breaker: CircuitBreaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.wait_time() == 0
+
+    breaker.record_failure()
+    assert breaker.state == CIRCUIT_OPEN
+    assert breaker.wait_time() > 0
+
+
+def test_open_circuit_raises_past_max_wait():
+    layer: RequestLayer = RequestLayer(
+        retry=RetryPolicy(max_attempts=1),
+        failure_threshold=1,
+        reset_timeout=60,
+        max_wait=1.0,
+    )
+
+    def _refused() -> httpx.Response:
+        raise httpx.ConnectError("Connection refused")
+
+    with pytest.raises(httpx.ConnectError):
+        layer.send(_refused, api_key=API_KEY, endpoint="geo")
+    with pytest.raises(CircuitOpenError):
+        layer.send(_refused, api_key=API_KEY, endpoint="geo")
+
+
+def test_circuit_closes_once_the_endpoint_recovers():
+    standin: OWMStandin = OWMStandin(error_rate=1.0)
+    layer: RequestLayer = RequestLayer(
+        retry=FAST_RETRY, failure_threshold=3, reset_timeout=0.05
+    )
+
+    with httpx.Client(transport=StandinTransport(standin)) as client:
+        send = _geocode(client)
+
+        def _recover_after_open() -> httpx.Response:
+            if layer.breaker("geo").state != CIRCUIT_CLOSED:
+                standin.error_rate = 0.0
+
+            return send()
+
+        res = _run_with_timeout(
+            lambda: layer.send(_recover_after_open, api_key=API_KEY, endpoint="geo")
+        )
+
+    assert res.status_code == 200
+    assert standin.count(status_code=500) == 3
+    assert layer.breaker("geo").state == CIRCUIT_CLOSED
+
+
+@pytest.mark.parametrize(
+    "trial_error",
+    [httpx.DecodingError("Bad gzip stream"), RuntimeError("Cache storage failed")],
+)
+def test_trial_that_raises_does_not_block_the_circuit(trial_error: Exception):
+    standin: OWMStandin = OWMStandin()
+    layer: RequestLayer = RequestLayer(
+        retry=RetryPolicy(max_attempts=1), failure_threshold=1, reset_timeout=0.05
+    )
+
+    def _refused() -> httpx.Response:
+        raise httpx.ConnectError("Connection refused")
+
+    def _broken() -> httpx.Response:
+        raise trial_error
+
+    with pytest.raises(httpx.ConnectError):
+        layer.send(_refused, api_key=API_KEY, endpoint="geo")
+    assert layer.breaker("geo").state == CIRCUIT_OPEN
+
+    time.sleep(0.06)
+    with pytest.raises(type(trial_error)):
+        layer.send(_broken, api_key=API_KEY, endpoint="geo")
+
+    with httpx.Client(transport=StandinTransport(standin)) as client:
+        res = _run_with_timeout(
+            lambda: layer.send(_geocode(client), api_key=API_KEY, endpoint="geo")
+        )
+
+    assert res.status_code == 200
+    assert layer.breaker("geo").state == CIRCUIT_CLOSED
+
+
+def test_cancelled_async_trial_does_not_block_the_circuit():
+    standin: OWMStandin = OWMStandin(latency=10.0)
+    layer: RequestLayer = RequestLayer(
+        retry=RetryPolicy(max_attempts=1), failure_threshold=1, reset_timeout=0.05
+    )
+
+    async def _refused() -> httpx.Response:
+        raise httpx.ConnectError("Connection refused")
+
+    async def _run() -> httpx.Response:
+        async with httpx.AsyncClient(
+            transport=AsyncStandinTransport(standin)
+        ) as client:
+            send = _geocode(client)
+
+            with pytest.raises(httpx.ConnectError):
+                await layer.send_async(_refused, api_key=API_KEY, endpoint="geo")
+            await asyncio.sleep(0.06)
+
+            ## The trial hangs on the stand-in's latency until it is cancelled, like a
+            #  request in flight when the daemon shuts down
+            trial: asyncio.Task = asyncio.create_task(
+                layer.send_async(send, api_key=API_KEY, endpoint="geo")
+            )
+            await asyncio.sleep(0.01)
+            trial.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await trial
+
+            standin.latency = 0.0
+
+            return await asyncio.wait_for(
+                layer.send_async(send, api_key=API_KEY, endpoint="geo"), timeout=5.0
+            )
+
+    res: httpx.Response = asyncio.run(_run())
+
+    assert res.status_code == 200
+    assert layer.breaker("geo").state == CIRCUIT_CLOSED
+
+
+## HTTP cache
+
+
+def _cache_client(standin: OWMStandin):
+    hishel = pytest.importorskip("hishel")
+
+    return hishel.CacheClient(
+        transport=StandinTransport(standin),
+        storage=hishel.InMemoryStorage(),
+        controller=hishel.Controller(force_cache=True),
+    )
+
+
+def _cached_geocode(client: httpx.Client, city: str = "springfield"):
+    return lambda: client.get(
+        GEO_DIRECT_URL,
+        params={"q": f"{city},us", "limit": 1, "appid": API_KEY},
+        headers=ONLY_IF_CACHED,
+    )
+
+
+def test_cached_responses_are_served_once_the_day_budget_is_used_up():
+    standin: OWMStandin = OWMStandin()
+    layer: RequestLayer = RequestLayer(calls_per_day=1)
+
+    with _cache_client(standin) as client:
+        layer.send(_geocode(client), api_key=API_KEY, endpoint="geo")
+
+        res = layer.send(
+            _geocode(client),
+            api_key=API_KEY,
+            endpoint="geo",
+            cached=_cached_geocode(client),
+        )
+        assert res.status_code == 200
+        assert res.extensions["from_cache"]
+
+        ## Places the cache doesn't hold still wait for the budget
+        with pytest.raises(BudgetExhaustedError):
+            layer.send(
+                _geocode(client, "shelbyville"),
+                api_key=API_KEY,
+                endpoint="geo",
+                cached=_cached_geocode(client, "shelbyville"),
+            )
+
+    assert standin.requests == 1
+
+
+def test_cached_responses_are_served_while_the_circuit_is_open():
+    standin: OWMStandin = OWMStandin()
+    layer: RequestLayer = RequestLayer(
+        retry=RetryPolicy(max_attempts=1), failure_threshold=1, max_wait=1.0
+    )
+
+    def _refused() -> httpx.Response:
+        raise httpx.ConnectError("Connection refused")
+
+    with _cache_client(standin) as client:
+        layer.send(_geocode(client), api_key=API_KEY, endpoint="geo")
+        with pytest.raises(httpx.ConnectError):
+            layer.send(_refused, api_key=API_KEY, endpoint="geo")
+        assert layer.breaker("geo").state == CIRCUIT_OPEN
+
+        res = layer.send(
+            _refused, api_key=API_KEY, endpoint="geo", cached=_cached_geocode(client)
+        )
+
+    assert res.status_code == 200
+    assert layer.breaker("geo").state == CIRCUIT_OPEN
+
+
+def test_cache_is_not_asked_when_the_request_can_be_sent():
+    standin: OWMStandin = OWMStandin()
+    layer: RequestLayer = RequestLayer()
+    lookups: list[int] = []
+
+    def _cached() -> httpx.Response:
+        lookups.append(1)
+
+        return httpx.Response(504)
+
+    with httpx.Client(transport=StandinTransport(standin)) as client:
+        res = layer.send(
+            _geocode(client), api_key=API_KEY, endpoint="geo", cached=_cached
+        )
+
+    assert res.status_code == 200
+    assert not lookups